@@ -0,0 +1,273 @@
+"""Motor de alertas precalculadas en prod_alertas.
+
+Las alertas (producción, tiempos muertos, stock bajo, paralizaciones) se
+derivaban recorriendo las tablas vivas en cada request. Aquí cada regla se
+registra con su función de evaluación y los prefijos de URL que la afectan;
+el resultado se sincroniza contra prod_alertas escribiendo solo las
+diferencias: alertas nuevas (primera_vez), modificadas (actualizada_en) y las
+que dejaron de cumplirse (resuelta_en). Los endpoints leen las abiertas por
+índice y las resueltas quedan como historial.
+
+Una regla se reevalúa:
+- tras una escritura exitosa en este worker bajo sus prefijos (con un debounce
+  de ALERTAS_DEBOUNCE_SEG para agrupar ráfagas), o antes de leerla si quedó
+  marcada, así quien escribe y luego lee ve su cambio;
+- en la tarea periódica `reevaluar_alertas` (cada ALERTAS_REEVALUAR_MIN), que
+  recoge el paso del día y lo escrito fuera de la API.
+Las escrituras de otros workers las reevalúa ese worker, así que la tabla es
+la misma para todos.
+"""
+import asyncio
+import logging
+import os
+import time
+
+import orjson
+
+from db import get_primary_pool
+from fast_json import dumps
+from coalescer import escuchar_escrituras
+
+logger = logging.getLogger(__name__)
+
+ALERTAS_REEVALUAR_MIN = float(os.environ.get('ALERTAS_REEVALUAR_MIN', '5'))
+ALERTAS_DEBOUNCE_SEG = float(os.environ.get('ALERTAS_DEBOUNCE_SEG', '1'))
+
+# tipo -> {"evaluar", "prefijos", "sucia", "lock", métricas...}
+_reglas = {}
+_cambio = None
+_task = None
+
+# Diferencias en una sola sentencia; el INSERT ve el estado previo, así que una
+# alerta ya abierta no se duplica (el índice único parcial lo garantiza igual)
+_SINCRONIZAR_SQL = """
+    WITH nuevas AS (
+        SELECT n.clave, n.nivel, n.registro_id, n.datos::jsonb as datos
+        FROM unnest($2::varchar[], $3::varchar[], $4::varchar[], $5::text[]) AS n(clave, nivel, registro_id, datos)
+    ),
+    resueltas AS (
+        UPDATE prod_alertas a SET resuelta_en = NOW()
+        WHERE a.tipo = $1 AND a.resuelta_en IS NULL
+          AND NOT EXISTS (SELECT 1 FROM nuevas n WHERE n.clave = a.clave)
+        RETURNING a.id
+    ),
+    actualizadas AS (
+        UPDATE prod_alertas a
+        SET nivel = n.nivel, registro_id = n.registro_id, datos = n.datos, actualizada_en = NOW()
+        FROM nuevas n
+        WHERE a.tipo = $1 AND a.resuelta_en IS NULL AND a.clave = n.clave
+          AND (a.datos IS DISTINCT FROM n.datos OR a.nivel IS DISTINCT FROM n.nivel)
+        RETURNING a.id
+    ),
+    insertadas AS (
+        INSERT INTO prod_alertas (tipo, clave, nivel, registro_id, datos, primera_vez, actualizada_en)
+        SELECT $1, n.clave, n.nivel, n.registro_id, n.datos, NOW(), NOW()
+        FROM nuevas n
+        WHERE NOT EXISTS (
+            SELECT 1 FROM prod_alertas a WHERE a.tipo = $1 AND a.clave = n.clave AND a.resuelta_en IS NULL
+        )
+        RETURNING id
+    )
+    SELECT (SELECT COUNT(*) FROM insertadas) as nuevas,
+           (SELECT COUNT(*) FROM actualizadas) as actualizadas,
+           (SELECT COUNT(*) FROM resueltas) as resueltas
+"""
+
+_ABIERTAS_SQL = """
+    SELECT clave, nivel, registro_id, datos, primera_vez, actualizada_en
+    FROM prod_alertas
+    WHERE tipo = $1 AND resuelta_en IS NULL
+"""
+
+
+async def init_alertas_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS prod_alertas (
+            id BIGSERIAL PRIMARY KEY,
+            tipo VARCHAR NOT NULL,
+            clave VARCHAR NOT NULL,
+            nivel VARCHAR,
+            registro_id VARCHAR,
+            datos JSONB NOT NULL DEFAULT '{}'::jsonb,
+            primera_vez TIMESTAMP NOT NULL DEFAULT NOW(),
+            actualizada_en TIMESTAMP NOT NULL DEFAULT NOW(),
+            resuelta_en TIMESTAMP
+        )
+    """)
+    # Una sola alerta abierta por (tipo, clave); al reaparecer se abre una fila nueva
+    await conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_alertas_abiertas ON prod_alertas(tipo, clave) WHERE resuelta_en IS NULL"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_alertas_historial ON prod_alertas(tipo, primera_vez DESC)"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_alertas_registro ON prod_alertas(registro_id) WHERE registro_id IS NOT NULL"
+    )
+
+
+def registrar_regla(tipo: str, evaluar, prefijos: tuple):
+    """Registra una regla.
+
+    `evaluar(conn)` retorna las alertas vigentes como lista de
+    (clave, nivel, registro_id, datos); `datos` es lo que sirven los endpoints.
+    """
+    _reglas[tipo] = {
+        "tipo": tipo,
+        "evaluar": evaluar,
+        "prefijos": tuple(prefijos),
+        "sucia": True,
+        "lock": None,
+        "evaluaciones": 0,
+        "ultima_evaluacion": None,
+        "ultimo_ms": None,
+        "ultimo_resultado": None,
+        "ultimo_error": None,
+    }
+    escuchar_escrituras(prefijos, lambda path, tipo=tipo: marcar_sucia(tipo))
+
+
+def marcar_sucia(tipo: str = None):
+    """Marca la regla (o todas) para reevaluarla tras el debounce o antes de la próxima lectura."""
+    for regla in ([_reglas[tipo]] if tipo else _reglas.values()):
+        regla["sucia"] = True
+    if _cambio is not None:
+        _cambio.set()
+
+
+def _lock(regla):
+    if regla["lock"] is None:
+        regla["lock"] = asyncio.Lock()
+    return regla["lock"]
+
+
+async def evaluar_regla(conn, tipo: str) -> dict:
+    """Evalúa la regla y sincroniza prod_alertas. `conn` debe ser del pool primario."""
+    regla = _reglas[tipo]
+    inicio = time.perf_counter()
+    # Se marca limpia antes de evaluar: una escritura durante la evaluación la vuelve a ensuciar
+    regla["sucia"] = False
+    try:
+        alertas = await regla["evaluar"](conn)
+        claves, niveles, registros, datos = [], [], [], []
+        vistas = set()
+        for clave, nivel, registro_id, d in alertas:
+            clave = str(clave)
+            if clave in vistas:
+                continue
+            vistas.add(clave)
+            claves.append(clave)
+            niveles.append(nivel)
+            registros.append(None if registro_id is None else str(registro_id))
+            datos.append(dumps(d).decode())
+        async with conn.transaction():
+            # Serializa la sincronización de la misma regla entre workers
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('prod_alertas:' || $1))", tipo)
+            row = await conn.fetchrow(_SINCRONIZAR_SQL, tipo, claves, niveles, registros, datos)
+    except Exception as e:
+        regla["sucia"] = True
+        regla["ultimo_error"] = str(e)[:300]
+        raise
+    resultado = {"abiertas": len(claves), **dict(row)}
+    regla["evaluaciones"] += 1
+    regla["ultima_evaluacion"] = time.time()
+    regla["ultimo_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    regla["ultimo_resultado"] = resultado
+    regla["ultimo_error"] = None
+    return resultado
+
+
+async def _evaluar_sucias(tipos=None):
+    pendientes = [t for t in (tipos or _reglas) if _reglas[t]["sucia"]]
+    if not pendientes:
+        return
+    pool = await get_primary_pool()
+    async with pool.acquire() as conn:
+        for tipo in pendientes:
+            async with _lock(_reglas[tipo]):
+                if _reglas[tipo]["sucia"]:
+                    await evaluar_regla(conn, tipo)
+
+
+def _fila(r) -> dict:
+    datos = orjson.loads(r["datos"]) if isinstance(r["datos"], (str, bytes)) else dict(r["datos"])
+    datos["primera_vez"] = r["primera_vez"].isoformat() if r["primera_vez"] else None
+    return datos
+
+
+async def alertas_abiertas(conn, tipo: str) -> list:
+    """`datos` de las alertas abiertas de la regla, con su `primera_vez`.
+
+    Si la regla tiene escrituras pendientes en este worker se evalúa primero
+    (en el primario); la lectura usa `conn`, que puede ser la réplica.
+    """
+    if _reglas[tipo]["sucia"]:
+        try:
+            await _evaluar_sucias([tipo])
+        except Exception:
+            # Se sirve lo último sincronizado; el bucle reintenta
+            logger.exception(f"Alertas '{tipo}': error evaluando antes de leer")
+        else:
+            # Recién escrito en el primario: leer de ahí para no depender del lag de la réplica
+            pool = await get_primary_pool()
+            async with pool.acquire() as primario:
+                return [_fila(r) for r in await primario.fetch(_ABIERTAS_SQL, tipo)]
+    return [_fila(r) for r in await conn.fetch(_ABIERTAS_SQL, tipo)]
+
+
+async def tarea_reevaluar_alertas():
+    """Tarea periódica: reevalúa todas las reglas (paso del día, escrituras fuera de la API)."""
+    pool = await get_primary_pool()
+    resultado = {}
+    async with pool.acquire() as conn:
+        for tipo, regla in _reglas.items():
+            async with _lock(regla):
+                try:
+                    resultado[tipo] = await evaluar_regla(conn, tipo)
+                except Exception as e:
+                    resultado[tipo] = {"error": str(e)[:300]}
+                    logger.exception(f"Alertas '{tipo}': error en la reevaluación periódica")
+    return resultado
+
+
+async def _bucle():
+    while True:
+        await _cambio.wait()
+        await asyncio.sleep(ALERTAS_DEBOUNCE_SEG)
+        _cambio.clear()
+        try:
+            await _evaluar_sucias()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Motor de alertas: error reevaluando")
+
+
+def estado_alertas_motor() -> dict:
+    return {
+        "reevaluar_min": ALERTAS_REEVALUAR_MIN,
+        "debounce_seg": ALERTAS_DEBOUNCE_SEG,
+        "reglas": {
+            tipo: {k: v for k, v in regla.items() if k not in ("evaluar", "lock")}
+            for tipo, regla in _reglas.items()
+        },
+    }
+
+
+async def iniciar_motor_alertas():
+    global _cambio, _task
+    # Las reglas arrancan marcadas: la primera lectura de cada una la evalúa
+    _cambio = asyncio.Event()
+    if _task is None:
+        _task = asyncio.create_task(_bucle())
+
+
+async def detener_motor_alertas():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,251 @@
+"""Stream SSE de alertas de producción (reemplaza el polling de NotificacionesBell).
+
+Cada worker lee las alertas (de prod_alertas, ver alertas_motor) una sola vez
+por cambio y envía a todas sus conexiones abiertas solo las diferencias, así el
+costo ya no crece con la cantidad de pestañas. Un cambio es una escritura exitosa en este worker a
+movimientos, incidencias, paralizaciones o registros (vía el middleware de
+coalescer), o el tick de ALERTAS_STREAM_TICK_SEG que recoge lo que escriben
+otros workers. Sin suscriptores no se calcula nada.
+
+Eventos:
+- `snapshot`: al conectar, {version, alertas, resumen}
+- `diff`: {version, upsert: [alertas nuevas o modificadas], remove: [movimiento_id], resumen}
+
+EventSource no puede enviar el header Authorization, y el JWT en la URL
+quedaría en los logs de acceso y de proxies. El navegador pide antes un ticket
+(`emitir_ticket`, con su header) y abre el stream con `?ticket=`: es de un solo
+uso, vence a los ALERTAS_STREAM_TICKET_SEG y en prod_stream_tickets solo se
+guarda su sha256, así cualquier worker lo puede canjear.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+from datetime import datetime, timezone
+
+from db import get_primary_pool
+from fast_json import dumps
+from coalescer import escuchar_escrituras
+
+logger = logging.getLogger(__name__)
+
+ALERTAS_STREAM_TICK_SEG = float(os.environ.get('ALERTAS_STREAM_TICK_SEG', '30'))
+# Espera tras una escritura para agrupar ráfagas (p.ej. un lote con varios movimientos)
+ALERTAS_STREAM_DEBOUNCE_SEG = float(os.environ.get('ALERTAS_STREAM_DEBOUNCE_SEG', '1'))
+ALERTAS_STREAM_PING_SEG = float(os.environ.get('ALERTAS_STREAM_PING_SEG', '20'))
+# Eventos pendientes por conexión; una conexión más lenta se cierra y el cliente reconecta
+ALERTAS_STREAM_COLA_MAX = int(os.environ.get('ALERTAS_STREAM_COLA_MAX', '50'))
+ALERTAS_STREAM_TICKET_SEG = float(os.environ.get('ALERTAS_STREAM_TICKET_SEG', '30'))
+
+PREFIJOS_ALERTAS = (
+    "/api/movimientos-produccion", "/api/incidencias", "/api/paralizaciones", "/api/registros",
+)
+
+_suscriptores = set()
+_estado = {
+    "version": 0,
+    "alertas": {},
+    "resumen": None,
+    "vigente": False,
+    "calculado_en": None,
+    "calculos": 0,
+    "diffs_enviados": 0,
+    "conexiones_cerradas_por_lentitud": 0,
+    "ultimo_calculo_ms": None,
+    "error": None,
+}
+_cambio = None
+_lock = None
+_task = None
+
+
+async def init_alertas_stream_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS prod_stream_tickets (
+            ticket_hash VARCHAR PRIMARY KEY,
+            usuario_id VARCHAR NOT NULL,
+            expira_en TIMESTAMP NOT NULL
+        )
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_stream_tickets_expira ON prod_stream_tickets(expira_en)")
+
+
+def _hash_ticket(ticket: str) -> str:
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+
+async def emitir_ticket(conn, usuario_id: str) -> dict:
+    """Ticket de un solo uso para abrir el stream; de paso purga los vencidos."""
+    ticket = secrets.token_urlsafe(32)
+    await conn.execute("DELETE FROM prod_stream_tickets WHERE expira_en < NOW()")
+    await conn.execute(
+        "INSERT INTO prod_stream_tickets (ticket_hash, usuario_id, expira_en) "
+        "VALUES ($1, $2, NOW() + make_interval(secs => $3))",
+        _hash_ticket(ticket), str(usuario_id), ALERTAS_STREAM_TICKET_SEG,
+    )
+    return {"ticket": ticket, "expira_seg": ALERTAS_STREAM_TICKET_SEG}
+
+
+async def canjear_ticket(conn, ticket: str):
+    """usuario_id del ticket si existe y no venció; lo borra en la misma sentencia (un solo uso)."""
+    row = await conn.fetchrow(
+        "DELETE FROM prod_stream_tickets WHERE ticket_hash = $1 RETURNING usuario_id, expira_en >= NOW() as vigente",
+        _hash_ticket(ticket),
+    )
+    return row["usuario_id"] if row and row["vigente"] else None
+
+
+def notificar_cambio(path: str = None):
+    """Marca las alertas como desactualizadas; el bucle recalcula tras el debounce."""
+    _estado["vigente"] = False
+    if _cambio is not None:
+        _cambio.set()
+
+
+escuchar_escrituras(PREFIJOS_ALERTAS, notificar_cambio)
+
+
+def _ordenar(alertas):
+    # Mismo orden que alertas_produccion: paralizados, vencidos, críticos, más días primero
+    prioridad = {'vencido': 0, 'critico': 1, 'atencion': 2, 'normal': 3}
+    return sorted(alertas, key=lambda a: (
+        0 if a["paralizado"] else 1,
+        prioridad.get(a["nivel"], 3),
+        -(a["dias"] or 0),
+    ))
+
+
+def _difundir(evento: str, datos: dict):
+    for cola in list(_suscriptores):
+        try:
+            cola.put_nowait((evento, datos))
+        except asyncio.QueueFull:
+            _suscriptores.discard(cola)
+            _estado["conexiones_cerradas_por_lentitud"] += 1
+
+
+async def _recalcular():
+    from routes.reportes_produccion import leer_alertas_produccion
+
+    inicio = datetime.now(timezone.utc)
+    pool = await get_primary_pool()
+    async with pool.acquire() as conn:
+        data = await leer_alertas_produccion(conn)
+    _estado["calculos"] += 1
+    _estado["calculado_en"] = datetime.now(timezone.utc).isoformat()
+    _estado["ultimo_calculo_ms"] = round((datetime.now(timezone.utc) - inicio).total_seconds() * 1000, 1)
+    _estado["error"] = None
+    _estado["vigente"] = True
+
+    nuevas = {a["movimiento_id"]: a for a in data["alertas"]}
+    previas = _estado["alertas"]
+    upsert = [a for k, a in nuevas.items() if previas.get(k) != a]
+    remove = [k for k in previas if k not in nuevas]
+    if not upsert and not remove and data["resumen"] == _estado["resumen"]:
+        return
+    _estado["alertas"] = nuevas
+    _estado["resumen"] = data["resumen"]
+    _estado["version"] += 1
+    if _suscriptores:
+        _estado["diffs_enviados"] += 1
+        _difundir("diff", {
+            "version": _estado["version"],
+            "upsert": upsert,
+            "remove": remove,
+            "resumen": data["resumen"],
+        })
+
+
+async def _asegurar_vigente():
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if not _estado["vigente"]:
+            await _recalcular()
+
+
+async def _bucle():
+    while True:
+        try:
+            await asyncio.wait_for(_cambio.wait(), ALERTAS_STREAM_TICK_SEG)
+            await asyncio.sleep(ALERTAS_STREAM_DEBOUNCE_SEG)
+        except asyncio.TimeoutError:
+            # Tick: recoge escrituras de otros workers y el paso del día
+            _estado["vigente"] = False
+        _cambio.clear()
+        if not _suscriptores:
+            continue
+        try:
+            await _asegurar_vigente()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _estado["error"] = str(e)[:300]
+            logger.exception("Stream de alertas: error recalculando")
+
+
+def _sse(evento: str, datos: dict) -> bytes:
+    return b"event: " + evento.encode() + b"\nid: " + str(datos["version"]).encode() + b"\ndata: " + dumps(datos) + b"\n\n"
+
+
+async def eventos_alertas(request):
+    """Generador para StreamingResponse: snapshot inicial y luego diffs hasta que el cliente se vaya."""
+    await _asegurar_vigente()
+    cola = asyncio.Queue(maxsize=ALERTAS_STREAM_COLA_MAX)
+    # Sin await entre el alta y el snapshot: ningún diff puede quedar entre ambos
+    _suscriptores.add(cola)
+    snapshot = {
+        "version": _estado["version"],
+        "alertas": _ordenar(_estado["alertas"].values()),
+        "resumen": _estado["resumen"],
+    }
+    try:
+        yield b"retry: 5000\n" + _sse("snapshot", snapshot)
+        while cola in _suscriptores:
+            try:
+                item = await asyncio.wait_for(cola.get(), ALERTAS_STREAM_PING_SEG)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": ping\n\n"
+                continue
+            if item is None or cola not in _suscriptores:
+                break
+            yield _sse(*item)
+    finally:
+        _suscriptores.discard(cola)
+
+
+def estado_alertas_stream() -> dict:
+    return {
+        "suscriptores": len(_suscriptores),
+        "tick_seg": ALERTAS_STREAM_TICK_SEG,
+        "alertas": len(_estado["alertas"]),
+        **{k: v for k, v in _estado.items() if k not in ("alertas",)},
+    }
+
+
+async def iniciar_alertas_stream():
+    global _cambio, _task
+    _cambio = asyncio.Event()
+    if _task is None:
+        _task = asyncio.create_task(_bucle())
+
+
+async def detener_alertas_stream():
+    global _task
+    for cola in list(_suscriptores):
+        try:
+            cola.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+    _suscriptores.clear()
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
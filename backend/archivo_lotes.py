@@ -0,0 +1,293 @@
+"""Archivo frío de lotes cerrados.
+
+Los lotes CERRADA/ANULADA se quedaban para siempre en prod_registros y sus
+tablas hijas, que las pantallas operativas recorren. Aquí los lotes cerrados
+hace más de ARCHIVO_MESES meses se mueven, con todo su grafo de hijos (ver
+GRAFO), a tablas `<tabla>_archivo` con las mismas columnas, y cualquier lote
+puede restaurarse. Cada tabla se mueve con un solo
+`DELETE ... RETURNING` -> `INSERT`, todas dentro de una transacción por lote de
+hasta ARCHIVO_LOTE_MAX registros: o se mueve el grafo completo o nada.
+
+Los reportes que necesitan la historia completa leen las vistas
+`<tabla>_con_archivo` (UNION ALL de la tabla viva y la de archivo, con la
+columna extra `archivado`); ver `tabla_o_vista`.
+
+La distribución PT del lote y sus vínculos a ajustes de Odoo se mueven con
+él, para que la conciliación no muestre lotes que ya no están vivos.
+
+No se archivan los libros de inventario (salidas, ingresos, consumos, WIP) ni
+las guías de remisión: kardex y valorización necesitan toda su historia en la
+tabla viva.
+"""
+import logging
+import os
+
+from db import get_pool
+from matriz_cubo import refrescar_cubo_registros
+from alertas_motor import marcar_sucia
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_MESES = int(os.environ.get('ARCHIVO_MESES', '12'))
+ARCHIVO_LOTE_MAX = int(os.environ.get('ARCHIVO_LOTE_MAX', '200'))
+
+ESTADOS_ARCHIVABLES = ("CERRADA", "ANULADA", "Anulada")
+
+# (tabla, columna, tabla padre). Sin padre la columna es el id del registro;
+# con padre, la columna apunta al id de la tabla padre. Los padres van antes
+# que sus hijos: se restaura en este orden y se archiva en el inverso.
+GRAFO = (
+    ("prod_registros", "id", None),
+    ("prod_registro_tallas", "registro_id", None),
+    ("prod_movimientos_produccion", "registro_id", None),
+    ("prod_mermas", "registro_id", None),
+    ("prod_fallados", "registro_id", None),
+    ("prod_registro_arreglos", "registro_id", None),
+    ("prod_arreglos", "registro_id", None),
+    ("prod_incidencia", "registro_id", None),
+    ("prod_paralizacion", "registro_id", None),
+    ("prod_conversacion", "registro_id", None),
+    ("prod_registro_requerimiento_mp", "registro_id", None),
+    ("prod_inventario_reservas", "registro_id", None),
+    ("prod_registro_costos_servicio", "registro_id", None),
+    ("prod_registro_cierre", "registro_id", None),
+    ("prod_registro_costo_snapshot", "registro_id", None),
+    ("prod_registro_pt_relacion", "registro_id", None),
+    ("prod_registro_pt_odoo_vinculo", "registro_id", None),
+    ("prod_inventario_reservas_linea", "reserva_id", "prod_inventario_reservas"),
+    ("prod_avance_historial", "movimiento_id", "prod_movimientos_produccion"),
+)
+
+# Fecha desde la que cuenta la antigüedad: el cierre, o la última actividad del lote
+_REFERENCIA_SQL = """
+    COALESCE(
+        c.fecha,
+        (SELECT MAX(COALESCE(m.fecha_fin, m.fecha_inicio)) FROM prod_movimientos_produccion m WHERE m.registro_id = r.id),
+        r.fecha_creacion::date
+    )
+"""
+
+_FILTRO_CANDIDATOS = f"""
+    FROM prod_registros r
+    LEFT JOIN prod_registro_cierre c ON c.registro_id = r.id
+    WHERE r.estado = ANY($1::varchar[])
+      AND ($2::varchar[] IS NULL OR r.id = ANY($2::varchar[]))
+      AND {_REFERENCIA_SQL} < CURRENT_DATE - make_interval(months => $3::int)
+      -- Una división viva del lote lo sigue necesitando
+      AND NOT EXISTS (
+          SELECT 1 FROM prod_registros h
+          WHERE h.dividido_desde_registro_id = r.id AND NOT (h.estado = ANY($1::varchar[]))
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM prod_inventario_reservas x WHERE x.registro_id = r.id AND x.estado = 'ACTIVA'
+      )
+"""
+
+_CANDIDATOS_SQL = f"""
+    SELECT r.id, r.n_corte, r.estado, r.dividido_desde_registro_id, {_REFERENCIA_SQL} as referencia
+    {_FILTRO_CANDIDATOS}
+    ORDER BY referencia, r.id
+    LIMIT $4
+    FOR UPDATE OF r SKIP LOCKED
+"""
+
+
+def _archivo(tabla: str) -> str:
+    return f"{tabla}_archivo"
+
+
+def _vista(tabla: str) -> str:
+    return f"{tabla}_con_archivo"
+
+
+def tabla_o_vista(tabla: str, incluir_archivo: bool) -> str:
+    """Nombre a usar en el FROM de un reporte que permite incluir lotes archivados."""
+    return _vista(tabla) if incluir_archivo else tabla
+
+
+async def _columnas(conn, tabla: str) -> list:
+    """[(nombre, tipo)] en orden; vacío si la tabla no existe."""
+    rows = await conn.fetch("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod) as tipo
+        FROM pg_attribute a
+        WHERE a.attrelid = to_regclass($1) AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, tabla)
+    return [(r['attname'], r['tipo']) for r in rows]
+
+
+async def _grafo(conn) -> list:
+    """GRAFO limitado a las tablas que existen, con la lista de columnas de cada una."""
+    grafo = []
+    for tabla, columna, padre in GRAFO:
+        columnas = await _columnas(conn, tabla)
+        if columnas:
+            grafo.append((tabla, columna, padre, [c for c, _ in columnas]))
+    return grafo
+
+
+async def init_archivo_tables(conn):
+    """Crea/alinea las tablas de archivo y recrea las vistas; llamar después de los ALTER de las tablas vivas."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS prod_archivo_lotes (
+            registro_id VARCHAR PRIMARY KEY,
+            n_corte VARCHAR,
+            estado VARCHAR,
+            referencia DATE,
+            archivado_en TIMESTAMP NOT NULL DEFAULT NOW(),
+            archivado_por VARCHAR
+        )
+    """)
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('prod_archivo_lotes'))")
+        for tabla, columna, _ in GRAFO:
+            vivas = await _columnas(conn, tabla)
+            if not vivas:
+                continue
+            archivo = _archivo(tabla)
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {archivo} (LIKE {tabla} INCLUDING DEFAULTS INCLUDING INDEXES)"
+            )
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{archivo}_{columna} ON {archivo}({columna})")
+            # Las tablas vivas reciben ADD COLUMN / ALTER TYPE en cada arranque; el archivo las sigue
+            archivadas = dict(await _columnas(conn, archivo))
+            for nombre, tipo in vivas:
+                if nombre not in archivadas:
+                    await conn.execute(f'ALTER TABLE {archivo} ADD COLUMN "{nombre}" {tipo}')
+                elif archivadas[nombre] != tipo:
+                    await conn.execute(f'ALTER TABLE {archivo} ALTER COLUMN "{nombre}" TYPE {tipo} USING "{nombre}"::{tipo}')
+            lista = ", ".join(f'"{c}"' for c, _ in vivas)
+            # DROP + CREATE: CREATE OR REPLACE no admite columnas nuevas antes de `archivado`
+            await conn.execute(f"DROP VIEW IF EXISTS {_vista(tabla)}")
+            await conn.execute(f"""
+                CREATE VIEW {_vista(tabla)} AS
+                SELECT {lista}, false AS archivado FROM {tabla}
+                UNION ALL
+                SELECT {lista}, true AS archivado FROM {archivo}
+            """)
+
+
+def _condicion(columna: str, padre: str) -> str:
+    # El padre siempre se consulta en la tabla viva: al archivar aún no se movió
+    # (se archiva de hijos a padres) y al restaurar ya volvió (de padres a hijos)
+    if padre is None:
+        return f"{columna} = ANY($1::varchar[])"
+    return f"{columna} IN (SELECT p.id::varchar FROM {padre} p WHERE p.registro_id = ANY($1::varchar[]))"
+
+
+async def _mover(conn, origen: str, destino: str, columna: str, padre: str, columnas: list, ids: list) -> int:
+    lista = ", ".join(f'"{c}"' for c in columnas)
+    return await conn.fetchval(f"""
+        WITH movidas AS (
+            DELETE FROM {origen} WHERE {_condicion(columna, padre)}
+            RETURNING {lista}
+        ),
+        insertadas AS (
+            INSERT INTO {destino} ({lista}) SELECT {lista} FROM movidas
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM insertadas
+    """, ids)
+
+
+async def archivar_lotes(conn, meses: int = None, limite: int = None, registro_ids=None,
+                         dry_run: bool = False, usuario: str = None) -> dict:
+    """Mueve al archivo hasta `limite` lotes cerrados hace más de `meses` meses, en una transacción.
+
+    Con `registro_ids` solo considera esos lotes (igual deben cumplir estado y antigüedad).
+    """
+    meses = ARCHIVO_MESES if meses is None else meses
+    limite = ARCHIVO_LOTE_MAX if limite is None else min(limite, ARCHIVO_LOTE_MAX)
+    grafo = await _grafo(conn)
+    filas = {}
+    async with conn.transaction():
+        # FOR UPDATE: un lote reabierto mientras tanto queda fuera o espera a que termine el lote
+        candidatos = await conn.fetch(
+            _CANDIDATOS_SQL, list(ESTADOS_ARCHIVABLES), list(registro_ids) if registro_ids else None, meses, limite
+        )
+        ids = [c['id'] for c in candidatos]
+        if ids and not dry_run:
+            for tabla, columna, padre, columnas in reversed(grafo):
+                filas[tabla] = await _mover(conn, tabla, _archivo(tabla), columna, padre, columnas, ids)
+            await conn.execute("""
+                INSERT INTO prod_archivo_lotes (registro_id, n_corte, estado, referencia, archivado_por)
+                SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::date[], $5::varchar[])
+                ON CONFLICT (registro_id) DO UPDATE SET
+                    n_corte = EXCLUDED.n_corte, estado = EXCLUDED.estado, referencia = EXCLUDED.referencia,
+                    archivado_en = NOW(), archivado_por = EXCLUDED.archivado_por
+            """, ids, [str(c['n_corte']) if c['n_corte'] is not None else None for c in candidatos],
+                [c['estado'] for c in candidatos], [c['referencia'] for c in candidatos], [usuario] * len(ids))
+            # Los ids que ya no existen solo restan sus hechos; los padres recalculan su marca de fraccionado
+            padres = [c['dividido_desde_registro_id'] for c in candidatos if c['dividido_desde_registro_id']]
+            await refrescar_cubo_registros(conn, ids + padres)
+    if ids and not dry_run:
+        marcar_sucia()
+    return {
+        "dry_run": dry_run,
+        "meses": meses,
+        "lotes": len(ids),
+        "registro_ids": ids,
+        "filas": filas,
+    }
+
+
+async def restaurar_lotes(conn, registro_ids, usuario: str = None) -> dict:
+    """Devuelve los lotes archivados (con sus hijos) a las tablas vivas, en una transacción."""
+    grafo = await _grafo(conn)
+    ids = list(dict.fromkeys(i for i in registro_ids if i))
+    filas = {}
+    async with conn.transaction():
+        encontrados = await conn.fetch(
+            f"SELECT id, dividido_desde_registro_id FROM {_archivo('prod_registros')} WHERE id = ANY($1::varchar[]) FOR UPDATE",
+            ids,
+        )
+        ids = [r['id'] for r in encontrados]
+        if ids:
+            for tabla, columna, padre, columnas in grafo:
+                filas[tabla] = await _mover(conn, _archivo(tabla), tabla, columna, padre, columnas, ids)
+            await conn.execute("DELETE FROM prod_archivo_lotes WHERE registro_id = ANY($1::varchar[])", ids)
+            padres = [r['dividido_desde_registro_id'] for r in encontrados if r['dividido_desde_registro_id']]
+            await refrescar_cubo_registros(conn, ids + padres)
+    if ids:
+        marcar_sucia()
+    return {"lotes": len(ids), "registro_ids": ids, "filas": filas}
+
+
+async def estado_archivo(conn) -> dict:
+    """Filas vivas y archivadas por tabla del grafo."""
+    tablas = []
+    for tabla, _, _, _ in await _grafo(conn):
+        row = await conn.fetchrow(f"""
+            SELECT (SELECT COUNT(*) FROM {tabla}) as vivas,
+                   (SELECT COUNT(*) FROM {_archivo(tabla)}) as archivadas
+        """)
+        tablas.append({"tabla": tabla, "vivas": row['vivas'], "archivadas": row['archivadas']})
+    archivables = await conn.fetchval(
+        f"SELECT COUNT(*) {_FILTRO_CANDIDATOS}", list(ESTADOS_ARCHIVABLES), None, ARCHIVO_MESES
+    )
+    lotes = await conn.fetchval("SELECT COUNT(*) FROM prod_archivo_lotes")
+    return {
+        "meses": ARCHIVO_MESES,
+        "lote_max": ARCHIVO_LOTE_MAX,
+        "archivables": archivables,
+        "lotes_archivados": lotes,
+        "tablas": tablas,
+    }
+
+
+async def tarea_archivar_lotes():
+    """Tarea periódica: archiva lotes por tandas de ARCHIVO_LOTE_MAX hasta no quedar candidatos."""
+    pool = await get_pool()
+    total = {"lotes": 0, "tandas": 0}
+    async with pool.acquire() as conn:
+        while True:
+            resultado = await archivar_lotes(conn, usuario="tarea_archivar_lotes")
+            if not resultado["lotes"]:
+                break
+            total["lotes"] += resultado["lotes"]
+            total["tandas"] += 1
+            if resultado["lotes"] < ARCHIVO_LOTE_MAX:
+                break
+    if total["lotes"]:
+        logger.info(f"Archivo de lotes: {total['lotes']} lotes en {total['tandas']} tandas")
+    return total
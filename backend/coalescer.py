@@ -0,0 +1,193 @@
+"""Coalescencia single-flight para endpoints de lectura caros.
+
+Cuando varios usuarios piden el mismo reporte a la vez (dashboard, matriz,
+costura, alertas al inicio del turno), solo la primera solicitud ejecuta las
+consultas; las demás esperan ese mismo cálculo y reciben el mismo cuerpo. El
+resultado queda unos segundos (ttl_seg por ruta) para las que llegan justo
+después.
+
+La clave es ruta + parámetros normalizados + versión de datos. La versión es un
+contador por prefijo de URL que sube con cada POST/PUT/PATCH/DELETE exitoso de
+este worker (middleware `InvalidacionEscrituras`), así que una escritura local
+invalida de inmediato los reportes que dependen de ella. Las escrituras de
+otros workers o de tareas internas quedan acotadas por el TTL.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+
+from fastapi.responses import Response
+
+from fast_json import dumps
+
+logger = logging.getLogger(__name__)
+
+COALESCER_HABILITADO = os.environ.get('COALESCER_HABILITADO', '1') not in ('0', 'false', 'False')
+COALESCER_TTL_SEG = float(os.environ.get('COALESCER_TTL_SEG', '5'))
+COALESCER_MAX_ENTRADAS = int(os.environ.get('COALESCER_MAX_ENTRADAS', '256'))
+
+# Parámetros de dependencias que no forman parte de la clave
+_IGNORAR = ("current_user", "user")
+
+_rutas = {}
+_versiones = {}
+_cache = {}
+_en_curso = {}
+# (prefijos, fn) avisados en cada escritura exitosa que toque alguno de sus prefijos
+_oyentes = []
+
+
+def escuchar_escrituras(prefijos: tuple, fn):
+    """Registra `fn(path)` (síncrona y liviana) para las escrituras bajo `prefijos`."""
+    _oyentes.append((tuple(prefijos), fn))
+
+
+def registrar_escritura(path: str):
+    """Sube la versión de todos los prefijos registrados que cubren `path`."""
+    for prefijo in _versiones:
+        if path.startswith(prefijo):
+            _versiones[prefijo] += 1
+    for prefijos, fn in _oyentes:
+        if path.startswith(prefijos):
+            try:
+                fn(path)
+            except Exception:
+                logger.exception(f"Oyente de escrituras falló para {path}")
+
+
+def _version(ruta) -> tuple:
+    return tuple(_versiones[p] for p in ruta["depende_de"])
+
+
+def _clave(nombre: str, kwargs: dict, version: tuple):
+    params = tuple(sorted((k, repr(v)) for k, v in kwargs.items() if k not in _IGNORAR))
+    return (nombre, params, version)
+
+
+def _podar(ahora: float):
+    if len(_cache) < COALESCER_MAX_ENTRADAS:
+        return
+    for clave in [c for c, e in _cache.items() if e["expira"] <= ahora]:
+        del _cache[clave]
+    while len(_cache) >= COALESCER_MAX_ENTRADAS:
+        del _cache[next(iter(_cache))]
+
+
+def _cuerpo(resultado):
+    """(status, media_type, bytes) de lo que retornó el endpoint."""
+    if isinstance(resultado, Response):
+        return resultado.status_code, resultado.media_type, resultado.body
+    return 200, "application/json", dumps(resultado)
+
+
+def coalescido(nombre: str, depende_de: tuple, ttl_seg: float = None):
+    """Decorador para endpoints GET: comparte cálculo en curso y resultado reciente.
+
+    `depende_de` = prefijos de URL cuyas escrituras invalidan el resultado.
+    Cada solicitud recibe su propia Response (el middleware gzip modifica los
+    headers de la respuesta que envía, así que no se comparte el objeto).
+    """
+    _rutas[nombre] = {
+        "nombre": nombre,
+        "ttl_seg": COALESCER_TTL_SEG if ttl_seg is None else ttl_seg,
+        "depende_de": tuple(depende_de),
+        "calculos": 0,
+        "hits": 0,
+        "compartidos": 0,
+        "errores": 0,
+        "ultimo_calculo_ms": None,
+    }
+    for prefijo in depende_de:
+        _versiones.setdefault(prefijo, 0)
+
+    def decorador(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            ruta = _rutas[nombre]
+            if not COALESCER_HABILITADO or ruta["ttl_seg"] <= 0:
+                return await fn(*args, **kwargs)
+
+            clave = _clave(nombre, kwargs, _version(ruta))
+            ahora = time.monotonic()
+            entrada = _cache.get(clave)
+            if entrada is not None and entrada["expira"] > ahora:
+                ruta["hits"] += 1
+                return Response(entrada["body"], status_code=entrada["status"], media_type=entrada["media_type"])
+
+            tarea = _en_curso.get(clave)
+            if tarea is not None:
+                ruta["compartidos"] += 1
+            else:
+                tarea = asyncio.ensure_future(_calcular(ruta, clave, fn, args, kwargs))
+                _en_curso[clave] = tarea
+            # shield: si esta solicitud se cancela, las demás siguen esperando el cálculo
+            status, media_type, body = await asyncio.shield(tarea)
+            return Response(body, status_code=status, media_type=media_type)
+
+        return wrapper
+
+    return decorador
+
+
+async def _calcular(ruta, clave, fn, args, kwargs):
+    inicio = time.monotonic()
+    try:
+        status, media_type, body = _cuerpo(await fn(*args, **kwargs))
+    except Exception:
+        ruta["errores"] += 1
+        raise
+    finally:
+        _en_curso.pop(clave, None)
+    ahora = time.monotonic()
+    ruta["calculos"] += 1
+    ruta["ultimo_calculo_ms"] = round((ahora - inicio) * 1000, 1)
+    # Solo se guarda si no hubo escrituras mientras se calculaba
+    if status < 400 and clave[2] == _version(ruta):
+        _podar(ahora)
+        _cache[clave] = {"expira": ahora + ruta["ttl_seg"], "status": status,
+                         "media_type": media_type, "body": body}
+    return status, media_type, body
+
+
+def estado_coalescencia() -> dict:
+    rutas = []
+    for r in _rutas.values():
+        total = r["calculos"] + r["hits"] + r["compartidos"]
+        rutas.append({
+            **r,
+            "depende_de": list(r["depende_de"]),
+            "solicitudes": total,
+            "tasa_ahorro": round((r["hits"] + r["compartidos"]) / total, 4) if total else 0,
+        })
+    return {
+        "habilitado": COALESCER_HABILITADO,
+        "entradas_cache": len(_cache),
+        "en_curso": len(_en_curso),
+        "versiones": dict(_versiones),
+        "rutas": rutas,
+    }
+
+
+class InvalidacionEscrituras:
+    """Middleware ASGI: una escritura exitosa sube la versión de los prefijos que toca.
+
+    La versión se sube al enviar los headers (antes del cuerpo) para que un
+    cliente que escribe y luego lee no reciba el reporte anterior.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        async def _send(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                registrar_escritura(scope["path"])
+            await send(message)
+
+        await self.app(scope, receive, _send)
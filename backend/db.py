@@ -1,8 +1,12 @@
 # Database connection pool management
 import asyncpg
 import asyncio
+import contextvars
+import functools
 import os
 import logging
+import time
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
@@ -17,9 +21,185 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL no configurado en .env")
 
+# Réplica opcional para reportes de solo lectura (vacío = todo va al primario)
+REPORTES_DATABASE_URL = os.environ.get('REPORTES_DATABASE_URL', '')
+# Si la réplica va más atrasada que esto, las lecturas vuelven al primario
+REPORTES_MAX_LAG_SEG = float(os.environ.get('REPORTES_MAX_LAG_SEG', '30'))
+REPORTES_VERIFICAR_LAG_SEG = float(os.environ.get('REPORTES_VERIFICAR_LAG_SEG', '5'))
+# Sentencias preparadas que asyncpg conserva por conexión (default de asyncpg: 100)
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '200'))
+
 pool = None
+pool_reportes = None
+
+_solo_lectura = contextvars.ContextVar("solo_lectura", default=False)
+_replica = {
+    "lag_seg": None,
+    "disponible": False,
+    "error": None,
+    "verificado_en": 0.0,
+    "lecturas_replica": 0,
+    "lecturas_primario": 0,
+}
+_replica_lock = None
+
+# Métricas del statement cache de asyncpg (todas las conexiones de ambos pools)
+_statement_cache = {"aciertos": 0, "fallos": 0}
+# Hash del texto SQL -> veces que se preparó (textos distintos = formas de consulta)
+_sentencias_preparadas = {}
+_MAX_SENTENCIAS_DISTINTAS = 5000
+# max_cached_statement_lifetime por defecto de asyncpg
+_VIDA_SENTENCIA_SEG = 300
+
+
+class _CacheSentencias:
+    """Query logger (API pública `Connection.add_query_logger`) que estima el statement cache.
+
+    Replica por conexión la política de asyncpg (LRU de DB_STATEMENT_CACHE_SIZE
+    textos SQL que vencen a los _VIDA_SENTENCIA_SEG de prepararse) sin tocar
+    sus internos. Un fallo significa que la sentencia se tuvo que preparar
+    (parse + plan en el servidor). Consultas con forma fija
+    (filtros_sql.FiltrosSQL) deberían acercar la tasa de aciertos a 1.
+    Es una estimación: un `execute` sin argumentos (protocolo simple, que
+    asyncpg no prepara) cuenta igual que una consulta preparada.
+    """
+
+    def __init__(self):
+        self._lru = OrderedDict()
+
+    def __call__(self, registro):
+        if registro.exception is not None:
+            return
+        query = registro.query
+        ahora = time.monotonic()
+        preparada = self._lru.get(query)
+        if preparada is not None and ahora - preparada < _VIDA_SENTENCIA_SEG:
+            self._lru.move_to_end(query)
+            _statement_cache["aciertos"] += 1
+            return
+        _statement_cache["fallos"] += 1
+        h = hash(query)
+        if h in _sentencias_preparadas or len(_sentencias_preparadas) < _MAX_SENTENCIAS_DISTINTAS:
+            _sentencias_preparadas[h] = _sentencias_preparadas.get(h, 0) + 1
+        if DB_STATEMENT_CACHE_SIZE <= 0:
+            return
+        self._lru[query] = ahora
+        self._lru.move_to_end(query)
+        while len(self._lru) > DB_STATEMENT_CACHE_SIZE:
+            self._lru.popitem(last=False)
+
+
+async def _init_conexion(conn):
+    """`init` de los pools: registra el contador de sentencias en cada conexión nueva."""
+    if hasattr(conn, "add_query_logger"):
+        conn.add_query_logger(_CacheSentencias())
+
+
+def estado_statement_cache() -> dict:
+    total = _statement_cache["aciertos"] + _statement_cache["fallos"]
+    return {
+        "tamano_por_conexion": DB_STATEMENT_CACHE_SIZE,
+        "aciertos": _statement_cache["aciertos"],
+        "fallos": _statement_cache["fallos"],
+        "tasa_aciertos": round(_statement_cache["aciertos"] / total, 4) if total else None,
+        "sentencias_distintas": len(_sentencias_preparadas),
+        "repreparadas": sum(1 for v in _sentencias_preparadas.values() if v > 1),
+    }
+
+
+def solo_lectura(fn):
+    """Decorador para endpoints de reporte: dentro de ellos get_pool() entrega la réplica.
+
+    El endpoint no debe escribir (ni encolar jobs con el pool por defecto): en
+    una réplica real la transacción es de solo lectura.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = _solo_lectura.set(True)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _solo_lectura.reset(token)
+    return wrapper
+
 
 async def get_pool():
+    """Pool primario, o el de reportes si el endpoint es @solo_lectura y la réplica está al día."""
+    if _solo_lectura.get() and REPORTES_DATABASE_URL:
+        replica = await _get_pool_reportes_vigente()
+        if replica is not None:
+            _replica["lecturas_replica"] += 1
+            return replica
+        _replica["lecturas_primario"] += 1
+    return await get_primary_pool()
+
+
+async def _get_pool_reportes_vigente():
+    global pool_reportes, _replica_lock
+    if time.monotonic() - _replica["verificado_en"] < REPORTES_VERIFICAR_LAG_SEG:
+        return pool_reportes if _replica["disponible"] else None
+    if _replica_lock is None:
+        _replica_lock = asyncio.Lock()
+    async with _replica_lock:
+        if time.monotonic() - _replica["verificado_en"] < REPORTES_VERIFICAR_LAG_SEG:
+            return pool_reportes if _replica["disponible"] else None
+        try:
+            if pool_reportes is None or pool_reportes._closed:
+                pool_reportes = await asyncpg.create_pool(
+                    REPORTES_DATABASE_URL,
+                    min_size=1,
+                    max_size=10,
+                    command_timeout=60,
+                    max_inactive_connection_lifetime=30,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    init=_init_conexion,
+                    server_settings={"search_path": "produccion,public"},
+                )
+            lag = await _medir_lag(pool_reportes, await get_primary_pool())
+            _replica["lag_seg"] = lag
+            _replica["disponible"] = lag <= REPORTES_MAX_LAG_SEG
+            _replica["error"] = None if _replica["disponible"] else f"Réplica atrasada {lag:.1f}s"
+        except Exception as e:
+            _replica["disponible"] = False
+            _replica["error"] = str(e)[:300]
+            logger.warning(f"Réplica de reportes no disponible, se usa el primario: {e}")
+        _replica["verificado_en"] = time.monotonic()
+    return pool_reportes if _replica["disponible"] else None
+
+
+async def _medir_lag(replica, primario) -> float:
+    """Segundos de atraso de la réplica respecto al primario (0 si está al día).
+
+    Una instancia que no está en recuperación (p.ej. una segunda base local
+    para pruebas) se considera al día. Si la réplica ya aplicó todo el WAL del
+    primario el lag es 0 aunque la última transacción sea vieja.
+    """
+    estado = await replica.fetchrow("""
+        SELECT pg_is_in_recovery() as en_recuperacion,
+               pg_last_wal_replay_lsn()::text as replay_lsn,
+               EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())) as desde_ultima
+    """)
+    if not estado["en_recuperacion"]:
+        return 0.0
+    if estado["replay_lsn"] is None:
+        return float("inf")
+    pendiente = await primario.fetchval(
+        "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), $1::pg_lsn)", estado["replay_lsn"]
+    )
+    if pendiente is None or pendiente <= 0:
+        return 0.0
+    return float(estado["desde_ultima"] or 0)
+
+
+def estado_replica() -> dict:
+    return {
+        "configurada": bool(REPORTES_DATABASE_URL),
+        "max_lag_seg": REPORTES_MAX_LAG_SEG,
+        **{k: v for k, v in _replica.items() if k != "verificado_en"},
+    }
+
+
+async def get_primary_pool():
     global pool
     if pool is None or pool._closed:
         pool = await asyncpg.create_pool(
@@ -28,6 +208,8 @@ async def get_pool():
             max_size=10,
             command_timeout=30,
             max_inactive_connection_lifetime=30,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            init=_init_conexion,
             server_settings={"search_path": "produccion,public"},
         )
     return pool
@@ -39,7 +221,7 @@ async def safe_acquire(max_retries=2):
     last_error = None
     for attempt in range(max_retries + 1):
         try:
-            p = await get_pool()
+            p = await get_primary_pool()
             async with p.acquire() as conn:
                 yield conn
                 return
@@ -60,7 +242,10 @@ async def safe_acquire(max_retries=2):
     raise last_error
 
 async def close_pool():
-    global pool
+    global pool, pool_reportes
     if pool:
         await pool.close()
         pool = None
+    if pool_reportes:
+        await pool_reportes.close()
+        pool_reportes = None
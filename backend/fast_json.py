@@ -0,0 +1,80 @@
+"""Respuesta JSON rápida (orjson) y compresión gzip para payloads grandes.
+
+`FastJSONResponse` es la clase de respuesta por defecto de la app. Los endpoints
+pesados (listas completas, matriz, costura) la retornan directamente con las
+filas de asyncpg para saltarse `jsonable_encoder`: orjson serializa datetime,
+date y UUID de forma nativa y `_default` resuelve Decimal y asyncpg.Record.
+"""
+import os
+import datetime as dt
+from decimal import Decimal
+
+import asyncpg
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+# Respuestas por encima de este tamaño (bytes) se comprimen con gzip
+GZIP_MIN_SIZE = int(os.environ.get('GZIP_MIN_SIZE', '2048'))
+GZIP_COMPRESS_LEVEL = int(os.environ.get('GZIP_COMPRESS_LEVEL', '5'))
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Tipos que orjson no soporta de forma nativa.
+
+    Decimal se convierte igual que `jsonable_encoder` (int si no tiene
+    decimales en su exponente, float en otro caso) para no cambiar el contrato
+    de los endpoints existentes.
+    """
+    if isinstance(obj, Decimal):
+        if obj.as_tuple().exponent >= 0:
+            return int(obj)
+        return float(obj)
+    if isinstance(obj, asyncpg.Record):
+        return dict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, dt.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', errors='replace')
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class GZipSinEventStream(GZipMiddleware):
+    """GZip salvo para Server-Sent Events: el compresor retendría los eventos en su buffer.
+
+    El tipo de la respuesta se conoce recién al enviarla, así que se decide por
+    el Accept de la solicitud (EventSource siempre envía text/event-stream).
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for k, v in scope["headers"]:
+                if k == b"accept" and b"text/event-stream" in v:
+                    await self.app(scope, receive, send)
+                    return
+        await super().__call__(scope, receive, send)
+
+
+def add_gzip_middleware(app):
+    app.add_middleware(
+        GZipSinEventStream,
+        minimum_size=GZIP_MIN_SIZE,
+        compresslevel=GZIP_COMPRESS_LEVEL,
+    )
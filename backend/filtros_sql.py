@@ -0,0 +1,98 @@
+"""Filtros SQL de forma fija para que los listados reutilicen sentencias preparadas.
+
+Cada filtro se emite siempre, con su parámetro en NULL cuando no aplica:
+
+    ($2::text IS NULL OR r.modelo_id = $2)
+    ($3::text[] IS NULL OR r.estado = ANY($3))
+
+Así un listado genera el mismo texto SQL con cualquier combinación de filtros
+(y cualquier cantidad de valores en una lista), y el statement cache de asyncpg
+y el planner de Postgres lo reutilizan en vez de preparar una sentencia nueva
+por combinación. Las métricas del cache están en db.estado_statement_cache().
+
+asyncpg no convierte texto a date/timestamp: `desde`/`hasta` reciben el valor
+del query string y lo convierten aquí (400 si no es una fecha ISO).
+"""
+from datetime import date, datetime
+
+from fastapi import HTTPException
+
+
+def _o_none(valor):
+    """'' y listas vacías cuentan como filtro ausente."""
+    if valor is None or valor == "" or valor == []:
+        return None
+    return valor
+
+
+def _fecha(valor, tipo: str):
+    """'YYYY-MM-DD' (o ISO con hora) -> date / datetime según el tipo SQL; None sigue None."""
+    valor = _o_none(valor)
+    if valor is None or not isinstance(valor, str):
+        return valor
+    try:
+        if tipo == "date":
+            return date.fromisoformat(valor[:10])
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {valor} (formato YYYY-MM-DD)")
+
+
+def lista_csv(valor: str):
+    """'a, b,,c' -> ['a', 'b', 'c']; vacío -> None."""
+    return [v.strip() for v in (valor or "").split(",") if v.strip()] or None
+
+
+class FiltrosSQL:
+    """Acumula condiciones y parámetros; `where()` y `params` van directo a conn.fetch."""
+
+    def __init__(self):
+        self.condiciones = []
+        self.params = []
+
+    def param(self, valor) -> int:
+        """Agrega un parámetro y retorna su índice ($n)."""
+        self.params.append(valor)
+        return len(self.params)
+
+    def siguiente(self) -> int:
+        """Índice del próximo parámetro (p.ej. para LIMIT/OFFSET después del WHERE)."""
+        return len(self.params) + 1
+
+    def igual(self, columna: str, valor, tipo: str = "text"):
+        n = self.param(_o_none(valor))
+        self.condiciones.append(f"(${n}::{tipo} IS NULL OR {columna} = ${n})")
+        return self
+
+    def en(self, columna: str, valores, tipo: str = "text"):
+        n = self.param(_o_none(list(valores) if valores else None))
+        self.condiciones.append(f"(${n}::{tipo}[] IS NULL OR {columna} = ANY(${n}))")
+        return self
+
+    def no_en(self, columna: str, valores, tipo: str = "text"):
+        """Excluye los valores; las filas con la columna en NULL se mantienen."""
+        n = self.param(_o_none(list(valores) if valores else None))
+        self.condiciones.append(f"(${n}::{tipo}[] IS NULL OR {columna} IS NULL OR {columna} <> ALL(${n}))")
+        return self
+
+    def desde(self, columna: str, valor, tipo: str = "date"):
+        n = self.param(_fecha(valor, tipo))
+        self.condiciones.append(f"(${n}::{tipo} IS NULL OR {columna} >= ${n}::{tipo})")
+        return self
+
+    def hasta(self, columna: str, valor, tipo: str = "date"):
+        n = self.param(_fecha(valor, tipo))
+        self.condiciones.append(f"(${n}::{tipo} IS NULL OR {columna} <= ${n}::{tipo})")
+        return self
+
+    def si(self, valor, predicado, tipo: str = "text"):
+        """Condición arbitraria que solo aplica si `valor` no es NULL.
+
+        `predicado(n)` recibe el índice del parámetro, p.ej. predicado_registros.
+        """
+        n = self.param(_o_none(valor))
+        self.condiciones.append(f"(${n}::{tipo} IS NULL OR {predicado(n)})")
+        return self
+
+    def where(self) -> str:
+        return " AND ".join(self.condiciones) if self.condiciones else "TRUE"
@@ -66,3 +66,218 @@ def limpiar_datos_sensibles(datos: dict) -> dict:
         if campo in datos_limpio:
             datos_limpio[campo] = '***'
     return datos_limpio
+
+
+# ==================== AGREGADOS MANTENIDOS DE INVENTARIO ====================
+# prod_inventario.stock_reservado / valor_inventario / stock_capas se mantienen
+# desde las rutas de reservas, salidas, ingresos y ajustes, para que la lista de
+# inventario, alertas-stock y stock-por-linea no agreguen capas/reservas por fila.
+
+_AGREGADOS_INVENTARIO_SET = """
+    stock_reservado = COALESCE((
+        SELECT SUM(rl.cantidad_reservada - rl.cantidad_liberada)
+        FROM prod_inventario_reservas_linea rl
+        JOIN prod_inventario_reservas r ON rl.reserva_id = r.id
+        WHERE rl.item_id = i.id AND r.estado = 'ACTIVA'
+    ), 0),
+    valor_inventario = COALESCE((
+        SELECT SUM(ing.cantidad_disponible * ing.costo_unitario)
+        FROM prod_inventario_ingresos ing
+        WHERE ing.item_id = i.id AND ing.cantidad_disponible > 0
+    ), 0),
+    stock_capas = COALESCE((
+        SELECT SUM(ing.cantidad_disponible)
+        FROM prod_inventario_ingresos ing
+        WHERE ing.item_id = i.id AND ing.cantidad_disponible > 0
+    ), 0)
+"""
+
+
+async def refrescar_agregados_inventario(conn, item_ids):
+    """Recalcula los agregados mantenidos de los items indicados (usa índices por item_id)."""
+    ids = [i for i in set(item_ids or []) if i]
+    if not ids:
+        return
+    await conn.execute(
+        f"UPDATE prod_inventario i SET {_AGREGADOS_INVENTARIO_SET} WHERE i.id = ANY($1::varchar[])",
+        ids
+    )
+
+
+async def refrescar_agregados_por_registro(conn, registro_id: str):
+    """Recalcula los agregados de todos los items con reservas del registro."""
+    rows = await conn.fetch("""
+        SELECT DISTINCT rl.item_id
+        FROM prod_inventario_reservas_linea rl
+        JOIN prod_inventario_reservas r ON rl.reserva_id = r.id
+        WHERE r.registro_id = $1
+    """, registro_id)
+    await refrescar_agregados_inventario(conn, [r['item_id'] for r in rows])
+
+
+async def recalcular_agregados_inventario(conn) -> int:
+    """Reconstruye los agregados de todo el inventario en un solo UPDATE set-based.
+
+    Solo escribe las filas cuyo valor cambió; retorna la cantidad de items corregidos.
+    """
+    result = await conn.execute("""
+        WITH res AS (
+            SELECT rl.item_id, SUM(rl.cantidad_reservada - rl.cantidad_liberada) as reservado
+            FROM prod_inventario_reservas_linea rl
+            JOIN prod_inventario_reservas r ON rl.reserva_id = r.id
+            WHERE r.estado = 'ACTIVA'
+            GROUP BY rl.item_id
+        ), capas AS (
+            SELECT item_id,
+                   SUM(cantidad_disponible * costo_unitario) as valor,
+                   SUM(cantidad_disponible) as cantidad
+            FROM prod_inventario_ingresos
+            WHERE cantidad_disponible > 0
+            GROUP BY item_id
+        ), calc AS (
+            SELECT i.id,
+                   COALESCE(res.reservado, 0) as reservado,
+                   COALESCE(capas.valor, 0) as valor,
+                   COALESCE(capas.cantidad, 0) as cantidad
+            FROM prod_inventario i
+            LEFT JOIN res ON res.item_id = i.id
+            LEFT JOIN capas ON capas.item_id = i.id
+        )
+        UPDATE prod_inventario i
+        SET stock_reservado = calc.reservado,
+            valor_inventario = calc.valor,
+            stock_capas = calc.cantidad
+        FROM calc
+        WHERE calc.id = i.id
+          AND (i.stock_reservado IS DISTINCT FROM calc.reservado
+               OR i.valor_inventario IS DISTINCT FROM calc.valor
+               OR i.stock_capas IS DISTINCT FROM calc.cantidad)
+    """)
+    return int(result.split()[-1]) if result else 0
+
+
+# ==================== RESUMEN WIP MANTENIDO ====================
+
+_WIP_RESUMEN_DELTA = """
+    INSERT INTO prod_wip_resumen AS w
+        (orden_id, costo_mp, costo_servicio, costo_ajuste, costo_total, total_movimientos, updated_at)
+    SELECT orden_id,
+           SUM(CASE WHEN origen_tipo = 'CONSUMO_MP' THEN costo ELSE 0 END),
+           SUM(CASE WHEN origen_tipo = 'SERVICIO' THEN costo ELSE 0 END),
+           SUM(CASE WHEN origen_tipo = 'AJUSTE' THEN costo ELSE 0 END),
+           SUM(costo), SUM(n), NOW()
+    FROM delta
+    GROUP BY orden_id
+    ON CONFLICT (orden_id) DO UPDATE SET
+        costo_mp = w.costo_mp + EXCLUDED.costo_mp,
+        costo_servicio = w.costo_servicio + EXCLUDED.costo_servicio,
+        costo_ajuste = w.costo_ajuste + EXCLUDED.costo_ajuste,
+        costo_total = w.costo_total + EXCLUDED.costo_total,
+        total_movimientos = w.total_movimientos + EXCLUDED.total_movimientos,
+        updated_at = NOW()
+"""
+
+
+async def registrar_wip(conn, empresa_id: int, orden_id: str, origen_tipo: str,
+                        origen_id: str, costo: float, fecha, descripcion: str):
+    """Registra un movimiento WIP y suma su costo a prod_wip_resumen."""
+    wip_id = str(uuid.uuid4())
+    await conn.execute(f"""
+        WITH delta AS (
+            INSERT INTO prod_wip_movimiento
+            (id, empresa_id, orden_id, origen_tipo, origen_id, costo, fecha, descripcion)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            RETURNING orden_id, origen_tipo, costo, 1 as n
+        )
+        {_WIP_RESUMEN_DELTA}
+    """, wip_id, empresa_id, orden_id, origen_tipo, origen_id, costo, fecha, descripcion)
+    return wip_id
+
+
+async def eliminar_wip_origen(conn, origen_tipo: str, origen_id: str):
+    """Revierte los movimientos WIP de un origen (consumo, servicio) y los resta del resumen."""
+    await conn.execute(f"""
+        WITH delta AS (
+            DELETE FROM prod_wip_movimiento
+            WHERE origen_tipo = $1 AND origen_id = $2
+            RETURNING orden_id, origen_tipo, -costo as costo, -1 as n
+        )
+        {_WIP_RESUMEN_DELTA}
+    """, origen_tipo, origen_id)
+    await conn.execute("DELETE FROM prod_wip_resumen WHERE total_movimientos <= 0")
+
+
+async def recalcular_wip_resumen(conn, dry_run: bool = False) -> dict:
+    """Verifica prod_wip_resumen contra el ledger prod_wip_movimiento y corrige las diferencias.
+
+    dry_run=true solo reporta las órdenes descuadradas.
+    """
+    diferencias = await conn.fetch("""
+        WITH ledger AS (
+            SELECT orden_id,
+                   SUM(CASE WHEN origen_tipo = 'CONSUMO_MP' THEN costo ELSE 0 END) as costo_mp,
+                   SUM(CASE WHEN origen_tipo = 'SERVICIO' THEN costo ELSE 0 END) as costo_servicio,
+                   SUM(CASE WHEN origen_tipo = 'AJUSTE' THEN costo ELSE 0 END) as costo_ajuste,
+                   SUM(costo) as costo_total,
+                   COUNT(*)::int as total_movimientos
+            FROM prod_wip_movimiento
+            GROUP BY orden_id
+        )
+        SELECT COALESCE(l.orden_id, w.orden_id) as orden_id,
+               w.costo_total as resumen_costo_total, l.costo_total as ledger_costo_total,
+               w.total_movimientos as resumen_movimientos, l.total_movimientos as ledger_movimientos
+        FROM ledger l
+        FULL JOIN prod_wip_resumen w ON w.orden_id = l.orden_id
+        WHERE w.orden_id IS NULL OR l.orden_id IS NULL
+           OR w.costo_mp IS DISTINCT FROM l.costo_mp
+           OR w.costo_servicio IS DISTINCT FROM l.costo_servicio
+           OR w.costo_ajuste IS DISTINCT FROM l.costo_ajuste
+           OR w.costo_total IS DISTINCT FROM l.costo_total
+           OR w.total_movimientos IS DISTINCT FROM l.total_movimientos
+    """)
+    ordenes = [d['orden_id'] for d in diferencias]
+    if ordenes and not dry_run:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM prod_wip_resumen WHERE orden_id = ANY($1::varchar[])", ordenes)
+            await conn.execute("""
+                INSERT INTO prod_wip_resumen
+                    (orden_id, costo_mp, costo_servicio, costo_ajuste, costo_total, total_movimientos, updated_at)
+                SELECT orden_id,
+                       SUM(CASE WHEN origen_tipo = 'CONSUMO_MP' THEN costo ELSE 0 END),
+                       SUM(CASE WHEN origen_tipo = 'SERVICIO' THEN costo ELSE 0 END),
+                       SUM(CASE WHEN origen_tipo = 'AJUSTE' THEN costo ELSE 0 END),
+                       SUM(costo), COUNT(*), NOW()
+                FROM prod_wip_movimiento
+                WHERE orden_id = ANY($1::varchar[])
+                GROUP BY orden_id
+            """, ordenes)
+    return {
+        "dry_run": dry_run,
+        "ordenes_corregidas": len(ordenes),
+        "detalle": [{
+            "orden_id": d['orden_id'],
+            "resumen_costo_total": float(d['resumen_costo_total'] or 0),
+            "ledger_costo_total": float(d['ledger_costo_total'] or 0),
+            "resumen_movimientos": d['resumen_movimientos'] or 0,
+            "ledger_movimientos": d['ledger_movimientos'] or 0,
+        } for d in diferencias],
+    }
+
+
+# ==================== SNAPSHOT DE COSTOS POR REGISTRO ====================
+
+async def invalidar_snapshot_costos(conn, registro_ids):
+    """Descarta el snapshot de costos de los registros; se reconstruye en la próxima lectura (ver routes/cierre.py)."""
+    ids = sorted(i for i in set(registro_ids or []) if i)
+    if not ids:
+        return
+    # Mismo lock por registro que la construcción del snapshot: un build concurrente
+    # termina antes del DELETE y nunca deja guardado un snapshot anterior al write.
+    # Los locks se toman en orden de id para que dos invalidaciones no se crucen
+    await conn.execute("""
+        SELECT pg_advisory_xact_lock(hashtext('costo_snapshot:' || x.id))
+        FROM (SELECT id FROM unnest($1::varchar[]) AS id ORDER BY id) x
+    """, ids)
+    await conn.execute(
+        "DELETE FROM prod_registro_costo_snapshot WHERE registro_id = ANY($1::varchar[])", ids
+    )
@@ -0,0 +1,234 @@
+"""Claves de idempotencia (header Idempotency-Key) para POSTs que consumen o registran costos.
+
+Un reintento del cliente tras un timeout no debe volver a consumir capas FIFO ni
+duplicar movimientos. Si la solicitud trae `Idempotency-Key`, el middleware
+guarda la respuesta exitosa en prod_idempotencia bajo (usuario, método, ruta,
+clave), donde usuario es el `sub` del JWT (no el token: un cliente que renueva
+el token entre reintentos sigue deduplicando); un reintento con la misma clave recibe la respuesta guardada sin
+volver a ejecutar el endpoint (header `Idempotent-Replayed: true`).
+
+- Misma clave con otro cuerpo: 422.
+- Misma clave mientras la primera sigue en curso: 409 (reintentar luego).
+- Respuestas >= 400 no se guardan: la clave se libera y el reintento se ejecuta.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+
+from jose import JWTError, jwt
+
+from db import get_pool
+from auth_utils import SECRET_KEY, ALGORITHM
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCIA_TTL_HORAS = float(os.environ.get('IDEMPOTENCIA_TTL_HORAS', '24'))
+# Una clave EN_CURSO más vieja que esto se considera abandonada (worker caído)
+IDEMPOTENCIA_BLOQUEO_SEG = int(os.environ.get('IDEMPOTENCIA_BLOQUEO_SEG', '300'))
+
+RUTAS_IDEMPOTENTES = [
+    ("POST", re.compile(r"^/api/inventario-salidas$")),
+    ("POST", re.compile(r"^/api/inventario-ingresos$")),
+    ("POST", re.compile(r"^/api/movimientos-produccion$")),
+    ("POST", re.compile(r"^/api/consumos$")),
+    ("POST", re.compile(r"^/api/registros/[^/]+/cierre-produccion$")),
+]
+
+_MAX_CLAVE = 255
+
+
+async def init_idempotencia_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS prod_idempotencia (
+            usuario_hash VARCHAR NOT NULL,
+            metodo VARCHAR NOT NULL,
+            ruta VARCHAR NOT NULL,
+            clave VARCHAR NOT NULL,
+            request_hash VARCHAR NOT NULL,
+            estado VARCHAR NOT NULL DEFAULT 'EN_CURSO',
+            status_code INT,
+            media_type VARCHAR,
+            respuesta BYTEA,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completado_at TIMESTAMP,
+            PRIMARY KEY (usuario_hash, metodo, ruta, clave)
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_idempotencia_created ON prod_idempotencia(created_at)"
+    )
+
+
+def _es_idempotente(metodo: str, path: str) -> bool:
+    return any(m == metodo and patron.match(path) for m, patron in RUTAS_IDEMPOTENTES)
+
+
+def _usuario(scope):
+    """`sub` del JWT del header Authorization; None si falta o no es válido."""
+    auth = _header(scope, b"authorization") or ""
+    esquema, _, token = auth.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token.strip(), SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+
+def _header(scope, nombre: bytes):
+    for k, v in scope.get("headers", []):
+        if k.lower() == nombre:
+            return v.decode("latin-1")
+    return None
+
+
+async def _reservar(conn, ident: tuple, request_hash: str):
+    """Inserta la clave EN_CURSO; si ya existe retorna la fila previa (o None si se tomó)."""
+    for _ in range(3):
+        previa = await _intentar_reserva(conn, ident, request_hash)
+        if previa is not False:
+            return previa
+    return {"request_hash": request_hash, "estado": "EN_CURSO"}
+
+
+async def _intentar_reserva(conn, ident: tuple, request_hash: str):
+    """None = reservada; fila = ya existía; False = la fila previa desapareció entre medio."""
+    fila = await conn.fetchrow(f"""
+        INSERT INTO prod_idempotencia (usuario_hash, metodo, ruta, clave, request_hash)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (usuario_hash, metodo, ruta, clave) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash, estado = 'EN_CURSO', status_code = NULL,
+                media_type = NULL, respuesta = NULL, created_at = CURRENT_TIMESTAMP, completado_at = NULL
+            WHERE prod_idempotencia.created_at < CURRENT_TIMESTAMP - INTERVAL '{IDEMPOTENCIA_TTL_HORAS} hours'
+               OR (prod_idempotencia.estado = 'EN_CURSO'
+                   AND prod_idempotencia.created_at < CURRENT_TIMESTAMP - INTERVAL '{IDEMPOTENCIA_BLOQUEO_SEG} seconds')
+        RETURNING estado
+    """, *ident, request_hash)
+    if fila is not None:
+        return None
+    previa = await conn.fetchrow("""
+        SELECT request_hash, estado, status_code, media_type, respuesta
+        FROM prod_idempotencia
+        WHERE usuario_hash = $1 AND metodo = $2 AND ruta = $3 AND clave = $4
+    """, *ident)
+    return previa if previa is not None else False
+
+
+async def _enviar(send, status: int, body: bytes, media_type: str, extra_headers=()):
+    headers = [(b"content-type", media_type.encode()), (b"content-length", str(len(body)).encode())]
+    headers.extend(extra_headers)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _error(send, status: int, detalle: str):
+    body = json.dumps({"detail": detalle}, ensure_ascii=False).encode("utf-8")
+    await _enviar(send, status, body, "application/json")
+
+
+class IdempotenciaMiddleware:
+    """Middleware ASGI para las rutas de RUTAS_IDEMPOTENTES que traen Idempotency-Key."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _es_idempotente(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        clave = _header(scope, b"idempotency-key")
+        if not clave:
+            await self.app(scope, receive, send)
+            return
+        if len(clave) > _MAX_CLAVE:
+            await _error(send, 400, f"Idempotency-Key excede {_MAX_CLAVE} caracteres")
+            return
+        usuario = _usuario(scope)
+        if usuario is None:
+            # Sin usuario autenticado el endpoint responde 401: no hay nada que deduplicar
+            await self.app(scope, receive, send)
+            return
+
+        # Leer el cuerpo completo para calcular su hash y reinyectarlo al endpoint
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        cuerpo = b"".join(chunks)
+        request_hash = hashlib.sha256(scope.get("query_string", b"") + b"\0" + cuerpo).hexdigest()
+        usuario_hash = hashlib.sha256(str(usuario).encode()).hexdigest()
+        ident = (usuario_hash, scope["method"], scope["path"], clave)
+
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            previa = await _reservar(conn, ident, request_hash)
+        if previa is not None:
+            if previa["request_hash"] != request_hash:
+                await _error(send, 422, "Idempotency-Key ya usada con otra solicitud")
+            elif previa["estado"] != "COMPLETADO":
+                await _error(send, 409, "Solicitud con esta Idempotency-Key aún en proceso")
+            else:
+                await _enviar(send, previa["status_code"], bytes(previa["respuesta"]),
+                              previa["media_type"] or "application/json",
+                              [(b"idempotent-replayed", b"true")])
+            return
+
+        entregado = False
+
+        async def _receive():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            return await receive()
+
+        respuesta = {"status": 500, "media_type": None, "body": []}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                respuesta["status"] = message["status"]
+                respuesta["media_type"] = _header(message, b"content-type")
+            elif message["type"] == "http.response.body":
+                respuesta["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, _receive, _send)
+        finally:
+            await self._registrar(ident, respuesta)
+
+    async def _registrar(self, ident, respuesta):
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                if respuesta["status"] < 400:
+                    await conn.execute("""
+                        UPDATE prod_idempotencia
+                        SET estado = 'COMPLETADO', status_code = $5, media_type = $6, respuesta = $7,
+                            completado_at = CURRENT_TIMESTAMP
+                        WHERE usuario_hash = $1 AND metodo = $2 AND ruta = $3 AND clave = $4
+                    """, *ident, respuesta["status"], respuesta["media_type"], b"".join(respuesta["body"]))
+                else:
+                    await conn.execute("""
+                        DELETE FROM prod_idempotencia
+                        WHERE usuario_hash = $1 AND metodo = $2 AND ruta = $3 AND clave = $4
+                    """, *ident)
+        except Exception:
+            logger.exception(f"Idempotencia: no se pudo registrar la respuesta de {ident[1]} {ident[2]}")
+
+
+async def tarea_limpiar_idempotencia():
+    """Tarea periódica: borra claves vencidas (IDEMPOTENCIA_TTL_HORAS)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        resultado = await conn.execute(f"""
+            DELETE FROM prod_idempotencia
+            WHERE created_at < CURRENT_TIMESTAMP - INTERVAL '{IDEMPOTENCIA_TTL_HORAS} hours'
+        """)
+    return {"claves_eliminadas": int(resultado.split()[-1])}
@@ -0,0 +1,413 @@
+"""Trabajos en segundo plano (jobs) persistidos en prod_jobs.
+
+Las operaciones pesadas (backups, reportes completos, reconciliaciones) se
+encolan como filas PENDIENTE y las ejecuta un despachador dentro del proceso de
+la API con concurrencia acotada (JOBS_CONCURRENCIA por worker). Con varios
+workers de uvicorn cada uno reclama pendientes con FOR UPDATE SKIP LOCKED, así
+que un job corre una sola vez. El progreso y la solicitud de cancelación viven
+en la fila; el resultado queda como archivo en JOBS_DIR (disco local).
+
+Los jobs usan su propio pool de conexiones con JOBS_COMMAND_TIMEOUT en lugar de
+los 30s del pool de la API.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+import asyncpg
+
+from db import DATABASE_URL, get_primary_pool
+
+logger = logging.getLogger(__name__)
+
+JOBS_CONCURRENCIA = int(os.environ.get('JOBS_CONCURRENCIA', '2'))
+JOBS_DIR = Path(os.environ.get('JOBS_DIR', str(Path(__file__).parent / 'jobs_data')))
+JOBS_COMMAND_TIMEOUT = float(os.environ.get('JOBS_COMMAND_TIMEOUT', '900'))
+JOBS_RETENCION_HORAS = float(os.environ.get('JOBS_RETENCION_HORAS', '72'))
+
+_POLL_SEG = 5
+_LATIDO_SEG = 15
+_LATIDO_VENCIDO_SEG = 120
+_PROGRESO_MIN_SEG = 1.0
+
+ESTADOS_JOB = ("PENDIENTE", "EJECUTANDO", "COMPLETADO", "ERROR", "CANCELADO")
+ESTADOS_FINALES = ("COMPLETADO", "ERROR", "CANCELADO")
+
+_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobCancelado(Exception):
+    pass
+
+
+_tipos = {}
+_en_curso = {}
+_pool_jobs = None
+_despachador = None
+_latido = None
+_despertar = None
+_deteniendo = False
+_stats = {"ejecutados": 0, "completados": 0, "errores": 0, "cancelados": 0}
+
+
+# ==================== TABLAS ====================
+
+async def init_jobs_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS prod_jobs (
+            id VARCHAR PRIMARY KEY,
+            tipo VARCHAR NOT NULL,
+            estado VARCHAR NOT NULL DEFAULT 'PENDIENTE',
+            params JSONB NOT NULL DEFAULT '{}'::jsonb,
+            progreso NUMERIC NOT NULL DEFAULT 0,
+            mensaje TEXT,
+            error TEXT,
+            resultado_nombre VARCHAR,
+            resultado_media_type VARCHAR,
+            resultado_bytes BIGINT,
+            usuario_id VARCHAR,
+            usuario_nombre VARCHAR,
+            worker VARCHAR,
+            cancelar_solicitado BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            heartbeat_at TIMESTAMP
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_pendientes ON prod_jobs(created_at) WHERE estado = 'PENDIENTE'"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_usuario ON prod_jobs(usuario_id, created_at DESC)"
+    )
+
+
+# ==================== REGISTRO DE TIPOS ====================
+
+def registrar_tipo_job(tipo: str, fn, descripcion: str = "", solo_admin: bool = False):
+    """Registra `fn(ctx: ContextoJob)` como ejecutor de `tipo`.
+
+    La función retorna un dict (se guarda como resultado.json) o guarda su
+    propio archivo con ctx.guardar_archivo() y retorna un resumen.
+    """
+    _tipos[tipo] = {"fn": fn, "descripcion": descripcion, "solo_admin": solo_admin}
+
+
+def tipos_job():
+    return [
+        {"tipo": t, "descripcion": v["descripcion"], "solo_admin": v["solo_admin"]}
+        for t, v in sorted(_tipos.items())
+    ]
+
+
+def tipo_job_registrado(tipo: str):
+    return _tipos.get(tipo)
+
+
+# ==================== CONTEXTO DE EJECUCIÓN ====================
+
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return str(v)
+
+
+def directorio_job(job_id: str) -> Path:
+    return JOBS_DIR / job_id
+
+
+class ContextoJob:
+    """Lo que recibe la función de un job: parámetros, usuario, conexión, progreso y salida."""
+
+    def __init__(self, job):
+        self.job_id = job["id"]
+        self.tipo = job["tipo"]
+        self.params = json.loads(job["params"]) if isinstance(job["params"], str) else dict(job["params"] or {})
+        self.usuario = {"id": job["usuario_id"], "username": job["usuario_nombre"]}
+        self.directorio = directorio_job(self.job_id)
+        self.resultado = None
+        self._ultimo_progreso = 0.0
+
+    def conexion(self):
+        """`async with ctx.conexion() as conn:` — conexión del pool de jobs (sin el timeout de 30s)."""
+        return _pool_jobs.acquire()
+
+    async def progreso(self, porcentaje: float, mensaje: str = None, forzar: bool = False):
+        """Reporta avance (0-100). Lanza JobCancelado si se pidió cancelar."""
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo_progreso < _PROGRESO_MIN_SEG:
+            return
+        self._ultimo_progreso = ahora
+        pool = await get_primary_pool()
+        cancelar = await pool.fetchval("""
+            UPDATE prod_jobs SET progreso = $2, mensaje = COALESCE($3, mensaje), heartbeat_at = NOW()
+            WHERE id = $1
+            RETURNING cancelar_solicitado
+        """, self.job_id, round(max(0.0, min(float(porcentaje), 100.0)), 2), mensaje)
+        if cancelar:
+            raise JobCancelado()
+
+    def guardar_archivo(self, nombre: str, contenido: bytes, media_type: str):
+        """Escribe el archivo resultado del job en su directorio."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        (self.directorio / nombre).write_bytes(contenido)
+        self.resultado = {"nombre": nombre, "media_type": media_type, "bytes": len(contenido)}
+
+    def archivo_entrada(self, nombre: str) -> Path:
+        """Ruta de un archivo adjuntado al encolar (ver encolar_job(archivos=...))."""
+        return self.directorio / "entrada" / nombre
+
+
+# ==================== ENCOLAR / CONSULTAR / CANCELAR ====================
+
+async def encolar_job(tipo: str, params: dict, usuario: dict, archivos: dict = None) -> dict:
+    """Inserta un job PENDIENTE y despierta al despachador.
+
+    `archivos` = {nombre: bytes} se guardan en disco antes de encolar (p.ej. el
+    JSON de un restore), para no pasar blobs por la tabla.
+    """
+    if tipo not in _tipos:
+        raise ValueError(f"Tipo de job desconocido: {tipo}")
+    job_id = str(uuid.uuid4())
+    if archivos:
+        entrada = directorio_job(job_id) / "entrada"
+        entrada.mkdir(parents=True, exist_ok=True)
+        for nombre, contenido in archivos.items():
+            (entrada / nombre).write_bytes(contenido)
+    pool = await get_primary_pool()
+    await pool.execute("""
+        INSERT INTO prod_jobs (id, tipo, params, usuario_id, usuario_nombre)
+        VALUES ($1, $2, $3::jsonb, $4, $5)
+    """, job_id, tipo, json.dumps(params or {}, default=_json_default),
+        (usuario or {}).get("id"), (usuario or {}).get("username"))
+    if _despertar is not None:
+        _despertar.set()
+    return {"job_id": job_id, "tipo": tipo, "estado": "PENDIENTE", "url": f"/api/jobs/{job_id}"}
+
+
+def job_publico(row) -> dict:
+    d = dict(row)
+    d["params"] = json.loads(d["params"]) if isinstance(d["params"], str) else d["params"]
+    d["progreso"] = float(d["progreso"] or 0)
+    inicio, fin = d.get("started_at"), d.get("finished_at")
+    d["duracion_ms"] = round((fin - inicio).total_seconds() * 1000) if inicio and fin else None
+    resultado = {k: d.pop(f"resultado_{k}") for k in ("nombre", "media_type", "bytes")}
+    d["resultado"] = (
+        {**resultado, "url": f"/api/jobs/{d['id']}/resultado"} if d["estado"] == "COMPLETADO" else None
+    )
+    d.pop("heartbeat_at", None)
+    for k in ("created_at", "started_at", "finished_at"):
+        if d.get(k):
+            d[k] = d[k].isoformat()
+    return d
+
+
+async def cancelar_job(conn, job_id: str):
+    """PENDIENTE pasa a CANCELADO de inmediato; EJECUTANDO queda marcado y el worker lo corta.
+
+    Retorna la fila actualizada o None si el job no existe o ya terminó.
+    """
+    row = await conn.fetchrow("""
+        UPDATE prod_jobs
+        SET cancelar_solicitado = TRUE,
+            estado = CASE WHEN estado = 'PENDIENTE' THEN 'CANCELADO' ELSE estado END,
+            finished_at = CASE WHEN estado = 'PENDIENTE' THEN NOW() ELSE finished_at END
+        WHERE id = $1 AND estado IN ('PENDIENTE', 'EJECUTANDO')
+        RETURNING *
+    """, job_id)
+    task = _en_curso.get(job_id)
+    if row is not None and task is not None:
+        task.cancel()
+    return row
+
+
+# ==================== EJECUCIÓN ====================
+
+async def _get_pool_jobs():
+    global _pool_jobs
+    if _pool_jobs is None or _pool_jobs._closed:
+        _pool_jobs = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=0,
+            max_size=JOBS_CONCURRENCIA + 1,
+            command_timeout=JOBS_COMMAND_TIMEOUT or None,
+            max_inactive_connection_lifetime=30,
+            server_settings={"search_path": "produccion,public"},
+        )
+    return _pool_jobs
+
+
+async def _reclamar_job():
+    pool = await get_primary_pool()
+    return await pool.fetchrow("""
+        UPDATE prod_jobs SET estado = 'EJECUTANDO', started_at = NOW(), heartbeat_at = NOW(), worker = $2
+        WHERE id = (
+            SELECT id FROM prod_jobs
+            WHERE estado = 'PENDIENTE' AND tipo = ANY($1::text[])
+            ORDER BY created_at
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING *
+    """, list(_tipos), _WORKER_ID)
+
+
+async def _finalizar(job_id: str, estado: str, error: str = None, resultado: dict = None):
+    resultado = resultado or {}
+    pool = await get_primary_pool()
+    await pool.execute("""
+        UPDATE prod_jobs
+        SET estado = $2, error = $3, finished_at = NOW(), heartbeat_at = NOW(),
+            progreso = CASE WHEN $2 = 'COMPLETADO' THEN 100 ELSE progreso END,
+            resultado_nombre = $4, resultado_media_type = $5, resultado_bytes = $6
+        WHERE id = $1
+    """, job_id, estado, error, resultado.get("nombre"), resultado.get("media_type"), resultado.get("bytes"))
+
+
+async def _ejecutar(job):
+    ctx = ContextoJob(job)
+    _stats["ejecutados"] += 1
+    try:
+        salida = await _tipos[job["tipo"]]["fn"](ctx)
+        if ctx.resultado is None:
+            contenido = json.dumps(salida, ensure_ascii=False, default=_json_default).encode("utf-8")
+            ctx.guardar_archivo("resultado.json", contenido, "application/json")
+        await _finalizar(ctx.job_id, "COMPLETADO", resultado=ctx.resultado)
+        _stats["completados"] += 1
+    except (asyncio.CancelledError, JobCancelado):
+        if _deteniendo:
+            await _finalizar(ctx.job_id, "ERROR", error="Interrumpido por reinicio del servidor")
+            _stats["errores"] += 1
+        else:
+            await _finalizar(ctx.job_id, "CANCELADO")
+            _stats["cancelados"] += 1
+    except Exception as e:
+        logger.exception(f"Job {ctx.job_id} ({ctx.tipo}) falló")
+        await _finalizar(ctx.job_id, "ERROR", error=str(e)[:2000])
+        _stats["errores"] += 1
+    finally:
+        shutil.rmtree(ctx.directorio / "entrada", ignore_errors=True)
+
+
+async def _despachar():
+    cupos = asyncio.Semaphore(JOBS_CONCURRENCIA)
+    while True:
+        await cupos.acquire()
+        try:
+            job = await _reclamar_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Jobs: error reclamando trabajo pendiente")
+            job = None
+        if job is None:
+            cupos.release()
+            try:
+                await asyncio.wait_for(_despertar.wait(), _POLL_SEG)
+            except asyncio.TimeoutError:
+                pass
+            _despertar.clear()
+            continue
+        task = asyncio.create_task(_ejecutar(job))
+        _en_curso[job["id"]] = task
+
+        def _liberar(_t, job_id=job["id"]):
+            _en_curso.pop(job_id, None)
+            cupos.release()
+
+        task.add_done_callback(_liberar)
+
+
+async def _latir():
+    """Heartbeat de los jobs en curso; corta los cancelados desde otro worker y cierra huérfanos."""
+    while True:
+        await asyncio.sleep(_LATIDO_SEG)
+        try:
+            pool = await get_primary_pool()
+            if _en_curso:
+                cancelados = await pool.fetch("""
+                    UPDATE prod_jobs SET heartbeat_at = NOW()
+                    WHERE id = ANY($1::text[]) AND estado = 'EJECUTANDO'
+                    RETURNING id, cancelar_solicitado
+                """, list(_en_curso))
+                for r in cancelados:
+                    if r["cancelar_solicitado"] and r["id"] in _en_curso:
+                        _en_curso[r["id"]].cancel()
+            # Jobs de un worker que murió sin cerrarlos
+            await pool.execute(f"""
+                UPDATE prod_jobs
+                SET estado = 'ERROR', error = 'Interrumpido: el worker dejó de responder', finished_at = NOW()
+                WHERE estado = 'EJECUTANDO'
+                  AND heartbeat_at < NOW() - INTERVAL '{_LATIDO_VENCIDO_SEG} seconds'
+            """)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Jobs: error en heartbeat")
+
+
+async def iniciar_jobs():
+    global _despachador, _latido, _despertar, _deteniendo
+    if _despachador is not None or JOBS_CONCURRENCIA <= 0:
+        return
+    _deteniendo = False
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    await _get_pool_jobs()
+    _despertar = asyncio.Event()
+    _despachador = asyncio.create_task(_despachar())
+    _latido = asyncio.create_task(_latir())
+    logger.info(f"Jobs: despachador iniciado ({JOBS_CONCURRENCIA} en paralelo, resultados en {JOBS_DIR})")
+
+
+async def detener_jobs():
+    global _despachador, _latido, _deteniendo, _pool_jobs
+    _deteniendo = True
+    for task in (_despachador, _latido, *list(_en_curso.values())):
+        if task is not None:
+            task.cancel()
+    for task in (_despachador, _latido, *list(_en_curso.values())):
+        if task is not None:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+    _despachador = _latido = None
+    if _pool_jobs is not None:
+        await _pool_jobs.close()
+        _pool_jobs = None
+
+
+def estado_jobs() -> dict:
+    return {
+        "worker": _WORKER_ID,
+        "activo": _despachador is not None,
+        "concurrencia": JOBS_CONCURRENCIA,
+        "en_curso": list(_en_curso),
+        "directorio": str(JOBS_DIR),
+        **_stats,
+    }
+
+
+async def tarea_limpiar_jobs():
+    """Tarea periódica: borra jobs terminados (y sus archivos) más viejos que JOBS_RETENCION_HORAS."""
+    pool = await get_primary_pool()
+    ids = await pool.fetch(f"""
+        DELETE FROM prod_jobs
+        WHERE estado = ANY($1::text[])
+          AND finished_at < NOW() - INTERVAL '{JOBS_RETENCION_HORAS} hours'
+        RETURNING id
+    """, list(ESTADOS_FINALES))
+    for r in ids:
+        shutil.rmtree(directorio_job(r["id"]), ignore_errors=True)
+    return {"jobs_eliminados": len(ids)}
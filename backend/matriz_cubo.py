@@ -0,0 +1,264 @@
+"""Cubo OLAP de producción detrás de la matriz y del reporte estados-item.
+
+`prod_matriz_hecho` guarda una fila por registro (color = '') más una fila por
+cada color de su distribución, con las dimensiones ya resueltas (marca, tipo,
+entalle, tela, hilo, ruta, modelo, hilo específico, estado, ...) y las prendas.
+`prod_matriz_cubo` es el agregado de esos hechos por todas las dimensiones
+(registros, prendas). Los reportes cortan el cubo con un GROUP BY sobre pocas
+filas en vez de recorrer prod_registros con sus tallas, colores y movimientos.
+
+El mantenimiento es incremental: cada escritura que cambia un registro llama a
+`refrescar_cubo_registros`, que resta sus hechos anteriores del cubo y suma los
+nuevos dentro de la transacción del llamador. `reconstruir_cubo` rehace todo
+(arranque con cubo vacío, tarea nocturna y endpoint manual).
+"""
+import zlib
+
+from db import get_pool
+
+# Dimensiones del cubo (todas NOT NULL, '' / 0 / FALSE como "sin valor")
+DIMENSIONES = [
+    "empresa_id", "marca_id", "tipo_id", "entalle_id", "tela_id", "hilo_id",
+    "ruta_id", "modelo_id", "hilo_especifico_id", "estado", "estado_op",
+    "urgente", "fraccionado", "color", "color_general",
+]
+_DIMS_SQL = ", ".join(DIMENSIONES)
+
+_LOCK_CUBO = zlib.crc32(b"matriz_cubo") & 0x7FFFFFFF
+
+
+def _sql_int(expr: str) -> str:
+    """Entero desde un valor JSONB (número o texto numérico); 0 si no es válido."""
+    return (
+        f"(CASE jsonb_typeof({expr}) "
+        f"WHEN 'number' THEN trunc(({expr} #>> '{{}}')::numeric)::bigint "
+        f"WHEN 'string' THEN CASE WHEN ({expr} #>> '{{}}') ~ '^\\s*[-+]?\\d+\\s*$' "
+        f"THEN trim({expr} #>> '{{}}')::bigint ELSE 0 END "
+        f"ELSE 0 END)"
+    )
+
+
+def _sql_array(expr: str) -> str:
+    return f"(CASE WHEN jsonb_typeof({expr}) = 'array' THEN {expr} ELSE '[]'::jsonb END)"
+
+
+# Hechos de los registros que cumplen {filtro}. Reglas iguales a la matriz:
+# prendas = SUM(prod_registro_tallas.cantidad_real) con fallback al JSONB tallas;
+# colores desde distribucion_colores, color general por id y luego por nombre.
+_HECHOS_SQL = f"""
+    WITH reg AS (
+        SELECT r.id AS registro_id,
+               COALESCE(r.empresa_id, 0) AS empresa_id,
+               COALESCE(m.marca_id, '') AS marca_id,
+               COALESCE(m.tipo_id, '') AS tipo_id,
+               COALESCE(m.entalle_id, '') AS entalle_id,
+               COALESCE(m.tela_id, '') AS tela_id,
+               COALESCE(m.hilo_id, '') AS hilo_id,
+               COALESCE(m.ruta_produccion_id, '') AS ruta_id,
+               COALESCE(r.modelo_id, '') AS modelo_id,
+               COALESCE(r.hilo_especifico_id, '') AS hilo_especifico_id,
+               COALESCE(r.estado, '') AS estado,
+               COALESCE(r.estado_op, '') AS estado_op,
+               COALESCE(r.urgente, FALSE) AS urgente,
+               (r.dividido_desde_registro_id IS NOT NULL OR EXISTS (
+                   SELECT 1 FROM prod_registros ch WHERE ch.dividido_desde_registro_id = r.id
+               )) AS fraccionado,
+               COALESCE(
+                   NULLIF((SELECT trunc(COALESCE(SUM(rt.cantidad_real), 0))::bigint
+                           FROM prod_registro_tallas rt WHERE rt.registro_id = r.id), 0),
+                   (SELECT COALESCE(SUM({_sql_int("t->'cantidad'")}), 0)
+                    FROM jsonb_array_elements({_sql_array("r.tallas::jsonb")}) t)
+               ) AS prendas,
+               r.distribucion_colores::jsonb AS dist
+        FROM prod_registros r
+        LEFT JOIN prod_modelos m ON m.id = r.modelo_id
+        WHERE {{filtro}}
+    ),
+    col AS (
+        SELECT reg.registro_id,
+               c->>'color_nombre' AS color,
+               MIN(COALESCE(c->>'color_id', '')) AS color_id,
+               SUM({_sql_int("c->'cantidad'")}) AS prendas
+        FROM reg,
+             jsonb_array_elements({_sql_array("reg.dist")}) t,
+             jsonb_array_elements({_sql_array("t->'colores'")}) c
+        WHERE COALESCE(c->>'color_nombre', '') <> ''
+        GROUP BY reg.registro_id, c->>'color_nombre'
+    )
+    SELECT registro_id, empresa_id, marca_id, tipo_id, entalle_id, tela_id, hilo_id,
+           ruta_id, modelo_id, hilo_especifico_id, estado, estado_op, urgente, fraccionado,
+           '' AS color, '' AS color_general, 1 AS registros, prendas
+    FROM reg
+    UNION ALL
+    SELECT reg.registro_id, reg.empresa_id, reg.marca_id, reg.tipo_id, reg.entalle_id, reg.tela_id, reg.hilo_id,
+           reg.ruta_id, reg.modelo_id, reg.hilo_especifico_id, reg.estado, reg.estado_op, reg.urgente, reg.fraccionado,
+           col.color,
+           COALESCE(NULLIF(cg_id.nombre, ''), cg_nom.nombre, '') AS color_general,
+           1 AS registros, col.prendas
+    FROM col
+    JOIN reg ON reg.registro_id = col.registro_id
+    LEFT JOIN LATERAL (
+        SELECT cg.nombre FROM prod_colores_catalogo cc
+        JOIN prod_colores_generales cg ON cc.color_general_id = cg.id
+        WHERE cc.id = col.color_id LIMIT 1
+    ) cg_id ON true
+    LEFT JOIN LATERAL (
+        SELECT cg.nombre FROM prod_colores_catalogo cc
+        JOIN prod_colores_generales cg ON cc.color_general_id = cg.id
+        WHERE cc.nombre = col.color LIMIT 1
+    ) cg_nom ON true
+"""
+
+_COLUMNAS_HECHO = f"registro_id, {_DIMS_SQL}, registros, prendas"
+_SELECT_HECHO = (
+    "registro_id, empresa_id, marca_id, tipo_id, entalle_id, tela_id, hilo_id, ruta_id, modelo_id, "
+    "hilo_especifico_id, estado, estado_op, urgente, fraccionado, color, color_general, registros, prendas"
+)
+
+
+async def init_matriz_cubo_tables(conn):
+    dims_ddl = """
+        empresa_id INT NOT NULL DEFAULT 0,
+        marca_id VARCHAR NOT NULL DEFAULT '',
+        tipo_id VARCHAR NOT NULL DEFAULT '',
+        entalle_id VARCHAR NOT NULL DEFAULT '',
+        tela_id VARCHAR NOT NULL DEFAULT '',
+        hilo_id VARCHAR NOT NULL DEFAULT '',
+        ruta_id VARCHAR NOT NULL DEFAULT '',
+        modelo_id VARCHAR NOT NULL DEFAULT '',
+        hilo_especifico_id VARCHAR NOT NULL DEFAULT '',
+        estado VARCHAR NOT NULL DEFAULT '',
+        estado_op VARCHAR NOT NULL DEFAULT '',
+        urgente BOOLEAN NOT NULL DEFAULT FALSE,
+        fraccionado BOOLEAN NOT NULL DEFAULT FALSE,
+        color VARCHAR NOT NULL DEFAULT '',
+        color_general VARCHAR NOT NULL DEFAULT '',
+        registros INT NOT NULL DEFAULT 0,
+        prendas BIGINT NOT NULL DEFAULT 0
+    """
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS prod_matriz_hecho (
+            registro_id VARCHAR NOT NULL,
+            {dims_ddl},
+            PRIMARY KEY (registro_id, color)
+        )
+    """)
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS prod_matriz_cubo (
+            {dims_ddl},
+            PRIMARY KEY ({_DIMS_SQL})
+        )
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_matriz_cubo_empresa_estado ON prod_matriz_cubo(empresa_id, estado_op, color)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_matriz_hecho_modelo ON prod_matriz_hecho(modelo_id)")
+
+
+_CELDA_SQL = " AND ".join(f"{d} = ${i}" for i, d in enumerate(DIMENSIONES, 1))
+
+_APLICAR_DELTA_SQL = f"""
+    INSERT INTO prod_matriz_cubo ({_DIMS_SQL}, registros, prendas)
+    VALUES ({", ".join(f"${i}" for i in range(1, len(DIMENSIONES) + 3))})
+    ON CONFLICT ({_DIMS_SQL}) DO UPDATE SET
+        registros = prod_matriz_cubo.registros + EXCLUDED.registros,
+        prendas = prod_matriz_cubo.prendas + EXCLUDED.prendas
+"""
+
+_PURGAR_CELDA_SQL = f"DELETE FROM prod_matriz_cubo WHERE {_CELDA_SQL} AND registros <= 0"
+
+
+async def refrescar_cubo_registros(conn, registro_ids):
+    """Recalcula los hechos de los registros indicados y aplica la diferencia al cubo.
+
+    Incluye a los padres de división (su marca de fraccionado depende de los hijos).
+    Los ids que ya no existen solo restan sus hechos anteriores.
+    """
+    ids = list({i for i in (registro_ids or []) if i})
+    if not ids:
+        return
+    padres = await conn.fetch(
+        "SELECT DISTINCT dividido_desde_registro_id FROM prod_registros "
+        "WHERE id = ANY($1::varchar[]) AND dividido_desde_registro_id IS NOT NULL", ids
+    )
+    ids = list(set(ids) | {p["dividido_desde_registro_id"] for p in padres})
+
+    async with conn.transaction():
+        # Compartido frente a reconstruir_cubo (exclusivo); entre refrescos solo
+        # se bloquean los mismos registros, tomados en orden para no cruzarse
+        await conn.execute("SELECT pg_advisory_xact_lock_shared($1)", _LOCK_CUBO)
+        await conn.execute("""
+            SELECT pg_advisory_xact_lock($1, hashtext(x.id))
+            FROM (SELECT id FROM unnest($2::varchar[]) AS id ORDER BY id) x
+        """, _LOCK_CUBO, ids)
+        viejos = await conn.fetch(
+            f"DELETE FROM prod_matriz_hecho WHERE registro_id = ANY($1::varchar[]) RETURNING {_DIMS_SQL}, registros, prendas",
+            ids,
+        )
+        nuevos = await conn.fetch(f"""
+            INSERT INTO prod_matriz_hecho ({_COLUMNAS_HECHO})
+            SELECT {_SELECT_HECHO} FROM ({_HECHOS_SQL.replace("{filtro}", "r.id = ANY($1::varchar[])")}) h
+            RETURNING {_DIMS_SQL}, registros, prendas
+        """, ids)
+
+        delta = {}
+        for signo, filas in ((-1, viejos), (1, nuevos)):
+            for f in filas:
+                celda = tuple(f[d] for d in DIMENSIONES)
+                r, p = delta.get(celda, (0, 0))
+                delta[celda] = (r + signo * f["registros"], p + signo * f["prendas"])
+        # Orden fijo de celdas: dos refrescos que tocan las mismas celdas las bloquean igual
+        celdas = sorted(
+            ((c, r, p) for c, (r, p) in delta.items() if r or p),
+            key=lambda x: tuple(str(v) for v in x[0]),
+        )
+        if celdas:
+            await conn.executemany(_APLICAR_DELTA_SQL, [(*c, r, p) for c, r, p in celdas])
+            await conn.executemany(_PURGAR_CELDA_SQL, [c for c, _, _ in celdas])
+
+
+async def refrescar_cubo_modelo(conn, modelo_id: str):
+    """Un cambio en el modelo (marca, tipo, tela, ruta...) mueve a todos sus registros de celda."""
+    rows = await conn.fetch("SELECT id FROM prod_registros WHERE modelo_id = $1", modelo_id)
+    await refrescar_cubo_registros(conn, [r["id"] for r in rows])
+
+
+async def reconstruir_cubo(conn) -> dict:
+    """Rehace hechos y cubo desde cero. Retorna conteos y las celdas que difieren del cubo anterior."""
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _LOCK_CUBO)
+        await conn.execute("CREATE TEMP TABLE _cubo_anterior ON COMMIT DROP AS SELECT * FROM prod_matriz_cubo")
+        await conn.execute("DELETE FROM prod_matriz_hecho")
+        await conn.execute(f"""
+            INSERT INTO prod_matriz_hecho ({_COLUMNAS_HECHO})
+            SELECT {_SELECT_HECHO} FROM ({_HECHOS_SQL.replace("{filtro}", "TRUE")}) h
+        """)
+        await conn.execute("DELETE FROM prod_matriz_cubo")
+        await conn.execute(f"""
+            INSERT INTO prod_matriz_cubo ({_DIMS_SQL}, registros, prendas)
+            SELECT {_DIMS_SQL}, SUM(registros), SUM(prendas)
+            FROM prod_matriz_hecho GROUP BY {_DIMS_SQL}
+        """)
+        diferencias = await conn.fetchval(f"""
+            SELECT COUNT(*) FROM (
+                (SELECT {_DIMS_SQL}, registros, prendas FROM prod_matriz_cubo
+                 EXCEPT SELECT {_DIMS_SQL}, registros, prendas FROM _cubo_anterior)
+                UNION ALL
+                (SELECT {_DIMS_SQL}, registros, prendas FROM _cubo_anterior
+                 EXCEPT SELECT {_DIMS_SQL}, registros, prendas FROM prod_matriz_cubo)
+            ) x
+        """)
+        hechos = await conn.fetchval("SELECT COUNT(*) FROM prod_matriz_hecho")
+        celdas = await conn.fetchval("SELECT COUNT(*) FROM prod_matriz_cubo")
+    return {"hechos": hechos, "celdas": celdas, "celdas_corregidas": diferencias}
+
+
+async def asegurar_cubo(conn):
+    """Construye el cubo si está vacío y hay registros (primer arranque tras la migración)."""
+    vacio = await conn.fetchval("SELECT NOT EXISTS (SELECT 1 FROM prod_matriz_hecho)")
+    if vacio and await conn.fetchval("SELECT EXISTS (SELECT 1 FROM prod_registros)"):
+        await reconstruir_cubo(conn)
+
+
+async def tarea_reconstruir_cubo():
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await reconstruir_cubo(conn)
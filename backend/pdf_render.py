@@ -0,0 +1,322 @@
+"""Renderizado de PDFs fuera del event loop, con cache direccionado por contenido.
+
+Los documentos se generan con reportlab en un pool de procesos (o hilos con
+PDF_MODO=hilo) con cupos acotados: si la cola está llena se rechaza la
+solicitud en vez de acumular trabajo. Cada PDF se guarda en un LRU en memoria
+bajo el sha256 de los datos de entrada, así que re-descargar el mismo balance
+no vuelve a renderizar. Por eso el documento no imprime la hora del render:
+todo lo que muestra tiene que venir de los datos de entrada.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+PDF_MODO = os.environ.get('PDF_MODO', 'proceso')  # proceso | hilo
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '2'))
+PDF_COLA_MAX = int(os.environ.get('PDF_COLA_MAX', '16'))
+PDF_CACHE_MB = float(os.environ.get('PDF_CACHE_MB', '64'))
+
+
+class ColaPdfLlena(Exception):
+    pass
+
+
+_executor = None
+_cupos = None
+_cache = OrderedDict()
+_cache_bytes = 0
+_en_curso = {}
+_stats = {"renders": 0, "hits": 0, "rechazados": 0}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        if PDF_MODO == 'hilo':
+            _executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf")
+        else:
+            _executor = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+    return _executor
+
+
+def _get_cupos():
+    global _cupos
+    if _cupos is None:
+        _cupos = asyncio.Semaphore(PDF_WORKERS + PDF_COLA_MAX)
+    return _cupos
+
+
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return str(v)
+
+
+def huella_pdf(tipo: str, datos: dict) -> str:
+    """sha256 de los datos de entrada: mismo contenido => mismo PDF."""
+    canonico = json.dumps({"tipo": tipo, "datos": datos}, sort_keys=True, default=_json_default)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+def _cache_get(clave):
+    pdf = _cache.get(clave)
+    if pdf is not None:
+        _cache.move_to_end(clave)
+    return pdf
+
+
+def _cache_put(clave, pdf: bytes):
+    global _cache_bytes
+    limite = PDF_CACHE_MB * 1024 * 1024
+    if len(pdf) > limite:
+        return
+    if clave in _cache:
+        _cache_bytes -= len(_cache.pop(clave))
+    _cache[clave] = pdf
+    _cache_bytes += len(pdf)
+    while _cache_bytes > limite and _cache:
+        _, viejo = _cache.popitem(last=False)
+        _cache_bytes -= len(viejo)
+
+
+async def _render(clave, fn, datos):
+    async with _get_cupos():
+        loop = asyncio.get_running_loop()
+        pdf = await loop.run_in_executor(_get_executor(), fn, datos)
+    _stats["renders"] += 1
+    _cache_put(clave, pdf)
+    return pdf
+
+
+async def renderizar_pdf(tipo: str, fn, datos: dict, esperar: bool = False) -> bytes:
+    """Renderiza `fn(datos)` en el pool, o lo sirve del cache si ya existe.
+
+    `fn` debe ser una función de módulo (picklable). Solicitudes simultáneas del
+    mismo contenido comparten un único render. Con esperar=False y la cola llena
+    lanza ColaPdfLlena; los lotes usan esperar=True.
+    """
+    clave = huella_pdf(tipo, datos)
+    pdf = _cache_get(clave)
+    if pdf is not None:
+        _stats["hits"] += 1
+        return pdf
+
+    tarea = _en_curso.get(clave)
+    if tarea is None:
+        if not esperar and _get_cupos().locked():
+            _stats["rechazados"] += 1
+            raise ColaPdfLlena("Cola de generación de PDF llena, intente en unos segundos")
+        tarea = asyncio.ensure_future(_render(clave, fn, datos))
+        _en_curso[clave] = tarea
+        tarea.add_done_callback(lambda _: _en_curso.pop(clave, None))
+    else:
+        _stats["hits"] += 1
+    return await asyncio.shield(tarea)
+
+
+def estado_pdf() -> dict:
+    return {
+        "modo": PDF_MODO,
+        "workers": PDF_WORKERS,
+        "cola_max": PDF_COLA_MAX,
+        "cache_entradas": len(_cache),
+        "cache_bytes": _cache_bytes,
+        **_stats,
+    }
+
+
+def cerrar_pdf_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# ==================== BALANCE DEL LOTE ====================
+
+def safe_float(v):
+    try:
+        return float(v or 0)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def render_balance_pdf(datos: dict) -> bytes:
+    """Balance del lote (tallas, cantidades, movimientos, materiales y costos congelados)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    reg = datos["registro"]
+    modelo = datos["modelo"]
+    cierre = datos["cierre"]
+    tallas = datos["tallas"]
+    tallas_map_nombre = datos["tallas_map_nombre"]
+    total_prendas = sum(int(t['cantidad_real']) for t in tallas)
+    total_mermas = datos["merma_qty"]
+    movs = datos["movimientos"]
+    salidas = datos["salidas"]
+    total_costo_mp = sum(float(s.get('costo_total', 0) or 0) for s in salidas)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1.5*cm, bottomMargin=1.5*cm, leftMargin=2*cm, rightMargin=2*cm,
+                            invariant=True)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=16, spaceAfter=6)
+    subtitle_style = ParagraphStyle('Subtitle', parent=styles['Heading2'], fontSize=12, spaceAfter=4)
+    normal = styles['Normal']
+
+    elements = []
+
+    elements.append(Paragraph(f"Balance del Lote - {reg['n_corte']}", title_style))
+    elements.append(Paragraph(f"Modelo: {modelo['nombre'] if modelo else 'N/A'} | Marca: {modelo['marca_nombre'] if modelo and modelo.get('marca_nombre') else 'N/A'}", normal))
+    estado_label = reg['estado']
+    if cierre and cierre.get('estado_cierre') == 'CERRADO':
+        estado_label += " [CERRADO]"
+    # Un PDF cacheado se sirve tal cual: la fecha impresa es la de los datos, no la del render
+    datos_al = datetime.fromisoformat(datos["datos_al"]) if datos.get("datos_al") else None
+    fecha = f" | Datos al: {datos_al.strftime('%d/%m/%Y %H:%M')}" if datos_al else ""
+    elements.append(Paragraph(f"Estado: {estado_label}{fecha}", normal))
+    elements.append(Spacer(1, 0.5*cm))
+
+    # Tallas
+    elements.append(Paragraph("Distribucion por Tallas", subtitle_style))
+    talla_data = [['Talla', 'Cantidad']]
+    for t in tallas:
+        nombre = tallas_map_nombre.get(t['talla_id'], t['talla_id'])
+        talla_data.append([nombre, str(int(t['cantidad_real']))])
+    talla_data.append(['TOTAL', str(total_prendas)])
+    t_table = Table(talla_data, colWidths=[8*cm, 4*cm])
+    t_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f9ff')),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ]))
+    elements.append(t_table)
+    elements.append(Spacer(1, 0.5*cm))
+
+    # Balance cantidades
+    elements.append(Paragraph("Balance de Cantidades", subtitle_style))
+    en_produccion = total_prendas - int(total_mermas)
+    bal_data = [
+        ['Concepto', 'Cantidad'],
+        ['Cantidad Inicial', str(total_prendas)],
+        ['En Produccion', str(en_produccion)],
+        ['Mermas / Faltantes', str(int(total_mermas))],
+    ]
+    bal_table = Table(bal_data, colWidths=[8*cm, 4*cm])
+    bal_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ]))
+    elements.append(bal_table)
+    elements.append(Spacer(1, 0.5*cm))
+
+    # Movimientos
+    if movs:
+        elements.append(Paragraph("Movimientos de Produccion", subtitle_style))
+        mov_data = [['Servicio', 'Enviado', 'Recibido', 'Fecha Envio', 'Estado']]
+        for m in movs:
+            fecha = str(m['fecha_inicio'])[:10] if m.get('fecha_inicio') else '-'
+            estado = 'Completado' if m.get('fecha_fin') else 'En proceso'
+            mov_data.append([
+                m.get('servicio_nombre', '-'),
+                str(int(m.get('cantidad_enviada', 0) or 0)),
+                str(int(m.get('cantidad_recibida', 0) or 0)),
+                fecha, estado,
+            ])
+        mov_table = Table(mov_data, colWidths=[4*cm, 2.5*cm, 2.5*cm, 2.5*cm, 2.5*cm])
+        mov_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ]))
+        elements.append(mov_table)
+        elements.append(Spacer(1, 0.5*cm))
+
+    # Materiales consumidos
+    if salidas:
+        elements.append(Paragraph("Materiales Consumidos", subtitle_style))
+        sal_data = [['Material', 'Cantidad', 'Costo']]
+        for s in salidas:
+            sal_data.append([
+                s.get('item_nombre', '-'),
+                f"{float(s.get('cantidad', 0)):.1f}",
+                f"S/ {float(s.get('costo_total', 0) or 0):.2f}",
+            ])
+        sal_data.append(['TOTAL MATERIALES', '', f"S/ {total_costo_mp:.2f}"])
+        sal_table = Table(sal_data, colWidths=[6*cm, 3*cm, 3*cm])
+        sal_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f9ff')),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ]))
+        elements.append(sal_table)
+        elements.append(Spacer(1, 0.5*cm))
+
+    # Resumen costos (del cierre congelado si existe)
+    if cierre:
+        elements.append(Paragraph("Resumen de Costos (Congelado)", subtitle_style))
+        cost_data = [
+            ['Concepto', 'Monto'],
+            ['Costo MP (FIFO)', f"S/ {safe_float(cierre.get('costo_mp')):.2f}"],
+            ['Costo Servicios', f"S/ {safe_float(cierre.get('costo_servicios')):.2f}"],
+            ['Otros Costos', f"S/ {safe_float(cierre.get('otros_costos')):.2f}"],
+            ['COSTO TOTAL FINAL', f"S/ {safe_float(cierre.get('costo_total')):.2f}"],
+            ['Costo Unitario Final', f"S/ {safe_float(cierre.get('costo_unitario_final') or cierre.get('costo_unit_pt')):.6f}"],
+        ]
+        cost_table = Table(cost_data, colWidths=[8*cm, 4*cm])
+        cost_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dcfce7')),
+            ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ]))
+        elements.append(cost_table)
+
+    doc.build(elements)
+    return buffer.getvalue()
@@ -0,0 +1,77 @@
+"""
+Router: Alertas precalculadas
+- GET /api/alertas: abiertas e historial (resueltas) desde prod_alertas
+- GET /api/alertas/estado: evaluaciones y tiempos de cada regla en este worker
+- POST /api/alertas/reevaluar: fuerza la reevaluación de todas las reglas
+"""
+from datetime import date
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Query
+
+from db import get_pool, solo_lectura
+from auth_utils import get_current_user
+from filtros_sql import FiltrosSQL
+from alertas_motor import tarea_reevaluar_alertas, estado_alertas_motor
+
+router = APIRouter(prefix="/api", tags=["alertas"])
+
+ESTADOS_ALERTA = ("abiertas", "resueltas", "todas")
+
+
+@router.get("/alertas")
+@solo_lectura
+async def listar_alertas(
+    tipo: Optional[str] = None,
+    registro_id: Optional[str] = None,
+    estado: str = "abiertas",
+    desde: Optional[date] = Query(None, description="primera_vez >= (YYYY-MM-DD)"),
+    hasta: Optional[date] = Query(None, description="primera_vez <= (YYYY-MM-DD)"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+):
+    """Alertas con su primera_vez y resuelta_en, más recientes primero."""
+    if estado not in ESTADOS_ALERTA:
+        raise HTTPException(status_code=400, detail=f"Estado inválido. Valores: {', '.join(ESTADOS_ALERTA)}")
+    filtros = FiltrosSQL()
+    filtros.igual("tipo", tipo)
+    filtros.igual("registro_id", registro_id)
+    filtros.desde("primera_vez::date", desde)
+    filtros.hasta("primera_vez::date", hasta)
+    if estado == "abiertas":
+        filtros.condiciones.append("resuelta_en IS NULL")
+    elif estado == "resueltas":
+        filtros.condiciones.append("resuelta_en IS NOT NULL")
+    n = filtros.siguiente()
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT id, tipo, clave, nivel, registro_id, datos, primera_vez, actualizada_en, resuelta_en,
+                   COUNT(*) OVER() as _total
+            FROM prod_alertas
+            WHERE {filtros.where()}
+            ORDER BY primera_vez DESC, id DESC
+            LIMIT ${n} OFFSET ${n + 1}
+        """, *filtros.params, limit, offset)
+    items = []
+    for r in rows:
+        d = dict(r)
+        d.pop("_total")
+        d["datos"] = orjson.loads(d["datos"]) if isinstance(d["datos"], (str, bytes)) else d["datos"]
+        items.append(d)
+    return {"items": items, "total": rows[0]["_total"] if rows else 0, "limit": limit, "offset": offset}
+
+
+@router.get("/alertas/estado")
+async def get_estado_alertas(current_user: dict = Depends(get_current_user)):
+    return estado_alertas_motor()
+
+
+@router.post("/alertas/reevaluar")
+async def reevaluar_alertas(current_user: dict = Depends(get_current_user)):
+    """Reevalúa todas las reglas ahora (no espera a la tarea periódica)."""
+    if current_user['rol'] != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores")
+    return await tarea_reevaluar_alertas()
@@ -0,0 +1,119 @@
+"""
+Router: Archivo de lotes cerrados
+- GET /api/archivo/estado: filas vivas/archivadas por tabla y lotes archivables
+- GET /api/archivo/lotes: lotes archivados (busqueda por n_corte)
+- POST /api/archivo/archivar: mueve una tanda de lotes cerrados al archivo (async=1 como job)
+- POST /api/archivo/restaurar: devuelve lotes archivados a las tablas vivas
+"""
+from typing import List, Optional
+
+import asyncpg
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, Field
+
+from db import get_pool
+from auth_utils import get_current_user
+from filtros_sql import FiltrosSQL
+from jobs import encolar_job, registrar_tipo_job
+from routes.auditoria import audit_log_safe, get_usuario
+from archivo_lotes import ARCHIVO_LOTE_MAX, archivar_lotes, restaurar_lotes, estado_archivo
+
+router = APIRouter(prefix="/api", tags=["archivo"])
+
+
+class ArchivarInput(BaseModel):
+    meses: Optional[int] = Field(None, ge=0)
+    limite: Optional[int] = Field(None, ge=1)
+    registro_ids: Optional[List[str]] = None
+    dry_run: bool = False
+
+
+class RestaurarInput(BaseModel):
+    registro_ids: List[str] = Field(min_length=1, max_length=ARCHIVO_LOTE_MAX)
+
+
+def _solo_admin(current_user: dict):
+    if current_user['rol'] != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores pueden archivar o restaurar lotes")
+
+
+@router.get("/archivo/estado")
+async def get_estado_archivo(current_user: dict = Depends(get_current_user)):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await estado_archivo(conn)
+
+
+@router.get("/archivo/lotes")
+async def listar_lotes_archivados(
+    busqueda: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+):
+    """Lotes archivados, más recientes primero."""
+    filtros = FiltrosSQL()
+    filtros.si(busqueda, lambda n: f"a.n_corte ILIKE '%' || ${n} || '%'")
+    n = filtros.siguiente()
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT a.*, COUNT(*) OVER() as _total
+            FROM prod_archivo_lotes a
+            WHERE {filtros.where()}
+            ORDER BY a.archivado_en DESC, a.registro_id
+            LIMIT ${n} OFFSET ${n + 1}
+        """, *filtros.params, limit, offset)
+    items = [{k: v for k, v in dict(r).items() if k != "_total"} for r in rows]
+    return {"items": items, "total": rows[0]["_total"] if rows else 0, "limit": limit, "offset": offset}
+
+
+@router.post("/archivo/archivar")
+async def archivar(
+    data: ArchivarInput,
+    async_: bool = Query(False, alias="async"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Archiva en una transacción hasta ARCHIVO_LOTE_MAX lotes cerrados hace más de `meses` meses."""
+    _solo_admin(current_user)
+    if async_:
+        return await encolar_job("archivar_lotes", data.model_dump(), current_user)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        resultado = await archivar_lotes(
+            conn, meses=data.meses, limite=data.limite, registro_ids=data.registro_ids,
+            dry_run=data.dry_run, usuario=current_user['username'],
+        )
+        if resultado["lotes"] and not data.dry_run:
+            await audit_log_safe(conn, get_usuario(current_user), "ARCHIVE", "produccion", "prod_registros", None,
+                datos_despues={"lotes": resultado["lotes"], "registro_ids": resultado["registro_ids"], "filas": resultado["filas"]})
+    return resultado
+
+
+@router.post("/archivo/restaurar")
+async def restaurar(data: RestaurarInput, current_user: dict = Depends(get_current_user)):
+    """Devuelve los lotes indicados (con todos sus hijos) a las tablas vivas."""
+    _solo_admin(current_user)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        try:
+            resultado = await restaurar_lotes(conn, data.registro_ids, usuario=current_user['username'])
+        except asyncpg.UniqueViolationError as e:
+            raise HTTPException(status_code=409, detail=f"No se puede restaurar: ya existe una fila viva con la misma clave ({e.constraint_name})")
+        if resultado["lotes"]:
+            await audit_log_safe(conn, get_usuario(current_user), "RESTORE", "produccion", "prod_registros", None,
+                datos_despues={"lotes": resultado["lotes"], "registro_ids": resultado["registro_ids"], "filas": resultado["filas"]})
+    resultado["no_encontrados"] = [i for i in data.registro_ids if i not in resultado["registro_ids"]]
+    return resultado
+
+
+async def _job_archivar_lotes(ctx):
+    p = ctx.params
+    async with ctx.conexion() as conn:
+        return await archivar_lotes(
+            conn, meses=p.get("meses"), limite=p.get("limite"), registro_ids=p.get("registro_ids"),
+            dry_run=bool(p.get("dry_run")), usuario=ctx.usuario['username'],
+        )
+
+
+registrar_tipo_job("archivar_lotes", _job_archivar_lotes, "Archivar lotes cerrados antiguos", solo_admin=True)
@@ -0,0 +1,176 @@
+"""
+Router: Búsqueda unificada
+GET /api/search sobre registros, modelos, inventario y rollos con índices
+trigram (pg_trgm). Los listados (registros, modelos, inventario) usan los
+mismos predicados para que el ILIKE '%term%' no recorra la tabla completa.
+"""
+import logging
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+
+from db import get_pool
+from auth_utils import get_current_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api", tags=["busqueda"])
+
+TIPOS_BUSQUEDA = ("registros", "modelos", "inventario", "rollos")
+
+# (tabla, columna) con índice GIN gin_trgm_ops
+_INDICES_TRGM = [
+    ("prod_registros", "n_corte"),
+    ("prod_modelos", "nombre"),
+    ("prod_inventario", "nombre"),
+    ("prod_inventario", "codigo"),
+    ("prod_inventario_rollos", "codigo_rollo"),
+    ("prod_inventario_rollos", "lote"),
+    ("prod_marcas", "nombre"),
+    ("prod_tipos", "nombre"),
+    ("prod_entalles", "nombre"),
+    ("prod_telas", "nombre"),
+]
+
+
+async def init_busqueda_indexes():
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        try:
+            await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as e:
+            logger.warning(f"pg_trgm no disponible, la búsqueda usará scans secuenciales: {e}")
+            return
+        for tabla, columna in _INDICES_TRGM:
+            try:
+                await conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{tabla}_{columna}_trgm ON {tabla} USING gin ({columna} gin_trgm_ops)"
+                )
+            except Exception as e:
+                logger.warning(f"No se pudo crear índice trigram {tabla}.{columna}: {e}")
+
+
+# ==================== PREDICADOS COMPARTIDOS ====================
+
+def patron_busqueda(term: str) -> str:
+    """'%term%' con los comodines de LIKE escapados."""
+    term = (term or "").strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{term}%"
+
+
+def predicado_registros(idx: int, alias: str = "r") -> str:
+    """n_corte o nombre del modelo; cada lado usa su índice trigram."""
+    return (
+        f"({alias}.n_corte ILIKE ${idx} OR {alias}.modelo_id IN "
+        f"(SELECT id FROM prod_modelos WHERE nombre ILIKE ${idx}))"
+    )
+
+
+def predicado_modelos(idx: int, alias: str = "m") -> str:
+    """Nombre del modelo o de su marca/tipo/entalle/tela."""
+    return (
+        f"({alias}.nombre ILIKE ${idx}"
+        f" OR {alias}.marca_id IN (SELECT id FROM prod_marcas WHERE nombre ILIKE ${idx})"
+        f" OR {alias}.tipo_id IN (SELECT id FROM prod_tipos WHERE nombre ILIKE ${idx})"
+        f" OR {alias}.entalle_id IN (SELECT id FROM prod_entalles WHERE nombre ILIKE ${idx})"
+        f" OR {alias}.tela_id IN (SELECT id FROM prod_telas WHERE nombre ILIKE ${idx}))"
+    )
+
+
+def predicado_inventario(idx: int, alias: str = "i") -> str:
+    return f"({alias}.nombre ILIKE ${idx} OR {alias}.codigo ILIKE ${idx})"
+
+
+def predicado_rollos(idx: int, alias: str = "ro") -> str:
+    return f"({alias}.codigo_rollo ILIKE ${idx} OR {alias}.lote ILIKE ${idx})"
+
+
+def _score(columnas, idx_term: int, idx_prefijo: int) -> str:
+    """similarity() del mejor campo + bonus por coincidencia exacta o por prefijo."""
+    sim = ", ".join(f"similarity(COALESCE({c}, ''), ${idx_term})" for c in columnas)
+    exacto = " OR ".join(f"lower({c}) = lower(${idx_term})" for c in columnas)
+    prefijo = " OR ".join(f"{c} ILIKE ${idx_prefijo}" for c in columnas)
+    return (
+        f"(GREATEST({sim}) + CASE WHEN {exacto} THEN 1 WHEN {prefijo} THEN 0.5 ELSE 0 END)"
+    )
+
+
+# ==================== ENDPOINT ====================
+
+@router.get("/search")
+async def busqueda_unificada(
+    q: str = Query(..., min_length=1),
+    tipos: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=50),
+    current_user: dict = Depends(get_current_user),
+):
+    """Búsqueda ranqueada para typeahead. `tipos` = lista separada por comas de TIPOS_BUSQUEDA."""
+    term = q.strip()
+    seleccion = [t.strip() for t in (tipos or "").split(",") if t.strip() in TIPOS_BUSQUEDA] or list(TIPOS_BUSQUEDA)
+    if len(term) < 2:
+        return {"q": term, "resultados": [], "por_tipo": {t: 0 for t in seleccion}}
+
+    prefijo = patron_busqueda(term)[1:]  # 'term%'
+    # $1 patrón '%term%', $2 término, $3 prefijo 'term%', $4 límite por tipo
+    ramas = {
+        "registros": f"""
+            SELECT 'registros' as tipo, r.id, r.n_corte as titulo,
+                   COALESCE(m.nombre, '') as subtitulo, r.estado as detalle,
+                   {_score(["r.n_corte", "m.nombre"], 2, 3)} as score
+            FROM prod_registros r
+            LEFT JOIN prod_modelos m ON r.modelo_id = m.id
+            WHERE {predicado_registros(1)}
+            ORDER BY score DESC, r.fecha_creacion DESC
+            LIMIT $4
+        """,
+        "modelos": f"""
+            SELECT 'modelos' as tipo, m.id, m.nombre as titulo,
+                   CONCAT_WS(' - ', ma.nombre, t.nombre, e.nombre, te.nombre) as subtitulo,
+                   NULL::varchar as detalle,
+                   {_score(["m.nombre", "ma.nombre", "t.nombre", "e.nombre", "te.nombre"], 2, 3)} as score
+            FROM prod_modelos m
+            LEFT JOIN prod_marcas ma ON m.marca_id = ma.id
+            LEFT JOIN prod_tipos t ON m.tipo_id = t.id
+            LEFT JOIN prod_entalles e ON m.entalle_id = e.id
+            LEFT JOIN prod_telas te ON m.tela_id = te.id
+            WHERE {predicado_modelos(1)}
+            ORDER BY score DESC, m.nombre
+            LIMIT $4
+        """,
+        "inventario": f"""
+            SELECT 'inventario' as tipo, i.id, i.nombre as titulo,
+                   i.codigo as subtitulo, i.categoria as detalle,
+                   {_score(["i.nombre", "i.codigo"], 2, 3)} as score
+            FROM prod_inventario i
+            WHERE {predicado_inventario(1)}
+            ORDER BY score DESC, i.nombre
+            LIMIT $4
+        """,
+        "rollos": f"""
+            SELECT 'rollos' as tipo, ro.id, COALESCE(NULLIF(ro.codigo_rollo, ''), ro.lote, '') as titulo,
+                   COALESCE(i.nombre, '') as subtitulo, ro.estado as detalle,
+                   {_score(["ro.codigo_rollo", "ro.lote"], 2, 3)} as score
+            FROM prod_inventario_rollos ro
+            LEFT JOIN prod_inventario i ON ro.item_id = i.id
+            WHERE {predicado_rollos(1)}
+            ORDER BY score DESC, ro.created_at DESC
+            LIMIT $4
+        """,
+    }
+    query = " UNION ALL ".join(f"({ramas[t]})" for t in seleccion) + " ORDER BY score DESC"
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(query, patron_busqueda(term), term, prefijo, limit)
+
+    resultados = [{
+        "tipo": r["tipo"],
+        "id": r["id"],
+        "titulo": r["titulo"],
+        "subtitulo": r["subtitulo"],
+        "detalle": r["detalle"],
+        "score": round(float(r["score"] or 0), 4),
+    } for r in rows]
+    por_tipo = {t: 0 for t in seleccion}
+    for r in resultados:
+        por_tipo[r["tipo"]] += 1
+    return {"q": term, "resultados": resultados, "por_tipo": por_tipo}
@@ -3,6 +3,8 @@ import json
 from fastapi import APIRouter, HTTPException, Depends
 from db import get_pool
 from helpers import row_to_dict, parse_jsonb
+from rutas_compiladas import invalidar_ruta
+from tarifas_persona import sincronizar_tarifas
 from auth_utils import get_current_user, require_permiso as require_permission
 from models import (
     MarcaCreate, Marca, TipoCreate, Tipo, EntalleCreate, Entalle,
@@ -576,6 +578,7 @@ async def create_ruta_produccion(input: RutaProduccionCreate):
             "INSERT INTO prod_rutas_produccion (id, nombre, descripcion, etapas, created_at) VALUES ($1, $2, $3, $4, $5)",
             ruta.id, ruta.nombre, ruta.descripcion, etapas_json, ruta.created_at.replace(tzinfo=None)
         )
+    invalidar_ruta(ruta.id)
     return ruta
 
 @router.put("/rutas-produccion/{ruta_id}")
@@ -588,6 +591,7 @@ async def update_ruta_produccion(ruta_id: str, input: RutaProduccionCreate):
         etapas_json = json.dumps([e.model_dump() for e in input.etapas])
         await conn.execute("UPDATE prod_rutas_produccion SET nombre = $1, descripcion = $2, etapas = $3 WHERE id = $4",
                           input.nombre, input.descripcion, etapas_json, ruta_id)
+        invalidar_ruta(ruta_id)
         return {**row_to_dict(result), "nombre": input.nombre, "descripcion": input.descripcion, "etapas": [e.model_dump() for e in input.etapas]}
 
 @router.delete("/rutas-produccion/{ruta_id}")
@@ -598,6 +602,7 @@ async def delete_ruta_produccion(ruta_id: str):
         if count > 0:
             raise HTTPException(status_code=400, detail=f"No se puede eliminar: {count} modelo(s) usan esta ruta")
         await conn.execute("DELETE FROM prod_rutas_produccion WHERE id = $1", ruta_id)
+        invalidar_ruta(ruta_id)
         return {"message": "Ruta eliminada"}
 
 # ==================== ENDPOINTS SERVICIOS PRODUCCION ====================
@@ -699,10 +704,12 @@ async def create_persona_produccion(input: PersonaCreate):
     pool = await get_pool()
     async with pool.acquire() as conn:
         servicios_json = json.dumps([s.model_dump() for s in persona.servicios])
-        await conn.execute(
-            "INSERT INTO prod_personas_produccion (id, nombre, tipo, telefono, email, direccion, servicios, activo, tipo_persona, unidad_interna_id, created_at) VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11)",
-            persona.id, persona.nombre, persona.tipo, persona.telefono, persona.email, persona.direccion, servicios_json, persona.activo, persona.tipo_persona, persona.unidad_interna_id, persona.created_at.replace(tzinfo=None)
-        )
+        async with conn.transaction():
+            await conn.execute(
+                "INSERT INTO prod_personas_produccion (id, nombre, tipo, telefono, email, direccion, servicios, activo, tipo_persona, unidad_interna_id, created_at) VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11)",
+                persona.id, persona.nombre, persona.tipo, persona.telefono, persona.email, persona.direccion, servicios_json, persona.activo, persona.tipo_persona, persona.unidad_interna_id, persona.created_at.replace(tzinfo=None)
+            )
+            await sincronizar_tarifas(conn, [persona.id])
     return persona
 
 @router.put("/personas-produccion/{persona_id}")
@@ -713,10 +720,12 @@ async def update_persona_produccion(persona_id: str, input: PersonaCreate):
         if not result:
             raise HTTPException(status_code=404, detail="Persona no encontrada")
         servicios_json = json.dumps([s.model_dump() for s in input.servicios])
-        await conn.execute(
-            "UPDATE prod_personas_produccion SET nombre=$1, tipo=$2, telefono=$3, email=$4, direccion=$5, servicios=$6, activo=$7, tipo_persona=$8, unidad_interna_id=$9 WHERE id=$10",
-            input.nombre, input.tipo, input.telefono, input.email, input.direccion, servicios_json, input.activo, input.tipo_persona, input.unidad_interna_id, persona_id
-        )
+        async with conn.transaction():
+            await conn.execute(
+                "UPDATE prod_personas_produccion SET nombre=$1, tipo=$2, telefono=$3, email=$4, direccion=$5, servicios=$6, activo=$7, tipo_persona=$8, unidad_interna_id=$9 WHERE id=$10",
+                input.nombre, input.tipo, input.telefono, input.email, input.direccion, servicios_json, input.activo, input.tipo_persona, input.unidad_interna_id, persona_id
+            )
+            await sincronizar_tarifas(conn, [persona_id])
         return {**row_to_dict(result), **input.model_dump()}
 
 @router.delete("/personas-produccion/{persona_id}")
@@ -726,7 +735,9 @@ async def delete_persona_produccion(persona_id: str):
         mov_count = await conn.fetchval("SELECT COUNT(*) FROM prod_movimientos_produccion WHERE persona_id = $1", persona_id)
         if mov_count > 0:
             raise HTTPException(status_code=400, detail=f"No se puede eliminar: {mov_count} movimiento(s) asignados")
-        await conn.execute("DELETE FROM prod_personas_produccion WHERE id = $1", persona_id)
+        async with conn.transaction():
+            await conn.execute("DELETE FROM prod_personas_produccion WHERE id = $1", persona_id)
+            await sincronizar_tarifas(conn, [persona_id])
         return {"message": "Persona eliminada"}
 @router.get("/lineas-negocio")
 async def get_lineas_negocio():
@@ -4,19 +4,33 @@ Archivo UNICO y oficial de cierre. Consolida cierre.py + cierre_v2.py.
 Calcula costo MP (FIFO) + costos servicio + otros costos → congela resultado → genera ingreso PT.
 """
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import date, datetime, timezone
 from decimal import Decimal
+import asyncio
+import io
+import os
+import time
 import uuid
 import json
+import zipfile
+from asyncpg.exceptions import DeadlockDetectedError
 from db import get_pool
 from auth import get_current_user
-from helpers import row_to_dict
+from helpers import row_to_dict, refrescar_agregados_inventario, refrescar_agregados_por_registro
 from routes.auditoria import audit_log, get_usuario
+from matriz_cubo import refrescar_cubo_registros
+from pdf_render import renderizar_pdf, render_balance_pdf, estado_pdf, ColaPdfLlena
 
 router = APIRouter(prefix="/api", tags=["cierre"])
 
+# Cierres simultáneos por lote (cada uno ocupa una conexión del pool)
+CIERRE_LOTE_CONCURRENCIA = int(os.environ.get('CIERRE_LOTE_CONCURRENCIA', '3'))
+CIERRE_LOTE_MAX_REGISTROS = 500
+BALANCE_LOTE_MAX_REGISTROS = 200
+
 
 class CierreRegistroInput(BaseModel):
     empresa_id: Optional[int] = None
@@ -25,6 +39,19 @@ class CierreRegistroInput(BaseModel):
     observacion_cierre: Optional[str] = None
 
 
+class CierreLoteInput(BaseModel):
+    registro_ids: List[str] = Field(min_length=1)
+    empresa_id: Optional[int] = None
+    fecha: Optional[date] = None
+    observacion_cierre: Optional[str] = None
+    dry_run: bool = False
+    concurrencia: Optional[int] = Field(None, ge=1, le=5)
+
+
+class BalanceLoteInput(BaseModel):
+    registro_ids: List[str] = Field(min_length=1)
+
+
 class PtItemUpdate(BaseModel):
     pt_item_id: Optional[str] = None
 
@@ -104,6 +131,60 @@ async def _calcular_costos(conn, registro_id):
     }
 
 
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return str(v)
+
+
+async def _snapshot_costos(conn, registro_id):
+    """Costos y cantidades del registro (salidas, movimientos, costos-servicio, mermas).
+
+    Se guarda en prod_registro_costo_snapshot y se reutiliza hasta que un write sobre
+    esas fuentes lo invalida (helpers.invalidar_snapshot_costos).
+    """
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('costo_snapshot:' || $1))", registro_id)
+        row = await conn.fetchrow(
+            "SELECT datos FROM prod_registro_costo_snapshot WHERE registro_id = $1", registro_id
+        )
+        if row:
+            datos = row['datos']
+            return json.loads(datos) if isinstance(datos, str) else datos
+
+        costos = await _calcular_costos(conn, registro_id)
+        merma_qty = await _get_merma_qty(conn, registro_id)
+        movs = await conn.fetch("""
+            SELECT s.nombre as servicio_nombre, m.cantidad_enviada, m.cantidad_recibida,
+                   m.fecha_inicio, m.fecha_fin
+            FROM prod_movimientos_produccion m
+            LEFT JOIN prod_servicios_produccion s ON m.servicio_id = s.id
+            WHERE m.registro_id = $1 ORDER BY m.fecha_inicio
+        """, registro_id)
+        salidas = await conn.fetch("""
+            SELECT i.nombre as item_nombre, i.codigo as item_codigo, s.cantidad, s.costo_total
+            FROM prod_inventario_salidas s
+            JOIN prod_inventario i ON s.item_id = i.id
+            WHERE s.registro_id = $1
+        """, registro_id)
+
+        datos_json = json.dumps({
+            "costos": costos,
+            "merma_qty": merma_qty,
+            "movimientos": [dict(m) for m in movs],
+            "salidas": [dict(s) for s in salidas],
+            "generado_at": datetime.now(timezone.utc).isoformat(),
+        }, default=_json_default)
+        await conn.execute("""
+            INSERT INTO prod_registro_costo_snapshot (registro_id, datos, generado_at)
+            VALUES ($1, $2::jsonb, NOW())
+            ON CONFLICT (registro_id) DO UPDATE SET datos = EXCLUDED.datos, generado_at = NOW()
+        """, registro_id, datos_json)
+        return json.loads(datos_json)
+
+
 async def _get_qty_terminada(conn, registro_id):
     """Cantidad terminada real desde tallas del registro."""
     return safe_float(await conn.fetchval(
@@ -120,18 +201,12 @@ async def _get_merma_qty(conn, registro_id):
     ))
 
 
-async def _validar_pre_cierre(conn, reg, qty_terminada):
-    """Validaciones obligatorias antes del cierre. Retorna lista de errores."""
+def _errores_cierre(reg, qty_terminada, estado_cierre, pt_existe):
+    """Reglas de validación pre-cierre sobre datos ya cargados (individual o por lote)."""
     errores = []
 
-    if not reg:
-        return ["Registro no encontrado"]
-
     # Ya cerrado
-    cierre_existente = await conn.fetchrow(
-        "SELECT id, estado_cierre FROM prod_registro_cierre WHERE registro_id = $1", reg["id"]
-    )
-    if cierre_existente and cierre_existente["estado_cierre"] == "CERRADO":
+    if estado_cierre == "CERRADO":
         errores.append("Este registro ya tiene un cierre activo. Use reapertura si necesita modificar.")
 
     # Cantidad terminada
@@ -141,10 +216,8 @@ async def _validar_pre_cierre(conn, reg, qty_terminada):
     # PT asignado
     if not reg.get("pt_item_id"):
         errores.append("Debe asignar un articulo de Producto Terminado (PT) antes de cerrar.")
-    else:
-        pt = await conn.fetchrow("SELECT id FROM prod_inventario WHERE id = $1", reg["pt_item_id"])
-        if not pt:
-            errores.append(f"El item PT asignado ({reg['pt_item_id']}) no existe en inventario.")
+    elif not pt_existe:
+        errores.append(f"El item PT asignado ({reg['pt_item_id']}) no existe en inventario.")
 
     # Estado compatible
     estados_no_cierre = ("CERRADA", "ANULADA", "Anulada")
@@ -154,6 +227,22 @@ async def _validar_pre_cierre(conn, reg, qty_terminada):
     return errores
 
 
+async def _validar_pre_cierre(conn, reg, qty_terminada):
+    """Validaciones obligatorias antes del cierre. Retorna lista de errores."""
+    if not reg:
+        return ["Registro no encontrado"]
+
+    cierre_existente = await conn.fetchrow(
+        "SELECT id, estado_cierre FROM prod_registro_cierre WHERE registro_id = $1", reg["id"]
+    )
+    pt_existe = False
+    if reg.get("pt_item_id"):
+        pt_existe = await conn.fetchval("SELECT id FROM prod_inventario WHERE id = $1", reg["pt_item_id"]) is not None
+    return _errores_cierre(
+        reg, qty_terminada, cierre_existente["estado_cierre"] if cierre_existente else None, pt_existe
+    )
+
+
 # ==================== ENDPOINTS ====================
 
 @router.put("/registros/{registro_id}/pt-item")
@@ -196,8 +285,9 @@ async def preview_cierre(registro_id: str, current_user: dict = Depends(get_curr
             raise HTTPException(status_code=400, detail="Este registro ya tiene un cierre activo")
 
         qty = await _get_qty_terminada(conn, registro_id)
-        merma_qty = await _get_merma_qty(conn, registro_id)
-        costos = await _calcular_costos(conn, registro_id)
+        snapshot = await _snapshot_costos(conn, registro_id)
+        merma_qty = snapshot["merma_qty"]
+        costos = snapshot["costos"]
 
         costo_unitario_final = costos["costo_total_final"] / qty if qty > 0 else 0
 
@@ -250,195 +340,331 @@ async def preview_cierre(registro_id: str, current_user: dict = Depends(get_curr
         }
 
 
-@router.post("/registros/{registro_id}/cierre-produccion")
-async def ejecutar_cierre(registro_id: str, data: CierreRegistroInput, current_user: dict = Depends(get_current_user)):
-    """Ejecuta el cierre: calcula costos, congela snapshot, crea ingreso PT, marca estado."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.transaction():
-            reg = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", registro_id)
-            if not reg:
-                raise HTTPException(status_code=404, detail="Registro no encontrado")
-
-            # Calcular qty
-            if data.qty_terminada and data.qty_terminada > 0:
-                qty_terminada = data.qty_terminada
-            else:
-                qty_terminada = await _get_qty_terminada(conn, registro_id)
-
-            # Validaciones obligatorias
-            errores = await _validar_pre_cierre(conn, reg, qty_terminada)
-            if errores:
-                raise HTTPException(status_code=400, detail="; ".join(errores))
-
-            # Merma
-            merma_qty = await _get_merma_qty(conn, registro_id)
-
-            # Costos reales
-            costos = await _calcular_costos(conn, registro_id)
-            costo_mp = costos["costo_mp"]
-            costo_servicios = costos["costo_servicios"]
-            otros_costos = costos["otros_costos"]
-            costo_total_final = costos["costo_total_final"]
-            costo_unitario_final = costo_total_final / qty_terminada if qty_terminada > 0 else 0
-
-            fecha_cierre = data.fecha or date.today()
-            empresa_id = data.empresa_id or reg.get('empresa_id') or 7
-            # Validar FK empresa
-            valid_empresa = await conn.fetchval("SELECT id FROM finanzas2.cont_empresa WHERE id = $1", empresa_id)
-            if not valid_empresa:
-                empresa_id = await conn.fetchval("SELECT id FROM finanzas2.cont_empresa ORDER BY id LIMIT 1") or 7
-
-            usuario_cierre = current_user.get("username", current_user.get("nombre", "sistema"))
-            ahora = datetime.now(timezone.utc)
-
-            # Snapshot de auditoria (congelado, no se recalcula despues)
-            snapshot = {
-                "registro_id": registro_id,
-                "n_corte": reg["n_corte"],
-                "qty_planeada": safe_float(reg.get("cantidad_total")),
-                "qty_terminada_real": qty_terminada,
-                "merma_qty": merma_qty,
-                "costo_mp": costo_mp,
-                "costo_servicios": costo_servicios,
-                "otros_costos": otros_costos,
-                "costo_total_final": round(costo_total_final, 2),
-                "costo_unitario_final": round(costo_unitario_final, 6),
-                "cerrado_por": usuario_cierre,
-                "cerrado_at": ahora.isoformat(),
-                "fuentes": {
-                    "mp": costos["salidas_mp_detalle"],
-                    "servicios": costos["movimientos_detalle"],
-                    "otros": costos["otros_costos_detalle"],
-                },
-            }
+async def _cerrar_registro(conn, registro_id: str, data: CierreRegistroInput, current_user: dict):
+    """Motor de cierre de un registro en su propia transacción (cierre individual y por lote)."""
+    async with conn.transaction():
+        reg = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", registro_id)
+        if not reg:
+            raise HTTPException(status_code=404, detail="Registro no encontrado")
+
+        # Calcular qty
+        if data.qty_terminada and data.qty_terminada > 0:
+            qty_terminada = data.qty_terminada
+        else:
+            qty_terminada = await _get_qty_terminada(conn, registro_id)
+
+        # Validaciones obligatorias
+        errores = await _validar_pre_cierre(conn, reg, qty_terminada)
+        if errores:
+            raise HTTPException(status_code=400, detail="; ".join(errores))
+
+        # Merma
+        merma_qty = await _get_merma_qty(conn, registro_id)
 
-            # Crear ingreso PT en inventario
-            ingreso_id = str(uuid.uuid4())
+        # Costos reales
+        costos = await _calcular_costos(conn, registro_id)
+        costo_mp = costos["costo_mp"]
+        costo_servicios = costos["costo_servicios"]
+        otros_costos = costos["otros_costos"]
+        costo_total_final = costos["costo_total_final"]
+        costo_unitario_final = costo_total_final / qty_terminada if qty_terminada > 0 else 0
+
+        fecha_cierre = data.fecha or date.today()
+        empresa_id = data.empresa_id or reg.get('empresa_id') or 7
+        # Validar FK empresa
+        valid_empresa = await conn.fetchval("SELECT id FROM finanzas2.cont_empresa WHERE id = $1", empresa_id)
+        if not valid_empresa:
+            empresa_id = await conn.fetchval("SELECT id FROM finanzas2.cont_empresa ORDER BY id LIMIT 1") or 7
+
+        usuario_cierre = current_user.get("username", current_user.get("nombre", "sistema"))
+        ahora = datetime.now(timezone.utc)
+
+        # Snapshot de auditoria (congelado, no se recalcula despues)
+        snapshot = {
+            "registro_id": registro_id,
+            "n_corte": reg["n_corte"],
+            "qty_planeada": safe_float(reg.get("cantidad_total")),
+            "qty_terminada_real": qty_terminada,
+            "merma_qty": merma_qty,
+            "costo_mp": costo_mp,
+            "costo_servicios": costo_servicios,
+            "otros_costos": otros_costos,
+            "costo_total_final": round(costo_total_final, 2),
+            "costo_unitario_final": round(costo_unitario_final, 6),
+            "cerrado_por": usuario_cierre,
+            "cerrado_at": ahora.isoformat(),
+            "fuentes": {
+                "mp": costos["salidas_mp_detalle"],
+                "servicios": costos["movimientos_detalle"],
+                "otros": costos["otros_costos_detalle"],
+            },
+        }
+
+        # Crear ingreso PT en inventario
+        ingreso_id = str(uuid.uuid4())
+        await conn.execute("""
+            INSERT INTO prod_inventario_ingresos
+            (id, item_id, cantidad, cantidad_disponible, costo_unitario,
+             proveedor, numero_documento, observaciones, fecha, empresa_id,
+             fin_origen_tipo, fin_origen_id, fin_numero_doc)
+            VALUES ($1, $2, $3, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+        """,
+            ingreso_id, reg['pt_item_id'], qty_terminada, costo_unitario_final,
+            'PRODUCCION', f'CIERRE-{reg["n_corte"]}',
+            f'Cierre produccion OP {reg["n_corte"]}', fecha_cierre,
+            empresa_id, 'PROD_CIERRE', registro_id, f'OP-{reg["n_corte"]}'
+        )
+
+        # Actualizar stock PT
+        await conn.execute("""
+            UPDATE prod_inventario
+            SET stock_actual = COALESCE(stock_actual, 0) + $1
+            WHERE id = $2
+        """, qty_terminada, reg['pt_item_id'])
+
+        # Verificar si es re-cierre (registro reabierto previamente)
+        existing_cierre = await conn.fetchrow(
+            "SELECT id FROM prod_registro_cierre WHERE registro_id = $1", registro_id
+        )
+
+        if existing_cierre:
+            # Re-cierre: actualizar el registro existente
             await conn.execute("""
-                INSERT INTO prod_inventario_ingresos
-                (id, item_id, cantidad, cantidad_disponible, costo_unitario,
-                 proveedor, numero_documento, observaciones, fecha, empresa_id,
-                 fin_origen_tipo, fin_origen_id, fin_numero_doc)
-                VALUES ($1, $2, $3, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+                UPDATE prod_registro_cierre SET
+                    fecha = $2, qty_terminada = $3, merma_qty = $4,
+                    costo_mp = $5, costo_servicios = $6, otros_costos = $7,
+                    costo_total = $8, costo_unit_pt = $9, costo_unitario_final = $10,
+                    pt_ingreso_id = $11, cerrado_por = $12,
+                    observacion_cierre = $13, estado_cierre = 'CERRADO',
+                    snapshot_json = $14, updated_at = NOW(),
+                    reabierto_por = NULL, reabierto_at = NULL, motivo_reapertura = NULL
+                WHERE registro_id = $1
             """,
-                ingreso_id, reg['pt_item_id'], qty_terminada, costo_unitario_final,
-                'PRODUCCION', f'CIERRE-{reg["n_corte"]}',
-                f'Cierre produccion OP {reg["n_corte"]}', fecha_cierre,
-                empresa_id, 'PROD_CIERRE', registro_id, f'OP-{reg["n_corte"]}'
+                registro_id, fecha_cierre, qty_terminada, merma_qty,
+                costo_mp, costo_servicios, otros_costos,
+                costo_total_final, costo_unitario_final, costo_unitario_final,
+                ingreso_id, usuario_cierre,
+                data.observacion_cierre, json.dumps(snapshot, default=str)
             )
-
-            # Actualizar stock PT
+            cierre_id = existing_cierre["id"]
+        else:
+            # Primer cierre
+            cierre_id = str(uuid.uuid4())
             await conn.execute("""
-                UPDATE prod_inventario
-                SET stock_actual = COALESCE(stock_actual, 0) + $1
-                WHERE id = $2
-            """, qty_terminada, reg['pt_item_id'])
-
-            # Verificar si es re-cierre (registro reabierto previamente)
-            existing_cierre = await conn.fetchrow(
-                "SELECT id FROM prod_registro_cierre WHERE registro_id = $1", registro_id
+                INSERT INTO prod_registro_cierre
+                (id, empresa_id, registro_id, fecha, qty_terminada, merma_qty,
+                 costo_mp, costo_servicios, otros_costos, costo_total,
+                 costo_unit_pt, costo_unitario_final, pt_ingreso_id,
+                 cerrado_por, observacion_cierre, estado_cierre, snapshot_json)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, 'CERRADO', $16)
+            """,
+                cierre_id, empresa_id, registro_id, fecha_cierre,
+                qty_terminada, merma_qty,
+                costo_mp, costo_servicios, otros_costos, costo_total_final,
+                costo_unitario_final, costo_unitario_final, ingreso_id,
+                usuario_cierre, data.observacion_cierre,
+                json.dumps(snapshot, default=str)
             )
 
-            if existing_cierre:
-                # Re-cierre: actualizar el registro existente
-                await conn.execute("""
-                    UPDATE prod_registro_cierre SET
-                        fecha = $2, qty_terminada = $3, merma_qty = $4,
-                        costo_mp = $5, costo_servicios = $6, otros_costos = $7,
-                        costo_total = $8, costo_unit_pt = $9, costo_unitario_final = $10,
-                        pt_ingreso_id = $11, cerrado_por = $12,
-                        observacion_cierre = $13, estado_cierre = 'CERRADO',
-                        snapshot_json = $14, updated_at = NOW(),
-                        reabierto_por = NULL, reabierto_at = NULL, motivo_reapertura = NULL
-                    WHERE registro_id = $1
-                """,
-                    registro_id, fecha_cierre, qty_terminada, merma_qty,
-                    costo_mp, costo_servicios, otros_costos,
-                    costo_total_final, costo_unitario_final, costo_unitario_final,
-                    ingreso_id, usuario_cierre,
-                    data.observacion_cierre, json.dumps(snapshot, default=str)
-                )
-                cierre_id = existing_cierre["id"]
-            else:
-                # Primer cierre
-                cierre_id = str(uuid.uuid4())
-                await conn.execute("""
-                    INSERT INTO prod_registro_cierre
-                    (id, empresa_id, registro_id, fecha, qty_terminada, merma_qty,
-                     costo_mp, costo_servicios, otros_costos, costo_total,
-                     costo_unit_pt, costo_unitario_final, pt_ingreso_id,
-                     cerrado_por, observacion_cierre, estado_cierre, snapshot_json)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, 'CERRADO', $16)
-                """,
-                    cierre_id, empresa_id, registro_id, fecha_cierre,
-                    qty_terminada, merma_qty,
-                    costo_mp, costo_servicios, otros_costos, costo_total_final,
-                    costo_unitario_final, costo_unitario_final, ingreso_id,
-                    usuario_cierre, data.observacion_cierre,
-                    json.dumps(snapshot, default=str)
-                )
-
-            # Liberar reservas pendientes
-            reservas = await conn.fetch("""
+        # Liberar reservas pendientes (set-based: líneas + requerimiento en una sentencia)
+        await conn.execute("""
+            WITH pendientes AS (
                 SELECT rl.id, rl.item_id, rl.talla_id,
                        rl.cantidad_reservada - rl.cantidad_liberada as pendiente
                 FROM prod_inventario_reservas_linea rl
                 JOIN prod_inventario_reservas r ON rl.reserva_id = r.id
                 WHERE r.registro_id = $1 AND r.estado = 'ACTIVA'
                 AND rl.cantidad_reservada > rl.cantidad_liberada
-            """, registro_id)
+            ), liberadas AS (
+                UPDATE prod_inventario_reservas_linea rl
+                SET cantidad_liberada = rl.cantidad_reservada, updated_at = NOW()
+                FROM pendientes p
+                WHERE rl.id = p.id
+                RETURNING p.item_id, p.talla_id, p.pendiente
+            )
+            UPDATE prod_registro_requerimiento_mp req
+            SET cantidad_reservada = req.cantidad_reservada - d.pendiente, updated_at = NOW()
+            FROM (
+                SELECT req2.id, SUM(l.pendiente) as pendiente
+                FROM liberadas l
+                JOIN prod_registro_requerimiento_mp req2
+                  ON req2.registro_id = $1 AND req2.item_id = l.item_id
+                 AND (l.talla_id IS NULL OR req2.talla_id = l.talla_id)
+                GROUP BY req2.id
+            ) d
+            WHERE req.id = d.id
+        """, registro_id)
 
-            for rl in reservas:
-                pendiente = float(rl['pendiente'])
-                if pendiente > 0:
-                    await conn.execute("""
-                        UPDATE prod_inventario_reservas_linea
-                        SET cantidad_liberada = cantidad_reservada, updated_at = NOW()
-                        WHERE id = $1
-                    """, rl['id'])
-                    await conn.execute("""
-                        UPDATE prod_registro_requerimiento_mp
-                        SET cantidad_reservada = cantidad_reservada - $1, updated_at = NOW()
-                        WHERE registro_id = $2 AND item_id = $3
-                        AND ($4::varchar IS NULL OR talla_id = $4)
-                    """, pendiente, registro_id, rl['item_id'], rl['talla_id'])
+        # Cerrar reservas
+        await conn.execute("""
+            UPDATE prod_inventario_reservas SET estado = 'CERRADA', updated_at = NOW()
+            WHERE registro_id = $1 AND estado = 'ACTIVA'
+        """, registro_id)
+        await refrescar_agregados_por_registro(conn, registro_id)
+        await refrescar_agregados_inventario(conn, [reg['pt_item_id']])
 
-            # Cerrar reservas
-            await conn.execute("""
-                UPDATE prod_inventario_reservas SET estado = 'CERRADA', updated_at = NOW()
-                WHERE registro_id = $1 AND estado = 'ACTIVA'
-            """, registro_id)
+        # Actualizar estado del registro
+        await conn.execute("""
+            UPDATE prod_registros SET estado = 'CERRADA', estado_op = 'CERRADA' WHERE id = $1
+        """, registro_id)
+        await refrescar_cubo_registros(conn, [registro_id])
 
-            # Actualizar estado del registro
-            await conn.execute("""
-                UPDATE prod_registros SET estado = 'CERRADA', estado_op = 'CERRADA' WHERE id = $1
-            """, registro_id)
+        # Auditoria (dentro de transaccion - atomico)
+        await audit_log(conn, get_usuario(current_user), "CONFIRM", "produccion", "prod_registro_cierre", registro_id,
+            datos_despues={"estado_cierre": "CERRADO", "costo_mp": round(costo_mp, 2),
+                           "costo_servicios": round(costo_servicios, 2), "otros_costos": round(otros_costos, 2),
+                           "costo_total_final": round(costo_total_final, 2), "qty_terminada": qty_terminada},
+            observacion=data.observacion_cierre, linea_negocio_id=reg.get('linea_negocio_id'),
+            referencia=cierre_id)
 
-            # Auditoria (dentro de transaccion - atomico)
-            await audit_log(conn, get_usuario(current_user), "CONFIRM", "produccion", "prod_registro_cierre", registro_id,
-                datos_despues={"estado_cierre": "CERRADO", "costo_mp": round(costo_mp, 2),
-                               "costo_servicios": round(costo_servicios, 2), "otros_costos": round(otros_costos, 2),
-                               "costo_total_final": round(costo_total_final, 2), "qty_terminada": qty_terminada},
-                observacion=data.observacion_cierre, linea_negocio_id=reg.get('linea_negocio_id'),
-                referencia=cierre_id)
+        return {
+            "message": f"Cierre completado para OP {reg['n_corte']}",
+            "cierre_id": cierre_id,
+            "ingreso_pt_id": ingreso_id,
+            "qty_terminada": qty_terminada,
+            "merma_qty": merma_qty,
+            "costo_mp": round(costo_mp, 2),
+            "costo_servicios": round(costo_servicios, 2),
+            "otros_costos": round(otros_costos, 2),
+            "costo_total_final": round(costo_total_final, 2),
+            "costo_unitario_final": round(costo_unitario_final, 6),
+            "costo_total": round(costo_total_final, 2),
+            "costo_unit_pt": round(costo_unitario_final, 6),
+            "estado_cierre": "CERRADO",
+            "snapshot_guardado": True,
+        }
 
-            return {
-                "message": f"Cierre completado para OP {reg['n_corte']}",
-                "cierre_id": cierre_id,
-                "ingreso_pt_id": ingreso_id,
-                "qty_terminada": qty_terminada,
-                "merma_qty": merma_qty,
-                "costo_mp": round(costo_mp, 2),
-                "costo_servicios": round(costo_servicios, 2),
-                "otros_costos": round(otros_costos, 2),
-                "costo_total_final": round(costo_total_final, 2),
-                "costo_unitario_final": round(costo_unitario_final, 6),
-                "costo_total": round(costo_total_final, 2),
-                "costo_unit_pt": round(costo_unitario_final, 6),
-                "estado_cierre": "CERRADO",
-                "snapshot_guardado": True,
-            }
+
+@router.post("/registros/{registro_id}/cierre-produccion")
+async def ejecutar_cierre(registro_id: str, data: CierreRegistroInput, current_user: dict = Depends(get_current_user)):
+    """Ejecuta el cierre: calcula costos, congela snapshot, crea ingreso PT, marca estado."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await _cerrar_registro(conn, registro_id, data, current_user)
+
+
+async def _prevalidar_lote(conn, registro_ids: List[str]) -> List[dict]:
+    """Validación y costos de todos los registros del lote en una sola consulta."""
+    rows = await conn.fetch("""
+        WITH ids AS (
+            SELECT id, ord FROM unnest($1::varchar[]) WITH ORDINALITY AS t(id, ord)
+        )
+        SELECT ids.id as solicitado, r.id, r.n_corte, r.estado, r.pt_item_id,
+               pt.id IS NOT NULL as pt_existe,
+               c.estado_cierre,
+               COALESCE(t.qty, 0) as qty_terminada,
+               COALESCE(me.qty, 0) as merma_qty,
+               COALESCE(s.costo, 0) as costo_mp,
+               COALESCE(mv.costo, 0) as costo_servicios,
+               COALESCE(cs.monto, 0) as otros_costos
+        FROM ids
+        LEFT JOIN prod_registros r ON r.id = ids.id
+        LEFT JOIN prod_inventario pt ON pt.id = r.pt_item_id
+        LEFT JOIN prod_registro_cierre c ON c.registro_id = r.id
+        LEFT JOIN (SELECT registro_id, SUM(cantidad_real) as qty FROM prod_registro_tallas
+                   WHERE registro_id = ANY($1::varchar[]) GROUP BY registro_id) t ON t.registro_id = r.id
+        LEFT JOIN (SELECT registro_id, SUM(cantidad) as qty FROM prod_mermas
+                   WHERE registro_id = ANY($1::varchar[]) GROUP BY registro_id) me ON me.registro_id = r.id
+        LEFT JOIN (SELECT registro_id, SUM(costo_total) as costo FROM prod_inventario_salidas
+                   WHERE registro_id = ANY($1::varchar[]) GROUP BY registro_id) s ON s.registro_id = r.id
+        LEFT JOIN (SELECT registro_id, SUM(costo_calculado) as costo FROM prod_movimientos_produccion
+                   WHERE registro_id = ANY($1::varchar[]) GROUP BY registro_id) mv ON mv.registro_id = r.id
+        LEFT JOIN (SELECT registro_id, SUM(monto) as monto FROM prod_registro_costos_servicio
+                   WHERE registro_id = ANY($1::varchar[]) GROUP BY registro_id) cs ON cs.registro_id = r.id
+        ORDER BY ids.ord
+    """, registro_ids)
+
+    resultado = []
+    for r in rows:
+        if r['id'] is None:
+            resultado.append({"registro_id": r['solicitado'], "n_corte": None,
+                              "puede_cerrar": False, "errores": ["Registro no encontrado"]})
+            continue
+        qty = safe_float(r['qty_terminada'])
+        costo_total = safe_float(r['costo_mp']) + safe_float(r['costo_servicios']) + safe_float(r['otros_costos'])
+        errores = _errores_cierre(r, qty, r['estado_cierre'], r['pt_existe'])
+        resultado.append({
+            "registro_id": r['id'],
+            "n_corte": r['n_corte'],
+            "puede_cerrar": not errores,
+            "errores": errores,
+            "qty_terminada": qty,
+            "merma_qty": safe_float(r['merma_qty']),
+            "costo_mp": round(safe_float(r['costo_mp']), 2),
+            "costo_servicios": round(safe_float(r['costo_servicios']), 2),
+            "otros_costos": round(safe_float(r['otros_costos']), 2),
+            "costo_total_final": round(costo_total, 2),
+            "costo_unitario_final": round(costo_total / qty, 6) if qty > 0 else 0,
+        })
+    return resultado
+
+
+@router.post("/cierre-produccion/lote")
+async def ejecutar_cierre_lote(data: CierreLoteInput, current_user: dict = Depends(get_current_user)):
+    """Cierra varios registros: prevalida el lote completo y cierra cada uno en su propia transacción.
+
+    dry_run=true devuelve solo la prevalidación (mismo motor, sin escribir).
+    """
+    registro_ids = list(dict.fromkeys(data.registro_ids))
+    if len(registro_ids) > CIERRE_LOTE_MAX_REGISTROS:
+        raise HTTPException(status_code=400, detail=f"Máximo {CIERRE_LOTE_MAX_REGISTROS} registros por lote")
+
+    inicio = time.perf_counter()
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        reporte = await _prevalidar_lote(conn, registro_ids)
+
+    for lote in reporte:
+        if not lote["puede_cerrar"]:
+            lote["resultado"] = "RECHAZADO"
+        else:
+            lote["resultado"] = "PREVIEW" if data.dry_run else "PENDIENTE"
+
+    if not data.dry_run:
+        semaforo = asyncio.Semaphore(data.concurrencia or CIERRE_LOTE_CONCURRENCIA)
+        cierre_input = CierreRegistroInput(
+            empresa_id=data.empresa_id, fecha=data.fecha, observacion_cierre=data.observacion_cierre
+        )
+
+        async def _cerrar(lote: dict):
+            async with semaforo:
+                t0 = time.perf_counter()
+                for intento in range(3):
+                    try:
+                        async with pool.acquire() as conn:
+                            res = await _cerrar_registro(conn, lote["registro_id"], cierre_input, current_user)
+                        lote.update({
+                            "resultado": "CERRADO",
+                            "cierre_id": res["cierre_id"],
+                            "ingreso_pt_id": res["ingreso_pt_id"],
+                            "qty_terminada": res["qty_terminada"],
+                            "costo_total_final": res["costo_total_final"],
+                            "costo_unitario_final": res["costo_unitario_final"],
+                        })
+                        break
+                    except DeadlockDetectedError:
+                        if intento == 2:
+                            lote.update({"resultado": "ERROR", "errores": ["Conflicto de bloqueo al cerrar, reintente"]})
+                    except HTTPException as e:
+                        lote.update({"resultado": "ERROR", "errores": [str(e.detail)]})
+                        break
+                    except Exception as e:
+                        lote.update({"resultado": "ERROR", "errores": [str(e)]})
+                        break
+                lote["duracion_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        await asyncio.gather(*(_cerrar(l) for l in reporte if l["puede_cerrar"]))
+
+    conteo = {}
+    for lote in reporte:
+        conteo[lote["resultado"]] = conteo.get(lote["resultado"], 0) + 1
+    return {
+        "dry_run": data.dry_run,
+        "total": len(reporte),
+        "resumen": conteo,
+        "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "registros": reporte,
+    }
 
 
 @router.get("/registros/{registro_id}/cierre-produccion")
@@ -466,6 +692,21 @@ async def get_cierre(registro_id: str, current_user: dict = Depends(get_current_
                 except (ValueError, TypeError):
                     pass
 
+        # Cierres sin snapshot congelado (anteriores a snapshot_json) o reabiertos:
+        # fuentes y costos actuales desde el snapshot de costos del registro
+        if not result.get("snapshot_json") or result.get("estado_cierre") != "CERRADO":
+            snapshot = await _snapshot_costos(conn, registro_id)
+            if not result.get("snapshot_json"):
+                result["snapshot_json"] = {
+                    "fuentes": {
+                        "mp": snapshot["costos"]["salidas_mp_detalle"],
+                        "servicios": snapshot["costos"]["movimientos_detalle"],
+                        "otros": snapshot["costos"]["otros_costos_detalle"],
+                    },
+                }
+            if result.get("estado_cierre") != "CERRADO":
+                result["costos_actuales"] = snapshot["costos"]
+
         return result
 
 
@@ -526,6 +767,8 @@ async def reabrir_cierre(registro_id: str, data: ReaperturaInput, current_user:
                     "DELETE FROM prod_inventario_ingresos WHERE id = $1",
                     cierre["pt_ingreso_id"]
                 )
+                if ingreso:
+                    await refrescar_agregados_inventario(conn, [ingreso["item_id"]])
 
             # Marcar cierre como reabierto
             await conn.execute("""
@@ -542,6 +785,7 @@ async def reabrir_cierre(registro_id: str, data: ReaperturaInput, current_user:
             await conn.execute("""
                 UPDATE prod_registros SET estado = 'Producto Terminado', estado_op = 'EN_PROCESO' WHERE id = $1
             """, registro_id)
+            await refrescar_cubo_registros(conn, [registro_id])
 
             # Auditoria (dentro de transaccion - atomico)
             reg_row = await conn.fetchrow("SELECT linea_negocio_id FROM prod_registros WHERE id = $1", registro_id)
@@ -561,196 +805,101 @@ async def reabrir_cierre(registro_id: str, data: ReaperturaInput, current_user:
 
 # ==================== PDF BALANCE ====================
 
+async def _datos_balance_pdf(conn, registro_id: str):
+    """Datos de entrada del balance PDF (serializables, ver pdf_render.render_balance_pdf)."""
+    reg = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", registro_id)
+    if not reg:
+        return None
+
+    modelo = await conn.fetchrow("SELECT m.nombre, ma.nombre as marca_nombre FROM prod_modelos m LEFT JOIN prod_marcas ma ON m.marca_id = ma.id WHERE m.id = $1", reg['modelo_id']) if reg['modelo_id'] else None
+    tallas = await conn.fetch("SELECT talla_id, cantidad_real FROM prod_registro_tallas WHERE registro_id = $1", registro_id)
+
+    tallas_info = json.loads(reg['tallas']) if reg.get('tallas') else []
+    tallas_map_nombre = {t.get('id', t.get('talla_id', '')): t.get('nombre', t.get('talla', '')) for t in tallas_info}
+
+    snapshot = await _snapshot_costos(conn, registro_id)
+    cierre = await conn.fetchrow("""
+        SELECT estado_cierre, costo_mp, costo_servicios, otros_costos, costo_total,
+               costo_unitario_final, costo_unit_pt
+        FROM prod_registro_cierre WHERE registro_id = $1
+    """, registro_id)
+
+    return {
+        "registro": {"id": reg['id'], "n_corte": reg['n_corte'], "estado": reg['estado']},
+        "modelo": dict(modelo) if modelo else None,
+        "tallas": [{"talla_id": t['talla_id'], "cantidad_real": int(t['cantidad_real'])} for t in tallas],
+        "tallas_map_nombre": tallas_map_nombre,
+        "merma_qty": snapshot["merma_qty"],
+        # Fecha de los datos, no del render: forma parte de la huella del cache
+        "datos_al": snapshot.get("generado_at"),
+        "movimientos": snapshot["movimientos"],
+        "salidas": snapshot["salidas"],
+        "cierre": {k: (float(v) if isinstance(v, Decimal) else v) for k, v in cierre.items()} if cierre else None,
+    }
+
+
+def _nombre_balance_pdf(datos: dict) -> str:
+    return f"Balance_{datos['registro']['n_corte'].replace(' ', '_')}.pdf"
+
+
 @router.get("/registros/{registro_id}/balance-pdf")
 async def get_balance_pdf(registro_id: str, current_user: dict = Depends(get_current_user)):
-    """Genera PDF detallado del balance del lote"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import cm
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from fastapi.responses import StreamingResponse
-    import io
-
+    """Genera PDF detallado del balance del lote (renderizado en el pool de PDF, cacheado por contenido)"""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        reg = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", registro_id)
-        if not reg:
-            raise HTTPException(status_code=404, detail="Registro no encontrado")
+        datos = await _datos_balance_pdf(conn, registro_id)
+    if not datos:
+        raise HTTPException(status_code=404, detail="Registro no encontrado")
 
-        modelo = await conn.fetchrow("SELECT m.nombre, ma.nombre as marca_nombre FROM prod_modelos m LEFT JOIN prod_marcas ma ON m.marca_id = ma.id WHERE m.id = $1", reg['modelo_id']) if reg['modelo_id'] else None
-        tallas = await conn.fetch("SELECT talla_id, cantidad_real FROM prod_registro_tallas WHERE registro_id = $1", registro_id)
-        total_prendas = sum(int(t['cantidad_real']) for t in tallas)
+    try:
+        pdf = await renderizar_pdf("balance", render_balance_pdf, datos)
+    except ColaPdfLlena as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={_nombre_balance_pdf(datos)}"}
+    )
 
-        tallas_info = json.loads(reg['tallas']) if reg.get('tallas') else []
-        tallas_map_nombre = {t.get('id', t.get('talla_id', '')): t.get('nombre', t.get('talla', '')) for t in tallas_info}
 
-        movs = await conn.fetch("""
-            SELECT m.*, s.nombre as servicio_nombre
-            FROM prod_movimientos_produccion m
-            LEFT JOIN prod_servicios_produccion s ON m.servicio_id = s.id
-            WHERE m.registro_id = $1 ORDER BY m.fecha_inicio
-        """, registro_id)
+@router.post("/registros/balance-pdf/lote")
+async def get_balance_pdf_lote(data: BalanceLoteInput, current_user: dict = Depends(get_current_user)):
+    """Balances de varios lotes en un ZIP (un PDF por registro; los no encontrados se omiten)."""
+    registro_ids = list(dict.fromkeys(data.registro_ids))
+    if len(registro_ids) > BALANCE_LOTE_MAX_REGISTROS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BALANCE_LOTE_MAX_REGISTROS} registros por lote")
 
-        mermas = await conn.fetch("SELECT * FROM prod_mermas WHERE registro_id = $1", registro_id)
-        total_mermas = sum(float(m.get('cantidad', 0) or 0) for m in mermas)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        lote = [await _datos_balance_pdf(conn, rid) for rid in registro_ids]
+    lote = [d for d in lote if d]
+    if not lote:
+        raise HTTPException(status_code=404, detail="Ningún registro encontrado")
 
-        cierre = await conn.fetchrow("SELECT * FROM prod_registro_cierre WHERE registro_id = $1", registro_id)
-
-        salidas = await conn.fetch("""
-            SELECT s.*, i.nombre as item_nombre, i.codigo as item_codigo
-            FROM prod_inventario_salidas s
-            JOIN prod_inventario i ON s.item_id = i.id
-            WHERE s.registro_id = $1
-        """, registro_id)
-        total_costo_mp = sum(float(s.get('costo_total', 0) or 0) for s in salidas)
+    pdfs = await asyncio.gather(*(renderizar_pdf("balance", render_balance_pdf, d, esperar=True) for d in lote))
 
+    def _zip():
         buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1.5*cm, bottomMargin=1.5*cm, leftMargin=2*cm, rightMargin=2*cm)
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=16, spaceAfter=6)
-        subtitle_style = ParagraphStyle('Subtitle', parent=styles['Heading2'], fontSize=12, spaceAfter=4)
-        normal = styles['Normal']
-
-        elements = []
-
-        elements.append(Paragraph(f"Balance del Lote - {reg['n_corte']}", title_style))
-        elements.append(Paragraph(f"Modelo: {modelo['nombre'] if modelo else 'N/A'} | Marca: {modelo['marca_nombre'] if modelo and modelo.get('marca_nombre') else 'N/A'}", normal))
-        estado_label = reg['estado']
-        if cierre and cierre.get('estado_cierre') == 'CERRADO':
-            estado_label += " [CERRADO]"
-        elements.append(Paragraph(f"Estado: {estado_label} | Fecha: {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M')}", normal))
-        elements.append(Spacer(1, 0.5*cm))
-
-        # Tallas
-        elements.append(Paragraph("Distribucion por Tallas", subtitle_style))
-        talla_data = [['Talla', 'Cantidad']]
-        for t in tallas:
-            nombre = tallas_map_nombre.get(t['talla_id'], t['talla_id'])
-            talla_data.append([nombre, str(int(t['cantidad_real']))])
-        talla_data.append(['TOTAL', str(total_prendas)])
-        t_table = Table(talla_data, colWidths=[8*cm, 4*cm])
-        t_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f9ff')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        elements.append(t_table)
-        elements.append(Spacer(1, 0.5*cm))
-
-        # Balance cantidades
-        elements.append(Paragraph("Balance de Cantidades", subtitle_style))
-        en_produccion = total_prendas - int(total_mermas)
-        bal_data = [
-            ['Concepto', 'Cantidad'],
-            ['Cantidad Inicial', str(total_prendas)],
-            ['En Produccion', str(en_produccion)],
-            ['Mermas / Faltantes', str(int(total_mermas))],
-        ]
-        bal_table = Table(bal_data, colWidths=[8*cm, 4*cm])
-        bal_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        elements.append(bal_table)
-        elements.append(Spacer(1, 0.5*cm))
-
-        # Movimientos
-        if movs:
-            elements.append(Paragraph("Movimientos de Produccion", subtitle_style))
-            mov_data = [['Servicio', 'Enviado', 'Recibido', 'Fecha Envio', 'Estado']]
-            for m in movs:
-                fecha = str(m['fecha_inicio'])[:10] if m.get('fecha_inicio') else '-'
-                estado = 'Completado' if m.get('fecha_fin') else 'En proceso'
-                mov_data.append([
-                    m.get('servicio_nombre', '-'),
-                    str(int(m.get('cantidad_enviada', 0) or 0)),
-                    str(int(m.get('cantidad_recibida', 0) or 0)),
-                    fecha, estado,
-                ])
-            mov_table = Table(mov_data, colWidths=[4*cm, 2.5*cm, 2.5*cm, 2.5*cm, 2.5*cm])
-            mov_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-                ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
-                ('TOPPADDING', (0, 0), (-1, -1), 3),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-            ]))
-            elements.append(mov_table)
-            elements.append(Spacer(1, 0.5*cm))
-
-        # Materiales consumidos
-        if salidas:
-            elements.append(Paragraph("Materiales Consumidos", subtitle_style))
-            sal_data = [['Material', 'Cantidad', 'Costo']]
-            for s in salidas:
-                sal_data.append([
-                    s.get('item_nombre', '-'),
-                    f"{float(s.get('cantidad', 0)):.1f}",
-                    f"S/ {float(s.get('costo_total', 0) or 0):.2f}",
-                ])
-            sal_data.append(['TOTAL MATERIALES', '', f"S/ {total_costo_mp:.2f}"])
-            sal_table = Table(sal_data, colWidths=[6*cm, 3*cm, 3*cm])
-            sal_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#f0f9ff')),
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-                ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-                ('TOPPADDING', (0, 0), (-1, -1), 3),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-            ]))
-            elements.append(sal_table)
-            elements.append(Spacer(1, 0.5*cm))
-
-        # Resumen costos (del cierre congelado si existe)
-        if cierre:
-            elements.append(Paragraph("Resumen de Costos (Congelado)", subtitle_style))
-            cost_data = [
-                ['Concepto', 'Monto'],
-                ['Costo MP (FIFO)', f"S/ {safe_float(cierre.get('costo_mp')):.2f}"],
-                ['Costo Servicios', f"S/ {safe_float(cierre.get('costo_servicios')):.2f}"],
-                ['Otros Costos', f"S/ {safe_float(cierre.get('otros_costos')):.2f}"],
-                ['COSTO TOTAL FINAL', f"S/ {safe_float(cierre.get('costo_total')):.2f}"],
-                ['Costo Unitario Final', f"S/ {safe_float(cierre.get('costo_unitario_final') or cierre.get('costo_unit_pt')):.6f}"],
-            ]
-            cost_table = Table(cost_data, colWidths=[8*cm, 4*cm])
-            cost_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dcfce7')),
-                ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-                ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-                ('TOPPADDING', (0, 0), (-1, -1), 4),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-            ]))
-            elements.append(cost_table)
-
-        doc.build(elements)
-        buffer.seek(0)
-
-        filename = f"Balance_{reg['n_corte'].replace(' ', '_')}.pdf"
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        nombres = set()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for datos, pdf in zip(lote, pdfs):
+                nombre = _nombre_balance_pdf(datos)
+                if nombre in nombres:
+                    nombre = nombre.replace(".pdf", f"_{datos['registro']['id'][:8]}.pdf")
+                nombres.add(nombre)
+                zf.writestr(nombre, pdf)
+        return buffer.getvalue()
+
+    contenido = await asyncio.to_thread(_zip)
+    return Response(
+        content=contenido,
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=Balances.zip"}
+    )
+
+
+@router.get("/pdf/estado")
+async def get_estado_pdf(current_user: dict = Depends(get_current_user)):
+    """Métricas del pool de PDF (renders, hits de cache, rechazos por cola llena)."""
+    return estado_pdf()
@@ -14,7 +14,8 @@ import sys
 sys.path.insert(0, '/app/backend')
 from db import get_pool
 from auth import get_current_user
-from helpers import row_to_dict
+from helpers import row_to_dict, refrescar_agregados_inventario
+from matriz_cubo import refrescar_cubo_registros
 
 
 # ==================== PYDANTIC MODELS ====================
@@ -36,7 +37,7 @@ class CierreConfirmar(BaseModel):
 
 async def calcular_wip(conn, orden_id: str):
     """Calcula WIP actual de una orden"""
-    wip = await conn.fetchrow("SELECT * FROM v_wip_resumen WHERE orden_id = $1", orden_id)
+    wip = await conn.fetchrow("SELECT * FROM prod_wip_resumen WHERE orden_id = $1", orden_id)
     if wip:
         return {
             "costo_mp": float(wip['costo_mp'] or 0),
@@ -253,6 +254,7 @@ async def ejecutar_cierre(
                 SET stock_actual = COALESCE(stock_actual, 0) + $1
                 WHERE id = $2
             """, data.cantidad_terminada, orden['pt_item_id'])
+            await refrescar_agregados_inventario(conn, [orden['pt_item_id']])
             
             # Mark orden as CERRADA
             await conn.execute("""
@@ -260,6 +262,7 @@ async def ejecutar_cierre(
                 SET estado_op = 'CERRADA', estado = 'CERRADA'
                 WHERE id = $1
             """, orden_id)
+            await refrescar_cubo_registros(conn, [orden_id])
             
             return {
                 "success": True,
@@ -364,6 +367,7 @@ async def anular_cierre(
                 
                 # Delete ingreso_pt
                 await conn.execute("DELETE FROM prod_ingreso_pt WHERE id = $1", ingreso_pt['id'])
+                await refrescar_agregados_inventario(conn, [ingreso_pt['item_pt_id']])
             
             # Delete cierre
             await conn.execute("DELETE FROM prod_registro_cierre WHERE id = $1", cierre['id'])
@@ -374,6 +378,7 @@ async def anular_cierre(
                 SET estado_op = 'EN_PROCESO', estado = 'En Proceso'
                 WHERE id = $1
             """, orden_id)
+            await refrescar_cubo_registros(conn, [orden_id])
             
             return {
                 "success": True,
@@ -14,7 +14,7 @@ import sys
 sys.path.insert(0, '/app/backend')
 from db import get_pool
 from auth import get_current_user
-from helpers import row_to_dict
+from helpers import row_to_dict, refrescar_agregados_inventario, registrar_wip, eliminar_wip_origen
 
 
 # ==================== PYDANTIC MODELS ====================
@@ -175,22 +175,11 @@ async def actualizar_stock_fifo(conn, item_id: str, cantidad: float, rollo_id: s
     await conn.execute("""
         UPDATE prod_inventario SET stock_actual = stock_actual - $1 WHERE id = $2
     """, cantidad, item_id)
+    await refrescar_agregados_inventario(conn, [item_id])
     
     return costo_total, detalle
 
 
-async def registrar_wip(conn, empresa_id: int, orden_id: str, origen_tipo: str, 
-                        origen_id: str, costo: float, fecha, descripcion: str):
-    """Registra un movimiento WIP"""
-    wip_id = str(uuid.uuid4())
-    await conn.execute("""
-        INSERT INTO prod_wip_movimiento 
-        (id, empresa_id, orden_id, origen_tipo, origen_id, costo, fecha, descripcion)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-    """, wip_id, empresa_id, orden_id, origen_tipo, origen_id, costo, fecha, descripcion)
-    return wip_id
-
-
 # ==================== ENDPOINTS ====================
 
 @router.get("/consumos")
@@ -519,10 +508,7 @@ async def delete_consumo(
                     """, cantidad, rollo['ingreso_id'])
             
             # Delete WIP entry
-            await conn.execute("""
-                DELETE FROM prod_wip_movimiento 
-                WHERE origen_tipo = 'CONSUMO_MP' AND origen_id = $1
-            """, consumo_id)
+            await eliminar_wip_origen(conn, 'CONSUMO_MP', consumo_id)
             
             # Update requerimiento
             if consumo['talla_id']:
@@ -540,6 +526,7 @@ async def delete_consumo(
             
             # Delete consumo
             await conn.execute("DELETE FROM prod_consumo_mp WHERE id = $1", consumo_id)
+            await refrescar_agregados_inventario(conn, [item_id])
             
             return {
                 "message": "Consumo eliminado y stock revertido",
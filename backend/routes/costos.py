@@ -8,7 +8,7 @@ from typing import Optional
 from datetime import date
 from db import get_pool
 from auth import get_current_user
-from helpers import row_to_dict
+from helpers import row_to_dict, invalidar_snapshot_costos
 
 router = APIRouter(prefix="/api", tags=["costos-servicio"])
 
@@ -75,6 +75,7 @@ async def create_costo_servicio(registro_id: str, data: CostoServicioCreate, cur
             RETURNING *
         """, empresa_id_valida, registro_id, data.fecha, data.descripcion,
             data.proveedor_texto, data.monto, data.fin_origen_tipo, data.fin_origen_id)
+        await invalidar_snapshot_costos(conn, [registro_id])
         
         return row_to_dict(row)
 
@@ -110,6 +111,7 @@ async def update_costo_servicio(registro_id: str, costo_id: str, data: CostoServ
             f"UPDATE prod_registro_costos_servicio SET {', '.join(updates)} WHERE id = ${idx} RETURNING *",
             *params
         )
+        await invalidar_snapshot_costos(conn, [registro_id])
         return row_to_dict(row)
 
 
@@ -123,4 +125,5 @@ async def delete_costo_servicio(registro_id: str, costo_id: str, current_user: d
         )
         if not deleted:
             raise HTTPException(status_code=404, detail="Costo no encontrado")
+        await invalidar_snapshot_costos(conn, [registro_id])
         return {"message": "Costo eliminado"}
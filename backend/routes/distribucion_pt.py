@@ -2,6 +2,8 @@
 Distribucion de Producto Terminado (PT) hacia Odoo y Conciliacion.
 Tablas: prod_registro_pt_relacion, prod_registro_pt_odoo_vinculo
 """
+import os
+import time
 from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field
 from typing import List, Optional
@@ -92,6 +94,16 @@ async def _get_total_producido(conn, registro_id: str) -> float:
     return float(total)
 
 
+def _estado_conciliacion(esperado: float, ingresado: float) -> str:
+    if esperado == 0:
+        return "SIN_DISTRIBUCION"
+    if ingresado <= 0:
+        return "PENDIENTE"
+    if ingresado < esperado:
+        return "PARCIAL"
+    return "COMPLETO"
+
+
 TIPOS_SALIDA_LABELS = {
     'normal': 'Normal',
     'arreglo': 'Arreglo',
@@ -208,6 +220,7 @@ async def guardar_distribucion_pt(
                 """, registro_id, tipo, prod_id, cantidad,
                    datetime.now(), current_user.get('username'))
 
+        _invalidar_conciliacion()
         return {"ok": True, "total_distribuido": total_distribuido, "total_producido": total_producido}
 
 
@@ -219,6 +232,7 @@ async def eliminar_distribucion_pt(registro_id: str, current_user: dict = Depend
             "DELETE FROM produccion.prod_registro_pt_relacion WHERE registro_id = $1",
             registro_id
         )
+        _invalidar_conciliacion()
         return {"ok": True}
 
 
@@ -296,6 +310,7 @@ async def vincular_ajuste_odoo(
         """, registro_id, data.stock_inventory_odoo_id,
            datetime.now(), current_user.get('username'))
 
+        _invalidar_conciliacion()
         return {"ok": True, "ajuste_nombre": ajuste['name']}
 
 
@@ -311,6 +326,7 @@ async def desvincular_ajuste_odoo(
             "DELETE FROM produccion.prod_registro_pt_odoo_vinculo WHERE id = $1 AND registro_id = $2",
             vinculo_id, registro_id
         )
+        _invalidar_conciliacion()
         return {"ok": True}
 
 
@@ -359,12 +375,7 @@ async def get_conciliacion_odoo(registro_id: str, current_user: dict = Depends(g
             ingresado = ingresado_map.get(prod_id, 0)
             pendiente = esperado - ingresado
 
-            if ingresado <= 0:
-                estado = "PENDIENTE"
-            elif ingresado < esperado:
-                estado = "PARCIAL"
-            else:
-                estado = "COMPLETO"
+            estado = _estado_conciliacion(esperado, ingresado)
 
             total_esperado += esperado
             total_ingresado += ingresado
@@ -381,14 +392,7 @@ async def get_conciliacion_odoo(registro_id: str, current_user: dict = Depends(g
             })
 
         # Estado global
-        if total_esperado == 0:
-            estado_global = "SIN_DISTRIBUCION"
-        elif total_ingresado <= 0:
-            estado_global = "PENDIENTE"
-        elif total_ingresado < total_esperado:
-            estado_global = "PARCIAL"
-        else:
-            estado_global = "COMPLETO"
+        estado_global = _estado_conciliacion(total_esperado, total_ingresado)
 
         return {
             "registro_id": registro_id,
@@ -401,6 +405,144 @@ async def get_conciliacion_odoo(registro_id: str, current_user: dict = Depends(g
         }
 
 
+# Cache de la conciliación masiva: se reutiliza mientras la huella de
+# relaciones, vínculos y stock_move de los ajustes vinculados no cambie.
+# La huella no ve los cambios de estado/n_corte/modelo de los registros:
+# esas columnas se refrescan a más tardar cada CONCILIACION_CACHE_TTL_SEG.
+CONCILIACION_CACHE_TTL_SEG = float(os.environ.get('CONCILIACION_CACHE_TTL_SEG', '60'))
+ESTADOS_CONCILIACION = ("PENDIENTE", "PARCIAL", "COMPLETO")
+_conciliacion_cache = {"huella": None, "filas": [], "generado_at": None, "expira": 0.0}
+
+
+def _invalidar_conciliacion():
+    _conciliacion_cache["huella"] = None
+
+
+async def _huella_conciliacion(conn) -> tuple:
+    row = await conn.fetchrow("""
+        SELECT
+            (SELECT COUNT(*) FROM produccion.prod_registro_pt_relacion) as relaciones,
+            (SELECT COALESCE(MAX(id), 0) FROM produccion.prod_registro_pt_relacion) as max_relacion,
+            (SELECT COALESCE(SUM(cantidad), 0) FROM produccion.prod_registro_pt_relacion) as suma_relacion,
+            (SELECT COUNT(*) FROM produccion.prod_registro_pt_odoo_vinculo) as vinculos,
+            (SELECT COALESCE(MAX(id), 0) FROM produccion.prod_registro_pt_odoo_vinculo) as max_vinculo,
+            (SELECT COUNT(*) FROM odoo.stock_move sm
+             WHERE sm.state = 'done' AND sm.inventory_id IN
+                   (SELECT stock_inventory_odoo_id FROM produccion.prod_registro_pt_odoo_vinculo)) as moves,
+            (SELECT COALESCE(MAX(sm.odoo_id), 0) FROM odoo.stock_move sm
+             WHERE sm.state = 'done' AND sm.inventory_id IN
+                   (SELECT stock_inventory_odoo_id FROM produccion.prod_registro_pt_odoo_vinculo)) as max_move,
+            (SELECT COALESCE(SUM(sm.product_qty), 0) FROM odoo.stock_move sm
+             WHERE sm.state = 'done' AND sm.inventory_id IN
+                   (SELECT stock_inventory_odoo_id FROM produccion.prod_registro_pt_odoo_vinculo)) as suma_moves
+    """)
+    return tuple(row.values())
+
+
+async def _calcular_conciliacion_masiva(conn) -> list:
+    """Esperado vs ingresado de todos los registros con distribución, en un solo pase."""
+    rows = await conn.fetch("""
+        WITH esperado AS (
+            SELECT registro_id, product_template_id_odoo, SUM(cantidad) as esperado
+            FROM produccion.prod_registro_pt_relacion
+            GROUP BY registro_id, product_template_id_odoo
+        ), ingresado AS (
+            SELECT v.registro_id, sm.product_tmpl_id, SUM(sm.product_qty) as ingresado
+            FROM produccion.prod_registro_pt_odoo_vinculo v
+            JOIN odoo.stock_move sm ON sm.inventory_id = v.stock_inventory_odoo_id
+            WHERE sm.state = 'done'
+              AND v.registro_id IN (SELECT registro_id FROM esperado)
+            GROUP BY v.registro_id, sm.product_tmpl_id
+        ), cruce AS (
+            SELECT e.registro_id, e.esperado, COALESCE(i.ingresado, 0) as ingresado
+            FROM esperado e
+            LEFT JOIN ingresado i
+              ON i.registro_id = e.registro_id AND i.product_tmpl_id = e.product_template_id_odoo
+        )
+        SELECT c.registro_id, r.n_corte, r.estado as registro_estado, r.estado_op,
+               m.nombre as modelo_nombre,
+               SUM(c.esperado) as total_esperado,
+               SUM(c.ingresado) as total_ingresado,
+               COUNT(*) as productos,
+               COUNT(*) FILTER (WHERE c.ingresado >= c.esperado) as productos_completos,
+               (SELECT COUNT(*) FROM produccion.prod_registro_pt_odoo_vinculo v
+                WHERE v.registro_id = c.registro_id) as vinculos
+        FROM cruce c
+        JOIN prod_registros r ON r.id = c.registro_id
+        LEFT JOIN prod_modelos m ON m.id = r.modelo_id
+        GROUP BY c.registro_id, r.n_corte, r.estado, r.estado_op, m.nombre, r.fecha_creacion
+        ORDER BY r.fecha_creacion DESC
+    """)
+    filas = []
+    for r in rows:
+        esperado = float(r['total_esperado'] or 0)
+        ingresado = float(r['total_ingresado'] or 0)
+        filas.append({
+            "registro_id": r['registro_id'],
+            "n_corte": r['n_corte'],
+            "modelo_nombre": r['modelo_nombre'],
+            "registro_estado": r['registro_estado'],
+            "estado_op": r['estado_op'],
+            "total_esperado": esperado,
+            "total_ingresado": ingresado,
+            "total_pendiente": esperado - ingresado,
+            "productos": r['productos'],
+            "productos_completos": r['productos_completos'],
+            "vinculos": r['vinculos'],
+            "estado": _estado_conciliacion(esperado, ingresado),
+        })
+    return filas
+
+
+@router.get("/conciliacion-odoo")
+async def get_conciliacion_odoo_masiva(
+    estado: Optional[str] = Query(None, description="PENDIENTE, PARCIAL, COMPLETO (separados por coma)"),
+    search: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    refrescar: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Conciliación de todos los registros con distribución PT, filtrable y paginada por estado."""
+    estados = [e.strip().upper() for e in (estado or "").split(",") if e.strip()]
+    invalidos = [e for e in estados if e not in ESTADOS_CONCILIACION]
+    if invalidos:
+        raise HTTPException(400, f"Estado invalido: {invalidos}. Use: {list(ESTADOS_CONCILIACION)}")
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        huella = await _huella_conciliacion(conn)
+        desde_cache = (not refrescar and _conciliacion_cache["huella"] == huella
+                       and time.monotonic() < _conciliacion_cache["expira"])
+        if not desde_cache:
+            _conciliacion_cache["filas"] = await _calcular_conciliacion_masiva(conn)
+            _conciliacion_cache["huella"] = huella
+            _conciliacion_cache["expira"] = time.monotonic() + CONCILIACION_CACHE_TTL_SEG
+            _conciliacion_cache["generado_at"] = datetime.now(timezone.utc).isoformat()
+
+    filas = _conciliacion_cache["filas"]
+    resumen = {e: 0 for e in ESTADOS_CONCILIACION}
+    for f in filas:
+        resumen[f["estado"]] = resumen.get(f["estado"], 0) + 1
+
+    if estados:
+        filas = [f for f in filas if f["estado"] in estados]
+    if search:
+        term = search.strip().lower()
+        filas = [f for f in filas
+                 if term in (f["n_corte"] or "").lower() or term in (f["modelo_nombre"] or "").lower()]
+
+    return {
+        "items": filas[offset:offset + limit],
+        "total": len(filas),
+        "limit": limit,
+        "offset": offset,
+        "resumen": resumen,
+        "generado_at": _conciliacion_cache["generado_at"],
+        "desde_cache": desde_cache,
+    }
+
+
 # ======================== CATALOGOS ODOO ========================
 
 @router.get("/odoo/product-templates")
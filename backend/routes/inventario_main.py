@@ -1,19 +1,35 @@
 """Router for inventory management endpoints (items, ingresos, salidas, ajustes, rollos, reservas, reconciliar)."""
+import csv
+import io
 import json
+import os
+import time
 import uuid
 from datetime import datetime, timezone
-from fastapi import APIRouter, HTTPException, Depends, Query
+from decimal import Decimal, InvalidOperation
+
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from db import get_pool
-from auth_utils import get_current_user
+from auth_utils import get_current_user, get_current_user_optional
 from models import (
     ItemInventarioCreate, IngresoInventarioCreate,
     SalidaInventarioCreate, AjusteInventarioCreate,
     IngresoInventario, SalidaInventario, AjusteInventario, ItemInventario,
 )
-from helpers import registrar_actividad, row_to_dict, parse_jsonb
+from helpers import (
+    registrar_actividad, row_to_dict, parse_jsonb,
+    refrescar_agregados_inventario, recalcular_agregados_inventario,
+    invalidar_snapshot_costos,
+)
+from fast_json import FastJSONResponse
+from jobs import encolar_job, registrar_tipo_job
+from routes.busqueda import patron_busqueda, predicado_inventario
+from filtros_sql import FiltrosSQL
+from alertas_motor import registrar_regla, alertas_abiertas
 from routes.auditoria import audit_log_safe, get_usuario
 from typing import Optional, List
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 CATEGORIAS_INVENTARIO = ["Telas", "Avios", "Otros"]
 
@@ -35,63 +51,35 @@ async def get_inventario(
 ):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        conditions = []
-        params = []
-        param_idx = 1
-
-        if search:
-            conditions.append(f"(i.nombre ILIKE ${param_idx} OR i.codigo ILIKE ${param_idx})")
-            params.append(f"%{search}%")
-            param_idx += 1
-
-        if categoria:
-            conditions.append(f"i.categoria = ${param_idx}")
-            params.append(categoria)
-            param_idx += 1
-
-        if linea_negocio_id:
-            if linea_negocio_id == "global":
-                conditions.append("i.linea_negocio_id IS NULL")
-            else:
-                conditions.append(f"(i.linea_negocio_id = ${param_idx} OR i.linea_negocio_id IS NULL)")
-                params.append(int(linea_negocio_id))
-                param_idx += 1
-
-        where_clause = " AND ".join(conditions) if conditions else "TRUE"
-
+        # Forma fija: los filtros ausentes van como NULL y el SQL no cambia
+        filtros = FiltrosSQL()
+        filtros.si(patron_busqueda(search) if search else None, predicado_inventario)
+        filtros.igual("i.categoria", categoria)
+        # 'global' = solo ítems sin línea; un id = esa línea más los globales
+        filtros.si(linea_negocio_id or None, lambda n: (
+            f"(CASE WHEN ${n} = 'global' THEN i.linea_negocio_id IS NULL"
+            f" ELSE (i.linea_negocio_id = NULLIF(${n}, 'global')::int OR i.linea_negocio_id IS NULL) END)"
+        ))
+        filtros.si(stock_status if stock_status in ('sin_stock', 'stock_bajo', 'ok') else None, lambda n: (
+            f"(CASE ${n} WHEN 'sin_stock' THEN i.stock_actual <= 0"
+            f" WHEN 'stock_bajo' THEN i.stock_actual > 0 AND i.stock_actual <= i.stock_minimo"
+            f" ELSE i.stock_actual > i.stock_minimo END)"
+        ))
+        params = filtros.params
+        param_idx = filtros.siguiente()
+
+        # Reservado y valorizado se leen de los agregados mantenidos en prod_inventario
         base_query = f"""
             FROM prod_inventario i
-            LEFT JOIN LATERAL (
-                SELECT SUM(rl.cantidad_reservada - rl.cantidad_liberada) as total_reservado
-                FROM prod_inventario_reservas_linea rl
-                JOIN prod_inventario_reservas r ON rl.reserva_id = r.id
-                WHERE rl.item_id = i.id AND r.estado = 'ACTIVA'
-            ) res ON true
-            LEFT JOIN LATERAL (
-                SELECT SUM(cantidad_disponible * costo_unitario) as valorizado
-                FROM prod_inventario_ingresos
-                WHERE item_id = i.id AND cantidad_disponible > 0
-            ) val ON true
-            WHERE {where_clause}
+            WHERE {filtros.where()}
         """
 
-        # stock_status filter is applied post-query since it depends on computed fields
-        # But we can push it into SQL for efficiency
-        if stock_status == 'sin_stock':
-            base_query += " AND i.stock_actual <= 0"
-        elif stock_status == 'stock_bajo':
-            base_query += " AND i.stock_actual > 0 AND i.stock_actual <= i.stock_minimo"
-        elif stock_status == 'ok':
-            base_query += " AND i.stock_actual > i.stock_minimo"
-
-        # Count
-        count_row = await conn.fetchrow(f"SELECT COUNT(*) as total {base_query}", *params)
-        total = count_row['total']
-
+        # Un solo query: count con window function + data
         select_fields = """
             SELECT i.*,
-                COALESCE(res.total_reservado, 0) as total_reservado,
-                COALESCE(val.valorizado, 0) as valorizado
+                COUNT(*) OVER() as _total_count,
+                COALESCE(i.stock_reservado, 0) as total_reservado,
+                COALESCE(i.valor_inventario, 0) as valorizado
         """
 
         order_clause = " ORDER BY i.nombre ASC"
@@ -103,18 +91,25 @@ async def get_inventario(
                 f"{select_fields} {base_query} {order_clause} LIMIT ${param_idx} OFFSET ${param_idx + 1}",
                 *params, limit, offset
             )
+        if rows:
+            total = rows[0]['_total_count']
+        elif offset > 0:
+            total = await conn.fetchval(f"SELECT COUNT(*) {base_query}", *params)
+        else:
+            total = 0
 
         result = []
         for r in rows:
             d = row_to_dict(r)
+            d.pop('_total_count', None)
             d['total_reservado'] = float(d.get('total_reservado') or 0)
             d['stock_disponible'] = max(0, float(d.get('stock_actual', 0)) - d['total_reservado'])
             d['valorizado'] = float(d.get('valorizado') or 0)
             result.append(d)
 
         if all == "true":
-            return result
-        return {"items": result, "total": total, "limit": limit, "offset": offset}
+            return FastJSONResponse(result)
+        return FastJSONResponse({"items": result, "total": total, "limit": limit, "offset": offset})
 
 @router.get("/inventario-filtros")
 async def get_inventario_filtros():
@@ -127,6 +122,48 @@ async def get_inventario_filtros():
         }
 
 
+# Escrituras que mueven stock, reservas o la configuración de alertas de un item
+_DEPENDE_STOCK = (
+    "/api/inventario", "/api/registros", "/api/reservas", "/api/ordenes", "/api/cierre-produccion",
+    "/api/consumos", "/api/rollos", "/api/transferencias-linea", "/api/backup",
+)
+
+
+async def _regla_alertas_stock(conn, modo: str):
+    """Items con stock_minimo > 0 cuyo stock de referencia no lo cubre (ignorados incluidos)."""
+    rows = await conn.fetch("""
+        SELECT i.id, i.codigo, i.nombre, i.categoria, i.unidad_medida,
+               i.stock_actual, i.stock_minimo, i.tipo_item,
+               COALESCE(i.ignorar_alerta_stock, false) as ignorar_alerta_stock,
+               COALESCE(i.stock_reservado, 0) as total_reservado
+        FROM prod_inventario i
+        WHERE i.stock_minimo > 0
+    """)
+    alertas = []
+    for r in rows:
+        d = row_to_dict(r)
+        stock_actual = float(d.get('stock_actual') or 0)
+        total_reservado = float(d.get('total_reservado') or 0)
+        stock_disponible = max(0, stock_actual - total_reservado)
+        stock_minimo = int(d.get('stock_minimo') or 0)
+
+        # Determinar el stock de referencia según modo
+        stock_ref = stock_disponible if modo == "disponible" else stock_actual
+
+        if stock_ref <= stock_minimo:
+            d['stock_actual'] = stock_actual
+            d['total_reservado'] = total_reservado
+            d['stock_disponible'] = stock_disponible
+            d['faltante'] = max(0, stock_minimo - stock_ref)
+            d['estado_stock'] = 'SIN_STOCK' if stock_actual <= 0 else 'STOCK_BAJO'
+            alertas.append((d['id'], d['estado_stock'], None, d))
+    return alertas
+
+
+registrar_regla("stock_fisico", lambda conn: _regla_alertas_stock(conn, "fisico"), _DEPENDE_STOCK)
+registrar_regla("stock_disponible", lambda conn: _regla_alertas_stock(conn, "disponible"), _DEPENDE_STOCK)
+
+
 @router.get("/inventario/alertas-stock")
 async def get_alertas_stock(
     modo: str = "fisico",
@@ -134,50 +171,19 @@ async def get_alertas_stock(
 ):
     """Retorna items con stock bajo o sin stock.
     modo: 'fisico' (stock_actual) o 'disponible' (stock_actual - reservado)
-    Solo items con stock_minimo > 0 configurado.
+    Solo items con stock_minimo > 0 configurado. Se leen de prod_alertas.
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        ignorar_filter = "" if incluir_ignorados == "true" else "AND COALESCE(i.ignorar_alerta_stock, false) = false"
-        
-        rows = await conn.fetch(f"""
-            SELECT i.id, i.codigo, i.nombre, i.categoria, i.unidad_medida,
-                   i.stock_actual, i.stock_minimo, i.tipo_item,
-                   COALESCE(i.ignorar_alerta_stock, false) as ignorar_alerta_stock,
-                   COALESCE((
-                       SELECT SUM(rl.cantidad_reservada - rl.cantidad_liberada)
-                       FROM prod_inventario_reservas_linea rl
-                       JOIN prod_inventario_reservas r ON rl.reserva_id = r.id
-                       WHERE rl.item_id = i.id AND r.estado = 'ACTIVA'
-                   ), 0) as total_reservado
-            FROM prod_inventario i
-            WHERE i.stock_minimo > 0
-              {ignorar_filter}
-            ORDER BY i.stock_actual ASC, i.nombre ASC
-        """)
-        
-        result = []
-        for r in rows:
-            d = row_to_dict(r)
-            stock_actual = float(d.get('stock_actual') or 0)
-            total_reservado = float(d.get('total_reservado') or 0)
-            stock_disponible = max(0, stock_actual - total_reservado)
-            stock_minimo = int(d.get('stock_minimo') or 0)
-            
-            # Determinar el stock de referencia según modo
-            stock_ref = stock_disponible if modo == "disponible" else stock_actual
-            
-            if stock_ref <= stock_minimo:
-                d['stock_actual'] = stock_actual
-                d['total_reservado'] = total_reservado
-                d['stock_disponible'] = stock_disponible
-                d['faltante'] = max(0, stock_minimo - stock_ref)
-                d['estado_stock'] = 'SIN_STOCK' if stock_actual <= 0 else 'STOCK_BAJO'
-                result.append(d)
-        
+        tipo = "stock_disponible" if modo == "disponible" else "stock_fisico"
+        result = await alertas_abiertas(conn, tipo)
+        if incluir_ignorados != "true":
+            result = [d for d in result if not d['ignorar_alerta_stock']]
+        result.sort(key=lambda d: (d['stock_actual'], d['nombre'] or ''))
+
         sin_stock = sum(1 for i in result if i['estado_stock'] == 'SIN_STOCK')
         stock_bajo = sum(1 for i in result if i['estado_stock'] == 'STOCK_BAJO')
-        
+
         return {
             "items": result,
             "total": len(result),
@@ -200,13 +206,11 @@ async def get_stock_por_linea():
                 i.stock_actual,
                 ln.nombre as linea_nombre,
                 ln.codigo as linea_codigo,
-                COALESCE(SUM(CASE WHEN ing.cantidad_disponible > 0 THEN ing.cantidad_disponible ELSE 0 END), 0) as stock_disponible_ingresos,
-                COALESCE(SUM(CASE WHEN ing.cantidad_disponible > 0 THEN ing.cantidad_disponible * ing.costo_unitario ELSE 0 END), 0) as valorizado
+                COALESCE(i.stock_capas, 0) as stock_disponible_ingresos,
+                COALESCE(i.valor_inventario, 0) as valorizado
             FROM prod_inventario i
-            LEFT JOIN prod_inventario_ingresos ing ON ing.item_id = i.id AND ing.cantidad_disponible > 0
             LEFT JOIN finanzas2.cont_linea_negocio ln ON i.linea_negocio_id = ln.id
-            WHERE i.stock_actual > 0 OR ing.cantidad_disponible > 0
-            GROUP BY i.id, i.codigo, i.nombre, i.unidad_medida, i.categoria, i.linea_negocio_id, i.stock_actual, ln.nombre, ln.codigo
+            WHERE i.stock_actual > 0 OR i.stock_capas > 0
             ORDER BY COALESCE(ln.nombre, 'ZZZZZ'), i.nombre
         """)
         return [dict(r) for r in rows]
@@ -363,7 +367,8 @@ async def delete_item_inventario(item_id: str):
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute("DELETE FROM prod_inventario_ingresos WHERE item_id = $1", item_id)
-        await conn.execute("DELETE FROM prod_inventario_salidas WHERE item_id = $1", item_id)
+        salidas = await conn.fetch("DELETE FROM prod_inventario_salidas WHERE item_id = $1 RETURNING registro_id", item_id)
+        await invalidar_snapshot_costos(conn, [s['registro_id'] for s in salidas])
         await conn.execute("DELETE FROM prod_inventario_ajustes WHERE item_id = $1", item_id)
         await conn.execute("DELETE FROM prod_inventario_rollos WHERE item_id = $1", item_id)
         await conn.execute("DELETE FROM prod_inventario WHERE id = $1", item_id)
@@ -461,6 +466,7 @@ async def create_ingreso(input: IngresoInventarioCreate, current_user: dict = De
                 FROM prod_inventario_ingresos WHERE item_id = $1 AND cantidad_disponible > 0
             ), 0) WHERE id = $1
         """, input.item_id)
+        await refrescar_agregados_inventario(conn, [input.item_id])
         
         await audit_log_safe(conn, get_usuario(current_user), "CREATE", "inventario", "prod_inventario_ingresos", ingreso.id,
             datos_despues={"item_id": input.item_id, "cantidad": cantidad, "costo_unitario": input.costo_unitario,
@@ -583,6 +589,7 @@ async def update_ingreso(ingreso_id: str, input: IngresoUpdateData):
                 diff, ingreso['item_id']
             )
 
+        await refrescar_agregados_inventario(conn, [ingreso['item_id']])
         return {"message": "Ingreso actualizado"}
 
 @router.delete("/inventario-ingresos/{ingreso_id}")
@@ -597,8 +604,263 @@ async def delete_ingreso(ingreso_id: str):
         await conn.execute("DELETE FROM prod_inventario_rollos WHERE ingreso_id = $1", ingreso_id)
         await conn.execute("DELETE FROM prod_inventario_ingresos WHERE id = $1", ingreso_id)
         await conn.execute("UPDATE prod_inventario SET stock_actual = stock_actual - $1 WHERE id = $2", ingreso['cantidad'], ingreso['item_id'])
+        await refrescar_agregados_inventario(conn, [ingreso['item_id']])
         return {"message": "Ingreso eliminado"}
 
+# ==================== IMPORTACIÓN MASIVA DE INGRESOS ====================
+
+INGRESOS_IMPORT_MAX_BYTES = int(os.environ.get('INGRESOS_IMPORT_MAX_BYTES', str(20 * 1024 * 1024)))
+
+# Columnas CSV: una fila por rollo (o por ingreso si el item no lleva rollos).
+# Las filas con el mismo `ingreso` (o, si no viene, mismo item/proveedor/documento/costo) forman un ingreso.
+COLUMNAS_CSV_INGRESO = (
+    "ingreso", "item_id", "item_codigo", "cantidad", "costo_unitario", "proveedor", "numero_documento",
+    "observaciones", "empresa_id", "linea_negocio_id",
+    "numero_rollo", "metraje", "ancho", "tono", "observaciones_rollo",
+)
+
+
+class IngresoImportar(BaseModel):
+    ref: Optional[str] = None
+    item_id: Optional[str] = None
+    item_codigo: Optional[str] = None
+    cantidad: float = 0
+    costo_unitario: float = 0.0
+    proveedor: str = ""
+    numero_documento: str = ""
+    observaciones: str = ""
+    rollos: List[dict] = []
+    empresa_id: int = 7
+    linea_negocio_id: Optional[int] = None
+
+
+def _ingresos_desde_csv(texto: str):
+    """Agrupa las filas del CSV en ingresos con sus rollos; retorna (ingresos, filas_leidas)."""
+    muestra = texto[:4096]
+    try:
+        dialecto = csv.Sniffer().sniff(muestra.split("\n", 1)[0], delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.DictReader(io.StringIO(texto), dialect=dialecto)
+    lector.fieldnames = [(c or "").strip().lower() for c in (lector.fieldnames or [])]
+    desconocidas = [c for c in lector.fieldnames if c and c not in COLUMNAS_CSV_INGRESO]
+    if desconocidas:
+        raise HTTPException(status_code=400, detail={
+            "mensaje": f"Columnas desconocidas: {', '.join(desconocidas)}",
+            "columnas": list(COLUMNAS_CSV_INGRESO),
+        })
+
+    grupos = {}
+    filas = 0
+    for fila in lector:
+        filas += 1
+        f = {k: (v or "").strip() for k, v in fila.items() if k}
+        clave = f.get("ingreso") or (f.get("item_id") or f.get("item_codigo"), f.get("proveedor"),
+                                      f.get("numero_documento"), f.get("costo_unitario"))
+        ingreso = grupos.get(clave)
+        if ingreso is None:
+            ingreso = grupos[clave] = {
+                "ref": f.get("ingreso") or f"fila {filas + 1}",
+                **{c: f[c] for c in ("item_id", "item_codigo", "proveedor", "numero_documento", "observaciones")
+                   if f.get(c)},
+                **{c: f[c] for c in ("cantidad", "costo_unitario", "empresa_id", "linea_negocio_id") if f.get(c)},
+                "rollos": [],
+            }
+        if f.get("metraje") or f.get("numero_rollo"):
+            ingreso["rollos"].append({
+                "numero_rollo": f.get("numero_rollo", ""),
+                "metraje": f.get("metraje") or 0,
+                "ancho": f.get("ancho") or 0,
+                "tono": f.get("tono", ""),
+                "observaciones": f.get("observaciones_rollo", ""),
+            })
+    return list(grupos.values()), filas
+
+
+def _decimal(valor):
+    """Decimal finito desde número o texto del CSV; None si no es un número válido."""
+    try:
+        d = Decimal(str(valor or 0).replace(" ", ""))
+    except InvalidOperation:
+        return None
+    return d if d.is_finite() else None
+
+
+@router.post("/inventario-ingresos/importar")
+async def importar_ingresos(
+    request: Request,
+    formato: Optional[str] = Query(None, description="csv o json; por defecto según Content-Type"),
+    dry_run: bool = Query(False),
+    todo_o_nada: bool = Query(True, description="Si algún ingreso tiene errores no se importa ninguno"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Importa ingresos con sus rollos (CSV de proveedor o JSON) en una sola transacción.
+
+    Ingresos y rollos se cargan con COPY (copy_records_to_table) y el stock y
+    costo promedio se actualizan una vez por item. JSON: lista de ingresos
+    (o {"ingresos": [...]}) con la forma de POST /inventario-ingresos, admitiendo
+    item_codigo en lugar de item_id.
+    """
+    t0 = time.perf_counter()
+    tiempos = {}
+
+    cuerpo = bytearray()
+    async for parte in request.stream():
+        cuerpo.extend(parte)
+        if len(cuerpo) > INGRESOS_IMPORT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Archivo mayor a {INGRESOS_IMPORT_MAX_BYTES // (1024 * 1024)} MB")
+    formato = (formato or ("csv" if "csv" in request.headers.get("content-type", "") else "json")).lower()
+    filas_csv = None
+    try:
+        if formato == "csv":
+            crudos, filas_csv = _ingresos_desde_csv(bytes(cuerpo).decode("utf-8-sig"))
+        elif formato == "json":
+            crudos = orjson.loads(bytes(cuerpo)) if cuerpo else []
+            if isinstance(crudos, dict):
+                crudos = crudos.get("ingresos", [])
+            if not isinstance(crudos, list):
+                raise HTTPException(status_code=400, detail="Se esperaba una lista de ingresos")
+        else:
+            raise HTTPException(status_code=400, detail="formato debe ser csv o json")
+    except (UnicodeDecodeError, orjson.JSONDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo leer el archivo: {e}")
+    if not crudos:
+        raise HTTPException(status_code=400, detail="El archivo no contiene ingresos")
+    tiempos["lectura"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    t = time.perf_counter()
+    errores = []
+    ingresos = []
+    for i, crudo in enumerate(crudos):
+        try:
+            ingresos.append((i, IngresoImportar.model_validate(crudo)))
+        except ValidationError as e:
+            errores.append({"indice": i, "ref": (crudo or {}).get("ref") if isinstance(crudo, dict) else None,
+                            "errores": [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()]})
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        items = await conn.fetch(
+            """SELECT id, codigo, nombre, control_por_rollos, linea_negocio_id FROM prod_inventario
+               WHERE id = ANY($1::varchar[]) OR codigo = ANY($2::varchar[])""",
+            list({ing.item_id for _, ing in ingresos if ing.item_id}),
+            list({ing.item_codigo for _, ing in ingresos if ing.item_codigo and not ing.item_id}),
+        )
+        por_id = {r['id']: r for r in items}
+        por_codigo = {r['codigo']: r for r in items}
+
+        ahora = datetime.now()
+        fecha = datetime.now(timezone.utc).replace(tzinfo=None)
+        registros_ingresos = []
+        registros_rollos = []
+        stock = {}
+        resumen = []
+        for i, ing in ingresos:
+            errs = []
+            item = por_id.get(ing.item_id) if ing.item_id else por_codigo.get(ing.item_codigo)
+            if item is None:
+                errs.append(f"Item de inventario no encontrado: {ing.item_id or ing.item_codigo or '(vacío)'}")
+            rollos = []
+            if item is not None and item['control_por_rollos'] and ing.rollos:
+                for j, r in enumerate(ing.rollos):
+                    metraje, ancho = _decimal(r.get('metraje')), _decimal(r.get('ancho'))
+                    if metraje is None or ancho is None:
+                        errs.append(f"Rollo {j + 1}: metraje o ancho no numérico")
+                        continue
+                    if metraje <= 0:
+                        errs.append(f"Rollo {j + 1}: metraje debe ser mayor a 0")
+                    rollos.append((r, metraje, ancho))
+                cantidad = sum((m for _, m, _ in rollos), Decimal(0))
+            else:
+                cantidad = _decimal(ing.cantidad)
+            if cantidad is None:
+                errs.append("Cantidad no numérica")
+            elif not errs and cantidad <= 0:
+                errs.append("La cantidad debe ser mayor a 0")
+            if errs:
+                errores.append({"indice": i, "ref": ing.ref, "errores": errs})
+                continue
+
+            ingreso_id = str(uuid.uuid4())
+            # Línea de negocio: el item manda (igual que POST /inventario-ingresos)
+            linea_negocio_id = item['linea_negocio_id'] or ing.linea_negocio_id
+            registros_ingresos.append((
+                ingreso_id, item['id'], cantidad, cantidad, _decimal(ing.costo_unitario) or Decimal(0), ing.proveedor,
+                ing.numero_documento, ing.observaciones, fecha, ing.empresa_id, linea_negocio_id,
+            ))
+            for r, metraje, ancho in rollos:
+                registros_rollos.append((
+                    str(uuid.uuid4()), item['id'], ingreso_id, str(r.get('numero_rollo') or ''), metraje, metraje,
+                    ancho, str(r.get('tono') or ''), str(r.get('observaciones') or ''), True, ahora, ing.empresa_id,
+                ))
+            stock[item['id']] = stock.get(item['id'], Decimal(0)) + cantidad
+            resumen.append({"indice": i, "ref": ing.ref, "id": ingreso_id, "item_id": item['id'],
+                            "item_nombre": item['nombre'], "cantidad": float(cantidad), "rollos": len(rollos)})
+        tiempos["validacion"] = round((time.perf_counter() - t) * 1000, 1)
+
+        importar = registros_ingresos and not dry_run and not (todo_o_nada and errores)
+        if importar:
+            t = time.perf_counter()
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "prod_inventario_ingresos", schema_name="produccion", records=registros_ingresos,
+                    columns=["id", "item_id", "cantidad", "cantidad_disponible", "costo_unitario", "proveedor",
+                             "numero_documento", "observaciones", "fecha", "empresa_id", "linea_negocio_id"],
+                )
+                if registros_rollos:
+                    await conn.copy_records_to_table(
+                        "prod_inventario_rollos", schema_name="produccion", records=registros_rollos,
+                        columns=["id", "item_id", "ingreso_id", "numero_rollo", "metraje", "metraje_disponible",
+                                 "ancho", "tono", "observaciones", "activo", "created_at", "empresa_id"],
+                    )
+                tiempos["copia"] = round((time.perf_counter() - t) * 1000, 1)
+
+                t = time.perf_counter()
+                item_ids = list(stock)
+                # Un UPDATE para todos los items: stock y costo promedio ponderado
+                await conn.execute("""
+                    UPDATE prod_inventario i SET stock_actual = i.stock_actual + d.cantidad
+                    FROM unnest($1::varchar[], $2::numeric[]) AS d(id, cantidad)
+                    WHERE i.id = d.id
+                """, item_ids, [stock[k] for k in item_ids])
+                await conn.execute("""
+                    UPDATE prod_inventario i SET costo_promedio = COALESCE(c.costo, 0)
+                    FROM (
+                        SELECT it.id, SUM(ing.cantidad_disponible * ing.costo_unitario) / NULLIF(SUM(ing.cantidad_disponible), 0) as costo
+                        FROM unnest($1::varchar[]) AS it(id)
+                        LEFT JOIN prod_inventario_ingresos ing ON ing.item_id = it.id AND ing.cantidad_disponible > 0
+                        GROUP BY it.id
+                    ) c
+                    WHERE i.id = c.id
+                """, item_ids)
+                await refrescar_agregados_inventario(conn, item_ids)
+                await audit_log_safe(conn, get_usuario(current_user), "CREATE", "inventario", "prod_inventario_ingresos",
+                    datos_despues={"importacion": formato, "ingresos": len(registros_ingresos),
+                                   "rollos": len(registros_rollos), "items": len(item_ids),
+                                   "ingreso_ids": [r[0] for r in registros_ingresos]})
+                tiempos["stock"] = round((time.perf_counter() - t) * 1000, 1)
+
+    if importar:
+        await registrar_actividad(pool, current_user['id'], current_user.get('username', ''), "crear",
+            tabla_afectada="inventario",
+            descripcion=f"Importó {len(registros_ingresos)} ingresos ({len(registros_rollos)} rollos) de {len(stock)} items")
+    tiempos["total"] = round((time.perf_counter() - t0) * 1000, 1)
+    return {
+        "dry_run": dry_run,
+        "importado": bool(importar),
+        "formato": formato,
+        "filas": {
+            "leidas": filas_csv if filas_csv is not None else len(crudos),
+            "ingresos": len(registros_ingresos),
+            "rollos": len(registros_rollos),
+            "items": len(stock),
+            "rechazados": len(errores),
+        },
+        "tiempos_ms": tiempos,
+        "ingresos": resumen,
+        "errores": sorted(errores, key=lambda e: e["indice"]),
+    }
+
 # ==================== ENDPOINTS SALIDAS INVENTARIO ====================
 
 @router.get("/inventario-salidas")
@@ -754,6 +1016,7 @@ async def create_salida(input: SalidaInventarioCreate, current_user: dict = Depe
             empresa_id, linea_negocio_id
         )
         await conn.execute("UPDATE prod_inventario SET stock_actual = stock_actual - $1 WHERE id = $2", input.cantidad, input.item_id)
+        await invalidar_snapshot_costos(conn, [input.registro_id])
         
         # === FASE 2: Actualizar cantidad_consumida en requerimiento ===
         if input.registro_id:
@@ -799,6 +1062,7 @@ async def create_salida(input: SalidaInventarioCreate, current_user: dict = Depe
                         SET cantidad_liberada = cantidad_reservada
                         WHERE reserva_id = $1 AND item_id = $2 AND talla_id IS NULL
                     """, reserva_row['reserva_id'], input.item_id)
+        await refrescar_agregados_inventario(conn, [input.item_id])
         
         await audit_log_safe(conn, get_usuario(current_user), "CREATE", "inventario", "prod_inventario_salidas", salida.id,
             datos_despues={"item_id": input.item_id, "cantidad": input.cantidad, "costo_total": round(costo_total, 4),
@@ -812,41 +1076,124 @@ async def create_salida(input: SalidaInventarioCreate, current_user: dict = Depe
     return salida
 
 
+# Líneas de reserva ACTIVAS con saldo pendiente cuyo item+registro+talla ya tuvo salidas.
+# Las salidas se agregan una sola vez (hash join) en lugar de un fetchval por línea.
+_RECONCILIAR_RESERVAS_CTE = """
+    WITH salidas AS (
+        SELECT registro_id, item_id, COALESCE(talla_id, '') as talla_key, SUM(cantidad) as total_salido
+        FROM prod_inventario_salidas
+        WHERE registro_id IS NOT NULL
+        GROUP BY registro_id, item_id, COALESCE(talla_id, '')
+        HAVING SUM(cantidad) > 0
+    ), candidatas AS (
+        SELECT rl.id, rl.reserva_id, rl.item_id, rl.talla_id, res.registro_id,
+               rl.cantidad_reservada - rl.cantidad_liberada as pendiente,
+               s.total_salido
+        FROM prod_inventario_reservas_linea rl
+        JOIN prod_inventario_reservas res ON rl.reserva_id = res.id
+        JOIN salidas s ON s.registro_id = res.registro_id
+                      AND s.item_id = rl.item_id
+                      AND s.talla_key = COALESCE(rl.talla_id, '')
+        WHERE res.estado = 'ACTIVA' AND (rl.cantidad_reservada - rl.cantidad_liberada) > 0
+    )
+"""
+
+
+async def reconciliar_reservas_set(conn, dry_run: bool = False) -> dict:
+    """Si ya hubo cualquier salida para un item+registro(+talla), libera toda la reserva restante.
+
+    En dry_run solo reporta las líneas que cambiarían.
+    """
+    if dry_run:
+        lineas = await conn.fetch(_RECONCILIAR_RESERVAS_CTE + """
+            SELECT id, reserva_id, item_id, talla_id, registro_id, pendiente, total_salido
+            FROM candidatas ORDER BY registro_id, item_id
+        """)
+    else:
+        async with conn.transaction():
+            lineas = await conn.fetch(_RECONCILIAR_RESERVAS_CTE + """
+                UPDATE prod_inventario_reservas_linea rl
+                SET cantidad_liberada = rl.cantidad_reservada, updated_at = CURRENT_TIMESTAMP
+                FROM candidatas c
+                WHERE rl.id = c.id
+                RETURNING rl.id, c.reserva_id, c.item_id, c.talla_id, c.registro_id, c.pendiente, c.total_salido
+            """)
+            await refrescar_agregados_inventario(conn, [l['item_id'] for l in lineas])
+    return {
+        "dry_run": dry_run,
+        "lineas_corregidas": len(lineas),
+        "cantidad_liberada": round(sum(float(l['pendiente']) for l in lineas), 4),
+        "registros_afectados": len({l['registro_id'] for l in lineas}),
+        "items_afectados": len({l['item_id'] for l in lineas}),
+        "detalle": [
+            {
+                "linea_id": l['id'],
+                "reserva_id": l['reserva_id'],
+                "registro_id": l['registro_id'],
+                "item_id": l['item_id'],
+                "talla_id": l['talla_id'],
+                "pendiente_liberado": float(l['pendiente']),
+                "total_salido": float(l['total_salido']),
+            }
+            for l in lineas[:500]
+        ],
+    }
+
+
+async def tarea_reconciliar_reservas():
+    """Tarea periódica registrada en scheduler (ver server.startup)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        resultado = await reconciliar_reservas_set(conn)
+    resultado.pop("detalle", None)
+    return resultado
+
+
+def _mensaje_reconciliacion(resultado: dict) -> dict:
+    if resultado["dry_run"]:
+        resultado["message"] = f"Simulación: {resultado['lineas_corregidas']} líneas se corregirían."
+    else:
+        resultado["message"] = f"Reconciliación completada. {resultado['lineas_corregidas']} líneas corregidas."
+    return resultado
+
+
 @router.post("/inventario/reconciliar-reservas")
-async def reconciliar_reservas():
-    """Sincroniza cantidad_liberada en reservas: si ya hubo salida para un item+registro, libera toda la reserva."""
+async def reconciliar_reservas(
+    dry_run: bool = False,
+    async_: bool = Query(False, alias="async"),
+    current_user: Optional[dict] = Depends(get_current_user_optional),
+):
+    """Sincroniza cantidad_liberada en reservas: si ya hubo salida para un item+registro, libera toda la reserva.
+
+    dry_run=true reporta qué líneas cambiarían sin modificar nada. async=1 lo ejecuta como job.
+    """
+    if async_:
+        # Un job queda a nombre de quien lo encola: sin usuario no se encola
+        if not current_user:
+            raise HTTPException(status_code=401, detail="No autenticado")
+        return await encolar_job("reconciliar_reservas", {"dry_run": dry_run}, current_user)
     pool = await get_pool()
     async with pool.acquire() as conn:
-        reservas_activas = await conn.fetch("""
-            SELECT rl.id, rl.reserva_id, rl.item_id, rl.talla_id, rl.cantidad_reservada, rl.cantidad_liberada,
-                   res.registro_id
-            FROM produccion.prod_inventario_reservas_linea rl
-            JOIN produccion.prod_inventario_reservas res ON rl.reserva_id = res.id
-            WHERE res.estado = 'ACTIVA' AND (rl.cantidad_reservada - rl.cantidad_liberada) > 0
-        """)
-        corregidas = 0
-        for rl in reservas_activas:
-            if rl['talla_id']:
-                total_salido = await conn.fetchval("""
-                    SELECT COALESCE(SUM(cantidad), 0) FROM produccion.prod_inventario_salidas
-                    WHERE item_id = $1 AND registro_id = $2 AND talla_id = $3
-                """, rl['item_id'], rl['registro_id'], rl['talla_id'])
-            else:
-                total_salido = await conn.fetchval("""
-                    SELECT COALESCE(SUM(cantidad), 0) FROM produccion.prod_inventario_salidas
-                    WHERE item_id = $1 AND registro_id = $2 AND talla_id IS NULL
-                """, rl['item_id'], rl['registro_id'])
-            
-            # Si ya hubo cualquier salida, liberar TODA la reserva
-            if float(total_salido) > 0 and float(rl['cantidad_liberada']) < float(rl['cantidad_reservada']):
-                await conn.execute("""
-                    UPDATE produccion.prod_inventario_reservas_linea
-                    SET cantidad_liberada = cantidad_reservada
-                    WHERE id = $1
-                """, rl['id'])
-                corregidas += 1
-        
-        return {"message": f"Reconciliación completada. {corregidas} líneas corregidas."}
+        resultado = await reconciliar_reservas_set(conn, dry_run=dry_run)
+    return _mensaje_reconciliacion(resultado)
+
+
+async def _job_reconciliar_reservas(ctx):
+    async with ctx.conexion() as conn:
+        resultado = await reconciliar_reservas_set(conn, dry_run=bool(ctx.params.get("dry_run")))
+    return _mensaje_reconciliacion(resultado)
+
+
+registrar_tipo_job("reconciliar_reservas", _job_reconciliar_reservas, "Reconciliar reservas con salidas")
+
+
+@router.post("/inventario/recalcular-agregados")
+async def recalcular_agregados():
+    """Reconstruye stock_reservado / valor_inventario / stock_capas de todos los items desde reservas y capas FIFO."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        corregidos = await recalcular_agregados_inventario(conn)
+        return {"message": f"Agregados recalculados. {corregidos} items corregidos.", "items_corregidos": corregidos}
 
 
 
@@ -955,6 +1302,7 @@ async def create_salida_extra(input: SalidaExtraCreate):
             empresa_id
         )
         await conn.execute("UPDATE prod_inventario SET stock_actual = stock_actual - $1 WHERE id = $2", input.cantidad, input.item_id)
+        await invalidar_snapshot_costos(conn, [input.registro_id])
         
         # Actualizar requerimiento si existe (suma al consumido aunque no tenga reserva)
         if input.registro_id:
@@ -980,6 +1328,7 @@ async def create_salida_extra(input: SalidaExtraCreate):
                         updated_at = CURRENT_TIMESTAMP
                     WHERE registro_id = $2 AND item_id = $3 AND talla_id IS NULL
                 """, input.cantidad, input.registro_id, input.item_id)
+        await refrescar_agregados_inventario(conn, [input.item_id])
         
         return {
             "id": salida_id,
@@ -1022,6 +1371,8 @@ async def delete_salida(salida_id: str):
                 await conn.execute("UPDATE prod_inventario_ingresos SET cantidad_disponible = cantidad_disponible + $1 WHERE id = $2", detalle['cantidad'], detalle['ingreso_id'])
         await conn.execute("DELETE FROM prod_inventario_salidas WHERE id = $1", salida_id)
         await conn.execute("UPDATE prod_inventario SET stock_actual = stock_actual + $1 WHERE id = $2", float(salida['cantidad']), salida['item_id'])
+        await refrescar_agregados_inventario(conn, [salida['item_id']])
+        await invalidar_snapshot_costos(conn, [salida['registro_id']])
         return {"message": "Salida eliminada y stock restaurado"}
 
 # ==================== ENDPOINTS ROLLOS ====================
@@ -1147,6 +1498,7 @@ async def create_ajuste(input: AjusteInventarioCreate, current_user: dict = Depe
                 else:  # salida
                     await conn.execute("UPDATE prod_inventario_rollos SET metraje_disponible = metraje_disponible - $1 WHERE id = $2", input.cantidad, input.rollo_id)
                     await conn.execute("UPDATE prod_inventario_ingresos SET cantidad_disponible = cantidad_disponible - $1 WHERE id = $2", input.cantidad, rollo['ingreso_id'])
+        await refrescar_agregados_inventario(conn, [input.item_id])
         
         stock_antes = float(item['stock_actual'])
         stock_despues = stock_antes + incremento
@@ -1199,3 +1551,5 @@ async def delete_ajuste(ajuste_id: str):
                 if ajuste['tipo'] == "entrada":
                     # Revertir entrada = restar metraje
                     await conn.execute("UPDATE prod_inventario_rollos SET metraje_disponible = metraje_disponible - $1, metraje = metraje - $1 WHERE id = $2", float(ajuste['cantidad']), ajuste['rollo_id'])
+        await refrescar_agregados_inventario(conn, [ajuste['item_id']])
+        return {"message": "Ajuste eliminado"}
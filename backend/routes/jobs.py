@@ -0,0 +1,121 @@
+"""
+Router: Jobs en segundo plano
+- POST /api/jobs: encola un job de un tipo registrado
+- GET /api/jobs/{id}: estado y progreso; /resultado descarga el archivo
+- POST /api/jobs/{id}/cancelar
+Los endpoints pesados aceptan además ?async=1 y devuelven el job_id.
+"""
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from typing import Optional
+
+from db import get_pool
+from auth_utils import get_current_user
+from jobs import (
+    ESTADOS_JOB, encolar_job, cancelar_job, job_publico, tipos_job, tipo_job_registrado,
+    estado_jobs, directorio_job,
+)
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+
+
+class JobCreate(BaseModel):
+    tipo: str
+    params: dict = {}
+
+
+def _puede_ver(job, current_user) -> bool:
+    return current_user['rol'] == 'admin' or job["usuario_id"] == current_user['id']
+
+
+async def _get_job(conn, job_id: str, current_user: dict):
+    job = await conn.fetchrow("SELECT * FROM prod_jobs WHERE id = $1", job_id)
+    if not job or not _puede_ver(job, current_user):
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job
+
+
+@router.post("/jobs")
+async def crear_job(data: JobCreate, current_user: dict = Depends(get_current_user)):
+    tipo = tipo_job_registrado(data.tipo)
+    if tipo is None:
+        raise HTTPException(status_code=400, detail=f"Tipo de job desconocido: {data.tipo}")
+    if tipo["solo_admin"] and current_user['rol'] != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores pueden ejecutar este job")
+    return await encolar_job(data.tipo, data.params, current_user)
+
+
+@router.get("/jobs")
+async def listar_jobs(
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+):
+    """Jobs del usuario (todos si es admin), más recientes primero."""
+    if estado and estado not in ESTADOS_JOB:
+        raise HTTPException(status_code=400, detail=f"Estado inválido. Valores: {', '.join(ESTADOS_JOB)}")
+    usuario_id = None if current_user['rol'] == 'admin' else current_user['id']
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT *, COUNT(*) OVER() as total_count FROM prod_jobs
+            WHERE ($1::text IS NULL OR estado = $1)
+              AND ($2::text IS NULL OR tipo = $2)
+              AND ($3::text IS NULL OR usuario_id = $3)
+            ORDER BY created_at DESC
+            LIMIT $4 OFFSET $5
+        """, estado, tipo, usuario_id, limit, offset)
+    total = rows[0]["total_count"] if rows else 0
+    items = []
+    for r in rows:
+        d = dict(r)
+        d.pop("total_count")
+        items.append(job_publico(d))
+    return {"items": items, "total": total, "limit": limit, "offset": offset}
+
+
+@router.get("/jobs/tipos")
+async def listar_tipos_job(current_user: dict = Depends(get_current_user)):
+    return tipos_job()
+
+
+@router.get("/jobs/runner")
+async def estado_runner(current_user: dict = Depends(get_current_user)):
+    """Estado del despachador de este worker (concurrencia, jobs en curso, contadores)."""
+    return estado_jobs()
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return job_publico(await _get_job(conn, job_id, current_user))
+
+
+@router.get("/jobs/{job_id}/resultado")
+async def get_job_resultado(job_id: str, current_user: dict = Depends(get_current_user)):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        job = await _get_job(conn, job_id, current_user)
+    if job["estado"] != "COMPLETADO":
+        raise HTTPException(status_code=409, detail=f"El job está {job['estado']}, aún no hay resultado")
+    ruta = directorio_job(job_id) / job["resultado_nombre"]
+    if not ruta.is_file():
+        raise HTTPException(status_code=410, detail="El archivo resultado ya no está disponible en este servidor")
+    return FileResponse(ruta, media_type=job["resultado_media_type"], filename=job["resultado_nombre"])
+
+
+@router.post("/jobs/{job_id}/cancelar")
+async def cancelar(job_id: str, current_user: dict = Depends(get_current_user)):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        job = await _get_job(conn, job_id, current_user)
+        if job["estado"] not in ("PENDIENTE", "EJECUTANDO"):
+            raise HTTPException(status_code=409, detail=f"El job ya terminó ({job['estado']})")
+        row = await cancelar_job(conn, job_id)
+        if row is None:
+            row = await _get_job(conn, job_id, current_user)
+    return job_publico(row)
@@ -6,7 +6,7 @@ y cruza con produccion.prod_registro_pt_odoo_vinculo para clasificar ingresos de
 from fastapi import APIRouter, Depends, Query
 from typing import Optional
 from datetime import datetime
-from db import get_pool
+from db import get_pool, solo_lectura
 from auth import get_current_user
 
 router = APIRouter(prefix="/api", tags=["kardex-pt"])
@@ -54,6 +54,7 @@ SALIDA_EXPR = """
 
 
 @router.get("/kardex-pt")
+@solo_lectura
 async def get_kardex_pt(
     product_tmpl_id: Optional[int] = Query(None),
     tipo_movimiento: Optional[str] = Query(None),
@@ -243,6 +244,7 @@ async def get_kardex_pt(
 
 
 @router.get("/kardex-pt/resumen")
+@solo_lectura
 async def get_kardex_pt_resumen(
     fecha_desde: Optional[str] = Query(None),
     fecha_hasta: Optional[str] = Query(None),
@@ -317,6 +319,7 @@ async def get_kardex_pt_resumen(
 
 
 @router.get("/kardex-pt/filtros")
+@solo_lectura
 async def get_kardex_pt_filtros(current_user: dict = Depends(get_current_user)):
     """Retorna opciones de filtro disponibles."""
     pool = await get_pool()
@@ -10,6 +10,9 @@ from models import (
     ModeloBomLineaUpdate, ReorderRequest,
 )
 from helpers import row_to_dict, parse_jsonb, registrar_actividad, get_muestra_pool
+from matriz_cubo import refrescar_cubo_modelo
+from routes.busqueda import patron_busqueda, predicado_modelos
+from filtros_sql import FiltrosSQL
 from typing import Optional, List
 from pydantic import BaseModel
 
@@ -173,42 +176,18 @@ async def get_modelos(
 
             return result
 
-        # Build WHERE clause dynamically for paginated query
-        conditions = []
-        params = []
-        param_idx = 1
-
-        if tipo_modelo == 'base':
-            conditions.append("m.base_id IS NULL")
-        elif tipo_modelo == 'variante':
-            conditions.append("m.base_id IS NOT NULL")
-
-        if search:
-            conditions.append(f"(m.nombre ILIKE ${param_idx} OR ma.nombre ILIKE ${param_idx} OR t.nombre ILIKE ${param_idx} OR e.nombre ILIKE ${param_idx} OR te.nombre ILIKE ${param_idx})")
-            params.append(f"%{search}%")
-            param_idx += 1
-
-        if marca:
-            conditions.append(f"ma.nombre = ${param_idx}")
-            params.append(marca)
-            param_idx += 1
-
-        if tipo:
-            conditions.append(f"t.nombre = ${param_idx}")
-            params.append(tipo)
-            param_idx += 1
-
-        if entalle:
-            conditions.append(f"e.nombre = ${param_idx}")
-            params.append(entalle)
-            param_idx += 1
-
-        if tela:
-            conditions.append(f"te.nombre = ${param_idx}")
-            params.append(tela)
-            param_idx += 1
-
-        where_clause = " AND ".join(conditions) if conditions else "TRUE"
+        # Forma fija: los filtros ausentes van como NULL y el SQL no cambia
+        filtros = FiltrosSQL()
+        filtros.si(tipo_modelo if tipo_modelo in ('base', 'variante') else None,
+                   lambda n: f"((${n} = 'base') = (m.base_id IS NULL))")
+        filtros.si(patron_busqueda(search) if search else None, predicado_modelos)
+        filtros.igual("ma.nombre", marca)
+        filtros.igual("t.nombre", tipo)
+        filtros.igual("e.nombre", entalle)
+        filtros.igual("te.nombre", tela)
+        where_clause = filtros.where()
+        params = filtros.params
+        param_idx = filtros.siguiente()
 
         # Count total
         count_row = await conn.fetchrow(f"""
@@ -802,6 +781,9 @@ async def update_modelo(modelo_id: str, input: ModeloCreate):
             input.nombre, input.marca_id, input.tipo_id, input.entalle_id, input.tela_id, input.hilo_id,
             input.ruta_produccion_id, servicios_json, pt_item_id, input.linea_negocio_id, modelo_id, base_id, hilo_especifico_id, muestra_modelo_id, muestra_base_id
         )
+        # Los registros del modelo cambian de fila en la matriz si cambió alguna dimensión
+        if any(result[c] != getattr(input, c) for c in ("marca_id", "tipo_id", "entalle_id", "tela_id", "hilo_id", "ruta_produccion_id")):
+            await refrescar_cubo_modelo(conn, modelo_id)
         return {**row_to_dict(result), **input.model_dump()}
 
 @router.delete("/modelos/{modelo_id}")
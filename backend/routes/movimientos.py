@@ -1,15 +1,18 @@
 """Router for production movements, mermas and guias de remision."""
 import json
+import time
 import uuid
 from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException, Depends, Query
 from db import get_pool
 from auth_utils import get_current_user
 from models import MovimientoCreate, Movimiento, MermaCreate, GuiaRemisionCreate
-from helpers import row_to_dict, parse_jsonb, registrar_actividad
+from helpers import row_to_dict, parse_jsonb, registrar_actividad, invalidar_snapshot_costos
 from routes.auditoria import audit_log_safe, get_usuario
+from filtros_sql import FiltrosSQL
+from tarifas_persona import tarifas_de, tarifa_persona_servicio
 from typing import Optional, List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 router = APIRouter(prefix="/api")
 
@@ -27,36 +30,18 @@ async def get_movimientos(
 ):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        conditions = []
-        params = []
-        param_idx = 1
-
-        if registro_id:
-            conditions.append(f"mp.registro_id = ${param_idx}")
-            params.append(registro_id)
-            param_idx += 1
-        if servicio_id:
-            conditions.append(f"mp.servicio_id = ${param_idx}")
-            params.append(servicio_id)
-            param_idx += 1
-        if persona_id:
-            conditions.append(f"mp.persona_id = ${param_idx}")
-            params.append(persona_id)
-            param_idx += 1
-        if fecha_desde:
-            conditions.append(f"mp.fecha_inicio >= ${param_idx}::date")
-            params.append(fecha_desde)
-            param_idx += 1
-        if fecha_hasta:
-            conditions.append(f"mp.fecha_inicio <= ${param_idx}::date")
-            params.append(fecha_hasta)
-            param_idx += 1
-        if search:
-            conditions.append(f"(r.n_corte ILIKE ${param_idx} OR s.nombre ILIKE ${param_idx} OR p.nombre ILIKE ${param_idx})")
-            params.append(f"%{search}%")
-            param_idx += 1
-
-        where_clause = " AND ".join(conditions) if conditions else "TRUE"
+        # Forma fija: los filtros ausentes van como NULL y el SQL no cambia
+        filtros = FiltrosSQL()
+        filtros.igual("mp.registro_id", registro_id)
+        filtros.igual("mp.servicio_id", servicio_id)
+        filtros.igual("mp.persona_id", persona_id)
+        filtros.desde("mp.fecha_inicio", fecha_desde)
+        filtros.hasta("mp.fecha_inicio", fecha_hasta)
+        filtros.si(f"%{search}%" if search else None,
+                   lambda n: f"(r.n_corte ILIKE ${n} OR s.nombre ILIKE ${n} OR p.nombre ILIKE ${n})")
+        where_clause = filtros.where()
+        params = filtros.params
+        param_idx = filtros.siguiente()
 
         base_from = """
             FROM prod_movimientos_produccion mp
@@ -102,6 +87,7 @@ async def get_movimientos(
             return result
         return {"items": result, "total": total, "limit": limit, "offset": offset}
 
+
 @router.post("/movimientos-produccion")
 async def create_movimiento(input: MovimientoCreate, current_user: dict = Depends(get_current_user)):
     pool = await get_pool()
@@ -118,19 +104,12 @@ async def create_movimiento(input: MovimientoCreate, current_user: dict = Depend
         srv = await conn.fetchrow("SELECT id FROM prod_servicios_produccion WHERE id = $1", input.servicio_id)
         if not srv:
             raise HTTPException(status_code=404, detail="Servicio no encontrado")
-        per = await conn.fetchrow("SELECT servicios FROM prod_personas_produccion WHERE id = $1", input.persona_id)
+        per = await conn.fetchrow("SELECT id FROM prod_personas_produccion WHERE id = $1", input.persona_id)
         if not per:
             raise HTTPException(status_code=404, detail="Persona no encontrada")
         
-        # Usar tarifa_aplicada del frontend si viene, sino calcular desde persona-servicio
-        tarifa = input.tarifa_aplicada or 0
-        if not tarifa:
-            servicios = parse_jsonb(per['servicios'])
-            for s in servicios:
-                sid = s if isinstance(s, str) else s.get('servicio_id')
-                if sid == input.servicio_id:
-                    tarifa = s.get('tarifa', 0) if isinstance(s, dict) else 0
-                    break
+        # Usar tarifa_aplicada del frontend si viene, sino la vigente persona-servicio
+        tarifa = input.tarifa_aplicada or await tarifa_persona_servicio(conn, input.persona_id, input.servicio_id)
         
         diferencia = input.cantidad_enviada - input.cantidad_recibida
         costo_calculado = input.cantidad_recibida * tarifa
@@ -179,6 +158,7 @@ async def create_movimiento(input: MovimientoCreate, current_user: dict = Depend
                 merma_id, input.registro_id, movimiento.id, input.servicio_id, input.persona_id,
                 diferencia, "Diferencia automática", datetime.now()
             )
+        await invalidar_snapshot_costos(conn, [input.registro_id])
         
         servicio_row = await conn.fetchrow("SELECT nombre FROM prod_servicios_produccion WHERE id = $1", input.servicio_id)
         servicio_nombre = servicio_row['nombre'] if servicio_row else input.servicio_id
@@ -192,6 +172,167 @@ async def create_movimiento(input: MovimientoCreate, current_user: dict = Depend
         descripcion=f"Creo movimiento en {servicio_nombre}: {input.cantidad_enviada} env / {input.cantidad_recibida} rec")
     return movimiento
 
+# ==================== REGISTRO DE MOVIMIENTOS EN LOTE ====================
+
+MOVIMIENTOS_LOTE_MAX = 500
+
+
+class MovimientosLoteInput(BaseModel):
+    movimientos: List[MovimientoCreate] = Field(min_length=1)
+    # True: si alguna fila tiene errores no se inserta ninguna
+    todo_o_nada: bool = False
+    dry_run: bool = False
+
+
+def _fecha_lote(valor, campo, errores):
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        errores.append(f"{campo} inválida: {valor}")
+        return None
+
+
+@router.post("/movimientos-produccion/lote")
+async def create_movimientos_lote(data: MovimientosLoteInput, current_user: dict = Depends(get_current_user)):
+    """Registra varios movimientos (cierre de turno) en una sola transacción.
+
+    Registros, paralizaciones, servicios y personas se validan con una consulta
+    por tabla para todo el lote, y las tarifas vigentes se leen por PK en otra.
+    Las filas válidas se insertan con un solo INSERT ... unnest (más sus mermas);
+    cada fila con problemas se reporta con su índice.
+    """
+    if len(data.movimientos) > MOVIMIENTOS_LOTE_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo {MOVIMIENTOS_LOTE_MAX} movimientos por lote")
+
+    inicio = time.perf_counter()
+    movs = data.movimientos
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        registro_ids = list({m.registro_id for m in movs})
+        registros = {r['id'] for r in await conn.fetch(
+            "SELECT id FROM prod_registros WHERE id = ANY($1::varchar[])", registro_ids)}
+        paralizados = {r['registro_id'] for r in await conn.fetch(
+            "SELECT DISTINCT registro_id FROM prod_paralizacion WHERE registro_id = ANY($1::varchar[]) AND activa = TRUE",
+            registro_ids)}
+        servicios = {r['id']: r['nombre'] for r in await conn.fetch(
+            "SELECT id, nombre FROM prod_servicios_produccion WHERE id = ANY($1::varchar[])",
+            list({m.servicio_id for m in movs}))}
+        personas = {r['id'] for r in await conn.fetch(
+            "SELECT id FROM prod_personas_produccion WHERE id = ANY($1::varchar[])",
+            list({m.persona_id for m in movs}))}
+        tarifas = await tarifas_de(conn, [(m.persona_id, m.servicio_id) for m in movs])
+
+        ahora = datetime.now()
+        validos = []
+        errores = []
+        for i, m in enumerate(movs):
+            errs = []
+            if m.registro_id not in registros:
+                errs.append("Registro no encontrado")
+            elif m.registro_id in paralizados:
+                errs.append("Registro PARALIZADO. Resuelve la incidencia antes de crear movimientos.")
+            if m.servicio_id not in servicios:
+                errs.append("Servicio no encontrado")
+            if m.persona_id not in personas:
+                errs.append("Persona no encontrada")
+            if m.cantidad_enviada < 0 or m.cantidad_recibida < 0:
+                errs.append("Las cantidades no pueden ser negativas")
+            fecha_inicio = _fecha_lote(m.fecha_inicio, "fecha_inicio", errs)
+            fecha_fin = _fecha_lote(m.fecha_fin, "fecha_fin", errs)
+            fecha_esperada = _fecha_lote(m.fecha_esperada_movimiento, "fecha_esperada_movimiento", errs)
+            if errs:
+                errores.append({"indice": i, "registro_id": m.registro_id, "errores": errs})
+                continue
+            # Usar tarifa_aplicada del frontend si viene, sino la vigente persona-servicio
+            tarifa = float(m.tarifa_aplicada or tarifas.get((m.persona_id, m.servicio_id), 0))
+            diferencia = m.cantidad_enviada - m.cantidad_recibida
+            validos.append({
+                "indice": i,
+                "id": str(uuid.uuid4()),
+                "registro_id": m.registro_id,
+                "servicio_id": m.servicio_id,
+                "persona_id": m.persona_id,
+                "cantidad_enviada": m.cantidad_enviada,
+                "cantidad_recibida": m.cantidad_recibida,
+                "diferencia": diferencia,
+                "costo_calculado": m.cantidad_recibida * tarifa,
+                "tarifa_aplicada": tarifa,
+                "fecha_inicio": fecha_inicio,
+                "fecha_fin": fecha_fin,
+                "fecha_esperada_movimiento": fecha_esperada,
+                "responsable_movimiento": m.responsable_movimiento or None,
+                "observaciones": m.observaciones,
+                "avance_porcentaje": m.avance_porcentaje,
+                "avance_updated_at": ahora if m.avance_porcentaje is not None else None,
+            })
+
+        insertar = validos and not data.dry_run and not (data.todo_o_nada and errores)
+        if insertar:
+            columna = lambda k: [v[k] for v in validos]
+            con_merma = [v for v in validos if v["diferencia"] > 0]
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO prod_movimientos_produccion (id, registro_id, servicio_id, persona_id, cantidad_enviada, cantidad_recibida, diferencia, costo_calculado, tarifa_aplicada, fecha_inicio, fecha_fin, fecha_esperada_movimiento, responsable_movimiento, observaciones, avance_porcentaje, avance_updated_at, created_at)
+                    SELECT t.*, $17::timestamp
+                    FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[], $5::int[], $6::int[], $7::int[],
+                                $8::float8[], $9::float8[], $10::date[], $11::date[], $12::date[], $13::text[], $14::text[],
+                                $15::int[], $16::timestamp[]) AS t
+                """,
+                    columna("id"), columna("registro_id"), columna("servicio_id"), columna("persona_id"),
+                    columna("cantidad_enviada"), columna("cantidad_recibida"), columna("diferencia"),
+                    columna("costo_calculado"), columna("tarifa_aplicada"),
+                    columna("fecha_inicio"), columna("fecha_fin"), columna("fecha_esperada_movimiento"),
+                    columna("responsable_movimiento"), columna("observaciones"),
+                    columna("avance_porcentaje"), columna("avance_updated_at"),
+                    datetime.now(timezone.utc).replace(tzinfo=None),
+                )
+                # Crear merma si hay diferencia
+                if con_merma:
+                    await conn.execute("""
+                        INSERT INTO prod_mermas (id, registro_id, movimiento_id, servicio_id, persona_id, cantidad, motivo, fecha)
+                        SELECT t.*, 'Diferencia automática', $7::timestamp
+                        FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[], $5::varchar[], $6::int[]) AS t
+                    """,
+                        [str(uuid.uuid4()) for _ in con_merma], [v["registro_id"] for v in con_merma],
+                        [v["id"] for v in con_merma], [v["servicio_id"] for v in con_merma],
+                        [v["persona_id"] for v in con_merma], [v["diferencia"] for v in con_merma], ahora,
+                    )
+                await invalidar_snapshot_costos(conn, [v["registro_id"] for v in validos])
+
+            usuario = get_usuario(current_user)
+            for v in validos:
+                await audit_log_safe(conn, usuario, "CREATE", "produccion", "prod_movimientos_produccion", v["id"],
+                    datos_despues={"servicio": servicios[v["servicio_id"]],
+                                   "cantidad_enviada": v["cantidad_enviada"], "cantidad_recibida": v["cantidad_recibida"],
+                                   "diferencia": v["diferencia"], "registro_id": v["registro_id"], "lote": True},
+                    referencia=v["registro_id"])
+
+    if insertar:
+        por_registro = {}
+        for v in validos:
+            por_registro.setdefault(v["registro_id"], []).append(v)
+        for registro_id, lista in por_registro.items():
+            await registrar_actividad(pool, current_user['id'], current_user.get('username', ''), "crear",
+                tabla_afectada="registros", registro_id=registro_id,
+                descripcion=f"Creo {len(lista)} movimiento(s) en lote: "
+                            + ", ".join(f"{servicios[v['servicio_id']]} {v['cantidad_enviada']} env / {v['cantidad_recibida']} rec" for v in lista))
+
+    for v in validos:
+        for campo in ("fecha_inicio", "fecha_fin", "fecha_esperada_movimiento"):
+            v[campo] = str(v[campo]) if v[campo] else None
+        v["avance_updated_at"] = v["avance_updated_at"].isoformat() if v["avance_updated_at"] else None
+    return {
+        "dry_run": data.dry_run,
+        "total": len(movs),
+        "insertados": len(validos) if insertar else 0,
+        "rechazados": len(errores),
+        "movimientos": validos,
+        "errores": errores,
+        "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
 @router.put("/movimientos-produccion/{movimiento_id}")
 async def update_movimiento(movimiento_id: str, input: MovimientoCreate):
     pool = await get_pool()
@@ -206,16 +347,8 @@ async def update_movimiento(movimiento_id: str, input: MovimientoCreate):
         if par_activa and par_activa > 0:
             raise HTTPException(status_code=400, detail="Registro PARALIZADO. Resuelve la incidencia antes de editar movimientos.")
         
-        # Usar tarifa_aplicada del frontend si viene, sino calcular desde persona-servicio
-        tarifa = input.tarifa_aplicada or 0
-        if not tarifa:
-            per = await conn.fetchrow("SELECT servicios FROM prod_personas_produccion WHERE id = $1", input.persona_id)
-            servicios = parse_jsonb(per['servicios']) if per else []
-            for s in servicios:
-                sid = s if isinstance(s, str) else s.get('servicio_id')
-                if sid == input.servicio_id:
-                    tarifa = s.get('tarifa', 0) if isinstance(s, dict) else 0
-                    break
+        # Usar tarifa_aplicada del frontend si viene, sino la vigente persona-servicio
+        tarifa = input.tarifa_aplicada or await tarifa_persona_servicio(conn, input.persona_id, input.servicio_id)
         
         diferencia = input.cantidad_enviada - input.cantidad_recibida
         costo_calculado = input.cantidad_recibida * tarifa
@@ -258,6 +391,7 @@ async def update_movimiento(movimiento_id: str, input: MovimientoCreate):
                 merma_id, input.registro_id, movimiento_id, input.servicio_id, input.persona_id,
                 diferencia, "Diferencia automática", datetime.now()
             )
+        await invalidar_snapshot_costos(conn, [result['registro_id'], input.registro_id])
         
         return {**row_to_dict(result), **input.model_dump(), "diferencia": diferencia, "costo_calculado": costo_calculado, "tarifa_aplicada": tarifa}
 
@@ -269,6 +403,7 @@ async def delete_movimiento(movimiento_id: str, current_user: dict = Depends(get
         await conn.execute("DELETE FROM prod_mermas WHERE movimiento_id = $1", movimiento_id)
         await conn.execute("DELETE FROM prod_movimientos_produccion WHERE id = $1", movimiento_id)
         if mov:
+            await invalidar_snapshot_costos(conn, [mov['registro_id']])
             servicio_row = await conn.fetchrow("SELECT nombre FROM prod_servicios_produccion WHERE id = $1", mov['servicio_id'])
             servicio_nombre = servicio_row['nombre'] if servicio_row else str(mov['servicio_id'])
             await audit_log_safe(conn, get_usuario(current_user), "DELETE", "produccion", "prod_movimientos_produccion", movimiento_id,
@@ -324,6 +459,7 @@ async def create_merma(input: MermaCreate):
             merma.id, merma.registro_id, merma.movimiento_id, merma.servicio_id, merma.persona_id,
             merma.cantidad, merma.motivo, merma.fecha.replace(tzinfo=None)
         )
+        await invalidar_snapshot_costos(conn, [merma.registro_id])
         return merma
 
 @router.put("/mermas/{merma_id}")
@@ -337,13 +473,16 @@ async def update_merma(merma_id: str, input: MermaCreate):
             """UPDATE prod_mermas SET registro_id=$1, movimiento_id=$2, servicio_id=$3, persona_id=$4, cantidad=$5, motivo=$6 WHERE id=$7""",
             input.registro_id, input.movimiento_id, input.servicio_id, input.persona_id, input.cantidad, input.motivo, merma_id
         )
+        await invalidar_snapshot_costos(conn, [result['registro_id'], input.registro_id])
         return {**row_to_dict(result), **input.model_dump()}
 
 @router.delete("/mermas/{merma_id}")
 async def delete_merma(merma_id: str):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute("DELETE FROM prod_mermas WHERE id = $1", merma_id)
+        deleted = await conn.fetchrow("DELETE FROM prod_mermas WHERE id = $1 RETURNING registro_id", merma_id)
+        if deleted:
+            await invalidar_snapshot_costos(conn, [deleted['registro_id']])
         return {"message": "Merma eliminada"}
 
 # ==================== ENDPOINTS GUIAS REMISION ====================
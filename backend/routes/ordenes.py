@@ -15,7 +15,8 @@ import sys
 sys.path.insert(0, '/app/backend')
 from db import get_pool
 from auth import get_current_user
-from helpers import row_to_dict
+from helpers import row_to_dict, recalcular_wip_resumen
+from matriz_cubo import refrescar_cubo_registros
 
 
 # ==================== PYDANTIC MODELS ====================
@@ -74,13 +75,19 @@ async def get_ordenes(
                    e.codigo as etapa_codigo, e.nombre as etapa_nombre,
                    COALESCE(w.costo_mp, 0) as costo_mp,
                    COALESCE(w.costo_servicio, 0) as costo_servicio,
-                   COALESCE(w.costo_total, 0) as costo_wip
+                   COALESCE(w.costo_total, 0) as costo_wip,
+                   COALESCE(tt.total_prendas, 0)::int as total_prendas
             FROM prod_registros r
             LEFT JOIN prod_modelos m ON r.modelo_id = m.id
             LEFT JOIN prod_marcas ma ON m.marca_id = ma.id
             LEFT JOIN prod_inventario pt ON r.pt_item_id = pt.id
             LEFT JOIN prod_orden_etapa e ON r.etapa_actual_id = e.id
-            LEFT JOIN v_wip_resumen w ON r.id = w.orden_id
+            LEFT JOIN prod_wip_resumen w ON r.id = w.orden_id
+            LEFT JOIN (
+                SELECT registro_id, SUM(cantidad_real) as total_prendas
+                FROM prod_registro_tallas
+                GROUP BY registro_id
+            ) tt ON tt.registro_id = r.id
             WHERE r.empresa_id = $1
         """
         params = [empresa_id]
@@ -96,19 +103,7 @@ async def get_ordenes(
         query += " ORDER BY r.fecha_creacion DESC"
         
         rows = await conn.fetch(query, *params)
-        
-        result = []
-        for r in rows:
-            d = row_to_dict(r)
-            # Get total prendas
-            total = await conn.fetchval(
-                "SELECT COALESCE(SUM(cantidad_real), 0) FROM prod_registro_tallas WHERE registro_id = $1",
-                d['id']
-            )
-            d['total_prendas'] = int(total or 0)
-            result.append(d)
-        
-        return result
+        return [row_to_dict(r) for r in rows]
 
 
 @router.get("/ordenes/{orden_id}")
@@ -151,7 +146,7 @@ async def get_orden(
         
         # WIP summary
         wip = await conn.fetchrow("""
-            SELECT * FROM v_wip_resumen WHERE orden_id = $1
+            SELECT * FROM prod_wip_resumen WHERE orden_id = $1
         """, orden_id)
         if wip:
             d['wip'] = row_to_dict(wip)
@@ -222,6 +217,7 @@ async def create_orden(
                     INSERT INTO prod_registro_tallas (id, registro_id, talla_id, cantidad_real, empresa_id)
                     VALUES ($1, $2, $3, $4, $5)
                 """, talla_id, orden_id, t.talla_id, t.cantidad, data.empresa_id)
+        await refrescar_cubo_registros(conn, [orden_id])
         
         return {"id": orden_id, "n_corte": data.n_corte, "estado_op": data.estado_op or 'ABIERTA'}
 
@@ -275,6 +271,7 @@ async def update_orden(
             f"UPDATE prod_registros SET {', '.join(updates)} WHERE id = ${idx}",
             *params
         )
+        await refrescar_cubo_registros(conn, [orden_id])
         
         updated = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", orden_id)
         return row_to_dict(updated)
@@ -317,6 +314,7 @@ async def update_tallas(
                 """, new_id, orden_id, t.talla_id, t.cantidad, orden['empresa_id'])
                 updated.append({"id": new_id, "talla_id": t.talla_id, "cantidad": t.cantidad})
         
+        await refrescar_cubo_registros(conn, [orden_id])
         return {"message": "Tallas actualizadas", "updated": updated}
 
 
@@ -352,6 +350,7 @@ async def cambiar_etapa(
             UPDATE prod_registros SET etapa_actual_id = $1, estado = $2, estado_op = $3
             WHERE id = $4
         """, etapa['id'], etapa['nombre'], nuevo_estado_op, orden_id)
+        await refrescar_cubo_registros(conn, [orden_id])
         
         return {
             "message": f"Etapa cambiada a {etapa['nombre']}",
@@ -373,7 +372,7 @@ async def get_resumen_wip(
         if not orden:
             raise HTTPException(status_code=404, detail="Orden no encontrada")
         
-        wip = await conn.fetchrow("SELECT * FROM v_wip_resumen WHERE orden_id = $1", orden_id)
+        wip = await conn.fetchrow("SELECT * FROM prod_wip_resumen WHERE orden_id = $1", orden_id)
         
         # Get details
         consumos = await conn.fetch("""
@@ -404,6 +403,32 @@ async def get_resumen_wip(
         }
 
 
+@router.post("/wip/verificar-resumen")
+async def verificar_resumen_wip(
+    dry_run: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Compara prod_wip_resumen con el ledger prod_wip_movimiento y reconstruye las órdenes descuadradas.
+
+    dry_run=true reporta las diferencias sin modificar nada.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        resultado = await recalcular_wip_resumen(conn, dry_run=dry_run)
+    if not dry_run:
+        resultado["message"] = f"Resumen WIP corregido en {resultado['ordenes_corregidas']} órdenes"
+    return resultado
+
+
+async def tarea_verificar_resumen_wip():
+    """Tarea periódica registrada en scheduler (ver server.startup)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        resultado = await recalcular_wip_resumen(conn)
+    resultado.pop("detalle", None)
+    return resultado
+
+
 @router.get("/etapas")
 async def get_etapas(
     empresa_id: int = Query(7),
@@ -0,0 +1,117 @@
+"""
+Router: Bundle del lote
+- GET /api/registros/{id}/bundle?campos=registro,tallas,...: una sola llamada
+  con las secciones que la pantalla del lote pedía por separado.
+Cada sección reutiliza el endpoint existente; se ejecutan en paralelo con a lo
+sumo BUNDLE_CONCURRENCIA conexiones del pool a la vez, y `_meta` trae el tiempo
+de cada una.
+"""
+import asyncio
+import os
+import time
+
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Query
+from starlette.responses import Response
+
+from auth_utils import get_current_user
+from routes.registros_main import (
+    get_registro, get_registro_tallas, get_materiales_consolidado, get_reservas_registro,
+    get_estados_disponibles_registro, analisis_estado_registro, get_divisiones_registro,
+)
+from routes.movimientos import get_movimientos
+from routes.inventario_main import get_salidas
+from routes.control_produccion import get_incidencias, get_paralizaciones
+from routes.conversacion import get_conversacion
+from routes.costos import get_costos_servicio
+from routes.trazabilidad import get_arreglos, resumen_cantidades
+
+router = APIRouter(prefix="/api")
+
+# Conexiones del pool que un bundle puede ocupar a la vez (el pool tiene 10)
+BUNDLE_CONCURRENCIA = int(os.environ.get('BUNDLE_CONCURRENCIA', '4'))
+
+SECCIONES = {
+    "registro": lambda rid, user: get_registro(rid),
+    "tallas": lambda rid, user: get_registro_tallas(rid),
+    "materiales": lambda rid, user: get_materiales_consolidado(rid),
+    "reservas": lambda rid, user: get_reservas_registro(rid),
+    "estados_disponibles": lambda rid, user: get_estados_disponibles_registro(rid),
+    "analisis_estado": lambda rid, user: analisis_estado_registro(rid),
+    "movimientos": lambda rid, user: get_movimientos(
+        registro_id=rid, servicio_id=None, persona_id=None, fecha_desde=None, fecha_hasta=None,
+        search="", limit=0, offset=0, all="true",
+    ),
+    "salidas": lambda rid, user: get_salidas(registro_id=rid),
+    "incidencias": lambda rid, user: get_incidencias(rid),
+    "paralizaciones": lambda rid, user: get_paralizaciones(rid),
+    "conversacion": lambda rid, user: get_conversacion(rid),
+    "divisiones": lambda rid, user: get_divisiones_registro(rid),
+    "costos_servicio": lambda rid, user: get_costos_servicio(rid, current_user=user),
+    "arreglos": lambda rid, user: get_arreglos(rid, current_user=user),
+    "resumen_cantidades": lambda rid, user: resumen_cantidades(rid, current_user=user),
+}
+
+
+def _contenido(resultado):
+    """Los endpoints que retornan FastJSONResponse ya vienen serializados."""
+    if isinstance(resultado, Response):
+        return orjson.loads(resultado.body)
+    return resultado
+
+
+async def _ejecutar(nombre, registro_id, current_user, semaforo):
+    async with semaforo:
+        inicio = time.perf_counter()
+        try:
+            datos = _contenido(await SECCIONES[nombre](registro_id, current_user))
+            error = None
+        except HTTPException as e:
+            datos, error = None, {"status": e.status_code, "detail": e.detail}
+        except Exception as e:
+            datos, error = None, {"status": 500, "detail": str(e)[:300]}
+        return nombre, datos, error, round((time.perf_counter() - inicio) * 1000, 1)
+
+
+@router.get("/registros/{registro_id}/bundle")
+async def get_registro_bundle(
+    registro_id: str,
+    campos: str = Query("", description="Secciones separadas por coma; vacío = todas"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Secciones del lote en un solo payload; un error en una sección no tumba las demás."""
+    pedidos = [c.strip() for c in campos.split(",") if c.strip()] or list(SECCIONES)
+    desconocidos = [c for c in pedidos if c not in SECCIONES]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail={
+            "mensaje": f"Secciones desconocidas: {', '.join(desconocidos)}",
+            "disponibles": list(SECCIONES),
+        })
+    pedidos = list(dict.fromkeys(pedidos))
+
+    inicio = time.perf_counter()
+    semaforo = asyncio.Semaphore(max(1, BUNDLE_CONCURRENCIA))
+    resultados = await asyncio.gather(*[
+        _ejecutar(nombre, registro_id, current_user, semaforo) for nombre in pedidos
+    ])
+
+    bundle = {}
+    errores = {}
+    tiempos = {}
+    for nombre, datos, error, ms in resultados:
+        tiempos[nombre] = ms
+        if error:
+            errores[nombre] = error
+        else:
+            bundle[nombre] = datos
+    if errores.get("registro", {}).get("status") == 404:
+        raise HTTPException(status_code=404, detail="Registro no encontrado")
+
+    bundle["_meta"] = {
+        "secciones": pedidos,
+        "tiempos_ms": tiempos,
+        "total_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "concurrencia": BUNDLE_CONCURRENCIA,
+        "errores": errores,
+    }
+    return bundle
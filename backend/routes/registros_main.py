@@ -9,7 +9,12 @@ from models import (
     RegistroCreate, Registro, RegistroTallaCreate, RegistroTallaUpdate, RegistroTallaBulkUpdate,
     ReservaCreateInput, LiberarReservaInput, ESTADOS_PRODUCCION, DivisionLoteRequest,
 )
-from helpers import row_to_dict, parse_jsonb, registrar_actividad
+from helpers import row_to_dict, parse_jsonb, registrar_actividad, refrescar_agregados_inventario, refrescar_agregados_por_registro
+from fast_json import FastJSONResponse
+from matriz_cubo import refrescar_cubo_registros
+from routes.busqueda import patron_busqueda, predicado_registros
+from filtros_sql import FiltrosSQL, lista_csv
+from rutas_compiladas import ruta_compilada
 from routes.auditoria import audit_log_safe, get_usuario
 from typing import Optional, List
 from pydantic import BaseModel
@@ -33,43 +38,16 @@ async def get_registros(
 ):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        # Build WHERE clause dynamically
-        conditions = []
-        params = []
-        param_idx = 1
-
-        if search:
-            conditions.append(f"(r.n_corte ILIKE ${param_idx} OR m.nombre ILIKE ${param_idx})")
-            params.append(f"%{search}%")
-            param_idx += 1
-
-        if estados:
-            estado_list = [e.strip() for e in estados.split(",") if e.strip()]
-            if estado_list:
-                placeholders = ", ".join(f"${param_idx + i}" for i in range(len(estado_list)))
-                conditions.append(f"r.estado IN ({placeholders})")
-                params.extend(estado_list)
-                param_idx += len(estado_list)
-
-        if excluir_estados:
-            excl_list = [e.strip() for e in excluir_estados.split(",") if e.strip()]
-            if excl_list:
-                placeholders = ", ".join(f"${param_idx + i}" for i in range(len(excl_list)))
-                conditions.append(f"(r.estado NOT IN ({placeholders}) OR r.estado IS NULL)")
-                params.extend(excl_list)
-                param_idx += len(excl_list)
-
-        if modelo_id:
-            conditions.append(f"r.modelo_id = ${param_idx}")
-            params.append(modelo_id)
-            param_idx += 1
-
-        if linea_negocio_id:
-            conditions.append(f"r.linea_negocio_id = ${param_idx}")
-            params.append(int(linea_negocio_id))
-            param_idx += 1
-
-        where_clause = " AND ".join(conditions) if conditions else "TRUE"
+        # Forma fija: los filtros ausentes van como NULL y el SQL no cambia
+        filtros = FiltrosSQL()
+        filtros.si(patron_busqueda(search) if search else None, predicado_registros)
+        filtros.en("r.estado", lista_csv(estados))
+        filtros.no_en("r.estado", lista_csv(excluir_estados))
+        filtros.igual("r.modelo_id", modelo_id)
+        filtros.igual("r.linea_negocio_id", int(linea_negocio_id) if linea_negocio_id else None, "int")
+        where_clause = filtros.where()
+        param_idx = filtros.siguiente()
+        params = filtros.params
 
         # Un solo query: count con window function + data paginada
         rows = await conn.fetch(f"""
@@ -139,7 +117,7 @@ async def get_registros(
                 else:
                     d['estado_operativo'] = 'NORMAL'
             result.append(d)
-        return {"items": result, "total": total, "limit": limit, "offset": offset}
+        return FastJSONResponse({"items": result, "total": total, "limit": limit, "offset": offset})
 
 # Endpoint para obtener estados únicos (para filtros)
 @router.get("/registros-estados")
@@ -240,6 +218,7 @@ async def create_registro(input: RegistroCreate, current_user: dict = Depends(ge
             registro.hilo_especifico_id, tallas_json, dist_json, registro.fecha_creacion.replace(tzinfo=None),
             registro.pt_item_id, registro.empresa_id, registro.observaciones, registro.linea_negocio_id
         )
+        await refrescar_cubo_registros(conn, [registro.id])
         cant_total = sum(t.cantidad for t in registro.tallas) if registro.tallas else 0
         await audit_log_safe(conn, get_usuario(current_user), "CREATE", "produccion", "prod_registros", registro.id,
             datos_despues={"n_corte": registro.n_corte, "modelo_id": registro.modelo_id, "estado": registro.estado,
@@ -319,6 +298,7 @@ async def update_registro(registro_id: str, input: RegistroCreate, current_user:
                        VALUES ($1, $2, $3, $4, $5, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)""",
                     str(uuid.uuid4()), registro_id, td['talla_id'], cant, empresa_id
                 )
+        await refrescar_cubo_registros(conn, [registro_id])
         
         datos_despues = {"estado": input.estado, "n_corte": input.n_corte,
                          "linea_negocio_id": input.linea_negocio_id, "urgente": input.urgente}
@@ -334,35 +314,39 @@ async def update_registro(registro_id: str, input: RegistroCreate, current_user:
 async def delete_registro(registro_id: str):
     pool = await get_pool()
     async with pool.acquire() as conn:
+        padre_id = await conn.fetchval(
+            "SELECT dividido_desde_registro_id FROM prod_registros WHERE id = $1", registro_id)
         await conn.execute("DELETE FROM prod_registros WHERE id = $1", registro_id)
+        await refrescar_cubo_registros(conn, [registro_id, padre_id])
         return {"message": "Registro eliminado"}
 
+async def _registro_y_ruta(conn, registro_id: str):
+    """Registro (con el ruta_produccion_id de su modelo en un solo fetch) y su RutaCompilada o None."""
+    registro = await conn.fetchrow("""
+        SELECT r.*, m.ruta_produccion_id AS _ruta_produccion_id
+        FROM prod_registros r
+        LEFT JOIN prod_modelos m ON m.id = r.modelo_id
+        WHERE r.id = $1
+    """, registro_id)
+    if not registro:
+        raise HTTPException(status_code=404, detail="Registro no encontrado")
+    return registro, await ruta_compilada(conn, registro['_ruta_produccion_id'])
+
+
 @router.get("/registros/{registro_id}/estados-disponibles")
 async def get_estados_disponibles_registro(registro_id: str):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        registro = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", registro_id)
-        if not registro:
-            raise HTTPException(status_code=404, detail="Registro no encontrado")
-        
-        # Obtener ruta del modelo
-        modelo = await conn.fetchrow("SELECT ruta_produccion_id FROM prod_modelos WHERE id = $1", registro['modelo_id']) if registro['modelo_id'] else None
-        ruta_id = modelo['ruta_produccion_id'] if modelo and modelo['ruta_produccion_id'] else None
-        
-        if ruta_id:
-            ruta = await conn.fetchrow("SELECT etapas, nombre FROM prod_rutas_produccion WHERE id = $1", ruta_id)
-            if ruta and ruta['etapas']:
-                etapas = ruta['etapas'] if isinstance(ruta['etapas'], list) else json.loads(ruta['etapas'])
-                etapas_sorted = sorted(etapas, key=lambda e: e.get('orden', 0))
-                # Solo mostrar etapas con aparece_en_estado=true (default true para compatibilidad)
-                estados = [e['nombre'] for e in etapas_sorted if e.get('nombre') and e.get('aparece_en_estado', True)]
-                return {
-                    "estados": estados,
-                    "usa_ruta": True,
-                    "ruta_nombre": ruta['nombre'],
-                    "estado_actual": registro['estado'],
-                    "etapas_completas": etapas_sorted
-                }
+        registro, ruta = await _registro_y_ruta(conn, registro_id)
+        if ruta:
+            # Solo etapas con aparece_en_estado=true (default true para compatibilidad)
+            return {
+                "estados": ruta.estados_visibles,
+                "usa_ruta": True,
+                "ruta_nombre": ruta.nombre,
+                "estado_actual": registro['estado'],
+                "etapas_completas": ruta.etapas
+            }
         
         # Fallback: lista genérica si no hay ruta
         return {"estados": ESTADOS_PRODUCCION, "usa_ruta": False, "estado_actual": registro['estado']}
@@ -373,17 +357,10 @@ async def analisis_estado_registro(registro_id: str):
     """Analiza la coherencia entre estado del registro y sus movimientos."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        registro = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", registro_id)
-        if not registro:
-            raise HTTPException(status_code=404, detail="Registro no encontrado")
-        
+        registro, ruta = await _registro_y_ruta(conn, registro_id)
         estado_actual = registro['estado']
         
-        # Obtener ruta del modelo
-        modelo = await conn.fetchrow("SELECT ruta_produccion_id FROM prod_modelos WHERE id = $1", registro['modelo_id']) if registro['modelo_id'] else None
-        ruta_id = modelo['ruta_produccion_id'] if modelo and modelo['ruta_produccion_id'] else None
-        
-        if not ruta_id:
+        if not ruta:
             return {
                 "usa_ruta": False,
                 "estado_actual": estado_actual,
@@ -394,20 +371,7 @@ async def analisis_estado_registro(registro_id: str):
                 "bloqueos": []
             }
         
-        ruta = await conn.fetchrow("SELECT etapas, nombre FROM prod_rutas_produccion WHERE id = $1", ruta_id)
-        if not ruta or not ruta['etapas']:
-            return {
-                "usa_ruta": False,
-                "estado_actual": estado_actual,
-                "estado_sugerido": None,
-                "siguiente_estado_sugerido": None,
-                "movimiento_faltante_por_estado": None,
-                "inconsistencias": [],
-                "bloqueos": []
-            }
-        
-        etapas = ruta['etapas'] if isinstance(ruta['etapas'], list) else json.loads(ruta['etapas'])
-        etapas_sorted = sorted(etapas, key=lambda e: e.get('orden', 0))
+        etapas_sorted = ruta.etapas
         
         # Obtener movimientos del registro
         movimientos = await conn.fetch(
@@ -424,14 +388,7 @@ async def analisis_estado_registro(registro_id: str):
             movs_por_servicio[sid].append(dict(m))
         
         # Encontrar la etapa actual en la ruta
-        etapa_actual_idx = None
-        for i, et in enumerate(etapas_sorted):
-            if et.get('nombre') == estado_actual:
-                etapa_actual_idx = i
-                break
-        
-        # Determinar etapas visibles (aparece_en_estado=true)
-        etapas_visibles = [e for e in etapas_sorted if e.get('aparece_en_estado', True)]
+        etapa_actual_idx = ruta.posicion(estado_actual)
         
         # --- Calcular estado sugerido basado en movimientos ---
         estado_sugerido = None
@@ -446,12 +403,7 @@ async def analisis_estado_registro(registro_id: str):
                     break
         
         # --- Calcular siguiente estado sugerido ---
-        siguiente_estado_sugerido = None
-        if etapa_actual_idx is not None and etapa_actual_idx < len(etapas_sorted) - 1:
-            for et in etapas_sorted[etapa_actual_idx + 1:]:
-                if et.get('aparece_en_estado', True):
-                    siguiente_estado_sugerido = et['nombre']
-                    break
+        siguiente_estado_sugerido = ruta.siguiente_visible(estado_actual)
         
         # --- Verificar si falta movimiento para el estado actual ---
         movimiento_faltante_por_estado = None
@@ -470,8 +422,7 @@ async def analisis_estado_registro(registro_id: str):
         inconsistencias = []
         
         # 1. Estado actual no está en la ruta
-        nombres_ruta = [e['nombre'] for e in etapas_sorted]
-        if estado_actual not in nombres_ruta:
+        if etapa_actual_idx is None:
             inconsistencias.append({
                 "tipo": "estado_fuera_ruta",
                 "mensaje": f"El estado '{estado_actual}' no existe en la ruta de producción.",
@@ -522,7 +473,7 @@ async def analisis_estado_registro(registro_id: str):
         
         return {
             "usa_ruta": True,
-            "ruta_nombre": ruta['nombre'],
+            "ruta_nombre": ruta.nombre,
             "estado_actual": estado_actual,
             "estado_sugerido": estado_sugerido,
             "siguiente_estado_sugerido": siguiente_estado_sugerido,
@@ -551,9 +502,7 @@ async def validar_cambio_estado(registro_id: str, body: dict):
     
     pool = await get_pool()
     async with pool.acquire() as conn:
-        registro = await conn.fetchrow("SELECT * FROM prod_registros WHERE id = $1", registro_id)
-        if not registro:
-            raise HTTPException(status_code=404, detail="Registro no encontrado")
+        registro, ruta = await _registro_y_ruta(conn, registro_id)
         
         # Bloqueo por paralización activa
         par_activa = await conn.fetchval(
@@ -567,20 +516,9 @@ async def validar_cambio_estado(registro_id: str, body: dict):
                 "paralizado": True
             }
         
-        modelo = await conn.fetchrow("SELECT ruta_produccion_id FROM prod_modelos WHERE id = $1", registro['modelo_id']) if registro['modelo_id'] else None
-        ruta_id = modelo['ruta_produccion_id'] if modelo and modelo['ruta_produccion_id'] else None
-        
-        if not ruta_id:
+        if not ruta:
             return {"permitido": True, "bloqueos": [], "sugerencia_movimiento": None}
         
-        ruta = await conn.fetchrow("SELECT etapas FROM prod_rutas_produccion WHERE id = $1", ruta_id)
-        if not ruta or not ruta['etapas']:
-            return {"permitido": True, "bloqueos": [], "sugerencia_movimiento": None}
-        
-        etapas = ruta['etapas'] if isinstance(ruta['etapas'], list) else json.loads(ruta['etapas'])
-        etapas_sorted = sorted(etapas, key=lambda e: e.get('orden', 0))
-        nombres_ruta = [e['nombre'] for e in etapas_sorted]
-        
         # Si se fuerza el cambio O el registro tiene skip_validacion_estado, permitir sin validaciones
         if forzar or registro.get('skip_validacion_estado'):
             return {"permitido": True, "bloqueos": [], "forzado": True, "sugerencia_movimiento": None}
@@ -588,16 +526,11 @@ async def validar_cambio_estado(registro_id: str, body: dict):
         bloqueos = []
         
         # Bloqueo 1: estado fuera de ruta
-        if nuevo_estado not in nombres_ruta:
+        nuevo_idx = ruta.posicion(nuevo_estado)
+        if nuevo_idx is None:
             bloqueos.append({"mensaje": f"El estado '{nuevo_estado}' no pertenece a la ruta de producción asignada.", "servicio_id": None, "movimiento_id": None, "etapa": None})
         
         # Bloqueo 2: saltar etapa obligatoria previa sin movimiento completado
-        nuevo_idx = None
-        for i, e in enumerate(etapas_sorted):
-            if e['nombre'] == nuevo_estado:
-                nuevo_idx = i
-                break
-        
         movimientos = await conn.fetch(
             "SELECT id, servicio_id, fecha_inicio, fecha_fin FROM prod_movimientos_produccion WHERE registro_id = $1",
             registro_id
@@ -624,10 +557,8 @@ async def validar_cambio_estado(registro_id: str, body: dict):
                         movs_padre[sid] = []
                     movs_padre[sid].append(dict(m))
             
-            for et in etapas_sorted[:nuevo_idx]:
-                sid = et.get('servicio_id')
-                if not sid:
-                    continue
+            for et in ruta.requisitos(nuevo_estado):
+                sid = et['servicio_id']
                 es_obligatoria = et.get('obligatorio', True)
                 
                 tiene_mov_propio = sid in movs_por_servicio
@@ -648,7 +579,7 @@ async def validar_cambio_estado(registro_id: str, body: dict):
         # Sugerencia: si el nuevo estado tiene servicio vinculado y no hay movimiento
         sugerencia_movimiento = None
         if nuevo_idx is not None and not bloqueos:
-            etapa_nueva = etapas_sorted[nuevo_idx]
+            etapa_nueva = ruta.etapas[nuevo_idx]
             sid = etapa_nueva.get('servicio_id')
             if sid and sid not in movs_por_servicio:
                 srv = await conn.fetchrow("SELECT nombre FROM prod_servicios_produccion WHERE id = $1", sid)
@@ -760,6 +691,7 @@ async def upsert_registro_tallas(registro_id: str, input: RegistroTallaBulkUpdat
                 )
                 updated.append({"id": new_id, "talla_id": t.talla_id, "cantidad_real": t.cantidad_real})
         
+        await refrescar_cubo_registros(conn, [registro_id])
         return {"message": "Tallas actualizadas", "updated": updated}
 
 
@@ -793,6 +725,7 @@ async def update_single_registro_talla(registro_id: str, talla_id: str, input: R
                 "UPDATE prod_registro_tallas SET cantidad_real = $1, updated_at = CURRENT_TIMESTAMP WHERE id = $2",
                 input.cantidad_real, existing['id']
             )
+            await refrescar_cubo_registros(conn, [registro_id])
             return {"id": existing['id'], "talla_id": talla_id, "cantidad_real": input.cantidad_real}
         else:
             new_id = str(uuid.uuid4())
@@ -801,6 +734,7 @@ async def update_single_registro_talla(registro_id: str, talla_id: str, input: R
                    VALUES ($1, $2, $3, $4)""",
                 new_id, registro_id, talla_id, input.cantidad_real
             )
+            await refrescar_cubo_registros(conn, [registro_id])
             return {"id": new_id, "talla_id": talla_id, "cantidad_real": input.cantidad_real}
 
 
@@ -1267,6 +1201,7 @@ async def crear_reserva(registro_id: str, input: ReservaCreateInput):
             END
             WHERE registro_id = $1
         """, registro_id)
+        await refrescar_agregados_inventario(conn, [l.item_id for l in input.lineas])
         
         return {
             "message": "Reserva creada",
@@ -1363,6 +1298,7 @@ async def anular_reserva(reserva_id: str):
         await conn.execute("""
             UPDATE prod_inventario_reservas SET estado = 'ANULADA', updated_at = CURRENT_TIMESTAMP WHERE id = $1
         """, reserva_id)
+        await refrescar_agregados_inventario(conn, [lin['item_id'] for lin in lineas])
         
         return {"message": "Reserva anulada", "reserva_id": reserva_id, "lineas_liberadas": len(lineas)}
 
@@ -1453,6 +1389,7 @@ async def liberar_reservas(registro_id: str, input: LiberarReservaInput):
             END
             WHERE registro_id = $1
         """, registro_id)
+        await refrescar_agregados_inventario(conn, [l.item_id for l in input.lineas])
         
         return {"message": "Reservas liberadas", "liberadas": liberadas}
 
@@ -1535,6 +1472,7 @@ async def liberar_reservas_pendientes_auto(conn, registro_id: str):
         END
         WHERE registro_id = $1
     """, registro_id)
+    await refrescar_agregados_por_registro(conn, registro_id)
     
     return {
         "total_liberado": total_liberado,
@@ -1571,6 +1509,7 @@ async def cerrar_registro(registro_id: str):
                 SET estado = 'CERRADA'
                 WHERE id = $1
             """, registro_id)
+            await refrescar_cubo_registros(conn, [registro_id])
             
             # Liberar reservas pendientes automáticamente
             liberacion = await liberar_reservas_pendientes_auto(conn, registro_id)
@@ -1610,6 +1549,7 @@ async def anular_registro(registro_id: str):
                 SET estado = 'ANULADA'
                 WHERE id = $1
             """, registro_id)
+            await refrescar_cubo_registros(conn, [registro_id])
             
             # Liberar reservas pendientes automáticamente
             liberacion = await liberar_reservas_pendientes_auto(conn, registro_id)
@@ -1895,6 +1835,7 @@ async def dividir_lote(registro_id: str, body: DivisionLoteRequest):
                    VALUES ($1, $2, $3, $4, $5, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)""",
                 str(uuid.uuid4()), hijo_id, th['talla_id'], th['cantidad'], empresa_id_real
             )
+        await refrescar_cubo_registros(conn, [registro_id, hijo_id])
         
         return {
             "mensaje": f"Lote dividido exitosamente. Nuevo registro: {n_corte_hijo}",
@@ -2028,6 +1969,7 @@ async def reunificar_lote(registro_id: str):
         
         # Eliminar el registro hijo
         await conn.execute("DELETE FROM prod_registros WHERE id = $1", registro_id)
+        await refrescar_cubo_registros(conn, [registro_id, padre_id])
         
         return {
             "mensaje": f"Lote reunificado exitosamente con {padre['tallas']}",
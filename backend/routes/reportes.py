@@ -11,7 +11,7 @@ router = APIRouter(prefix="/api", tags=["reportes"])
 
 import sys
 sys.path.insert(0, '/app/backend')
-from db import get_pool
+from db import get_pool, solo_lectura
 from auth import get_current_user
 from helpers import row_to_dict
 
@@ -19,6 +19,7 @@ from helpers import row_to_dict
 # ==================== REPORTE MP VALORIZADO ====================
 
 @router.get("/reportes/mp-valorizado")
+@solo_lectura
 async def get_mp_valorizado(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user)
@@ -98,6 +99,7 @@ async def get_mp_valorizado(
 # ==================== REPORTE WIP VALORIZADO ====================
 
 @router.get("/reportes/wip")
+@solo_lectura
 async def get_wip_valorizado(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user)
@@ -169,6 +171,7 @@ async def get_wip_valorizado(
 # ==================== REPORTE PT VALORIZADO ====================
 
 @router.get("/reportes/pt-valorizado")
+@solo_lectura
 async def get_pt_valorizado(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user)
@@ -240,6 +243,7 @@ async def get_pt_valorizado(
 # ==================== KARDEX POR ITEM ====================
 
 @router.get("/reportes/kardex/{item_id}")
+@solo_lectura
 async def get_kardex_item(
     item_id: str,
     fecha_desde: Optional[date] = None,
@@ -341,6 +345,7 @@ async def get_kardex_item(
 # ==================== REPORTE DE ÓRDENES ====================
 
 @router.get("/reportes/ordenes")
+@solo_lectura
 async def get_reporte_ordenes(
     empresa_id: int = Query(7),
     estado_op: Optional[str] = None,
@@ -378,7 +383,7 @@ async def get_reporte_ordenes(
             LEFT JOIN prod_marcas ma ON m.marca_id = ma.id
             LEFT JOIN prod_inventario pt ON r.pt_item_id = pt.id
             LEFT JOIN prod_orden_etapa e ON r.etapa_actual_id = e.id
-            LEFT JOIN v_wip_resumen w ON r.id = w.orden_id
+            LEFT JOIN prod_wip_resumen w ON r.id = w.orden_id
             LEFT JOIN prod_registro_cierre c ON c.registro_id = r.id
             WHERE r.empresa_id = $1
         """
@@ -436,6 +441,7 @@ async def get_reporte_ordenes(
 # ==================== RESUMEN GENERAL ====================
 
 @router.get("/reportes/resumen-general")
+@solo_lectura
 async def get_resumen_general(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user)
@@ -456,7 +462,7 @@ async def get_resumen_general(
         # WIP value - Solo órdenes ABIERTA/EN_PROCESO
         wip_valor = await conn.fetchval("""
             SELECT COALESCE(SUM(w.costo_total), 0)
-            FROM v_wip_resumen w
+            FROM prod_wip_resumen w
             JOIN prod_registros r ON w.orden_id = r.id
             WHERE r.empresa_id = $1 AND r.estado_op IN ('ABIERTA', 'EN_PROCESO')
         """, empresa_id)
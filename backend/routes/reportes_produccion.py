@@ -3,18 +3,28 @@ Router: Reportes de Producción P0
 Dashboard KPIs, En Proceso, WIP por Etapa, Atrasados, Trazabilidad,
 Cumplimiento de Ruta, Balance Terceros, Lotes Fraccionados.
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import Optional
-from datetime import date, datetime, timezone
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from typing import Optional, List
+from datetime import date
 import json
 
 router = APIRouter(prefix="/api/reportes-produccion", tags=["reportes-produccion"])
 
 import sys
 sys.path.insert(0, '/app/backend')
-from db import get_pool
-from auth import get_current_user
+from db import get_pool, solo_lectura
+from auth import get_current_user, security
 from helpers import row_to_dict
+from fast_json import FastJSONResponse
+from matriz_cubo import reconstruir_cubo
+from coalescer import coalescido, estado_coalescencia
+from alertas_stream import eventos_alertas, estado_alertas_stream, emitir_ticket, canjear_ticket
+from rutas_compiladas import ruta_compilada, rutas_compiladas
+from filtros_sql import FiltrosSQL
+from alertas_motor import registrar_regla, alertas_abiertas
+from archivo_lotes import tabla_o_vista
 
 
 def parse_jsonb(val):
@@ -44,9 +54,27 @@ def safe_int(v):
         return 0
 
 
+# Escrituras que cambian los reportes coalescidos (dashboard, matriz, costura, alertas)
+_DEPENDE_PRODUCCION = (
+    "/api/registros", "/api/ordenes", "/api/movimientos-produccion", "/api/mermas",
+    "/api/incidencias", "/api/paralizaciones", "/api/fallados", "/api/arreglos",
+    "/api/cierre-produccion", "/api/reportes-produccion", "/api/modelos",
+    "/api/personas-produccion", "/api/servicios-produccion", "/api/rutas-produccion",
+    "/api/marcas", "/api/tipos", "/api/entalles", "/api/telas", "/api/hilos", "/api/backup",
+)
+
+
+@router.get("/coalescencia/estado")
+async def get_estado_coalescencia(current_user: dict = Depends(get_current_user)):
+    """Métricas de la coalescencia por ruta: cálculos, hits de cache y solicitudes compartidas."""
+    return estado_coalescencia()
+
+
 # ==================== 1. DASHBOARD KPIs ====================
 
 @router.get("/dashboard")
+@coalescido("dashboard", _DEPENDE_PRODUCCION, ttl_seg=10)
+@solo_lectura
 async def dashboard_kpis(
     empresa_id: int = Query(7),
     fecha_desde: Optional[str] = None,
@@ -166,6 +194,7 @@ async def dashboard_kpis(
 # ==================== 2. PRODUCCIÓN EN PROCESO ====================
 
 @router.get("/en-proceso")
+@solo_lectura
 async def produccion_en_proceso(
     empresa_id: int = Query(7),
     estado: Optional[str] = None,
@@ -234,6 +263,7 @@ async def produccion_en_proceso(
 # ==================== 3. WIP POR ETAPA ====================
 
 @router.get("/wip-etapa")
+@solo_lectura
 async def wip_por_etapa(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user),
@@ -271,6 +301,7 @@ async def wip_por_etapa(
 # ==================== 4. LOTES ATRASADOS ====================
 
 @router.get("/atrasados")
+@solo_lectura
 async def lotes_atrasados(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user),
@@ -328,6 +359,7 @@ async def lotes_atrasados(
 # ==================== 5. TRAZABILIDAD ====================
 
 @router.get("/trazabilidad/{registro_id}")
+@solo_lectura
 async def trazabilidad_registro(
     registro_id: str,
     current_user: dict = Depends(get_current_user),
@@ -420,128 +452,180 @@ async def trazabilidad_registro(
 
 # ==================== 6. CUMPLIMIENTO DE RUTA ====================
 
+# Etapas de la ruta de cada registro cruzadas con sus movimientos agregados por
+# servicio: el estado de cada etapa sale del SQL en vez de recorrer R×E×M en Python.
+_CUMPLIMIENTO_SQL = """
+    WITH reg AS (
+        SELECT r.id, r.n_corte, r.estado, r.estado_op, r.urgente,
+               r.fecha_creacion, r.fecha_entrega_final,
+               m.nombre as modelo_nombre,
+               rp.id as ruta_id, rp.nombre as ruta_nombre,
+               CASE WHEN jsonb_typeof(rp.etapas::jsonb) = 'array' THEN rp.etapas::jsonb ELSE '[]'::jsonb END as etapas
+        FROM prod_registros r
+        JOIN prod_modelos m ON r.modelo_id = m.id
+        JOIN prod_rutas_produccion rp ON m.ruta_produccion_id = rp.id
+        WHERE {where}
+          AND r.estado_op IN ('ABIERTA', 'EN_PROCESO')
+          AND r.dividido_desde_registro_id IS NULL
+    ),
+    mov AS (
+        SELECT mp.registro_id, mp.servicio_id,
+               bool_or(mp.fecha_inicio IS NOT NULL) as inicio,
+               bool_or(mp.fecha_fin IS NOT NULL) as fin
+        FROM prod_movimientos_produccion mp
+        WHERE mp.registro_id IN (SELECT id FROM reg)
+        GROUP BY mp.registro_id, mp.servicio_id
+    ),
+    etapa AS (
+        SELECT reg.id as registro_id, e.ord,
+               COALESCE(e.val->>'nombre', '') as nombre,
+               COALESCE(e.val->'obligatorio', 'false'::jsonb) as obligatorio,
+               CASE WHEN mov.fin THEN 'COMPLETADA' WHEN mov.inicio THEN 'EN_CURSO' ELSE 'PENDIENTE' END as estado
+        FROM reg
+        CROSS JOIN LATERAL jsonb_array_elements(reg.etapas) WITH ORDINALITY AS e(val, ord)
+        LEFT JOIN mov ON mov.registro_id = reg.id
+                     AND mov.servicio_id IS NOT DISTINCT FROM (e.val->>'servicio_id')
+    ),
+    por_registro AS (
+        SELECT registro_id,
+               COUNT(*) as total_etapas,
+               COUNT(*) FILTER (WHERE estado = 'COMPLETADA') as completadas,
+               COUNT(*) FILTER (WHERE estado = 'EN_CURSO') as en_curso,
+               COUNT(*) FILTER (WHERE estado = 'PENDIENTE') as pendientes,
+               jsonb_agg(jsonb_build_object('nombre', nombre, 'obligatorio', obligatorio, 'estado', estado)
+                         ORDER BY ord) as detalle_etapas
+        FROM etapa
+        GROUP BY registro_id
+    ),
+    cumplimiento AS (
+        SELECT reg.*,
+               COALESCE(pr.total_etapas, 0) as total_etapas,
+               COALESCE(pr.completadas, 0) as completadas,
+               COALESCE(pr.en_curso, 0) as en_curso,
+               COALESCE(pr.pendientes, 0) as pendientes,
+               COALESCE(pr.detalle_etapas, '[]'::jsonb) as detalle_etapas
+        FROM reg
+        LEFT JOIN por_registro pr ON pr.registro_id = reg.id
+    )
+"""
+
+
 @router.get("/cumplimiento-ruta")
+@solo_lectura
 async def cumplimiento_ruta(
     empresa_id: int = Query(7),
     ruta_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, description="Registros por página; sin valor = todos"),
+    offset: int = Query(0, ge=0),
+    solo_resumen: bool = Query(False, description="Solo totales por etapa y por ruta, sin detalle por registro"),
     current_user: dict = Depends(get_current_user),
 ):
+    filtros = FiltrosSQL()
+    filtros.condiciones.append(f"r.empresa_id = ${filtros.param(empresa_id)}")
+    filtros.igual("rp.id", ruta_id)
+    base = _CUMPLIMIENTO_SQL.format(where=filtros.where())
+    params = filtros.params
+
     pool = await get_pool()
     async with pool.acquire() as conn:
-        query = """
-            SELECT r.id, r.n_corte, r.estado, r.estado_op, r.urgente,
-                   r.fecha_creacion, r.fecha_entrega_final,
-                   m.nombre as modelo_nombre,
-                   rp.id as ruta_id, rp.nombre as ruta_nombre, rp.etapas as ruta_etapas,
-                   COALESCE((SELECT SUM(rt.cantidad_real) FROM prod_registro_tallas rt WHERE rt.registro_id = r.id),0) as total_prendas
-            FROM prod_registros r
-            LEFT JOIN prod_modelos m ON r.modelo_id = m.id
-            LEFT JOIN prod_rutas_produccion rp ON m.ruta_produccion_id = rp.id
-            WHERE r.empresa_id = $1
-              AND r.estado_op IN ('ABIERTA', 'EN_PROCESO')
-              AND r.dividido_desde_registro_id IS NULL
-              AND rp.id IS NOT NULL
-        """
-        params = [empresa_id]
-        if ruta_id:
-            params.append(ruta_id)
-            query += f" AND rp.id = ${len(params)}"
+        if solo_resumen:
+            return await _resumen_cumplimiento(conn, base, params)
 
-        query += " ORDER BY r.fecha_creacion ASC"
-        rows = await conn.fetch(query, *params)
-
-        # Get all movimientos for these registros in batch
-        reg_ids = [r["id"] for r in rows]
-        if reg_ids:
-            movs = await conn.fetch("""
-                SELECT mp.registro_id, mp.servicio_id,
-                       mp.fecha_inicio, mp.fecha_fin
-                FROM prod_movimientos_produccion mp
-                WHERE mp.registro_id = ANY($1::text[])
-            """, reg_ids)
+        n = filtros.siguiente()
+        rows = await conn.fetch(f"""
+            {base}
+            SELECT c.id, c.n_corte, c.estado, c.estado_op, c.urgente,
+                   c.fecha_creacion, c.fecha_entrega_final, c.modelo_nombre,
+                   c.ruta_id, c.ruta_nombre,
+                   c.total_etapas, c.completadas, c.en_curso, c.pendientes, c.detalle_etapas,
+                   COALESCE((SELECT SUM(rt.cantidad_real) FROM prod_registro_tallas rt WHERE rt.registro_id = c.id),0) as total_prendas,
+                   COUNT(*) OVER() as _total_count
+            FROM cumplimiento c
+            ORDER BY c.fecha_creacion ASC, c.id
+            LIMIT ${n} OFFSET ${n + 1}
+        """, *params, limit, offset)
+        if rows:
+            total = rows[0]["_total_count"]
+        elif offset > 0:
+            total = await conn.fetchval(f"{base} SELECT COUNT(*) FROM cumplimiento", *params)
         else:
-            movs = []
-
-        # Index: registro_id -> list of {servicio_id, fecha_inicio, fecha_fin}
-        mov_map = {}
-        for mv in movs:
-            rid = mv["registro_id"]
-            if rid not in mov_map:
-                mov_map[rid] = []
-            mov_map[rid].append({
-                "servicio_id": mv["servicio_id"],
-                "inicio": mv["fecha_inicio"] is not None,
-                "fin": mv["fecha_fin"] is not None,
-            })
+            total = 0
 
         registros = []
         for r in rows:
             d = row_to_dict(r)
-            etapas = parse_jsonb(d.pop("ruta_etapas", None))
+            d.pop("_total_count", None)
             d["total_prendas"] = safe_int(d.get("total_prendas"))
             if d.get("fecha_creacion"):
                 d["fecha_creacion"] = str(d["fecha_creacion"])
             if d.get("fecha_entrega_final"):
                 d["fecha_entrega_final"] = str(d["fecha_entrega_final"])
-
-            reg_movs = mov_map.get(r["id"], [])
-            total_etapas = len(etapas)
-            completadas = 0
-            en_curso = 0
-            pendientes = 0
-            detalle_etapas = []
-
-            for etapa in etapas:
-                sid = etapa.get("servicio_id")
-                nombre_etapa = etapa.get("nombre", "")
-                obligatorio = etapa.get("obligatorio", False)
-
-                # Check if any movement matches this service
-                movs_etapa = [m for m in reg_movs if m["servicio_id"] == sid]
-                tiene_inicio = any(m["inicio"] for m in movs_etapa)
-                tiene_fin = any(m["fin"] for m in movs_etapa)
-
-                if tiene_fin:
-                    estado_etapa = "COMPLETADA"
-                    completadas += 1
-                elif tiene_inicio:
-                    estado_etapa = "EN_CURSO"
-                    en_curso += 1
-                else:
-                    estado_etapa = "PENDIENTE"
-                    pendientes += 1
-
-                detalle_etapas.append({
-                    "nombre": nombre_etapa,
-                    "obligatorio": obligatorio,
-                    "estado": estado_etapa,
-                })
-
-            pct = round((completadas / total_etapas * 100), 1) if total_etapas > 0 else 0
-            d["total_etapas"] = total_etapas
-            d["completadas"] = completadas
-            d["en_curso"] = en_curso
-            d["pendientes"] = pendientes
-            d["pct_cumplimiento"] = pct
-            d["detalle_etapas"] = detalle_etapas
+            d["detalle_etapas"] = parse_jsonb(d.get("detalle_etapas"))
+            total_etapas = d["total_etapas"]
+            d["pct_cumplimiento"] = round((d["completadas"] / total_etapas * 100), 1) if total_etapas > 0 else 0
             registros.append(d)
 
-        return {"registros": registros, "total": len(registros)}
+        return {"registros": registros, "total": total, "limit": limit, "offset": offset}
+
+
+async def _resumen_cumplimiento(conn, base: str, params: list) -> dict:
+    """Totales sin detalle por registro: general, por etapa y por ruta."""
+    general = await conn.fetchrow(f"""
+        {base}
+        SELECT COUNT(*) as total_registros,
+               COALESCE(SUM(total_etapas), 0) as total_etapas,
+               COALESCE(SUM(completadas), 0) as completadas,
+               COALESCE(SUM(en_curso), 0) as en_curso,
+               COALESCE(SUM(pendientes), 0) as pendientes,
+               COUNT(*) FILTER (WHERE total_etapas > 0 AND completadas = total_etapas) as registros_completos,
+               COUNT(*) FILTER (WHERE completadas = 0 AND en_curso = 0) as registros_sin_iniciar,
+               AVG(CASE WHEN total_etapas > 0 THEN completadas * 100.0 / total_etapas ELSE 0 END) as pct_promedio
+        FROM cumplimiento
+    """, *params)
+    por_etapa = await conn.fetch(f"""
+        {base}
+        SELECT nombre,
+               COUNT(*) FILTER (WHERE estado = 'COMPLETADA') as completadas,
+               COUNT(*) FILTER (WHERE estado = 'EN_CURSO') as en_curso,
+               COUNT(*) FILTER (WHERE estado = 'PENDIENTE') as pendientes
+        FROM etapa
+        GROUP BY nombre
+        ORDER BY AVG(ord), nombre
+    """, *params)
+    por_ruta = await conn.fetch(f"""
+        {base}
+        SELECT ruta_id, ruta_nombre, COUNT(*) as registros,
+               AVG(CASE WHEN total_etapas > 0 THEN completadas * 100.0 / total_etapas ELSE 0 END) as pct_promedio
+        FROM cumplimiento
+        GROUP BY ruta_id, ruta_nombre
+        ORDER BY ruta_nombre
+    """, *params)
+    resumen = row_to_dict(general)
+    resumen["pct_promedio"] = round(safe_float(resumen["pct_promedio"]), 1)
+    return {
+        "resumen": resumen,
+        "por_etapa": [row_to_dict(r) for r in por_etapa],
+        "por_ruta": [
+            {**row_to_dict(r), "pct_promedio": round(safe_float(r["pct_promedio"]), 1)} for r in por_ruta
+        ],
+    }
 
 
 # ==================== 7. BALANCE POR TERCEROS ====================
 
 @router.get("/balance-terceros")
+@solo_lectura
 async def balance_terceros(
     empresa_id: int = Query(7),
     servicio_id: Optional[str] = None,
     persona_id: Optional[str] = None,
+    incluir_archivo: bool = Query(False, description="Incluir lotes archivados"),
     current_user: dict = Depends(get_current_user),
 ):
     pool = await get_pool()
     async with pool.acquire() as conn:
         # By service
-        query_srv = """
+        query_srv = f"""
             SELECT sp.id as servicio_id, sp.nombre as servicio,
                    pp.id as persona_id, pp.nombre as persona, pp.tipo_persona,
                    COUNT(DISTINCT mp.registro_id) as lotes,
@@ -551,11 +635,13 @@ async def balance_terceros(
                    COALESCE(SUM(mp.diferencia),0) as total_diferencia,
                    COALESCE(SUM(mp.costo_calculado),0) as costo_total,
                    COUNT(mp.id) FILTER (WHERE mp.fecha_fin IS NULL) as movs_abiertos,
-                   COALESCE(SUM(mp.cantidad_enviada) FILTER (WHERE mp.fecha_fin IS NULL),0) as prendas_en_poder
-            FROM prod_movimientos_produccion mp
-            JOIN prod_registros r ON mp.registro_id = r.id
+                   COALESCE(SUM(mp.cantidad_enviada) FILTER (WHERE mp.fecha_fin IS NULL),0) as prendas_en_poder,
+                   MAX(pst.tarifa) as tarifa_vigente
+            FROM {tabla_o_vista("prod_movimientos_produccion", incluir_archivo)} mp
+            JOIN {tabla_o_vista("prod_registros", incluir_archivo)} r ON mp.registro_id = r.id
             JOIN prod_servicios_produccion sp ON mp.servicio_id = sp.id
             LEFT JOIN prod_personas_produccion pp ON mp.persona_id = pp.id
+            LEFT JOIN prod_persona_servicio_tarifa pst ON pst.persona_id = mp.persona_id AND pst.servicio_id = mp.servicio_id
             WHERE r.empresa_id = $1
         """
         params = [empresa_id]
@@ -585,6 +671,8 @@ async def balance_terceros(
                 "costo_total": safe_float(r["costo_total"]),
                 "movs_abiertos": int(r["movs_abiertos"]),
                 "prendas_en_poder": safe_int(r["prendas_en_poder"]),
+                # Tarifa actual de la persona para el servicio (None si ya no lo tiene asignado)
+                "tarifa_vigente": None if r["tarifa_vigente"] is None else safe_float(r["tarifa_vigente"]),
             })
 
         # Summary by service only
@@ -605,6 +693,7 @@ async def balance_terceros(
 # ==================== 8. LOTES FRACCIONADOS ====================
 
 @router.get("/lotes-fraccionados")
+@solo_lectura
 async def lotes_fraccionados(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user),
@@ -660,6 +749,7 @@ async def lotes_fraccionados(
 # ==================== FILTROS: Servicios y Rutas para combos ====================
 
 @router.get("/filtros")
+@solo_lectura
 async def get_filtros_reportes(
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user),
@@ -684,7 +774,196 @@ async def get_filtros_reportes(
 
 # ==================== 9. MATRIZ DINÁMICA ====================
 
+_SQL_ATRASADO = (
+    "(r.fecha_entrega_final < CURRENT_DATE OR EXISTS ("
+    "SELECT 1 FROM prod_movimientos_produccion mp "
+    "WHERE mp.registro_id = r.id "
+    "AND mp.fecha_esperada_movimiento < CURRENT_DATE "
+    "AND mp.fecha_fin IS NULL))"
+)
+
+_MATRIZ_DIMS_FILA = ("marca_id", "tipo_id", "entalle_id", "tela_id", "hilo_id")
+
+
+def _matriz_where(empresa_id, solo_activos, ruta_id, marca_id, tipo_id, entalle_id,
+                  tela_id, hilo_id, modelo_id, estado, solo_atrasados, solo_fraccionados):
+    """Filtros de la matriz sobre prod_registros r / prod_modelos m (drill-down)."""
+    where_clauses = ["r.empresa_id = $1"]
+    params = [empresa_id]
+
+    if solo_activos:
+        where_clauses.append("r.estado_op IN ('ABIERTA','EN_PROCESO')")
+
+    if ruta_id:
+        params.append(ruta_id)
+        where_clauses.append(f"m.ruta_produccion_id = ${len(params)}")
+    if marca_id:
+        params.append(marca_id)
+        where_clauses.append(f"m.marca_id = ${len(params)}")
+    if tipo_id:
+        params.append(tipo_id)
+        where_clauses.append(f"m.tipo_id = ${len(params)}")
+    if entalle_id:
+        params.append(entalle_id)
+        where_clauses.append(f"m.entalle_id = ${len(params)}")
+    if tela_id:
+        params.append(tela_id)
+        where_clauses.append(f"m.tela_id = ${len(params)}")
+    if hilo_id:
+        params.append(hilo_id)
+        where_clauses.append(f"m.hilo_id = ${len(params)}")
+    if modelo_id:
+        params.append(modelo_id)
+        where_clauses.append(f"r.modelo_id = ${len(params)}")
+    if estado:
+        params.append(estado)
+        where_clauses.append(f"r.estado = ${len(params)}")
+    if solo_atrasados:
+        where_clauses.append(_SQL_ATRASADO)
+    if solo_fraccionados:
+        where_clauses.append(
+            "(r.dividido_desde_registro_id IS NOT NULL OR EXISTS ("
+            "SELECT 1 FROM prod_registros ch WHERE ch.dividido_desde_registro_id = r.id))"
+        )
+
+    return where_clauses, params
+
+
+async def _matriz_detalle(conn, where_sql: str, params: list) -> list:
+    """Detalle enriquecido por registro (curva, colores, último movimiento...)."""
+    rows = await conn.fetch(f"""
+        SELECT
+            r.id, r.n_corte, r.estado, r.estado_op, r.urgente,
+            r.fecha_entrega_final, r.tallas as tallas_jsonb,
+            r.dividido_desde_registro_id,
+            r.curva,
+            r.fecha_creacion,
+            r.distribucion_colores as dist_colores_raw,
+            COALESCE(ma.id,'')   as marca_id,
+            COALESCE(ma.nombre,'Sin marca')  as marca,
+            COALESCE(tp.id,'')   as tipo_id_val,
+            COALESCE(tp.nombre,'Sin tipo')   as tipo,
+            COALESCE(en.id,'')   as entalle_id_val,
+            COALESCE(en.nombre,'Sin entalle') as entalle,
+            COALESCE(te.id,'')   as tela_id_val,
+            COALESCE(te.nombre,'Sin tela')   as tela,
+            COALESCE(hi.id,'')   as hilo_id_val,
+            COALESCE(hi.nombre,'Sin hilo')   as hilo,
+            COALESCE(he.nombre,'')   as hilo_especifico,
+            m.nombre  as modelo_nombre,
+            rp.nombre as ruta_nombre,
+            COALESCE(rt_sum.prendas, 0) as prendas_tabla,
+            COALESCE(CURRENT_DATE - mov_first.primera_fecha, 0) as dias_proceso,
+            mov_first.primera_fecha as fecha_inicio_prod,
+            COALESCE(mov_ult.ult_servicio, '') as ult_mov_servicio,
+            mov_ult.ult_fecha_inicio as ult_mov_fecha,
+            COALESCE(mov_agg.diferencia_total, 0) as diferencia_acumulada,
+            COALESCE(mov_agg.total_movimientos, 0) as total_movimientos
+        FROM prod_registros r
+        LEFT JOIN prod_modelos m  ON r.modelo_id = m.id
+        LEFT JOIN prod_marcas ma  ON m.marca_id = ma.id
+        LEFT JOIN prod_tipos tp   ON m.tipo_id = tp.id
+        LEFT JOIN prod_entalles en ON m.entalle_id = en.id
+        LEFT JOIN prod_telas te   ON m.tela_id = te.id
+        LEFT JOIN prod_hilos hi   ON m.hilo_id = hi.id
+        LEFT JOIN prod_hilos_especificos he ON he.id = COALESCE(m.hilo_especifico_id, r.hilo_especifico_id)
+        LEFT JOIN prod_rutas_produccion rp ON m.ruta_produccion_id = rp.id
+        LEFT JOIN LATERAL (
+            SELECT COALESCE(SUM(rt.cantidad_real), 0) as prendas
+            FROM prod_registro_tallas rt WHERE rt.registro_id = r.id
+        ) rt_sum ON true
+        LEFT JOIN LATERAL (
+            SELECT MIN(mp0.fecha_inicio) as primera_fecha
+            FROM prod_movimientos_produccion mp0
+            WHERE mp0.registro_id = r.id AND mp0.fecha_inicio IS NOT NULL
+        ) mov_first ON true
+        LEFT JOIN LATERAL (
+            SELECT sp.nombre as ult_servicio, mp.fecha_inicio as ult_fecha_inicio
+            FROM prod_movimientos_produccion mp
+            LEFT JOIN prod_servicios_produccion sp ON mp.servicio_id = sp.id
+            WHERE mp.registro_id = r.id
+            ORDER BY mp.fecha_inicio DESC NULLS LAST, mp.created_at DESC
+            LIMIT 1
+        ) mov_ult ON true
+        LEFT JOIN LATERAL (
+            SELECT COALESCE(SUM(mp2.diferencia), 0) as diferencia_total,
+                   COUNT(*) as total_movimientos
+            FROM prod_movimientos_produccion mp2
+            WHERE mp2.registro_id = r.id
+        ) mov_agg ON true
+        WHERE {where_sql}
+        ORDER BY ma.nombre, tp.nombre, en.nombre, te.nombre, hi.nombre, r.n_corte
+    """, *params)
+
+    # ── 3. Calcular prendas con fallback ──────────────────────
+    def calc_prendas(row):
+        """prod_registro_tallas primero; fallback a JSONB tallas."""
+        p = safe_int(row["prendas_tabla"])
+        if p > 0:
+            return p
+        tallas = parse_jsonb(row["tallas_jsonb"])
+        return sum(safe_int(t.get("cantidad", 0)) for t in tallas)
+
+    # ── 3b. Cargar mapeo color_id -> color_general_nombre ──────
+    color_gen_map = {}  # color_id -> color_general_nombre
+    cat_rows = await conn.fetch("""
+        SELECT cc.id as color_id, cc.nombre as color_nombre, COALESCE(cg.nombre, '') as color_general_nombre
+        FROM prod_colores_catalogo cc
+        LEFT JOIN prod_colores_generales cg ON cc.color_general_id = cg.id
+    """)
+    for cr in cat_rows:
+        color_gen_map[cr["color_id"]] = cr["color_general_nombre"]
+        color_gen_map[cr["color_nombre"]] = cr["color_general_nombre"]
+
+    detalle = []
+    for r in rows:
+        tallas_raw = parse_jsonb(r["tallas_jsonb"])
+        curva_detalle = [
+            {"talla": t.get("talla_nombre", ""), "cantidad": safe_int(t.get("cantidad", 0))}
+            for t in tallas_raw
+        ]
+
+        # Colores: agregar desde distribucion_colores (JSONB por talla)
+        dist_colores = parse_jsonb(r["dist_colores_raw"])
+        colores_map = {}  # color_nombre -> {cantidad, color_general}
+        for talla_entry in dist_colores:
+            for c in (talla_entry.get("colores") or []):
+                cn = c.get("color_nombre", "")
+                if cn:
+                    if cn not in colores_map:
+                        cg = color_gen_map.get(c.get("color_id", ""), "") or color_gen_map.get(cn, "")
+                        colores_map[cn] = {"cantidad": 0, "color_general": cg}
+                    colores_map[cn]["cantidad"] += safe_int(c.get("cantidad", 0))
+        colores_lista = [{"color": k, "color_general": v["color_general"], "cantidad": v["cantidad"]} for k, v in colores_map.items()]
+
+        detalle.append({
+            "id": r["id"],
+            "n_corte": r["n_corte"],
+            "estado": r["estado"],
+            "prendas": calc_prendas(r),
+            "modelo": r["modelo_nombre"],
+            "ruta": r["ruta_nombre"],
+            "urgente": r["urgente"],
+            "es_hijo": r["dividido_desde_registro_id"] is not None,
+            "fecha_entrega": str(r["fecha_entrega_final"]) if r["fecha_entrega_final"] else None,
+            "fecha_inicio_prod": str(r["fecha_inicio_prod"]) if r["fecha_inicio_prod"] else None,
+            "curva": r["curva"] or "",
+            "curva_detalle": curva_detalle,
+            "hilo_especifico": r["hilo_especifico"],
+            "dias_proceso": safe_int(r["dias_proceso"]),
+            "ult_mov_servicio": r["ult_mov_servicio"],
+            "ult_mov_fecha": str(r["ult_mov_fecha"]) if r["ult_mov_fecha"] else None,
+            "diferencia_acumulada": safe_int(r["diferencia_acumulada"]),
+            "total_movimientos": safe_int(r["total_movimientos"]),
+            "colores": colores_lista,
+            "colores_resumen": ", ".join(colores_map.keys()) if colores_map else "",
+        })
+    return detalle
+
+
 @router.get("/matriz")
+@coalescido("matriz", _DEPENDE_PRODUCCION)
+@solo_lectura
 async def matriz_produccion(
     empresa_id: int = Query(7),
     ruta_id: Optional[str] = None,
@@ -713,34 +992,28 @@ async def matriz_produccion(
     Regla prendas: Se usa SUM(prod_registro_tallas.cantidad_real).
     Si no existe detalle en la tabla, se hace fallback a la suma del campo
     JSONB tallas del registro.
+
+    Los conteos salen del cubo prod_matriz_cubo; el detalle por registro de
+    cada fila/celda se pide aparte a /matriz/detalle con la `clave` de la fila.
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
 
         # ── 1. Determinar columnas (estados) ──────────────────────
         if ruta_id:
-            ruta_row = await conn.fetchrow(
-                "SELECT etapas FROM prod_rutas_produccion WHERE id = $1", ruta_id
-            )
-            if not ruta_row:
+            ruta = await ruta_compilada(conn, ruta_id)
+            if ruta is None and not await conn.fetchval(
+                "SELECT 1 FROM prod_rutas_produccion WHERE id = $1", ruta_id
+            ):
                 raise HTTPException(status_code=404, detail="Ruta no encontrada")
-            etapas_ruta = parse_jsonb(ruta_row["etapas"])
-            columnas = [
-                e["nombre"] for e in etapas_ruta if e.get("aparece_en_estado")
-            ]
+            columnas = list(ruta.columnas_matriz) if ruta else []
         else:
             # Sin filtro de ruta: unir etapas visibles de TODAS las rutas activas,
             # deduplicar, y ordenar por posición promedio.
-            all_rutas = await conn.fetch("SELECT etapas FROM prod_rutas_produccion")
             col_positions = {}  # nombre -> list of positions
-            for rr in all_rutas:
-                etapas = parse_jsonb(rr["etapas"])
-                pos = 0
-                for e in etapas:
-                    if e.get("aparece_en_estado"):
-                        name = e["nombre"]
-                        col_positions.setdefault(name, []).append(pos)
-                        pos += 1
+            for ruta in await rutas_compiladas(conn):
+                for pos, name in enumerate(ruta.columnas_matriz):
+                    col_positions.setdefault(name, []).append(pos)
             # Ordenar por posición promedio
             columnas = sorted(
                 col_positions.keys(),
@@ -750,145 +1023,58 @@ async def matriz_produccion(
         if not columnas:
             columnas = ["Sin estado"]
 
-        # ── 2. Query principal: un registro por fila ──────────────
-        where_clauses = ["r.empresa_id = $1"]
+        # ── 2. Cortar el cubo: una fila por celda (ver matriz_cubo.py) ──
+        where_clauses = ["c.empresa_id = $1"]
         params = [empresa_id]
-
         if solo_activos:
-            where_clauses.append("r.estado_op IN ('ABIERTA','EN_PROCESO')")
-
-        if ruta_id:
-            params.append(ruta_id)
-            where_clauses.append(f"m.ruta_produccion_id = ${len(params)}")
-        if marca_id:
-            params.append(marca_id)
-            where_clauses.append(f"m.marca_id = ${len(params)}")
-        if tipo_id:
-            params.append(tipo_id)
-            where_clauses.append(f"m.tipo_id = ${len(params)}")
-        if entalle_id:
-            params.append(entalle_id)
-            where_clauses.append(f"m.entalle_id = ${len(params)}")
-        if tela_id:
-            params.append(tela_id)
-            where_clauses.append(f"m.tela_id = ${len(params)}")
-        if hilo_id:
-            params.append(hilo_id)
-            where_clauses.append(f"m.hilo_id = ${len(params)}")
-        if modelo_id:
-            params.append(modelo_id)
-            where_clauses.append(f"r.modelo_id = ${len(params)}")
-        if estado:
-            params.append(estado)
-            where_clauses.append(f"r.estado = ${len(params)}")
-        if solo_atrasados:
-            where_clauses.append(
-                "(r.fecha_entrega_final < CURRENT_DATE OR EXISTS ("
-                "SELECT 1 FROM prod_movimientos_produccion mp "
-                "WHERE mp.registro_id = r.id "
-                "AND mp.fecha_esperada_movimiento < CURRENT_DATE "
-                "AND mp.fecha_fin IS NULL))"
-            )
+            where_clauses.append("c.estado_op IN ('ABIERTA','EN_PROCESO')")
+        for col, val in (
+            ("ruta_id", ruta_id), ("marca_id", marca_id), ("tipo_id", tipo_id),
+            ("entalle_id", entalle_id), ("tela_id", tela_id), ("hilo_id", hilo_id),
+            ("modelo_id", modelo_id), ("estado", estado),
+        ):
+            if val:
+                params.append(val)
+                where_clauses.append(f"c.{col} = ${len(params)}")
         if solo_fraccionados:
+            where_clauses.append("c.fraccionado")
+        fuente = "prod_matriz_cubo"
+        if solo_atrasados:
+            # Depende de la fecha actual: se corta sobre los hechos por registro.
+            fuente = "prod_matriz_hecho"
             where_clauses.append(
-                "(r.dividido_desde_registro_id IS NOT NULL OR EXISTS ("
-                "SELECT 1 FROM prod_registros ch WHERE ch.dividido_desde_registro_id = r.id))"
+                f"c.registro_id IN (SELECT r.id FROM prod_registros r WHERE {_SQL_ATRASADO})"
             )
 
-        where_sql = " AND ".join(where_clauses)
-
         rows = await conn.fetch(f"""
-            SELECT
-                r.id, r.n_corte, r.estado, r.estado_op, r.urgente,
-                r.fecha_entrega_final, r.tallas as tallas_jsonb,
-                r.dividido_desde_registro_id,
-                r.curva,
-                r.fecha_creacion,
-                r.distribucion_colores as dist_colores_raw,
-                COALESCE(ma.id,'')   as marca_id,
-                COALESCE(ma.nombre,'Sin marca')  as marca,
-                COALESCE(tp.id,'')   as tipo_id_val,
-                COALESCE(tp.nombre,'Sin tipo')   as tipo,
-                COALESCE(en.id,'')   as entalle_id_val,
-                COALESCE(en.nombre,'Sin entalle') as entalle,
-                COALESCE(te.id,'')   as tela_id_val,
-                COALESCE(te.nombre,'Sin tela')   as tela,
-                COALESCE(hi.id,'')   as hilo_id_val,
-                COALESCE(hi.nombre,'Sin hilo')   as hilo,
-                COALESCE(he.nombre,'')   as hilo_especifico,
-                m.nombre  as modelo_nombre,
-                rp.nombre as ruta_nombre,
-                COALESCE(rt_sum.prendas, 0) as prendas_tabla,
-                COALESCE(CURRENT_DATE - mov_first.primera_fecha, 0) as dias_proceso,
-                mov_first.primera_fecha as fecha_inicio_prod,
-                COALESCE(mov_ult.ult_servicio, '') as ult_mov_servicio,
-                mov_ult.ult_fecha_inicio as ult_mov_fecha,
-                COALESCE(mov_agg.diferencia_total, 0) as diferencia_acumulada,
-                COALESCE(mov_agg.total_movimientos, 0) as total_movimientos
-            FROM prod_registros r
-            LEFT JOIN prod_modelos m  ON r.modelo_id = m.id
-            LEFT JOIN prod_marcas ma  ON m.marca_id = ma.id
-            LEFT JOIN prod_tipos tp   ON m.tipo_id = tp.id
-            LEFT JOIN prod_entalles en ON m.entalle_id = en.id
-            LEFT JOIN prod_telas te   ON m.tela_id = te.id
-            LEFT JOIN prod_hilos hi   ON m.hilo_id = hi.id
-            LEFT JOIN prod_hilos_especificos he ON he.id = COALESCE(m.hilo_especifico_id, r.hilo_especifico_id)
-            LEFT JOIN prod_rutas_produccion rp ON m.ruta_produccion_id = rp.id
-            LEFT JOIN LATERAL (
-                SELECT COALESCE(SUM(rt.cantidad_real), 0) as prendas
-                FROM prod_registro_tallas rt WHERE rt.registro_id = r.id
-            ) rt_sum ON true
-            LEFT JOIN LATERAL (
-                SELECT MIN(mp0.fecha_inicio) as primera_fecha
-                FROM prod_movimientos_produccion mp0
-                WHERE mp0.registro_id = r.id AND mp0.fecha_inicio IS NOT NULL
-            ) mov_first ON true
-            LEFT JOIN LATERAL (
-                SELECT sp.nombre as ult_servicio, mp.fecha_inicio as ult_fecha_inicio
-                FROM prod_movimientos_produccion mp
-                LEFT JOIN prod_servicios_produccion sp ON mp.servicio_id = sp.id
-                WHERE mp.registro_id = r.id
-                ORDER BY mp.fecha_inicio DESC NULLS LAST, mp.created_at DESC
-                LIMIT 1
-            ) mov_ult ON true
-            LEFT JOIN LATERAL (
-                SELECT COALESCE(SUM(mp2.diferencia), 0) as diferencia_total,
-                       COUNT(*) as total_movimientos
-                FROM prod_movimientos_produccion mp2
-                WHERE mp2.registro_id = r.id
-            ) mov_agg ON true
-            WHERE {where_sql}
-            ORDER BY ma.nombre, tp.nombre, en.nombre, te.nombre, hi.nombre, r.n_corte
+            SELECT c.marca_id, c.tipo_id, c.entalle_id, c.tela_id, c.hilo_id,
+                   COALESCE(ma.nombre,'Sin marca')  as marca,
+                   COALESCE(tp.nombre,'Sin tipo')   as tipo,
+                   COALESCE(en.nombre,'Sin entalle') as entalle,
+                   COALESCE(te.nombre,'Sin tela')   as tela,
+                   COALESCE(hi.nombre,'Sin hilo')   as hilo,
+                   c.estado, c.color, c.color_general,
+                   SUM(c.registros)::int as registros,
+                   SUM(c.prendas)::bigint as prendas
+            FROM {fuente} c
+            LEFT JOIN prod_marcas ma  ON ma.id = c.marca_id
+            LEFT JOIN prod_tipos tp   ON tp.id = c.tipo_id
+            LEFT JOIN prod_entalles en ON en.id = c.entalle_id
+            LEFT JOIN prod_telas te   ON te.id = c.tela_id
+            LEFT JOIN prod_hilos hi   ON hi.id = c.hilo_id
+            WHERE {" AND ".join(where_clauses)}
+            GROUP BY c.marca_id, c.tipo_id, c.entalle_id, c.tela_id, c.hilo_id,
+                     ma.nombre, tp.nombre, en.nombre, te.nombre, hi.nombre,
+                     c.estado, c.color, c.color_general
+            ORDER BY ma.nombre, tp.nombre, en.nombre, te.nombre, hi.nombre, c.estado, c.color
         """, *params)
 
-        # ── 3. Calcular prendas con fallback ──────────────────────
-        def calc_prendas(row):
-            """prod_registro_tallas primero; fallback a JSONB tallas."""
-            p = safe_int(row["prendas_tabla"])
-            if p > 0:
-                return p
-            tallas = parse_jsonb(row["tallas_jsonb"])
-            return sum(safe_int(t.get("cantidad", 0)) for t in tallas)
-
-        # ── 3b. Cargar mapeo color_id -> color_general_nombre ──────
-        color_gen_map = {}  # color_id -> color_general_nombre
-        cat_rows = await conn.fetch("""
-            SELECT cc.id as color_id, cc.nombre as color_nombre, COALESCE(cg.nombre, '') as color_general_nombre
-            FROM prod_colores_catalogo cc
-            LEFT JOIN prod_colores_generales cg ON cc.color_general_id = cg.id
-        """)
-        for cr in cat_rows:
-            color_gen_map[cr["color_id"]] = cr["color_general_nombre"]
-            color_gen_map[cr["color_nombre"]] = cr["color_general_nombre"]
-
-        # ── 4. Agrupar en memoria ─────────────────────────────────
+        # ── 3. Agrupar celdas por fila ────────────────────────────
         # Clave de agrupación: (marca, tipo, entalle, tela, hilo)
-        groups = {}   # key -> {celdas, detalle, meta}
+        # Las filas con color = '' son el total del registro; las demás, su desglose por color.
+        groups = {}
         for r in rows:
             key = (r["marca"], r["tipo"], r["entalle"], r["tela"], r["hilo"])
-            prendas = calc_prendas(r)
-            est = r["estado"]
-
             if key not in groups:
                 groups[key] = {
                     "marca": r["marca"],
@@ -897,75 +1083,29 @@ async def matriz_produccion(
                     "tela": r["tela"],
                     "hilo": r["hilo"],
                     "item": f"{r['marca']} - {r['tipo']} - {r['entalle']} - {r['tela']}",
+                    "clave": "|".join(r[d] for d in _MATRIZ_DIMS_FILA),
                     "celdas": {},
                     "total": {"registros": 0, "prendas": 0},
-                    "detalle": [],
                     "colores_grupo": {},
                 }
             g = groups[key]
 
-            # Celda
+            if r["color"]:
+                if r["color"] not in g["colores_grupo"]:
+                    g["colores_grupo"][r["color"]] = {"cantidad": 0, "color_general": r["color_general"], "registros": 0}
+                g["colores_grupo"][r["color"]]["cantidad"] += r["prendas"]
+                g["colores_grupo"][r["color"]]["registros"] += r["registros"]
+                continue
+
+            est = r["estado"]
             if est not in g["celdas"]:
                 g["celdas"][est] = {"registros": 0, "prendas": 0}
-            g["celdas"][est]["registros"] += 1
-            g["celdas"][est]["prendas"] += prendas
-
-            # Total fila
-            g["total"]["registros"] += 1
-            g["total"]["prendas"] += prendas
-
-            # Detalle enriquecido
-            tallas_raw = parse_jsonb(r["tallas_jsonb"])
-            curva_detalle = [
-                {"talla": t.get("talla_nombre", ""), "cantidad": safe_int(t.get("cantidad", 0))}
-                for t in tallas_raw
-            ]
-
-            # Colores: agregar desde distribucion_colores (JSONB por talla)
-            dist_colores = parse_jsonb(r["dist_colores_raw"])
-            colores_map = {}  # color_nombre -> {cantidad, color_general}
-            for talla_entry in dist_colores:
-                for c in (talla_entry.get("colores") or []):
-                    cn = c.get("color_nombre", "")
-                    if cn:
-                        if cn not in colores_map:
-                            cg = color_gen_map.get(c.get("color_id", ""), "") or color_gen_map.get(cn, "")
-                            colores_map[cn] = {"cantidad": 0, "color_general": cg}
-                        colores_map[cn]["cantidad"] += safe_int(c.get("cantidad", 0))
-            colores_lista = [{"color": k, "color_general": v["color_general"], "cantidad": v["cantidad"]} for k, v in colores_map.items()]
-            colores_resumen = ", ".join(colores_map.keys()) if colores_map else ""
-
-            g["detalle"].append({
-                "id": r["id"],
-                "n_corte": r["n_corte"],
-                "estado": est,
-                "prendas": prendas,
-                "modelo": r["modelo_nombre"],
-                "ruta": r["ruta_nombre"],
-                "urgente": r["urgente"],
-                "es_hijo": r["dividido_desde_registro_id"] is not None,
-                "fecha_entrega": str(r["fecha_entrega_final"]) if r["fecha_entrega_final"] else None,
-                "fecha_inicio_prod": str(r["fecha_inicio_prod"]) if r["fecha_inicio_prod"] else None,
-                "curva": r["curva"] or "",
-                "curva_detalle": curva_detalle,
-                "hilo_especifico": r["hilo_especifico"],
-                "dias_proceso": safe_int(r["dias_proceso"]),
-                "ult_mov_servicio": r["ult_mov_servicio"],
-                "ult_mov_fecha": str(r["ult_mov_fecha"]) if r["ult_mov_fecha"] else None,
-                "diferencia_acumulada": safe_int(r["diferencia_acumulada"]),
-                "total_movimientos": safe_int(r["total_movimientos"]),
-                "colores": colores_lista,
-                "colores_resumen": colores_resumen,
-            })
-
-            # Acumular colores a nivel de grupo
-            for cn, info in colores_map.items():
-                if cn not in g["colores_grupo"]:
-                    g["colores_grupo"][cn] = {"cantidad": 0, "color_general": info["color_general"], "registros": 0}
-                g["colores_grupo"][cn]["cantidad"] += info["cantidad"]
-                g["colores_grupo"][cn]["registros"] += 1
+            g["celdas"][est]["registros"] += r["registros"]
+            g["celdas"][est]["prendas"] += r["prendas"]
+            g["total"]["registros"] += r["registros"]
+            g["total"]["prendas"] += r["prendas"]
 
-        # ── 5. Construir respuesta ────────────────────────────────
+        # ── 4. Construir respuesta ────────────────────────────────
         filas = list(groups.values())
         # Convertir colores_grupo dict a lista legible
         for f in filas:
@@ -985,7 +1125,7 @@ async def matriz_produccion(
             total_general["registros"] += f["total"]["registros"]
             total_general["prendas"] += f["total"]["prendas"]
 
-        # ── 6. Filtros disponibles para el frontend ───────────────
+        # ── 5. Filtros disponibles para el frontend ───────────────
         marcas = await conn.fetch("SELECT id, nombre FROM prod_marcas ORDER BY nombre")
         tipos = await conn.fetch("SELECT id, nombre FROM prod_tipos ORDER BY nombre")
         entalles = await conn.fetch("SELECT id, nombre FROM prod_entalles ORDER BY nombre")
@@ -994,7 +1134,7 @@ async def matriz_produccion(
         rutas = await conn.fetch("SELECT id, nombre FROM prod_rutas_produccion ORDER BY nombre")
         modelos = await conn.fetch("SELECT id, nombre FROM prod_modelos ORDER BY nombre")
 
-        return {
+        return FastJSONResponse({
             "columnas": columnas,
             "filas": filas,
             "totales_columna": totales_columna,
@@ -1008,7 +1148,50 @@ async def matriz_produccion(
                 "rutas": [{"id": r["id"], "nombre": r["nombre"]} for r in rutas],
                 "modelos": [{"id": r["id"], "nombre": r["nombre"]} for r in modelos],
             },
-        }
+        })
+
+
+@router.get("/matriz/detalle")
+@solo_lectura
+async def matriz_detalle(
+    clave: str,
+    estados: Optional[List[str]] = Query(None),
+    empresa_id: int = Query(7),
+    ruta_id: Optional[str] = None,
+    modelo_id: Optional[str] = None,
+    estado: Optional[str] = None,
+    solo_atrasados: bool = False,
+    solo_activos: bool = True,
+    solo_fraccionados: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    """Drill-down de la matriz: registros de una fila (clave) y opcionalmente de ciertos estados."""
+    ids = clave.split("|")
+    if len(ids) != len(_MATRIZ_DIMS_FILA):
+        raise HTTPException(status_code=400, detail="Clave de fila inválida")
+    where_clauses, params = _matriz_where(
+        empresa_id, solo_activos, ruta_id, None, None, None, None, None,
+        modelo_id, estado, solo_atrasados, solo_fraccionados,
+    )
+    for dim, val in zip(_MATRIZ_DIMS_FILA, ids):
+        params.append(val)
+        where_clauses.append(f"COALESCE(m.{dim}, '') = ${len(params)}")
+    if estados:
+        params.append(estados)
+        where_clauses.append(f"r.estado = ANY(${len(params)}::varchar[])")
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        detalle = await _matriz_detalle(conn, " AND ".join(where_clauses), params)
+    return FastJSONResponse({"registros": detalle, "total": len(detalle)})
+
+
+@router.post("/matriz/reconstruir-cubo")
+async def matriz_reconstruir_cubo(current_user: dict = Depends(get_current_user)):
+    """Reconstruye el cubo de la matriz desde prod_registros (mantenimiento)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await reconstruir_cubo(conn)
 
 
 # ==================== REPORTE OPERATIVO DE COSTURA ====================
@@ -1018,7 +1201,110 @@ from pydantic import BaseModel
 class AvanceRapidoInput(BaseModel):
     avance_porcentaje: int
 
+# Riesgo de cada movimiento como expresiones SQL para que filtros, orden y
+# paginación se resuelvan en Postgres. Misma lógica que antes en Python:
+# - vencido: pasó fecha_fin o fecha_esperada con avance < 100
+# - si no, puntaje: días sin actualizar (>=5: +3, >=3: +1), días para la entrega
+#   (fecha_esperada o fecha_fin; <=2 con avance < 70: +3, <=5 con avance < 50: +1)
+#   e incidencias abiertas (>=2: +2, >=1: +1); >=3 crítico, >=1 atención.
+_COSTURA_SQL = """
+    WITH inc AS (
+        SELECT registro_id, COUNT(*) as abiertas
+        FROM produccion.prod_incidencia
+        WHERE estado = 'ABIERTA'
+        GROUP BY registro_id
+    ),
+    base AS (
+        SELECT
+            m.id as movimiento_id,
+            m.registro_id,
+            m.persona_id,
+            m.servicio_id,
+            m.cantidad_enviada,
+            m.cantidad_recibida,
+            m.avance_porcentaje,
+            m.fecha_inicio,
+            m.fecha_fin,
+            m.fecha_esperada_movimiento,
+            m.avance_updated_at,
+            m.observaciones as mov_observaciones,
+            r.n_corte,
+            r.estado as registro_estado,
+            r.observaciones as registro_observaciones,
+            r.urgente,
+            p.nombre as persona_nombre,
+            p.tipo_persona as persona_tipo,
+            mod.nombre as modelo_nombre,
+            marca.nombre as marca_nombre,
+            tipo.nombre as tipo_nombre,
+            ent.nombre as entalle_nombre,
+            tela.nombre as tela_nombre,
+            COALESCE(he.nombre, '') as hilo_especifico_nombre,
+            s.nombre as servicio_nombre,
+            COALESCE(inc.abiertas, 0) as incidencias_abiertas,
+            CURRENT_DATE - m.fecha_inicio as dias_transcurridos,
+            CASE
+                WHEN m.avance_updated_at IS NOT NULL
+                    THEN FLOOR(EXTRACT(EPOCH FROM (LOCALTIMESTAMP - m.avance_updated_at)) / 86400)::int
+                WHEN m.fecha_inicio IS NOT NULL AND m.avance_porcentaje IS NOT NULL
+                    THEN CURRENT_DATE - m.fecha_inicio
+            END as dias_sin_actualizar,
+            COALESCE(m.fecha_esperada_movimiento, m.fecha_fin) - CURRENT_DATE as dias_para_entrega
+        FROM produccion.prod_movimientos_produccion m
+        JOIN produccion.prod_registros r ON r.id = m.registro_id
+        JOIN produccion.prod_personas_produccion p ON p.id = m.persona_id
+        JOIN produccion.prod_servicios_produccion s ON s.id = m.servicio_id
+        LEFT JOIN produccion.prod_modelos mod ON mod.id = r.modelo_id
+        LEFT JOIN produccion.prod_marcas marca ON marca.id = mod.marca_id
+        LEFT JOIN produccion.prod_tipos tipo ON tipo.id = mod.tipo_id
+        LEFT JOIN produccion.prod_entalles ent ON ent.id = mod.entalle_id
+        LEFT JOIN produccion.prod_telas tela ON tela.id = mod.tela_id
+        LEFT JOIN produccion.prod_hilos_especificos he ON he.id = COALESCE(mod.hilo_especifico_id, r.hilo_especifico_id)
+        LEFT JOIN inc ON inc.registro_id = r.id
+    ),
+    c AS (
+        SELECT b.*,
+            CASE
+                WHEN COALESCE(b.avance_porcentaje, 0) < 100
+                     AND (CURRENT_DATE > b.fecha_fin OR CURRENT_DATE > b.fecha_esperada_movimiento)
+                    THEN 'vencido'
+                WHEN sc.puntaje >= 3 THEN 'critico'
+                WHEN sc.puntaje >= 1 THEN 'atencion'
+                ELSE 'normal'
+            END as nivel_riesgo
+        FROM base b
+        CROSS JOIN LATERAL (
+            SELECT
+                CASE WHEN b.dias_sin_actualizar >= 5 THEN 3 WHEN b.dias_sin_actualizar >= 3 THEN 1 ELSE 0 END
+              + CASE
+                    WHEN b.dias_para_entrega <= 2 AND COALESCE(b.avance_porcentaje, 0) < 70 THEN 3
+                    WHEN b.dias_para_entrega <= 5 AND COALESCE(b.avance_porcentaje, 0) < 50 THEN 1
+                    ELSE 0
+                END
+              + CASE WHEN b.incidencias_abiertas >= 2 THEN 2 WHEN b.incidencias_abiertas >= 1 THEN 1 ELSE 0 END
+            as puntaje
+        ) sc
+    )
+"""
+
+# Vencidos + críticos de la persona de la fila (ventana solo usada para ordenar)
+_RIESGO_PERSONA = "COUNT(*) FILTER (WHERE c.nivel_riesgo IN ('vencido', 'critico')) OVER (PARTITION BY c.persona_id)"
+
+# Orden del tablero; `grupo_*` agrupa por persona con las de más vencidos/críticos primero
+_ORDEN_COSTURA = {
+    "persona": "c.persona_nombre, c.n_corte",
+    "grupo_dias_desc": f"{_RIESGO_PERSONA} DESC, c.persona_nombre, c.persona_id, c.dias_transcurridos DESC NULLS LAST",
+    "grupo_dias_asc": f"{_RIESGO_PERSONA} DESC, c.persona_nombre, c.persona_id, c.dias_transcurridos ASC NULLS FIRST",
+    "dias_desc": "c.dias_transcurridos DESC NULLS LAST",
+    "dias_asc": "c.dias_transcurridos ASC NULLS FIRST",
+    "riesgo": "CASE c.nivel_riesgo WHEN 'vencido' THEN 0 WHEN 'critico' THEN 1 WHEN 'atencion' THEN 2 ELSE 3 END, c.dias_sin_actualizar DESC NULLS LAST",
+    "sin_actualizar": "c.dias_sin_actualizar DESC NULLS LAST",
+}
+
+
 @router.get("/costura")
+@coalescido("costura", _DEPENDE_PRODUCCION)
+@solo_lectura
 async def reporte_costura(
     servicio_nombre: str = Query("Costura"),
     persona_id: Optional[str] = None,
@@ -1031,213 +1317,124 @@ async def reporte_costura(
     vencidos: Optional[bool] = None,
     sin_actualizar: Optional[bool] = None,
     incluir_terminados: bool = Query(False),
+    busqueda: Optional[str] = Query(None, description="Corte, modelo, tipo, entalle, tela, hilo o persona"),
+    orden: str = Query("persona"),
+    limit: Optional[int] = Query(None, ge=1, description="Filas por página; sin valor = todas"),
+    offset: int = Query(0, ge=0),
     user=Depends(get_current_user)
 ):
+    if orden not in _ORDEN_COSTURA:
+        raise HTTPException(status_code=400, detail=f"orden inválido; opciones: {', '.join(_ORDEN_COSTURA)}")
+
+    filtros = FiltrosSQL()
+    # Si servicio_nombre es __todos__, no filtrar por servicio
+    filtros.si(None if servicio_nombre == '__todos__' else servicio_nombre,
+               lambda n: f"LOWER(c.servicio_nombre) = LOWER(${n})")
+    filtros.condiciones.append(f"(${filtros.param(incluir_terminados)}::boolean OR c.fecha_fin IS NULL)")
+    filtros.igual("c.persona_id", persona_id)
+    for columna, valor in (("c.modelo_nombre", modelo_nombre), ("c.tipo_nombre", tipo_nombre),
+                           ("c.entalle_nombre", entalle_nombre), ("c.tela_nombre", tela_nombre)):
+        filtros.si(valor, lambda n, columna=columna: f"LOWER({columna}) = LOWER(${n})")
+    filtros.igual("c.nivel_riesgo", riesgo)
+    filtros.si(con_incidencias, lambda n: f"(c.incidencias_abiertas > 0) = ${n}", "boolean")
+    filtros.si(True if vencidos else None, lambda n: "c.nivel_riesgo = 'vencido'", "boolean")
+    filtros.si(True if sin_actualizar else None, lambda n: "c.dias_sin_actualizar >= 3", "boolean")
+    filtros.si(f"%{busqueda.strip()}%" if busqueda and busqueda.strip() else None,
+               lambda n: f"(c.n_corte ILIKE ${n} OR c.modelo_nombre ILIKE ${n} OR c.tipo_nombre ILIKE ${n}"
+                         f" OR c.entalle_nombre ILIKE ${n} OR c.tela_nombre ILIKE ${n}"
+                         f" OR c.hilo_especifico_nombre ILIKE ${n} OR c.persona_nombre ILIKE ${n})")
+    where = filtros.where()
+    params = filtros.params
+
     pool = await get_pool()
     async with pool.acquire() as conn:
-        # Si servicio_nombre es __todos__, no filtrar por servicio
-        filtro_servicio = servicio_nombre != '__todos__'
-        rows = await conn.fetch("""
-            SELECT
-                m.id as movimiento_id,
-                m.registro_id,
-                m.persona_id,
-                m.servicio_id,
-                m.cantidad_enviada,
-                m.cantidad_recibida,
-                m.avance_porcentaje,
-                m.fecha_inicio,
-                m.fecha_fin,
-                m.fecha_esperada_movimiento,
-                m.avance_updated_at,
-                m.observaciones as mov_observaciones,
-                m.created_at as mov_created_at,
-                r.n_corte,
-                r.estado as registro_estado,
-                r.observaciones as registro_observaciones,
-                r.urgente,
-                p.nombre as persona_nombre,
-                p.tipo_persona as persona_tipo,
-                mod.nombre as modelo_nombre,
-                marca.nombre as marca_nombre,
-                tipo.nombre as tipo_nombre,
-                ent.nombre as entalle_nombre,
-                tela.nombre as tela_nombre,
-                COALESCE(he.nombre, '') as hilo_especifico_nombre,
-                s.nombre as servicio_nombre,
-                (SELECT COUNT(*) FROM produccion.prod_incidencia i
-                 WHERE i.registro_id = r.id AND i.estado = 'ABIERTA') as incidencias_abiertas
-            FROM produccion.prod_movimientos_produccion m
-            JOIN produccion.prod_registros r ON r.id = m.registro_id
-            JOIN produccion.prod_personas_produccion p ON p.id = m.persona_id
-            JOIN produccion.prod_servicios_produccion s ON s.id = m.servicio_id
-            LEFT JOIN produccion.prod_modelos mod ON mod.id = r.modelo_id
-            LEFT JOIN produccion.prod_marcas marca ON marca.id = mod.marca_id
-            LEFT JOIN produccion.prod_tipos tipo ON tipo.id = mod.tipo_id
-            LEFT JOIN produccion.prod_entalles ent ON ent.id = mod.entalle_id
-            LEFT JOIN produccion.prod_telas tela ON tela.id = mod.tela_id
-            LEFT JOIN produccion.prod_hilos_especificos he ON he.id = COALESCE(mod.hilo_especifico_id, r.hilo_especifico_id)
-            WHERE ($3 = FALSE OR LOWER(s.nombre) = LOWER($1))
-              AND ($2 = TRUE OR m.fecha_fin IS NULL)
-            ORDER BY p.nombre, r.n_corte
-        """, servicio_nombre, incluir_terminados, filtro_servicio)
-
-        hoy = date.today()
-        results = []
-        for r in rows:
-            d = dict(r)
-            avance = d['avance_porcentaje'] or 0
-            fecha_inicio = d['fecha_inicio']
-            fecha_fin = d['fecha_fin']
-            fecha_esperada = d['fecha_esperada_movimiento']
-            avance_updated = d['avance_updated_at']
-            incidencias = d['incidencias_abiertas'] or 0
-
-            # Días transcurridos
-            dias_transcurridos = None
-            if fecha_inicio:
-                dias_transcurridos = (hoy - fecha_inicio).days
-
-            # Días sin actualizar avance
-            dias_sin_actualizar = None
-            if avance_updated:
-                dias_sin_actualizar = (datetime.now() - avance_updated).days
-            elif fecha_inicio and d['avance_porcentaje'] is not None:
-                dias_sin_actualizar = (hoy - fecha_inicio).days
-
-            # Pendiente estimado — ELIMINADO por pedido del usuario
-
-            # Lógica de riesgo
-            nivel_riesgo = 'normal'
-            if fecha_fin and hoy > fecha_fin and avance < 100:
-                nivel_riesgo = 'vencido'
-            elif fecha_esperada and hoy > fecha_esperada and avance < 100:
-                nivel_riesgo = 'vencido'
-            else:
-                score = 0
-                if dias_sin_actualizar is not None and dias_sin_actualizar >= 5:
-                    score += 3
-                elif dias_sin_actualizar is not None and dias_sin_actualizar >= 3:
-                    score += 1
-                if fecha_esperada:
-                    dias_para_entrega = (fecha_esperada - hoy).days
-                    if dias_para_entrega <= 2 and avance < 70:
-                        score += 3
-                    elif dias_para_entrega <= 5 and avance < 50:
-                        score += 1
-                elif fecha_fin:
-                    dias_para_entrega = (fecha_fin - hoy).days
-                    if dias_para_entrega <= 2 and avance < 70:
-                        score += 3
-                    elif dias_para_entrega <= 5 and avance < 50:
-                        score += 1
-                if incidencias >= 2:
-                    score += 2
-                elif incidencias >= 1:
-                    score += 1
-                if score >= 3:
-                    nivel_riesgo = 'critico'
-                elif score >= 1:
-                    nivel_riesgo = 'atencion'
-
-            item = {
-                "movimiento_id": d['movimiento_id'],
-                "registro_id": d['registro_id'],
-                "persona_id": d['persona_id'],
-                "persona_nombre": d['persona_nombre'],
-                "persona_tipo": d['persona_tipo'],
-                "n_corte": d['n_corte'],
-                "registro_estado": d['registro_estado'],
-                "modelo_nombre": d['modelo_nombre'],
-                "marca_nombre": d['marca_nombre'],
-                "tipo_nombre": d['tipo_nombre'],
-                "entalle_nombre": d['entalle_nombre'],
-                "tela_nombre": d['tela_nombre'],
-                "hilo_especifico": d['hilo_especifico_nombre'],
-                "cantidad_enviada": d['cantidad_enviada'],
-                "cantidad_recibida": d['cantidad_recibida'],
-                "avance_porcentaje": d['avance_porcentaje'],
-                "fecha_inicio": str(d['fecha_inicio']) if d['fecha_inicio'] else None,
-                "fecha_fin": str(d['fecha_fin']) if d['fecha_fin'] else None,
-                "fecha_esperada": str(d['fecha_esperada_movimiento']) if d['fecha_esperada_movimiento'] else None,
-                "avance_updated_at": d['avance_updated_at'].isoformat() if d['avance_updated_at'] else None,
-                "dias_transcurridos": dias_transcurridos,
-                "dias_sin_actualizar": dias_sin_actualizar,
-                "incidencias_abiertas": incidencias,
-                "nivel_riesgo": nivel_riesgo,
-                "urgente": d['urgente'],
-                "observaciones": d['registro_observaciones'] or d['mov_observaciones'] or None,
-                "servicio_nombre": d['servicio_nombre'],
-            }
-
-            # Aplicar filtros en Python (más simple que SQL dinámico)
-            if persona_id and d['persona_id'] != persona_id:
-                continue
-            if modelo_nombre and (d['modelo_nombre'] or '').lower() != modelo_nombre.lower():
-                continue
-            if tipo_nombre and (d['tipo_nombre'] or '').lower() != tipo_nombre.lower():
-                continue
-            if entalle_nombre and (d['entalle_nombre'] or '').lower() != entalle_nombre.lower():
-                continue
-            if tela_nombre and (d['tela_nombre'] or '').lower() != tela_nombre.lower():
-                continue
-            if riesgo and nivel_riesgo != riesgo:
-                continue
-            if con_incidencias is True and incidencias == 0:
-                continue
-            if con_incidencias is False and incidencias > 0:
-                continue
-            if vencidos is True and nivel_riesgo != 'vencido':
-                continue
-            if sin_actualizar is True and (dias_sin_actualizar is None or dias_sin_actualizar < 3):
-                continue
-
-            results.append(item)
-
-        # KPIs
-        personas_set = set()
-        total_prendas = 0
-        registros_activos = 0
-        registros_vencidos = 0
-        registros_criticos = 0
-        registros_sin_act = 0
-        incidencias_totales = 0
-
-        for item in results:
-            personas_set.add(item['persona_id'])
-            total_prendas += item['cantidad_enviada'] or 0
-            registros_activos += 1
-            if item['nivel_riesgo'] == 'vencido':
-                registros_vencidos += 1
-            if item['nivel_riesgo'] == 'critico':
-                registros_criticos += 1
-            if item['dias_sin_actualizar'] is not None and item['dias_sin_actualizar'] >= 3:
-                registros_sin_act += 1
-            incidencias_totales += item['incidencias_abiertas']
-
-        # Filtros disponibles (valores únicos de los datos)
-        personas_unicas = []
-        seen_personas = set()
-        for item in results:
-            if item['persona_id'] not in seen_personas:
-                seen_personas.add(item['persona_id'])
-                personas_unicas.append({"id": item['persona_id'], "nombre": item['persona_nombre']})
+        n = filtros.siguiente()
+        rows = await conn.fetch(f"""
+            {_COSTURA_SQL}
+            SELECT c.*, COUNT(*) OVER() as _total_count
+            FROM c
+            WHERE {where}
+            ORDER BY {_ORDEN_COSTURA[orden]}, c.movimiento_id
+            LIMIT ${n} OFFSET ${n + 1}
+        """, *params, limit, offset)
+
+        # KPIs y personas sobre todo el conjunto filtrado, no solo la página
+        por_persona = await conn.fetch(f"""
+            {_COSTURA_SQL}
+            SELECT c.persona_id as id, MIN(c.persona_nombre) as nombre, MIN(c.persona_tipo) as tipo,
+                   COUNT(*) as registros,
+                   COALESCE(SUM(c.cantidad_enviada), 0) as total_prendas,
+                   COUNT(*) FILTER (WHERE c.nivel_riesgo = 'vencido') as vencidos,
+                   COUNT(*) FILTER (WHERE c.nivel_riesgo = 'critico') as criticos,
+                   COUNT(*) FILTER (WHERE c.dias_sin_actualizar >= 3) as sin_actualizar,
+                   COALESCE(SUM(c.incidencias_abiertas), 0) as incidencias,
+                   ROUND(AVG(c.avance_porcentaje)) as avance_promedio
+            FROM c
+            WHERE {where}
+            GROUP BY c.persona_id
+            ORDER BY nombre, c.persona_id
+        """, *params)
 
-        return {
-            "kpis": {
-                "costureros_activos": len(personas_set),
-                "registros_activos": registros_activos,
-                "total_prendas": total_prendas,
-                "registros_vencidos": registros_vencidos,
-                "registros_criticos": registros_criticos,
-                "registros_sin_actualizar": registros_sin_act,
-                "incidencias_abiertas": incidencias_totales,
-            },
-            "items": results,
-            "filtros": {
-                "personas": sorted(personas_unicas, key=lambda x: x['nombre']),
-            }
+    total = rows[0]["_total_count"] if rows else sum(p["registros"] for p in por_persona)
+    items = []
+    for d in rows:
+        items.append({
+            "movimiento_id": d['movimiento_id'],
+            "registro_id": d['registro_id'],
+            "persona_id": d['persona_id'],
+            "persona_nombre": d['persona_nombre'],
+            "persona_tipo": d['persona_tipo'],
+            "n_corte": d['n_corte'],
+            "registro_estado": d['registro_estado'],
+            "modelo_nombre": d['modelo_nombre'],
+            "marca_nombre": d['marca_nombre'],
+            "tipo_nombre": d['tipo_nombre'],
+            "entalle_nombre": d['entalle_nombre'],
+            "tela_nombre": d['tela_nombre'],
+            "hilo_especifico": d['hilo_especifico_nombre'],
+            "cantidad_enviada": d['cantidad_enviada'],
+            "cantidad_recibida": d['cantidad_recibida'],
+            "avance_porcentaje": d['avance_porcentaje'],
+            "fecha_inicio": str(d['fecha_inicio']) if d['fecha_inicio'] else None,
+            "fecha_fin": str(d['fecha_fin']) if d['fecha_fin'] else None,
+            "fecha_esperada": str(d['fecha_esperada_movimiento']) if d['fecha_esperada_movimiento'] else None,
+            "avance_updated_at": d['avance_updated_at'].isoformat() if d['avance_updated_at'] else None,
+            "dias_transcurridos": d['dias_transcurridos'],
+            "dias_sin_actualizar": d['dias_sin_actualizar'],
+            "incidencias_abiertas": d['incidencias_abiertas'],
+            "nivel_riesgo": d['nivel_riesgo'],
+            "urgente": d['urgente'],
+            "observaciones": d['registro_observaciones'] or d['mov_observaciones'] or None,
+            "servicio_nombre": d['servicio_nombre'],
+        })
+
+    personas = []
+    for p in por_persona:
+        persona = row_to_dict(p)
+        persona["total_prendas"] = safe_int(persona["total_prendas"])
+        persona["incidencias"] = safe_int(persona["incidencias"])
+        persona["avance_promedio"] = None if p["avance_promedio"] is None else int(p["avance_promedio"])
+        personas.append(persona)
+
+    return FastJSONResponse({
+        "kpis": {
+            "costureros_activos": len(personas),
+            "registros_activos": total,
+            "total_prendas": sum(p["total_prendas"] for p in personas),
+            "registros_vencidos": sum(p["vencidos"] for p in personas),
+            "registros_criticos": sum(p["criticos"] for p in personas),
+            "registros_sin_actualizar": sum(p["sin_actualizar"] for p in personas),
+            "incidencias_abiertas": sum(p["incidencias"] for p in personas),
+        },
+        "items": items,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "orden": orden,
+        "filtros": {
+            "personas": personas,
         }
+    })
 
 
 @router.put("/costura/avance/{movimiento_id}")
@@ -1298,258 +1495,353 @@ async def get_avance_historial(
 
 
 @router.get("/alertas-produccion")
+@coalescido("alertas_produccion", _DEPENDE_PRODUCCION, ttl_seg=15)
+@solo_lectura
 async def alertas_produccion():
     """Devuelve alertas activas: lotes vencidos, críticos, paralizados, sin actualizar."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        hoy = date.today()
-        
-        # Query all active movimientos across all services
-        rows = await conn.fetch("""
-            SELECT 
-                m.id as movimiento_id,
-                m.registro_id,
-                m.servicio_id,
-                r.n_corte,
-                r.urgente,
-                s.nombre as servicio_nombre,
-                mod.nombre as modelo_nombre,
-                pp.nombre as persona_nombre,
-                m.cantidad_enviada,
-                m.avance_porcentaje,
-                m.fecha_inicio,
-                m.fecha_fin,
-                m.avance_updated_at,
-                COALESCE(m.fecha_esperada_movimiento, m.fecha_fin) as fecha_esperada,
-                (SELECT COUNT(*) FROM produccion.prod_incidencia i 
-                 WHERE i.registro_id = r.id AND i.estado = 'ABIERTA') as incidencias_abiertas,
-                (SELECT COUNT(*) FROM produccion.prod_paralizacion p 
-                 WHERE p.registro_id = r.id AND p.activa = true) as paralizaciones_activas
-            FROM produccion.prod_movimientos_produccion m
-            JOIN produccion.prod_registros r ON r.id = m.registro_id
-            JOIN produccion.prod_servicios_produccion s ON s.id = m.servicio_id
-            LEFT JOIN produccion.prod_modelos mod ON mod.id = r.modelo_id
-            LEFT JOIN produccion.prod_personas_produccion pp ON pp.id = m.persona_id
-            WHERE m.avance_porcentaje < 100
-              AND m.fecha_inicio IS NOT NULL
-            ORDER BY m.fecha_inicio ASC
-        """)
-        
-        alertas = []
-        resumen = {"vencidos": 0, "criticos": 0, "paralizados": 0, "sin_actualizar": 0, "total": 0}
-        
-        for row in rows:
-            avance = row["avance_porcentaje"] or 0
-            fecha_esperada = row["fecha_esperada"]
-            fecha_inicio = row["fecha_inicio"]
-            incidencias = row["incidencias_abiertas"]
-            paralizados = row["paralizaciones_activas"]
-            
-            # Días transcurridos
-            dias = (hoy - fecha_inicio).days if fecha_inicio else 0
-            
-            # Días sin actualizar
-            dias_sin_act = None
-            if row["avance_updated_at"]:
-                dias_sin_act = (hoy - row["avance_updated_at"].date()).days
-            elif fecha_inicio:
-                dias_sin_act = dias
-            
-            # Lógica de riesgo (misma del reporte costura)
-            nivel = 'normal'
-            if fecha_esperada and hoy > fecha_esperada and avance < 100:
-                nivel = 'vencido'
-            else:
-                score = 0
-                if dias_sin_act is not None and dias_sin_act >= 5: score += 3
-                elif dias_sin_act is not None and dias_sin_act >= 3: score += 1
-                if fecha_esperada:
-                    dias_entrega = (fecha_esperada - hoy).days
-                    if dias_entrega <= 2 and avance < 70: score += 3
-                    elif dias_entrega <= 5 and avance < 50: score += 1
-                if incidencias >= 2: score += 2
-                elif incidencias >= 1: score += 1
-                if score >= 3: nivel = 'critico'
-                elif score >= 1: nivel = 'atencion'
-            
-            # Solo incluir alertas relevantes (no normales)
-            motivos = []
-            if nivel == 'vencido':
-                motivos.append('Fecha vencida')
-                resumen["vencidos"] += 1
-            if nivel == 'critico':
-                resumen["criticos"] += 1
-            if paralizados > 0:
-                motivos.append('Producción paralizada')
-                resumen["paralizados"] += 1
-            if dias_sin_act is not None and dias_sin_act >= 5:
-                motivos.append(f'{dias_sin_act}d sin actualizar')
-                resumen["sin_actualizar"] += 1
-            if fecha_esperada:
-                dias_entrega = (fecha_esperada - hoy).days
-                if dias_entrega <= 2 and avance < 70:
-                    motivos.append(f'Entrega en {dias_entrega}d, avance {avance}%')
-            if incidencias >= 1:
-                motivos.append(f'{incidencias} incidencia{"s" if incidencias > 1 else ""}')
-            if row["urgente"]:
-                motivos.append('Urgente')
-            
-            if nivel in ('vencido', 'critico') or paralizados > 0:
-                alertas.append({
-                    "movimiento_id": str(row["movimiento_id"]),
-                    "registro_id": str(row["registro_id"]),
-                    "n_corte": row["n_corte"],
-                    "urgente": row["urgente"],
-                    "servicio": row["servicio_nombre"],
-                    "servicio_id": str(row["servicio_id"]),
-                    "modelo": row["modelo_nombre"],
-                    "persona": row["persona_nombre"],
-                    "avance": avance,
-                    "dias": dias,
-                    "dias_sin_actualizar": dias_sin_act,
-                    "nivel": nivel,
-                    "motivos": motivos,
-                    "motivo_texto": '; '.join(motivos),
-                    "incidencias": incidencias,
-                    "paralizado": paralizados > 0,
-                })
-        
-        resumen["total"] = len(alertas)
-        
-        # Ordenar: paralizados primero, luego vencidos, luego críticos, luego por días desc
-        prioridad = {'vencido': 0, 'critico': 1, 'atencion': 2, 'normal': 3}
-        alertas.sort(key=lambda a: (
-            0 if a["paralizado"] else 1,
-            prioridad.get(a["nivel"], 3),
-            -(a["dias"] or 0),
-        ))
-        
-        return {"alertas": alertas, "resumen": resumen}
-        
+        return await leer_alertas_produccion(conn)
 
 
-@router.get("/tiempos-muertos")
-async def reporte_tiempos_muertos(
-    incluir_resueltos: bool = Query(False),
-    user=Depends(get_current_user)
-):
-    """Lotes parados: último servicio terminado sin actividad posterior."""
+@router.post("/alertas-produccion/stream/ticket")
+async def ticket_stream_alertas(current_user: dict = Depends(get_current_user)):
+    """Ticket de un solo uso para abrir el stream con ?ticket= (EventSource no envía headers)."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        hoy = date.today()
+        return await emitir_ticket(conn, current_user['id'])
 
-        # Para cada registro, encontrar el último movimiento terminado
-        # y verificar si hay algún movimiento posterior que haya iniciado
-        rows = await conn.fetch("""
-            WITH ultimo_terminado AS (
-                SELECT DISTINCT ON (m.registro_id)
-                    m.registro_id,
-                    m.id as movimiento_id,
-                    m.servicio_id,
-                    s.nombre as servicio_nombre,
-                    m.persona_id,
-                    pp.nombre as persona_nombre,
-                    m.fecha_fin,
-                    m.cantidad_enviada,
-                    m.created_at as mov_created
-                FROM produccion.prod_movimientos_produccion m
-                JOIN produccion.prod_servicios_produccion s ON s.id = m.servicio_id
-                LEFT JOIN produccion.prod_personas_produccion pp ON pp.id = m.persona_id
-                WHERE m.fecha_fin IS NOT NULL
-                ORDER BY m.registro_id, m.fecha_fin DESC, m.created_at DESC
-            ),
-            tiene_siguiente AS (
-                SELECT ut.registro_id,
-                       bool_or(m2.fecha_inicio IS NOT NULL) as siguiente_iniciado
-                FROM ultimo_terminado ut
-                LEFT JOIN produccion.prod_movimientos_produccion m2
-                    ON m2.registro_id = ut.registro_id
-                    AND m2.created_at > ut.mov_created
-                    AND m2.id != ut.movimiento_id
-                GROUP BY ut.registro_id
+
+@router.get("/alertas-produccion/stream")
+async def stream_alertas_produccion(
+    request: Request,
+    ticket: str = Query("", description="Ticket de POST /alertas-produccion/stream/ticket"),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """Alertas por Server-Sent Events: `snapshot` al conectar y luego solo `diff`.
+
+    Autenticación por header Authorization o por un ticket de un solo uso; el
+    JWT nunca va en la URL.
+    """
+    if credentials is not None or not ticket:
+        await get_current_user(credentials)
+    else:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            usuario_id = await canjear_ticket(conn, ticket)
+            activo = usuario_id is not None and await conn.fetchval(
+                "SELECT 1 FROM prod_usuarios WHERE id = $1 AND activo = true", usuario_id
             )
-            SELECT
-                ut.registro_id,
-                ut.movimiento_id,
-                ut.servicio_nombre as ultimo_servicio,
-                ut.persona_nombre as ultima_persona,
-                ut.fecha_fin as fecha_termino,
-                ut.cantidad_enviada,
-                r.n_corte,
-                r.estado as estado_actual,
-                r.urgente,
-                mod.nombre as modelo_nombre,
-                marca.nombre as marca_nombre,
-                COALESCE(tp.nombre, '') as tipo_nombre,
-                COALESCE(en.nombre, '') as entalle_nombre,
-                COALESCE(te.nombre, '') as tela_nombre,
-                COALESCE(he.nombre, '') as hilo_especifico_nombre,
-                COALESCE(ts.siguiente_iniciado, false) as siguiente_iniciado
-            FROM ultimo_terminado ut
-            JOIN produccion.prod_registros r ON r.id = ut.registro_id
-            LEFT JOIN produccion.prod_modelos mod ON mod.id = r.modelo_id
-            LEFT JOIN produccion.prod_marcas marca ON marca.id = mod.marca_id
-            LEFT JOIN produccion.prod_tipos tp ON tp.id = mod.tipo_id
-            LEFT JOIN produccion.prod_entalles en ON en.id = mod.entalle_id
-            LEFT JOIN produccion.prod_telas te ON te.id = mod.tela_id
-            LEFT JOIN produccion.prod_hilos_especificos he ON he.id = COALESCE(mod.hilo_especifico_id, r.hilo_especifico_id)
-            LEFT JOIN tiene_siguiente ts ON ts.registro_id = ut.registro_id
-            ORDER BY ut.fecha_fin ASC
-        """)
-
-        items = []
-        resumen = {"total": 0, "en_espera": 0, "criticos": 0, "dias_perdidos": 0}
-
-        for row in rows:
-            fecha_fin = row["fecha_termino"]
-            siguiente = row["siguiente_iniciado"]
-            dias_parado = (hoy - fecha_fin).days if fecha_fin else 0
-
-            en_espera = not siguiente
-
-            # Filtro por defecto: solo los que están en espera
-            if not incluir_resueltos and not en_espera:
-                continue
+        if not activo:
+            raise HTTPException(status_code=401, detail="Ticket inválido o vencido")
+    return StreamingResponse(
+        eventos_alertas(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-            nivel = 'ok'
-            if en_espera:
-                if dias_parado >= 7:
-                    nivel = 'critico'
-                elif dias_parado >= 3:
-                    nivel = 'atencion'
-                else:
-                    nivel = 'espera'
 
-            items.append({
+@router.get("/alertas-produccion/stream/estado")
+async def get_estado_stream_alertas(current_user: dict = Depends(get_current_user)):
+    """Suscriptores, cálculos y diffs enviados por el stream de alertas de este worker."""
+    return estado_alertas_stream()
+
+
+def _ordenar_alertas(alertas) -> list:
+    # Paralizados primero, luego vencidos, luego críticos, luego por días desc
+    prioridad = {'vencido': 0, 'critico': 1, 'atencion': 2, 'normal': 3}
+    return sorted(alertas, key=lambda a: (
+        0 if a["paralizado"] else 1,
+        prioridad.get(a["nivel"], 3),
+        -(a["dias"] or 0),
+    ))
+
+
+async def leer_alertas_produccion(conn) -> dict:
+    """Alertas activas y resumen desde prod_alertas; lo usan el endpoint y el stream (alertas_stream).
+
+    Los contadores del resumen se derivan de las alertas: todo lote vencido,
+    crítico, paralizado o con 5+ días sin actualizar genera alerta.
+    """
+    alertas = _ordenar_alertas(await alertas_abiertas(conn, "produccion"))
+    resumen = {
+        "vencidos": sum(1 for a in alertas if a["nivel"] == 'vencido'),
+        "criticos": sum(1 for a in alertas if a["nivel"] == 'critico'),
+        "paralizados": sum(1 for a in alertas if a["paralizado"]),
+        "sin_actualizar": sum(1 for a in alertas if (a["dias_sin_actualizar"] or 0) >= 5),
+        "total": len(alertas),
+    }
+    return {"alertas": alertas, "resumen": resumen}
+
+
+async def calcular_alertas_produccion(conn) -> dict:
+    """Alertas activas y resumen sobre las tablas vivas; es la regla "produccion" del motor de alertas."""
+    hoy = date.today()
+
+    # Query all active movimientos across all services
+    rows = await conn.fetch("""
+        SELECT 
+            m.id as movimiento_id,
+            m.registro_id,
+            m.servicio_id,
+            r.n_corte,
+            r.urgente,
+            s.nombre as servicio_nombre,
+            mod.nombre as modelo_nombre,
+            pp.nombre as persona_nombre,
+            m.cantidad_enviada,
+            m.avance_porcentaje,
+            m.fecha_inicio,
+            m.fecha_fin,
+            m.avance_updated_at,
+            COALESCE(m.fecha_esperada_movimiento, m.fecha_fin) as fecha_esperada,
+            (SELECT COUNT(*) FROM produccion.prod_incidencia i 
+             WHERE i.registro_id = r.id AND i.estado = 'ABIERTA') as incidencias_abiertas,
+            (SELECT COUNT(*) FROM produccion.prod_paralizacion p 
+             WHERE p.registro_id = r.id AND p.activa = true) as paralizaciones_activas
+        FROM produccion.prod_movimientos_produccion m
+        JOIN produccion.prod_registros r ON r.id = m.registro_id
+        JOIN produccion.prod_servicios_produccion s ON s.id = m.servicio_id
+        LEFT JOIN produccion.prod_modelos mod ON mod.id = r.modelo_id
+        LEFT JOIN produccion.prod_personas_produccion pp ON pp.id = m.persona_id
+        WHERE m.avance_porcentaje < 100
+          AND m.fecha_inicio IS NOT NULL
+        ORDER BY m.fecha_inicio ASC
+    """)
+
+    alertas = []
+    resumen = {"vencidos": 0, "criticos": 0, "paralizados": 0, "sin_actualizar": 0, "total": 0}
+
+    for row in rows:
+        avance = row["avance_porcentaje"] or 0
+        fecha_esperada = row["fecha_esperada"]
+        fecha_inicio = row["fecha_inicio"]
+        incidencias = row["incidencias_abiertas"]
+        paralizados = row["paralizaciones_activas"]
+
+        # Días transcurridos
+        dias = (hoy - fecha_inicio).days if fecha_inicio else 0
+
+        # Días sin actualizar
+        dias_sin_act = None
+        if row["avance_updated_at"]:
+            dias_sin_act = (hoy - row["avance_updated_at"].date()).days
+        elif fecha_inicio:
+            dias_sin_act = dias
+
+        # Lógica de riesgo (misma del reporte costura)
+        nivel = 'normal'
+        if fecha_esperada and hoy > fecha_esperada and avance < 100:
+            nivel = 'vencido'
+        else:
+            score = 0
+            if dias_sin_act is not None and dias_sin_act >= 5: score += 3
+            elif dias_sin_act is not None and dias_sin_act >= 3: score += 1
+            if fecha_esperada:
+                dias_entrega = (fecha_esperada - hoy).days
+                if dias_entrega <= 2 and avance < 70: score += 3
+                elif dias_entrega <= 5 and avance < 50: score += 1
+            if incidencias >= 2: score += 2
+            elif incidencias >= 1: score += 1
+            if score >= 3: nivel = 'critico'
+            elif score >= 1: nivel = 'atencion'
+
+        # Solo incluir alertas relevantes (no normales)
+        motivos = []
+        if nivel == 'vencido':
+            motivos.append('Fecha vencida')
+            resumen["vencidos"] += 1
+        if nivel == 'critico':
+            resumen["criticos"] += 1
+        if paralizados > 0:
+            motivos.append('Producción paralizada')
+            resumen["paralizados"] += 1
+        if dias_sin_act is not None and dias_sin_act >= 5:
+            motivos.append(f'{dias_sin_act}d sin actualizar')
+            resumen["sin_actualizar"] += 1
+        if fecha_esperada:
+            dias_entrega = (fecha_esperada - hoy).days
+            if dias_entrega <= 2 and avance < 70:
+                motivos.append(f'Entrega en {dias_entrega}d, avance {avance}%')
+        if incidencias >= 1:
+            motivos.append(f'{incidencias} incidencia{"s" if incidencias > 1 else ""}')
+        if row["urgente"]:
+            motivos.append('Urgente')
+
+        if nivel in ('vencido', 'critico') or paralizados > 0:
+            alertas.append({
+                "movimiento_id": str(row["movimiento_id"]),
                 "registro_id": str(row["registro_id"]),
                 "n_corte": row["n_corte"],
                 "urgente": row["urgente"],
+                "servicio": row["servicio_nombre"],
+                "servicio_id": str(row["servicio_id"]),
                 "modelo": row["modelo_nombre"],
-                "marca": row["marca_nombre"],
-                "tipo": row["tipo_nombre"],
-                "entalle": row["entalle_nombre"],
-                "tela": row["tela_nombre"],
-                "hilo_especifico": row["hilo_especifico_nombre"],
-                "ultimo_servicio": row["ultimo_servicio"],
-                "ultima_persona": row["ultima_persona"],
-                "fecha_termino": str(fecha_fin) if fecha_fin else None,
-                "estado_actual": row["estado_actual"],
-                "dias_parado": dias_parado,
-                "en_espera": en_espera,
+                "persona": row["persona_nombre"],
+                "avance": avance,
+                "dias": dias,
+                "dias_sin_actualizar": dias_sin_act,
                 "nivel": nivel,
+                "motivos": motivos,
+                "motivo_texto": '; '.join(motivos),
+                "incidencias": incidencias,
+                "paralizado": paralizados > 0,
             })
 
-            if en_espera:
-                resumen["en_espera"] += 1
-                resumen["dias_perdidos"] += dias_parado
-            if nivel == 'critico':
-                resumen["criticos"] += 1
+    resumen["total"] = len(alertas)
+
+    return {"alertas": _ordenar_alertas(alertas), "resumen": resumen}
+
+
+async def _regla_alertas_produccion(conn):
+    data = await calcular_alertas_produccion(conn)
+    return [(a["movimiento_id"], a["nivel"], a["registro_id"], a) for a in data["alertas"]]
+
+
+registrar_regla("produccion", _regla_alertas_produccion, _DEPENDE_PRODUCCION)
+
+
+
+@router.get("/tiempos-muertos")
+@solo_lectura
+async def reporte_tiempos_muertos(
+    incluir_resueltos: bool = Query(False),
+    user=Depends(get_current_user)
+):
+    """Lotes parados: último servicio terminado sin actividad posterior.
+
+    Los lotes en espera salen de prod_alertas (regla "tiempos_muertos"); con
+    incluir_resueltos se recorren en vivo todos los lotes con un servicio terminado.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        if incluir_resueltos:
+            items = await calcular_tiempos_muertos(conn, incluir_resueltos=True)
+        else:
+            items = await alertas_abiertas(conn, "tiempos_muertos")
+
+    resumen = {
+        "total": len(items),
+        "en_espera": sum(1 for i in items if i["en_espera"]),
+        "criticos": sum(1 for i in items if i["nivel"] == 'critico'),
+        "dias_perdidos": sum(i["dias_parado"] for i in items if i["en_espera"]),
+    }
 
-        resumen["total"] = len(items)
+    # Ordenar: en espera primero, luego por días desc
+    items.sort(key=lambda a: (0 if a["en_espera"] else 1, -a["dias_parado"]))
 
-        # Ordenar: en espera primero, luego por días desc
-        items.sort(key=lambda a: (0 if a["en_espera"] else 1, -a["dias_parado"]))
+    return {"items": items, "resumen": resumen}
 
-        return {"items": items, "resumen": resumen}
 
-        return {"alertas": alertas, "resumen": resumen}
+async def calcular_tiempos_muertos(conn, incluir_resueltos: bool = False) -> list:
+    """Lotes con su último servicio terminado; sin incluir_resueltos solo los que siguen en espera."""
+    hoy = date.today()
+
+    # Para cada registro, encontrar el último movimiento terminado
+    # y verificar si hay algún movimiento posterior que haya iniciado
+    rows = await conn.fetch("""
+        WITH ultimo_terminado AS (
+            SELECT DISTINCT ON (m.registro_id)
+                m.registro_id,
+                m.id as movimiento_id,
+                m.servicio_id,
+                s.nombre as servicio_nombre,
+                m.persona_id,
+                pp.nombre as persona_nombre,
+                m.fecha_fin,
+                m.cantidad_enviada,
+                m.created_at as mov_created
+            FROM produccion.prod_movimientos_produccion m
+            JOIN produccion.prod_servicios_produccion s ON s.id = m.servicio_id
+            LEFT JOIN produccion.prod_personas_produccion pp ON pp.id = m.persona_id
+            WHERE m.fecha_fin IS NOT NULL
+            ORDER BY m.registro_id, m.fecha_fin DESC, m.created_at DESC
+        ),
+        tiene_siguiente AS (
+            SELECT ut.registro_id,
+                   bool_or(m2.fecha_inicio IS NOT NULL) as siguiente_iniciado
+            FROM ultimo_terminado ut
+            LEFT JOIN produccion.prod_movimientos_produccion m2
+                ON m2.registro_id = ut.registro_id
+                AND m2.created_at > ut.mov_created
+                AND m2.id != ut.movimiento_id
+            GROUP BY ut.registro_id
+        )
+        SELECT
+            ut.registro_id,
+            ut.movimiento_id,
+            ut.servicio_nombre as ultimo_servicio,
+            ut.persona_nombre as ultima_persona,
+            ut.fecha_fin as fecha_termino,
+            ut.cantidad_enviada,
+            r.n_corte,
+            r.estado as estado_actual,
+            r.urgente,
+            mod.nombre as modelo_nombre,
+            marca.nombre as marca_nombre,
+            COALESCE(tp.nombre, '') as tipo_nombre,
+            COALESCE(en.nombre, '') as entalle_nombre,
+            COALESCE(te.nombre, '') as tela_nombre,
+            COALESCE(he.nombre, '') as hilo_especifico_nombre,
+            COALESCE(ts.siguiente_iniciado, false) as siguiente_iniciado
+        FROM ultimo_terminado ut
+        JOIN produccion.prod_registros r ON r.id = ut.registro_id
+        LEFT JOIN produccion.prod_modelos mod ON mod.id = r.modelo_id
+        LEFT JOIN produccion.prod_marcas marca ON marca.id = mod.marca_id
+        LEFT JOIN produccion.prod_tipos tp ON tp.id = mod.tipo_id
+        LEFT JOIN produccion.prod_entalles en ON en.id = mod.entalle_id
+        LEFT JOIN produccion.prod_telas te ON te.id = mod.tela_id
+        LEFT JOIN produccion.prod_hilos_especificos he ON he.id = COALESCE(mod.hilo_especifico_id, r.hilo_especifico_id)
+        LEFT JOIN tiene_siguiente ts ON ts.registro_id = ut.registro_id
+        ORDER BY ut.fecha_fin ASC
+    """)
+
+    items = []
+
+    for row in rows:
+        fecha_fin = row["fecha_termino"]
+        siguiente = row["siguiente_iniciado"]
+        dias_parado = (hoy - fecha_fin).days if fecha_fin else 0
+
+        en_espera = not siguiente
+
+        # Filtro por defecto: solo los que están en espera
+        if not incluir_resueltos and not en_espera:
+            continue
+
+        nivel = 'ok'
+        if en_espera:
+            if dias_parado >= 7:
+                nivel = 'critico'
+            elif dias_parado >= 3:
+                nivel = 'atencion'
+            else:
+                nivel = 'espera'
+
+        items.append({
+            "registro_id": str(row["registro_id"]),
+            "n_corte": row["n_corte"],
+            "urgente": row["urgente"],
+            "modelo": row["modelo_nombre"],
+            "marca": row["marca_nombre"],
+            "tipo": row["tipo_nombre"],
+            "entalle": row["entalle_nombre"],
+            "tela": row["tela_nombre"],
+            "hilo_especifico": row["hilo_especifico_nombre"],
+            "ultimo_servicio": row["ultimo_servicio"],
+            "ultima_persona": row["ultima_persona"],
+            "fecha_termino": str(fecha_fin) if fecha_fin else None,
+            "estado_actual": row["estado_actual"],
+            "dias_parado": dias_parado,
+            "en_espera": en_espera,
+            "nivel": nivel,
+        })
+
+    return items
+
+
+async def _regla_tiempos_muertos(conn):
+    return [(i["registro_id"], i["nivel"], i["registro_id"], i) for i in await calcular_tiempos_muertos(conn)]
+
+
+registrar_regla("tiempos_muertos", _regla_tiempos_muertos, _DEPENDE_PRODUCCION)
@@ -5,7 +5,7 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import Optional
 from db import get_pool
 from auth import get_current_user
-from helpers import row_to_dict
+from helpers import row_to_dict, refrescar_agregados_inventario
 
 router = APIRouter(prefix="/api", tags=["reportes-valorizacion"])
 
@@ -231,6 +231,7 @@ async def ingreso_from_finanzas(data: dict, current_user: dict = Depends(get_cur
                 UPDATE prod_inventario SET stock_actual = COALESCE(stock_actual, 0) + $1
                 WHERE id = $2
             """, cantidad, data['item_id'])
+            await refrescar_agregados_inventario(conn, [data['item_id']])
             
             return {
                 "message": "Ingreso desde finanzas registrado",
@@ -15,6 +15,7 @@ sys.path.insert(0, '/app/backend')
 from db import get_pool
 from auth import get_current_user
 from helpers import row_to_dict
+from routes.busqueda import patron_busqueda, predicado_rollos
 
 
 # ==================== PYDANTIC MODELS ====================
@@ -47,6 +48,7 @@ class RolloUpdate(BaseModel):
 async def get_rollos(
     item_id: Optional[str] = None,
     estado: Optional[str] = None,
+    search: Optional[str] = None,
     empresa_id: int = Query(7),
     current_user: dict = Depends(get_current_user)
 ):
@@ -70,6 +72,10 @@ async def get_rollos(
             params.append(estado)
             query += f" AND r.estado = ${len(params)}"
         
+        if search:
+            params.append(patron_busqueda(search))
+            query += f" AND {predicado_rollos(len(params), 'r')}"
+        
         query += " ORDER BY r.created_at DESC"
         
         rows = await conn.fetch(query, *params)
@@ -14,7 +14,7 @@ import sys
 sys.path.insert(0, '/app/backend')
 from db import get_pool
 from auth import get_current_user
-from helpers import row_to_dict
+from helpers import row_to_dict, registrar_wip, eliminar_wip_origen
 
 
 # ==================== PYDANTIC MODELS ====================
@@ -56,25 +56,10 @@ ESTADOS_SERVICIO = ['PENDIENTE', 'EN_PROCESO', 'COMPLETADO', 'CANCELADO']
 
 # ==================== HELPER FUNCTIONS ====================
 
-async def registrar_wip(conn, empresa_id: int, orden_id: str, origen_tipo: str, 
-                        origen_id: str, costo: float, fecha, descripcion: str):
-    """Registra un movimiento WIP"""
-    wip_id = str(uuid.uuid4())
-    await conn.execute("""
-        INSERT INTO prod_wip_movimiento 
-        (id, empresa_id, orden_id, origen_tipo, origen_id, costo, fecha, descripcion)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-    """, wip_id, empresa_id, orden_id, origen_tipo, origen_id, costo, fecha, descripcion)
-    return wip_id
-
-
 async def actualizar_wip_servicio(conn, servicio_id: str, nuevo_costo: float, fecha, descripcion: str):
     """Actualiza o crea WIP para un servicio"""
     # Delete existing
-    await conn.execute("""
-        DELETE FROM prod_wip_movimiento 
-        WHERE origen_tipo = 'SERVICIO' AND origen_id = $1
-    """, servicio_id)
+    await eliminar_wip_origen(conn, 'SERVICIO', servicio_id)
     
     # Create new if costo > 0
     if nuevo_costo > 0:
@@ -335,10 +320,7 @@ async def delete_servicio_orden(
                 )
             
             # Delete WIP
-            await conn.execute("""
-                DELETE FROM prod_wip_movimiento 
-                WHERE origen_tipo = 'SERVICIO' AND origen_id = $1
-            """, servicio_id)
+            await eliminar_wip_origen(conn, 'SERVICIO', servicio_id)
             
             # Delete servicio
             await conn.execute("DELETE FROM prod_servicio_orden WHERE id = $1", servicio_id)
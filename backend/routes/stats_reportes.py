@@ -4,18 +4,38 @@ import uuid
 import io
 import csv
 from datetime import datetime, timezone, date
+from decimal import Decimal
 from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
 from fastapi.responses import StreamingResponse
-from db import get_pool
+from db import get_pool, solo_lectura, estado_replica, estado_statement_cache
 from auth_utils import get_current_user
-from helpers import row_to_dict, parse_jsonb
+from helpers import row_to_dict, parse_jsonb, registrar_actividad, recalcular_wip_resumen, recalcular_agregados_inventario
 from typing import Optional, List
 from pydantic import BaseModel
 from models import ESTADOS_PRODUCCION
+from jobs import encolar_job, registrar_tipo_job, JobCancelado
+from filtros_sql import FiltrosSQL
+from rutas_compiladas import invalidar_ruta, estado_rutas_cache
+from tarifas_persona import sincronizar_tarifas, estado_tarifas_cache
+from alertas_motor import registrar_regla, alertas_abiertas
+from matriz_cubo import reconstruir_cubo
+from archivo_lotes import tabla_o_vista
 
 router = APIRouter(prefix="/api")
 
+@router.get("/db/estado")
+async def get_estado_db(current_user: dict = Depends(get_current_user)):
+    """Estado de la réplica de reportes, del statement cache de asyncpg y de los caches de rutas y tarifas."""
+    return {
+        "replica_reportes": estado_replica(),
+        "statement_cache": estado_statement_cache(),
+        "rutas_compiladas": estado_rutas_cache(),
+        "tarifas_persona": estado_tarifas_cache(),
+    }
+
+
 @router.get("/stats")
+@solo_lectura
 async def get_stats():
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -34,20 +54,10 @@ async def get_stats():
         salidas = await conn.fetchval("SELECT COUNT(*) FROM prod_inventario_salidas")
         ajustes = await conn.fetchval("SELECT COUNT(*) FROM prod_inventario_ajustes")
         
-        # Alertas de stock: items con stock_minimo > 0 y stock por debajo
-        stock_bajo_count = await conn.fetchval("""
-            SELECT COUNT(*) FROM prod_inventario 
-            WHERE stock_minimo > 0 
-              AND stock_actual > 0 
-              AND stock_actual <= stock_minimo 
-              AND COALESCE(ignorar_alerta_stock, false) = false
-        """)
-        sin_stock_count = await conn.fetchval("""
-            SELECT COUNT(*) FROM prod_inventario 
-            WHERE stock_minimo > 0 
-              AND stock_actual <= 0 
-              AND COALESCE(ignorar_alerta_stock, false) = false
-        """)
+        # Alertas de stock (prod_alertas): items con stock_minimo > 0 y stock físico por debajo
+        alertas_stock = [d for d in await alertas_abiertas(conn, "stock_fisico") if not d['ignorar_alerta_stock']]
+        sin_stock_count = sum(1 for d in alertas_stock if d['estado_stock'] == 'SIN_STOCK')
+        stock_bajo_count = len(alertas_stock) - sin_stock_count
         
         estados_count = {}
         for estado in ESTADOS_PRODUCCION:
@@ -66,6 +76,7 @@ async def get_stats():
         }
 
 @router.get("/stats/charts")
+@solo_lectura
 async def get_stats_charts():
     """Datos para gráficos del dashboard"""
     pool = await get_pool()
@@ -119,6 +130,7 @@ async def get_stats_charts():
 # ==================== REPORTE MERMAS ====================
 
 @router.get("/reportes/mermas")
+@solo_lectura
 async def get_reporte_mermas(fecha_inicio: str = None, fecha_fin: str = None, persona_id: str = None, servicio_id: str = None):
     """Reporte de mermas por período con totales y estadísticas"""
     pool = await get_pool()
@@ -195,59 +207,57 @@ async def get_reporte_mermas(fecha_inicio: str = None, fecha_fin: str = None, pe
 # ==================== REPORTE PRODUCTIVIDAD ====================
 
 @router.get("/reportes/productividad")
-async def get_reporte_productividad(fecha_inicio: str = None, fecha_fin: str = None, servicio_id: str = None, persona_id: str = None):
+@solo_lectura
+async def get_reporte_productividad(fecha_inicio: str = None, fecha_fin: str = None, servicio_id: str = None, persona_id: str = None,
+                                    incluir_archivo: bool = False):
+    """`incluir_archivo` suma también los movimientos de lotes archivados."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        query = "SELECT * FROM prod_movimientos_produccion WHERE fecha_fin IS NOT NULL"
-        params = []
-        if fecha_inicio:
-            params.append(fecha_inicio)
-            query += f" AND fecha_fin >= ${len(params)}::date"
-        if fecha_fin:
-            params.append(fecha_fin)
-            query += f" AND fecha_fin <= ${len(params)}::date"
-        if servicio_id:
-            params.append(servicio_id)
-            query += f" AND servicio_id = ${len(params)}"
-        if persona_id:
-            params.append(persona_id)
-            query += f" AND persona_id = ${len(params)}"
-
+        filtros = FiltrosSQL()
+        filtros.condiciones.append("m.fecha_fin IS NOT NULL")
+        filtros.desde("m.fecha_fin", fecha_inicio)
+        filtros.hasta("m.fecha_fin", fecha_fin)
+        filtros.igual("m.servicio_id", servicio_id)
+        filtros.igual("m.persona_id", persona_id)
+        # costo_tarifa_vigente: lo recibido valorizado con la tarifa actual de cada persona-servicio
+        rows = await conn.fetch(f"""
+            SELECT m.servicio_id, m.persona_id,
+                   COALESCE(MIN(s.nombre), 'Desconocido') as servicio_nombre,
+                   COALESCE(MIN(p.nombre), 'Desconocido') as persona_nombre,
+                   COALESCE(SUM(m.cantidad_recibida), 0) as total_cantidad,
+                   COALESCE(SUM(m.costo_calculado), 0) as total_costo,
+                   COALESCE(SUM(m.cantidad_recibida * pst.tarifa), 0) as costo_tarifa_vigente,
+                   COUNT(*) as movimientos
+            FROM {tabla_o_vista("prod_movimientos_produccion", incluir_archivo)} m
+            LEFT JOIN prod_servicios_produccion s ON s.id = m.servicio_id
+            LEFT JOIN prod_personas_produccion p ON p.id = m.persona_id
+            LEFT JOIN prod_persona_servicio_tarifa pst ON pst.persona_id = m.persona_id AND pst.servicio_id = m.servicio_id
+            WHERE {filtros.where()}
+            GROUP BY m.servicio_id, m.persona_id
+        """, *filtros.params)
 
-        
-        rows = await conn.fetch(query, *params)
-        
         por_servicio = {}
         por_persona = {}
-        
-        for m in rows:
-            srv_id = m['servicio_id']
-            per_id = m['persona_id']
-            cantidad = m['cantidad_recibida'] or 0
-            costo = float(m['costo_calculado'] or 0)
-            
-            srv = await conn.fetchrow("SELECT nombre FROM prod_servicios_produccion WHERE id = $1", srv_id)
-            srv_nombre = srv['nombre'] if srv else 'Desconocido'
-            
-            if srv_id not in por_servicio:
-                por_servicio[srv_id] = {"servicio_id": srv_id, "servicio_nombre": srv_nombre, "total_cantidad": 0, "total_costo": 0, "movimientos": 0}
-            por_servicio[srv_id]['total_cantidad'] += cantidad
-            por_servicio[srv_id]['total_costo'] += costo
-            por_servicio[srv_id]['movimientos'] += 1
-            
-            per = await conn.fetchrow("SELECT nombre FROM prod_personas_produccion WHERE id = $1", per_id)
-            per_nombre = per['nombre'] if per else 'Desconocido'
-            
-            if per_id not in por_persona:
-                por_persona[per_id] = {"persona_id": per_id, "persona_nombre": per_nombre, "total_cantidad": 0, "total_costo": 0, "movimientos": 0}
-            por_persona[per_id]['total_cantidad'] += cantidad
-            por_persona[per_id]['total_costo'] += costo
-            por_persona[per_id]['movimientos'] += 1
-        
+        total_movimientos = 0
+        for r in rows:
+            total_movimientos += r['movimientos']
+            for clave, grupo, campo_id, campo_nombre in (
+                (r['servicio_id'], por_servicio, "servicio_id", "servicio_nombre"),
+                (r['persona_id'], por_persona, "persona_id", "persona_nombre"),
+            ):
+                if clave not in grupo:
+                    grupo[clave] = {campo_id: clave, campo_nombre: r[campo_nombre], "total_cantidad": 0,
+                                    "total_costo": 0, "costo_tarifa_vigente": 0, "movimientos": 0}
+                g = grupo[clave]
+                g['total_cantidad'] += int(r['total_cantidad'])
+                g['total_costo'] += float(r['total_costo'])
+                g['costo_tarifa_vigente'] += float(r['costo_tarifa_vigente'])
+                g['movimientos'] += r['movimientos']
+
         return {
             "por_servicio": list(por_servicio.values()),
             "por_persona": list(por_persona.values()),
-            "total_movimientos": len(rows)
+            "total_movimientos": total_movimientos
         }
 
 # ==================== ENDPOINTS KARDEX E INVENTARIO MOVIMIENTOS ====================
@@ -360,10 +370,12 @@ async def get_inventario_movimientos(
         return {"items": movimientos, "total": total}
 
 @router.get("/inventario-kardex/{item_id}")
+@solo_lectura
 async def get_inventario_kardex_by_path(item_id: str):
     return await _get_kardex(item_id)
 
 @router.get("/inventario-kardex")
+@solo_lectura
 async def get_inventario_kardex(item_id: str):
     return await _get_kardex(item_id)
 
@@ -458,6 +470,7 @@ async def _get_kardex(item_id: str):
 # ==================== REPORTE ITEM - ESTADOS (PIVOT) ====================
 
 @router.get("/reportes/estados-item")
+@solo_lectura
 async def get_reporte_estados_item(
     search: str = None,
     marca_id: str = None,
@@ -497,44 +510,47 @@ async def get_reporte_estados_item(
 
     pool = await get_pool()
     async with pool.acquire() as conn:
+        # Conteos desde el cubo de producción (una fila por combinación de dimensiones).
         query = """
-            SELECT r.estado, r.urgente, he.nombre as hilo_nombre,
+            SELECT c.estado,
                    ma.nombre as marca_nombre,
                    t.nombre as tipo_nombre,
                    e.nombre as entalle_nombre,
-                   te.nombre as tela_nombre
-            FROM prod_registros r
-            LEFT JOIN prod_modelos m ON r.modelo_id = m.id
-            LEFT JOIN prod_marcas ma ON m.marca_id = ma.id
-            LEFT JOIN prod_tipos t ON m.tipo_id = t.id
-            LEFT JOIN prod_entalles e ON m.entalle_id = e.id
-            LEFT JOIN prod_telas te ON m.tela_id = te.id
-            LEFT JOIN prod_hilos_especificos he ON r.hilo_especifico_id = he.id
-            WHERE 1=1
+                   te.nombre as tela_nombre,
+                   he.nombre as hilo_nombre,
+                   SUM(c.registros)::int as registros
+            FROM prod_matriz_cubo c
+            LEFT JOIN prod_marcas ma ON ma.id = c.marca_id
+            LEFT JOIN prod_tipos t ON t.id = c.tipo_id
+            LEFT JOIN prod_entalles e ON e.id = c.entalle_id
+            LEFT JOIN prod_telas te ON te.id = c.tela_id
+            LEFT JOIN prod_hilos_especificos he ON he.id = c.hilo_especifico_id
+            WHERE c.color = '' AND c.estado = ANY($1::varchar[])
         """
-        params = []
+        params = [estados_incluidos]
 
         if marca_id:
             params.append(marca_id)
-            query += f" AND m.marca_id = ${len(params)}"
+            query += f" AND c.marca_id = ${len(params)}"
         if tipo_id:
             params.append(tipo_id)
-            query += f" AND m.tipo_id = ${len(params)}"
+            query += f" AND c.tipo_id = ${len(params)}"
         if entalle_id:
             params.append(entalle_id)
-            query += f" AND m.entalle_id = ${len(params)}"
+            query += f" AND c.entalle_id = ${len(params)}"
         if tela_id:
             params.append(tela_id)
-            query += f" AND m.tela_id = ${len(params)}"
+            query += f" AND c.tela_id = ${len(params)}"
         if hilo_especifico_id:
             params.append(hilo_especifico_id)
-            query += f" AND r.hilo_especifico_id = ${len(params)}"
+            query += f" AND c.hilo_especifico_id = ${len(params)}"
 
         if prioridad == "urgente":
-            query += " AND r.urgente = true"
+            query += " AND c.urgente"
         elif prioridad == "normal":
-            query += " AND (r.urgente = false OR r.urgente IS NULL)"
+            query += " AND NOT c.urgente"
 
+        query += " GROUP BY c.estado, ma.nombre, t.nombre, e.nombre, te.nombre, he.nombre"
         rows = await conn.fetch(query, *params)
 
     data = {}
@@ -544,8 +560,6 @@ async def get_reporte_estados_item(
 
     for row in rows:
         estado = row.get('estado')
-        if estado not in estados_incluidos:
-            continue
 
         marca = safe(row.get('marca_nombre')) or 'Sin Marca'
         tipo = safe(row.get('tipo_nombre')) or 'Sin Tipo'
@@ -572,8 +586,8 @@ async def get_reporte_estados_item(
         if not col:
             continue
 
-        data[key][col] += 1
-        data[key]["total"] += 1
+        data[key][col] += row['registros']
+        data[key]["total"] += row['registros']
 
     result_rows = list(data.values())
     result_rows.sort(key=lambda r: (r.get('item') or '', r.get('hilo') or ''))
@@ -588,6 +602,7 @@ async def get_reporte_estados_item(
 
 
 @router.get("/reportes/estados-item/detalle")
+@solo_lectura
 async def get_reporte_estados_item_detalle(
     item: str,
     hilo: str,
@@ -697,31 +712,7 @@ async def get_reporte_estados_item_detalle(
         "rows": result,
     }
 
-@router.get("/reportes/estados-item/export")
-async def export_reporte_estados_item(
-    search: str = None,
-    marca_id: str = None,
-    tipo_id: str = None,
-    entalle_id: str = None,
-    tela_id: str = None,
-    hilo_especifico_id: str = None,
-    prioridad: str = None,
-    include_tienda: bool = False,
-    current_user: dict = Depends(get_current_user),
-):
-    """Export CSV (Excel) del reporte ITEM - ESTADOS."""
-
-    reporte = await get_reporte_estados_item(
-        search=search,
-        marca_id=marca_id,
-        tipo_id=tipo_id,
-        entalle_id=entalle_id,
-        tela_id=tela_id,
-        hilo_especifico_id=hilo_especifico_id,
-        prioridad=prioridad,
-        include_tienda=include_tienda,
-    )
-
+def _csv_estados_item(reporte: dict, include_tienda: bool):
     cols = [
         ('Item', 'item'),
         ('Hilo', 'hilo'),
@@ -753,15 +744,57 @@ async def export_reporte_estados_item(
                 values.append(s)
         output.write(','.join(values) + '\n')
 
-    output.seek(0)
     filename = f"reporte_estados_item_{datetime.now().strftime('%Y%m%d')}.csv"
+    return output.getvalue().encode('utf-8-sig'), filename
+
+
+@router.get("/reportes/estados-item/export")
+@solo_lectura
+async def export_reporte_estados_item(
+    search: str = None,
+    marca_id: str = None,
+    tipo_id: str = None,
+    entalle_id: str = None,
+    tela_id: str = None,
+    hilo_especifico_id: str = None,
+    prioridad: str = None,
+    include_tienda: bool = False,
+    async_: bool = Query(False, alias="async"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Export CSV (Excel) del reporte ITEM - ESTADOS. Con async=1 se genera como job."""
+    filtros = dict(
+        search=search,
+        marca_id=marca_id,
+        tipo_id=tipo_id,
+        entalle_id=entalle_id,
+        tela_id=tela_id,
+        hilo_especifico_id=hilo_especifico_id,
+        prioridad=prioridad,
+        include_tienda=include_tienda,
+    )
+    if async_:
+        return await encolar_job("export_estados_item", filtros, current_user)
+
+    reporte = await get_reporte_estados_item(**filtros)
+    contenido, filename = _csv_estados_item(reporte, include_tienda)
 
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode('utf-8-sig')),
+        io.BytesIO(contenido),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
+
+async def _job_export_estados_item(ctx):
+    reporte = await get_reporte_estados_item(**ctx.params)
+    contenido, filename = _csv_estados_item(reporte, ctx.params.get("include_tienda", False))
+    ctx.guardar_archivo(filename, contenido, "text/csv")
+    return {"filas": len(reporte.get("rows", []))}
+
+
+registrar_tipo_job("export_estados_item", _job_export_estados_item, "Export CSV del reporte ITEM - ESTADOS")
+
 # ==================== ENDPOINTS BACKUP ====================
 
 BACKUP_TABLES = [
@@ -771,44 +804,63 @@ BACKUP_TABLES = [
     'prod_inventario_ingresos', 'prod_inventario_salidas', 'prod_inventario_ajustes',
     'prod_inventario_rollos', 'prod_servicios_produccion', 'prod_personas_produccion',
     'prod_rutas_produccion', 'prod_movimientos_produccion', 'prod_mermas',
-    'prod_guias_remision', 'prod_usuarios'
+    'prod_guias_remision', 'prod_usuarios',
+    # Lotes cerrados archivados (archivo_lotes.py)
+    'prod_archivo_lotes', 'prod_registros_archivo', 'prod_movimientos_produccion_archivo', 'prod_mermas_archivo',
 ]
 
-@router.get("/backup/create")
-async def create_backup(current_user: dict = Depends(get_current_user)):
-    """Crea un backup completo de todas las tablas"""
-    if current_user['rol'] != 'admin':
-        raise HTTPException(status_code=403, detail="Solo administradores pueden crear backups")
-    
-    pool = await get_pool()
+async def _generar_backup(conn, usuario_nombre: str, progreso=None) -> dict:
     backup_data = {
         "version": "1.0",
         "created_at": datetime.now(timezone.utc).isoformat(),
-        "created_by": current_user['username'],
+        "created_by": usuario_nombre,
         "tables": {}
     }
-    
+    for i, table in enumerate(BACKUP_TABLES):
+        try:
+            rows = await conn.fetch(f"SELECT * FROM {table}")
+            table_data = []
+            for row in rows:
+                row_dict = dict(row)
+                # Convertir tipos no serializables
+                for key, value in row_dict.items():
+                    if isinstance(value, datetime):
+                        row_dict[key] = value.isoformat()
+                    elif isinstance(value, date):
+                        row_dict[key] = value.isoformat()
+                    elif isinstance(value, uuid.UUID):
+                        row_dict[key] = str(value)
+                    elif isinstance(value, Decimal):
+                        row_dict[key] = float(value)
+                table_data.append(row_dict)
+            backup_data["tables"][table] = table_data
+        except Exception as e:
+            backup_data["tables"][table] = {"error": str(e)}
+        if progreso:
+            await progreso(100 * (i + 1) / len(BACKUP_TABLES), f"Tabla {table}")
+    return backup_data
+
+
+def _archivo_backup(backup_data: dict):
+    json_content = json.dumps(backup_data, ensure_ascii=False, indent=2)
+    filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    return json_content.encode('utf-8'), filename
+
+
+@router.get("/backup/create")
+async def create_backup(
+    async_: bool = Query(False, alias="async"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Crea un backup completo de todas las tablas. Con async=1 se genera como job."""
+    if current_user['rol'] != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores pueden crear backups")
+    if async_:
+        return await encolar_job("backup_create", {}, current_user)
+
+    pool = await get_pool()
     async with pool.acquire() as conn:
-        for table in BACKUP_TABLES:
-            try:
-                rows = await conn.fetch(f"SELECT * FROM {table}")
-                table_data = []
-                for row in rows:
-                    row_dict = dict(row)
-                    # Convertir tipos no serializables
-                    for key, value in row_dict.items():
-                        if isinstance(value, datetime):
-                            row_dict[key] = value.isoformat()
-                        elif isinstance(value, date):
-                            row_dict[key] = value.isoformat()
-                        elif isinstance(value, uuid.UUID):
-                            row_dict[key] = str(value)
-                        elif isinstance(value, Decimal):
-                            row_dict[key] = float(value)
-                    table_data.append(row_dict)
-                backup_data["tables"][table] = table_data
-            except Exception as e:
-                backup_data["tables"][table] = {"error": str(e)}
+        backup_data = await _generar_backup(conn, current_user['username'])
     
     # Registrar actividad
     await registrar_actividad(
@@ -821,15 +873,33 @@ async def create_backup(current_user: dict = Depends(get_current_user)):
     )
     
     # Generar archivo JSON
-    json_content = json.dumps(backup_data, ensure_ascii=False, indent=2)
-    filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    contenido, filename = _archivo_backup(backup_data)
     
     return StreamingResponse(
-        io.BytesIO(json_content.encode('utf-8')),
+        io.BytesIO(contenido),
         media_type="application/json",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
+
+async def _job_backup_create(ctx):
+    async with ctx.conexion() as conn:
+        backup_data = await _generar_backup(conn, ctx.usuario['username'], ctx.progreso)
+    contenido, filename = _archivo_backup(backup_data)
+    ctx.guardar_archivo(filename, contenido, "application/json")
+    await registrar_actividad(
+        await get_pool(),
+        usuario_id=ctx.usuario['id'],
+        usuario_nombre=ctx.usuario['username'],
+        tipo_accion="crear",
+        tabla_afectada="backup",
+        descripcion="Creó backup completo de la base de datos (job)"
+    )
+    return {"tablas": len(backup_data["tables"])}
+
+
+registrar_tipo_job("backup_create", _job_backup_create, "Backup completo de la base de datos", solo_admin=True)
+
 @router.get("/backup/info")
 async def backup_info(current_user: dict = Depends(get_current_user)):
     """Retorna información sobre las tablas para backup"""
@@ -849,53 +919,113 @@ async def backup_info(current_user: dict = Depends(get_current_user)):
     
     return info
 
-@router.post("/backup/restore")
-async def restore_backup(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    """Restaura un backup desde archivo JSON"""
-    if current_user['rol'] != 'admin':
-        raise HTTPException(status_code=403, detail="Solo administradores pueden restaurar backups")
-    
+# Tablas del backup de las que dependen los hechos de prod_matriz_cubo
+_TABLAS_CUBO = {"prod_registros", "prod_movimientos_produccion", "prod_modelos",
+                "prod_colores_catalogo", "prod_colores_generales"}
+
+
+async def _insertar_filas(conn, table: str, rows: list, errors: list):
+    """Inserta las filas de la tabla; si alguna falla, reintenta fila por fila y reporta las que fallan."""
+    columns = list(rows[0].keys())
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(f'${i+1}' for i in range(len(columns)))})"
+    try:
+        async with conn.transaction():
+            await conn.executemany(query, [[row.get(c) for c in columns] for row in rows])
+        return
+    except Exception:
+        pass
+    for row in rows:
+        cols = list(row.keys())
+        q = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(f'${i+1}' for i in range(len(cols)))})"
+        try:
+            async with conn.transaction():
+                await conn.execute(q, *row.values())
+        except Exception as row_error:
+            errors.append(f"{table}: {str(row_error)[:50]}")
+
+
+async def _restaurar_backup(conn, backup_data: dict, progreso=None):
+    """Restaura todas las tablas en una sola transacción: un error o corte no deja la base a medias.
+
+    La cancelación del job solo se atiende antes de empezar; una vez borradas
+    las tablas el progreso se sigue reportando pero el restore no se interrumpe.
+    """
+    restored = []
+    errors = []
+    tablas = [
+        (table, rows) for table, rows in backup_data["tables"].items()
+        if table in BACKUP_TABLES and rows and not (isinstance(rows, dict) and "error" in rows)
+    ]
+    if progreso:
+        await progreso(0, "Iniciando restore", forzar=True)
+
+    async def avance(porcentaje, mensaje):
+        if not progreso:
+            return
+        try:
+            await progreso(porcentaje, mensaje)
+        except JobCancelado:
+            pass
+
+    async with conn.transaction():
+        for n, (table, rows) in enumerate(tablas):
+            await avance(100 * n / len(tablas), f"Tabla {table}")
+            # Savepoint por tabla: una tabla que falla no aborta las demás
+            try:
+                async with conn.transaction():
+                    await conn.execute(f"DELETE FROM {table}")
+                    await _insertar_filas(conn, table, rows, errors)
+                restored.append(table)
+            except Exception as table_error:
+                errors.append(f"{table}: {str(table_error)}")
+        if restored:
+            # Los snapshots de costos ya no corresponden a los datos restaurados
+            await conn.execute("DELETE FROM prod_registro_costo_snapshot")
+        if "prod_personas_produccion" in restored:
+            await sincronizar_tarifas(conn)
+        if _TABLAS_CUBO & set(restored):
+            # El cubo se mantiene incremental: tras reemplazar sus tablas se rehace completo
+            await reconstruir_cubo(conn)
+        if {"prod_registros", "prod_movimientos_produccion"} & set(restored):
+            # prod_wip_resumen no va en el backup: se cuadra contra el ledger que quedó tras el restore
+            await recalcular_wip_resumen(conn)
+        if {"prod_inventario", "prod_inventario_ingresos", "prod_inventario_salidas"} & set(restored):
+            # Los agregados de prod_inventario vienen del momento del backup; se recalculan con las capas y reservas actuales
+            await recalcular_agregados_inventario(conn)
+    if "prod_rutas_produccion" in restored:
+        invalidar_ruta()
+    return restored, errors
+
+
+def _leer_backup(content: bytes) -> dict:
     try:
-        content = await file.read()
         backup_data = json.loads(content.decode('utf-8'))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al leer archivo: {str(e)}")
-    
     if "tables" not in backup_data:
         raise HTTPException(status_code=400, detail="Formato de backup inválido")
+    return backup_data
+
+
+@router.post("/backup/restore")
+async def restore_backup(
+    file: UploadFile = File(...),
+    async_: bool = Query(False, alias="async"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Restaura un backup desde archivo JSON. Con async=1 se restaura como job."""
+    if current_user['rol'] != 'admin':
+        raise HTTPException(status_code=403, detail="Solo administradores pueden restaurar backups")
     
-    pool = await get_pool()
-    restored = []
-    errors = []
+    content = await file.read()
+    backup_data = _leer_backup(content)
+    if async_:
+        return await encolar_job("backup_restore", {"archivo": file.filename}, current_user,
+                                 archivos={"backup.json": content})
     
+    pool = await get_pool()
     async with pool.acquire() as conn:
-        for table, rows in backup_data["tables"].items():
-            if table not in BACKUP_TABLES:
-                continue
-            if isinstance(rows, dict) and "error" in rows:
-                continue
-            if not rows:
-                continue
-            
-            try:
-                # Eliminar datos existentes
-                await conn.execute(f"DELETE FROM {table}")
-                
-                # Insertar nuevos datos
-                for row in rows:
-                    columns = list(row.keys())
-                    values = list(row.values())
-                    placeholders = [f"${i+1}" for i in range(len(columns))]
-                    
-                    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"
-                    try:
-                        await conn.execute(query, *values)
-                    except Exception as row_error:
-                        errors.append(f"{table}: {str(row_error)[:50]}")
-                
-                restored.append(table)
-            except Exception as table_error:
-                errors.append(f"{table}: {str(table_error)}")
+        restored, errors = await _restaurar_backup(conn, backup_data)
     
     # Registrar actividad
     await registrar_actividad(
@@ -914,6 +1044,28 @@ async def restore_backup(file: UploadFile = File(...), current_user: dict = Depe
         "errors": errors
     }
 
+
+async def _job_backup_restore(ctx):
+    entrada = ctx.archivo_entrada("backup.json")
+    if not entrada.is_file():
+        raise ValueError("El restore se encola subiendo el archivo a /api/backup/restore?async=1")
+    backup_data = _leer_backup(entrada.read_bytes())
+    async with ctx.conexion() as conn:
+        restored, errors = await _restaurar_backup(conn, backup_data, ctx.progreso)
+    await registrar_actividad(
+        await get_pool(),
+        usuario_id=ctx.usuario['id'],
+        usuario_nombre=ctx.usuario['username'],
+        tipo_accion="editar",
+        tabla_afectada="backup",
+        descripcion=f"Restauró backup (job): {len(restored)} tablas restauradas",
+        datos_nuevos={"tablas_restauradas": restored, "errores": errors}
+    )
+    return {"message": "Backup restaurado", "restored_tables": restored, "errors": errors}
+
+
+registrar_tipo_job("backup_restore", _job_backup_restore, "Restaurar backup JSON", solo_admin=True)
+
 # ==================== ENDPOINTS EXPORTAR EXCEL ====================
 
 @router.get("/export/{tabla}")
@@ -1109,79 +1261,111 @@ from routes.inventario_main import router as inventario_main_router
 
 # ==================== REPORTE PARALIZADOS ====================
 
+_DEPENDE_PARALIZACIONES = (
+    "/api/paralizaciones", "/api/incidencias", "/api/registros", "/api/movimientos-produccion",
+    "/api/modelos", "/api/marcas", "/api/personas-produccion", "/api/servicios-produccion", "/api/backup",
+)
+
+# Una fila por paralización; las activas son la regla "paralizacion" del motor de alertas
+_PARALIZADOS_SQL = """
+    SELECT 
+        p.id,
+        p.registro_id,
+        p.movimiento_id,
+        p.fecha_inicio,
+        p.fecha_fin,
+        p.motivo,
+        p.comentario,
+        p.activa,
+        r.n_corte,
+        r.estado as registro_estado,
+        r.urgente,
+        mod.nombre as modelo_nombre,
+        ma.nombre as marca_nombre,
+        -- Último movimiento activo
+        (SELECT sp.nombre FROM prod_movimientos_produccion mp
+         JOIN prod_servicios_produccion sp ON sp.id = mp.servicio_id
+         WHERE mp.registro_id = r.id AND mp.avance_porcentaje < 100
+         ORDER BY mp.fecha_inicio DESC NULLS LAST LIMIT 1) as servicio_actual,
+        (SELECT pp.nombre FROM prod_movimientos_produccion mp
+         JOIN prod_personas_produccion pp ON pp.id = mp.persona_id
+         WHERE mp.registro_id = r.id AND mp.avance_porcentaje < 100
+         ORDER BY mp.fecha_inicio DESC NULLS LAST LIMIT 1) as persona_actual,
+        -- Movimiento vinculado (si tiene)
+        (SELECT sp.nombre FROM prod_servicios_produccion sp
+         JOIN prod_movimientos_produccion mp ON mp.id = p.movimiento_id AND sp.id = mp.servicio_id
+         ) as servicio_movimiento,
+        -- Incidencia vinculada
+        (SELECT i.tipo FROM prod_incidencia i 
+         WHERE i.paralizacion_id = p.id LIMIT 1) as incidencia_tipo,
+        (SELECT i.estado FROM prod_incidencia i 
+         WHERE i.paralizacion_id = p.id LIMIT 1) as incidencia_estado,
+        -- Cantidad de prendas
+        COALESCE((SELECT SUM(rt.cantidad_real) FROM prod_registro_tallas rt 
+                  WHERE rt.registro_id = r.id), 0) as prendas
+    FROM prod_paralizacion p
+    JOIN prod_registros r ON r.id = p.registro_id
+    LEFT JOIN prod_modelos mod ON mod.id = r.modelo_id
+    LEFT JOIN prod_marcas ma ON ma.id = mod.marca_id
+    WHERE p.activa = $1
+    ORDER BY p.fecha_inicio DESC
+    """
+
+
+def _fecha(valor):
+    """date desde date/datetime o desde el ISO guardado en prod_alertas."""
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    return valor.date() if hasattr(valor, 'date') else valor
+
+
+def _paralizacion(row) -> dict:
+    d = row_to_dict(row)
+    # Serializar fechas
+    for f in ("fecha_inicio", "fecha_fin"):
+        if d.get(f):
+            d[f] = str(d[f])
+    return d
+
+
+async def _regla_paralizaciones(conn):
+    return [(r['id'], 'paralizado', r['registro_id'], _paralizacion(r)) for r in await conn.fetch(_PARALIZADOS_SQL, True)]
+
+
+registrar_regla("paralizacion", _regla_paralizaciones, _DEPENDE_PARALIZACIONES)
+
+
 @router.get("/reportes/paralizados")
+@solo_lectura
 async def reporte_paralizados(
     solo_activas: Optional[str] = None,
 ):
-    """Reporte completo de paralizaciones: activas + historial."""
+    """Reporte completo de paralizaciones: activas (desde prod_alertas) + historial."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT 
-                p.id,
-                p.registro_id,
-                p.movimiento_id,
-                p.fecha_inicio,
-                p.fecha_fin,
-                p.motivo,
-                p.comentario,
-                p.activa,
-                r.n_corte,
-                r.estado as registro_estado,
-                r.urgente,
-                mod.nombre as modelo_nombre,
-                ma.nombre as marca_nombre,
-                -- Último movimiento activo
-                (SELECT sp.nombre FROM prod_movimientos_produccion mp
-                 JOIN prod_servicios_produccion sp ON sp.id = mp.servicio_id
-                 WHERE mp.registro_id = r.id AND mp.avance_porcentaje < 100
-                 ORDER BY mp.fecha_inicio DESC NULLS LAST LIMIT 1) as servicio_actual,
-                (SELECT pp.nombre FROM prod_movimientos_produccion mp
-                 JOIN prod_personas_produccion pp ON pp.id = mp.persona_id
-                 WHERE mp.registro_id = r.id AND mp.avance_porcentaje < 100
-                 ORDER BY mp.fecha_inicio DESC NULLS LAST LIMIT 1) as persona_actual,
-                -- Movimiento vinculado (si tiene)
-                (SELECT sp.nombre FROM prod_servicios_produccion sp
-                 JOIN prod_movimientos_produccion mp ON mp.id = p.movimiento_id AND sp.id = mp.servicio_id
-                 ) as servicio_movimiento,
-                -- Incidencia vinculada
-                (SELECT i.tipo FROM prod_incidencia i 
-                 WHERE i.paralizacion_id = p.id LIMIT 1) as incidencia_tipo,
-                (SELECT i.estado FROM prod_incidencia i 
-                 WHERE i.paralizacion_id = p.id LIMIT 1) as incidencia_estado,
-                -- Cantidad de prendas
-                COALESCE((SELECT SUM(rt.cantidad_real) FROM prod_registro_tallas rt 
-                          WHERE rt.registro_id = r.id), 0) as prendas
-            FROM prod_paralizacion p
-            JOIN prod_registros r ON r.id = p.registro_id
-            LEFT JOIN prod_modelos mod ON mod.id = r.modelo_id
-            LEFT JOIN prod_marcas ma ON ma.id = mod.marca_id
-            ORDER BY p.activa DESC, p.fecha_inicio DESC
-        """)
-
-        from datetime import date
+        activas = await alertas_abiertas(conn, "paralizacion")
+        activas.sort(key=lambda d: d.get("fecha_inicio") or "", reverse=True)
+        filas = activas
+        if solo_activas != "true":
+            filas = activas + [_paralizacion(r) for r in await conn.fetch(_PARALIZADOS_SQL, False)]
+
         hoy = date.today()
         resultado = []
         resumen = {"activas": 0, "resueltas": 0, "total": 0, "prendas_afectadas": 0, "dias_promedio": 0}
         dias_list = []
 
-        for row in rows:
-            d = row_to_dict(row)
+        for d in filas:
             activa = d.get("activa", False)
 
-            # Filtro
-            if solo_activas == "true" and not activa:
-                continue
-
             # Calcular días
-            fi = d.get("fecha_inicio")
-            ff = d.get("fecha_fin")
-            if fi:
-                fi_date = fi.date() if hasattr(fi, 'date') else fi
+            fi_date = _fecha(d.get("fecha_inicio"))
+            if fi_date:
                 if activa:
                     dias = (hoy - fi_date).days
                 else:
-                    ff_date = ff.date() if ff and hasattr(ff, 'date') else (ff or hoy)
+                    ff_date = _fecha(d.get("fecha_fin")) or hoy
                     dias = (ff_date - fi_date).days
             else:
                 dias = 0
@@ -1195,11 +1379,6 @@ async def reporte_paralizados(
                 resumen["resueltas"] += 1
             resumen["total"] += 1
 
-            # Serializar fechas
-            for f in ("fecha_inicio", "fecha_fin"):
-                if d.get(f):
-                    d[f] = str(d[f])
-
             d["dias"] = dias
             d["servicio"] = d.get("servicio_movimiento") or d.get("servicio_actual") or ""
             d["persona"] = d.get("persona_actual") or ""
@@ -16,9 +16,10 @@ router = APIRouter(prefix="/api", tags=["trazabilidad"])
 
 import sys
 sys.path.insert(0, '/app/backend')
-from db import get_pool
+from db import get_pool, solo_lectura
 from auth import get_current_user
 from helpers import row_to_dict
+from jobs import encolar_job, registrar_tipo_job
 
 DIAS_LIMITE_ARREGLO = 3
 
@@ -786,175 +787,207 @@ async def trazabilidad_completa(
 # ==================== REPORTE TRAZABILIDAD GENERAL ====================
 
 @router.get("/reporte-trazabilidad")
+@solo_lectura
 async def reporte_trazabilidad(
+    async_: bool = Query(False, alias="async"),
     current_user: dict = Depends(get_current_user),
 ):
-    """Resumen de trazabilidad de todos los registros activos."""
+    """Resumen de trazabilidad de todos los registros activos. Con async=1 se genera como job."""
+    if async_:
+        return await encolar_job("reporte_trazabilidad", {}, current_user)
     pool = await get_pool()
     async with pool.acquire() as conn:
-        registros = await conn.fetch("""
-            SELECT r.id, r.n_corte, r.estado, r.estado_op,
-                   m.nombre as modelo_nombre, ma.nombre as marca,
-                   COALESCE((SELECT SUM(rt.cantidad_real) FROM prod_registro_tallas rt WHERE rt.registro_id = r.id), 0) as cantidad_inicial
-            FROM prod_registros r
-            LEFT JOIN prod_modelos m ON r.modelo_id = m.id
-            LEFT JOIN prod_marcas ma ON m.marca_id = ma.id
-            ORDER BY r.n_corte
-        """)
+        return await _reporte_trazabilidad(conn)
 
-        resultado = []
-        for reg in registros:
-            rid = reg["id"]
-            ci = safe_int(reg["cantidad_inicial"])
-
-            merma = safe_int(await conn.fetchval(
-                "SELECT COALESCE(SUM(cantidad),0) FROM prod_mermas WHERE registro_id = $1", rid))
-            total_fallados = await _get_total_fallados(conn, rid)
-
-            # Arreglos V2
-            arreglos_rows = await conn.fetch(
-                "SELECT cantidad, cantidad_recuperada, cantidad_liquidacion, cantidad_merma, estado, fecha_limite FROM prod_registro_arreglos WHERE registro_id = $1", rid)
-            total_en_arreglo = sum(safe_int(a["cantidad"]) for a in arreglos_rows)
-            recuperado = sum(safe_int(a["cantidad_recuperada"]) for a in arreglos_rows)
-            liquidacion = sum(safe_int(a["cantidad_liquidacion"]) for a in arreglos_rows)
-            merma_arreglos = sum(safe_int(a["cantidad_merma"]) for a in arreglos_rows)
-            fallado_pendiente = total_fallados - total_en_arreglo
-
-            vencidos = 0
-            for a in arreglos_rows:
-                estado = _calcular_estado_arreglo(dict(a))
-                if estado == "VENCIDO":
-                    vencidos += safe_int(a["cantidad"])
-
-            normal = max(ci - total_fallados - merma, 0)
-            tiene_novedades = total_fallados > 0 or merma > 0
-
-            resultado.append({
-                "id": rid,
-                "n_corte": reg["n_corte"],
-                "estado": reg["estado"],
-                "modelo": reg["modelo_nombre"] or "",
-                "marca": reg["marca"] or "",
-                "cantidad_inicial": ci,
-                "normal": normal,
-                "total_fallados": total_fallados,
-                "fallado_pendiente": max(fallado_pendiente, 0),
-                "en_arreglo": total_en_arreglo,
-                "recuperado": recuperado,
-                "liquidacion": liquidacion,
-                "merma": merma,
-                "merma_arreglos": merma_arreglos,
-                "vencidos": vencidos,
-                "tiene_novedades": tiene_novedades,
-            })
 
-        totales = {
-            "registros": len(resultado),
-            "cantidad_inicial": sum(r["cantidad_inicial"] for r in resultado),
-            "normal": sum(r["normal"] for r in resultado),
-            "total_fallados": sum(r["total_fallados"] for r in resultado),
-            "en_arreglo": sum(r["en_arreglo"] for r in resultado),
-            "recuperado": sum(r["recuperado"] for r in resultado),
-            "liquidacion": sum(r["liquidacion"] for r in resultado),
-            "merma": sum(r["merma"] for r in resultado),
-            "vencidos": sum(r["vencidos"] for r in resultado),
-        }
+async def _job_reporte_trazabilidad(ctx):
+    async with ctx.conexion() as conn:
+        return await _reporte_trazabilidad(conn, ctx.progreso)
+
+
+async def _reporte_trazabilidad(conn, progreso=None):
+    registros = await conn.fetch("""
+        SELECT r.id, r.n_corte, r.estado, r.estado_op,
+               m.nombre as modelo_nombre, ma.nombre as marca,
+               COALESCE((SELECT SUM(rt.cantidad_real) FROM prod_registro_tallas rt WHERE rt.registro_id = r.id), 0) as cantidad_inicial
+        FROM prod_registros r
+        LEFT JOIN prod_modelos m ON r.modelo_id = m.id
+        LEFT JOIN prod_marcas ma ON m.marca_id = ma.id
+        ORDER BY r.n_corte
+    """)
 
-        return {"registros": resultado, "totales": totales}
+    resultado = []
+    for n, reg in enumerate(registros):
+        rid = reg["id"]
+        if progreso:
+            await progreso(100 * n / len(registros), f"{n}/{len(registros)} registros")
+        ci = safe_int(reg["cantidad_inicial"])
+
+        merma = safe_int(await conn.fetchval(
+            "SELECT COALESCE(SUM(cantidad),0) FROM prod_mermas WHERE registro_id = $1", rid))
+        total_fallados = await _get_total_fallados(conn, rid)
+
+        # Arreglos V2
+        arreglos_rows = await conn.fetch(
+            "SELECT cantidad, cantidad_recuperada, cantidad_liquidacion, cantidad_merma, estado, fecha_limite FROM prod_registro_arreglos WHERE registro_id = $1", rid)
+        total_en_arreglo = sum(safe_int(a["cantidad"]) for a in arreglos_rows)
+        recuperado = sum(safe_int(a["cantidad_recuperada"]) for a in arreglos_rows)
+        liquidacion = sum(safe_int(a["cantidad_liquidacion"]) for a in arreglos_rows)
+        merma_arreglos = sum(safe_int(a["cantidad_merma"]) for a in arreglos_rows)
+        fallado_pendiente = total_fallados - total_en_arreglo
+
+        vencidos = 0
+        for a in arreglos_rows:
+            estado = _calcular_estado_arreglo(dict(a))
+            if estado == "VENCIDO":
+                vencidos += safe_int(a["cantidad"])
+
+        normal = max(ci - total_fallados - merma, 0)
+        tiene_novedades = total_fallados > 0 or merma > 0
+
+        resultado.append({
+            "id": rid,
+            "n_corte": reg["n_corte"],
+            "estado": reg["estado"],
+            "modelo": reg["modelo_nombre"] or "",
+            "marca": reg["marca"] or "",
+            "cantidad_inicial": ci,
+            "normal": normal,
+            "total_fallados": total_fallados,
+            "fallado_pendiente": max(fallado_pendiente, 0),
+            "en_arreglo": total_en_arreglo,
+            "recuperado": recuperado,
+            "liquidacion": liquidacion,
+            "merma": merma,
+            "merma_arreglos": merma_arreglos,
+            "vencidos": vencidos,
+            "tiene_novedades": tiene_novedades,
+        })
+
+    totales = {
+        "registros": len(resultado),
+        "cantidad_inicial": sum(r["cantidad_inicial"] for r in resultado),
+        "normal": sum(r["normal"] for r in resultado),
+        "total_fallados": sum(r["total_fallados"] for r in resultado),
+        "en_arreglo": sum(r["en_arreglo"] for r in resultado),
+        "recuperado": sum(r["recuperado"] for r in resultado),
+        "liquidacion": sum(r["liquidacion"] for r in resultado),
+        "merma": sum(r["merma"] for r in resultado),
+        "vencidos": sum(r["vencidos"] for r in resultado),
+    }
+
+    return {"registros": resultado, "totales": totales}
 
 
 # ==================== REPORTES KPI TRAZABILIDAD ====================
 
 @router.get("/reportes/trazabilidad-kpis")
+@solo_lectura
 async def reportes_trazabilidad_kpis(
+    async_: bool = Query(False, alias="async"),
     current_user: dict = Depends(get_current_user),
 ):
-    """KPIs consolidados de trazabilidad."""
+    """KPIs consolidados de trazabilidad. Con async=1 se calculan como job."""
+    if async_:
+        return await encolar_job("trazabilidad_kpis", {}, current_user)
     pool = await get_pool()
     async with pool.acquire() as conn:
-        # Mermas por servicio
-        mermas_servicio = await conn.fetch("""
-            SELECT sp.nombre as servicio,
-                   COUNT(*) as eventos,
-                   COALESCE(SUM(m.cantidad), 0) as total_prendas
-            FROM prod_mermas m
-            LEFT JOIN prod_servicios_produccion sp ON m.servicio_id = sp.id
-            GROUP BY sp.nombre
-            ORDER BY total_prendas DESC
-        """)
+        return await _trazabilidad_kpis(conn)
 
-        # Fallados resumen
-        fallados_resumen = await conn.fetchrow(
-            "SELECT COUNT(*) as eventos, COALESCE(SUM(cantidad_detectada), 0) as prendas FROM prod_fallados"
-        )
 
-        # Arreglos V2 resumen
-        arreglos_resumen = await conn.fetchrow("""
-            SELECT COUNT(*) as total,
-                   COALESCE(SUM(cantidad_recuperada), 0) as recuperadas,
-                   COALESCE(SUM(cantidad_liquidacion), 0) as liquidadas,
-                   COALESCE(SUM(cantidad_merma), 0) as mermas
-            FROM prod_registro_arreglos
-        """)
-
-        # Arreglos vencidos
-        arreglos_vencidos = await conn.fetch("""
-            SELECT a.id, a.registro_id, r.n_corte,
-                   sp.nombre as servicio_nombre,
-                   pp.nombre as persona_nombre,
-                   a.cantidad, a.fecha_envio, a.fecha_limite,
-                   a.estado,
-                   (CURRENT_DATE - a.fecha_limite::date) as dias_vencido
-            FROM prod_registro_arreglos a
-            JOIN prod_registros r ON a.registro_id = r.id
-            LEFT JOIN prod_servicios_produccion sp ON a.servicio_id = sp.id
-            LEFT JOIN prod_personas_produccion pp ON a.persona_id = pp.id
-            WHERE a.fecha_limite < CURRENT_DATE
-              AND (a.cantidad_recuperada + a.cantidad_liquidacion + a.cantidad_merma) < a.cantidad
-            ORDER BY a.fecha_limite ASC
-        """)
+async def _job_trazabilidad_kpis(ctx):
+    async with ctx.conexion() as conn:
+        return await _trazabilidad_kpis(conn)
 
-        # Arreglos por responsable
-        arreglos_responsable = await conn.fetch("""
-            SELECT COALESCE(sp.nombre, pp.nombre, 'Sin asignar') as responsable,
-                   COUNT(*) as total_arreglos,
-                   COALESCE(SUM(a.cantidad), 0) as prendas_enviadas,
-                   COALESCE(SUM(a.cantidad_recuperada), 0) as prendas_recuperadas
-            FROM prod_registro_arreglos a
-            LEFT JOIN prod_servicios_produccion sp ON a.servicio_id = sp.id
-            LEFT JOIN prod_personas_produccion pp ON a.persona_id = pp.id
-            GROUP BY COALESCE(sp.nombre, pp.nombre, 'Sin asignar')
-            ORDER BY total_arreglos DESC
-        """)
 
-        # Totales mermas
-        totales_mermas = await conn.fetchrow("SELECT COUNT(*) as eventos, COALESCE(SUM(cantidad),0) as prendas FROM prod_mermas")
+async def _trazabilidad_kpis(conn):
+    # Mermas por servicio
+    mermas_servicio = await conn.fetch("""
+        SELECT sp.nombre as servicio,
+               COUNT(*) as eventos,
+               COALESCE(SUM(m.cantidad), 0) as total_prendas
+        FROM prod_mermas m
+        LEFT JOIN prod_servicios_produccion sp ON m.servicio_id = sp.id
+        GROUP BY sp.nombre
+        ORDER BY total_prendas DESC
+    """)
 
-        return {
-            "kpis": {
-                "mermas_total": safe_int(totales_mermas["prendas"]),
-                "mermas_eventos": safe_int(totales_mermas["eventos"]),
-                "fallados_total": safe_int(fallados_resumen["prendas"]),
-                "fallados_eventos": safe_int(fallados_resumen["eventos"]),
-                "arreglos_total": safe_int(arreglos_resumen["total"]),
-                "arreglos_recuperadas": safe_int(arreglos_resumen["recuperadas"]),
-                "arreglos_liquidadas": safe_int(arreglos_resumen["liquidadas"]),
-                "arreglos_vencidos": len(arreglos_vencidos),
-            },
-            "mermas_por_servicio": [dict(r) for r in mermas_servicio],
-            "arreglos_vencidos": [
-                {**dict(r), "fecha_envio": str(r["fecha_envio"]) if r["fecha_envio"] else None,
-                 "fecha_limite": str(r["fecha_limite"]) if r["fecha_limite"] else None}
-                for r in arreglos_vencidos
-            ],
-            "arreglos_por_responsable": [dict(r) for r in arreglos_responsable],
-        }
+    # Fallados resumen
+    fallados_resumen = await conn.fetchrow(
+        "SELECT COUNT(*) as eventos, COALESCE(SUM(cantidad_detectada), 0) as prendas FROM prod_fallados"
+    )
 
+    # Arreglos V2 resumen
+    arreglos_resumen = await conn.fetchrow("""
+        SELECT COUNT(*) as total,
+               COALESCE(SUM(cantidad_recuperada), 0) as recuperadas,
+               COALESCE(SUM(cantidad_liquidacion), 0) as liquidadas,
+               COALESCE(SUM(cantidad_merma), 0) as mermas
+        FROM prod_registro_arreglos
+    """)
+
+    # Arreglos vencidos
+    arreglos_vencidos = await conn.fetch("""
+        SELECT a.id, a.registro_id, r.n_corte,
+               sp.nombre as servicio_nombre,
+               pp.nombre as persona_nombre,
+               a.cantidad, a.fecha_envio, a.fecha_limite,
+               a.estado,
+               (CURRENT_DATE - a.fecha_limite::date) as dias_vencido
+        FROM prod_registro_arreglos a
+        JOIN prod_registros r ON a.registro_id = r.id
+        LEFT JOIN prod_servicios_produccion sp ON a.servicio_id = sp.id
+        LEFT JOIN prod_personas_produccion pp ON a.persona_id = pp.id
+        WHERE a.fecha_limite < CURRENT_DATE
+          AND (a.cantidad_recuperada + a.cantidad_liquidacion + a.cantidad_merma) < a.cantidad
+        ORDER BY a.fecha_limite ASC
+    """)
+
+    # Arreglos por responsable
+    arreglos_responsable = await conn.fetch("""
+        SELECT COALESCE(sp.nombre, pp.nombre, 'Sin asignar') as responsable,
+               COUNT(*) as total_arreglos,
+               COALESCE(SUM(a.cantidad), 0) as prendas_enviadas,
+               COALESCE(SUM(a.cantidad_recuperada), 0) as prendas_recuperadas
+        FROM prod_registro_arreglos a
+        LEFT JOIN prod_servicios_produccion sp ON a.servicio_id = sp.id
+        LEFT JOIN prod_personas_produccion pp ON a.persona_id = pp.id
+        GROUP BY COALESCE(sp.nombre, pp.nombre, 'Sin asignar')
+        ORDER BY total_arreglos DESC
+    """)
+
+    # Totales mermas
+    totales_mermas = await conn.fetchrow("SELECT COUNT(*) as eventos, COALESCE(SUM(cantidad),0) as prendas FROM prod_mermas")
+
+    return {
+        "kpis": {
+            "mermas_total": safe_int(totales_mermas["prendas"]),
+            "mermas_eventos": safe_int(totales_mermas["eventos"]),
+            "fallados_total": safe_int(fallados_resumen["prendas"]),
+            "fallados_eventos": safe_int(fallados_resumen["eventos"]),
+            "arreglos_total": safe_int(arreglos_resumen["total"]),
+            "arreglos_recuperadas": safe_int(arreglos_resumen["recuperadas"]),
+            "arreglos_liquidadas": safe_int(arreglos_resumen["liquidadas"]),
+            "arreglos_vencidos": len(arreglos_vencidos),
+        },
+        "mermas_por_servicio": [dict(r) for r in mermas_servicio],
+        "arreglos_vencidos": [
+            {**dict(r), "fecha_envio": str(r["fecha_envio"]) if r["fecha_envio"] else None,
+             "fecha_limite": str(r["fecha_limite"]) if r["fecha_limite"] else None}
+            for r in arreglos_vencidos
+        ],
+        "arreglos_por_responsable": [dict(r) for r in arreglos_responsable],
+    }
+
+
+registrar_tipo_job("reporte_trazabilidad", _job_reporte_trazabilidad, "Reporte de trazabilidad general")
+registrar_tipo_job("trazabilidad_kpis", _job_trazabilidad_kpis, "KPIs consolidados de trazabilidad")
 
 
 # ==================== CONTROL DE FALLADOS (pantalla centralizada) ====================
 
 @router.get("/fallados-control")
+@solo_lectura
 async def fallados_control(
     estado: Optional[str] = None,
     servicio_id: Optional[str] = None,
@@ -0,0 +1,129 @@
+"""Rutas de producción compiladas en memoria.
+
+Cada apertura del selector de estado (estados-disponibles, analisis-estado,
+validar-cambio-estado) y cada carga de la matriz leía la ruta y parseaba su
+JSONB `etapas`. Aquí cada ruta se parsea una vez a `RutaCompilada`: etapas
+ordenadas, estados visibles, índice por nombre, servicio por etapa y las
+etapas que deben estar cubiertas antes de pasar a cada estado.
+
+El CRUD de rutas en catalogos.py llama a `invalidar_ruta`; con varios workers
+las demás copias quedan acotadas por RUTAS_CACHE_TTL_SEG.
+"""
+import json
+import os
+import time
+
+RUTAS_CACHE_TTL_SEG = float(os.environ.get('RUTAS_CACHE_TTL_SEG', '60'))
+
+# ruta_id -> (expira, RutaCompilada o None si no existe / no tiene etapas)
+_rutas = {}
+_todas = {"expira": 0.0, "ids": ()}
+_metricas = {"hits": 0, "compilaciones": 0, "invalidaciones": 0}
+
+
+class RutaCompilada:
+    """Representación inmutable de una ruta; no modificar las etapas retornadas."""
+
+    def __init__(self, ruta_id: str, nombre: str, etapas: list):
+        self.id = ruta_id
+        self.nombre = nombre
+        self.etapas = sorted(etapas, key=lambda e: e.get('orden', 0))
+        self.nombres = [e.get('nombre') for e in self.etapas]
+        # Primer índice de cada nombre (igual que los recorridos con break que reemplaza)
+        self.indice = {}
+        for i, nombre_etapa in enumerate(self.nombres):
+            self.indice.setdefault(nombre_etapa, i)
+        # aparece_en_estado es true por defecto para el selector de estados...
+        self.visibles = [i for i, e in enumerate(self.etapas) if _visible(e)]
+        self.estados_visibles = [self.nombres[i] for i in self.visibles if self.nombres[i]]
+        # ...pero la matriz solo usa las etapas marcadas explícitamente
+        self.columnas_matriz = [e['nombre'] for e in self.etapas if e.get('aparece_en_estado')]
+        self.servicio_por_etapa = [e.get('servicio_id') for e in self.etapas]
+        # Siguiente etapa visible después de cada posición
+        self._siguiente_visible = [None] * len(self.etapas)
+        siguiente = None
+        for i in range(len(self.etapas) - 1, -1, -1):
+            self._siguiente_visible[i] = siguiente
+            if _visible(self.etapas[i]):
+                siguiente = self.nombres[i]
+
+    def posicion(self, estado):
+        return self.indice.get(estado)
+
+    def siguiente_visible(self, estado):
+        idx = self.posicion(estado)
+        return None if idx is None else self._siguiente_visible[idx]
+
+    def requisitos(self, estado):
+        """Etapas previas con servicio que condicionan pasar a `estado` (vacío si no está en la ruta)."""
+        idx = self.posicion(estado)
+        if idx is None:
+            return []
+        return [e for e in self.etapas[:idx] if e.get('servicio_id')]
+
+
+def _visible(etapa) -> bool:
+    return bool(etapa.get('aparece_en_estado', True))
+
+
+def _parsear(etapas):
+    if isinstance(etapas, str):
+        try:
+            etapas = json.loads(etapas)
+        except (ValueError, json.JSONDecodeError):
+            return []
+    return etapas if isinstance(etapas, list) else []
+
+
+def compilar(row):
+    etapas = _parsear(row['etapas']) if row and row['etapas'] else []
+    if not etapas:
+        return None
+    _metricas["compilaciones"] += 1
+    return RutaCompilada(row['id'], row['nombre'], etapas)
+
+
+async def ruta_compilada(conn, ruta_id):
+    """RutaCompilada de `ruta_id`, o None si no existe o no tiene etapas."""
+    if not ruta_id:
+        return None
+    ahora = time.monotonic()
+    entrada = _rutas.get(ruta_id)
+    if entrada is not None and entrada[0] > ahora:
+        _metricas["hits"] += 1
+        return entrada[1]
+    row = await conn.fetchrow("SELECT id, nombre, etapas FROM prod_rutas_produccion WHERE id = $1", ruta_id)
+    ruta = compilar(row)
+    _rutas[ruta_id] = (ahora + RUTAS_CACHE_TTL_SEG, ruta)
+    return ruta
+
+
+async def rutas_compiladas(conn) -> list:
+    """Todas las rutas con etapas, en el orden de la tabla."""
+    ahora = time.monotonic()
+    if _todas["expira"] > ahora and all(
+        i in _rutas and _rutas[i][0] > ahora for i in _todas["ids"]
+    ):
+        _metricas["hits"] += 1
+        return [_rutas[i][1] for i in _todas["ids"] if _rutas[i][1] is not None]
+    rows = await conn.fetch("SELECT id, nombre, etapas FROM prod_rutas_produccion")
+    expira = ahora + RUTAS_CACHE_TTL_SEG
+    for row in rows:
+        _rutas[row['id']] = (expira, compilar(row))
+    _todas["ids"] = tuple(row['id'] for row in rows)
+    _todas["expira"] = expira
+    return [_rutas[i][1] for i in _todas["ids"] if _rutas[i][1] is not None]
+
+
+def invalidar_ruta(ruta_id: str = None):
+    """Descarta la ruta (o todas) para que la próxima lectura la recompile."""
+    _metricas["invalidaciones"] += 1
+    if ruta_id is None:
+        _rutas.clear()
+    else:
+        _rutas.pop(ruta_id, None)
+    _todas["expira"] = 0.0
+
+
+def estado_rutas_cache() -> dict:
+    return {"rutas": len(_rutas), "ttl_seg": RUTAS_CACHE_TTL_SEG, **_metricas}
@@ -0,0 +1,100 @@
+"""Tareas periódicas en segundo plano dentro del proceso de la API.
+
+Cada tarea corre en su propio loop asyncio con un intervalo fijo. Antes de cada
+ejecución toma un advisory lock de Postgres (no bloqueante) para que, con varios
+workers de uvicorn, solo uno ejecute la tarea en cada tick.
+"""
+import asyncio
+import logging
+import zlib
+from datetime import datetime, timezone
+
+from db import get_pool
+
+logger = logging.getLogger(__name__)
+
+_tareas = {}
+
+
+def registrar_tarea_periodica(nombre: str, intervalo_seg: float, fn, retraso_inicial_seg: float = 60):
+    """Registra `fn` (coroutine function sin argumentos) para correr cada `intervalo_seg`.
+
+    Un intervalo <= 0 deja la tarea registrada pero deshabilitada.
+    """
+    _tareas[nombre] = {
+        "nombre": nombre,
+        "intervalo_seg": intervalo_seg,
+        "retraso_inicial_seg": retraso_inicial_seg,
+        "fn": fn,
+        "task": None,
+        "ultima_ejecucion": None,
+        "ultimo_resultado": None,
+        "ultimo_error": None,
+        "ejecuciones": 0,
+    }
+
+
+def _lock_key(nombre: str) -> int:
+    # advisory lock de 32 bits estable entre procesos
+    return zlib.crc32(f"tarea:{nombre}".encode()) & 0x7FFFFFFF
+
+
+async def ejecutar_tarea(nombre: str):
+    """Ejecuta una tarea una vez, respetando el advisory lock. Retorna su resultado o None si otro worker la tiene."""
+    tarea = _tareas[nombre]
+    pool = await get_pool()
+    async with pool.acquire() as lock_conn:
+        tomado = await lock_conn.fetchval("SELECT pg_try_advisory_lock($1)", _lock_key(nombre))
+        if not tomado:
+            return None
+        try:
+            resultado = await tarea["fn"]()
+            tarea["ultimo_resultado"] = resultado
+            tarea["ultimo_error"] = None
+            return resultado
+        except Exception as e:
+            tarea["ultimo_error"] = str(e)
+            logger.exception(f"Tarea periódica '{nombre}' falló")
+            return None
+        finally:
+            tarea["ultima_ejecucion"] = datetime.now(timezone.utc).isoformat()
+            tarea["ejecuciones"] += 1
+            await lock_conn.execute("SELECT pg_advisory_unlock($1)", _lock_key(nombre))
+
+
+async def _loop(nombre: str):
+    tarea = _tareas[nombre]
+    await asyncio.sleep(tarea["retraso_inicial_seg"])
+    while True:
+        try:
+            await ejecutar_tarea(nombre)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Tarea periódica '{nombre}': error adquiriendo conexión")
+        await asyncio.sleep(tarea["intervalo_seg"])
+
+
+async def iniciar_tareas():
+    for nombre, tarea in _tareas.items():
+        if tarea["intervalo_seg"] and tarea["intervalo_seg"] > 0 and tarea["task"] is None:
+            tarea["task"] = asyncio.create_task(_loop(nombre))
+            logger.info(f"Tarea periódica '{nombre}' iniciada cada {tarea['intervalo_seg']}s")
+
+
+async def detener_tareas():
+    for tarea in _tareas.values():
+        if tarea["task"] is not None:
+            tarea["task"].cancel()
+            try:
+                await tarea["task"]
+            except (asyncio.CancelledError, Exception):
+                pass
+            tarea["task"] = None
+
+
+def estado_tareas():
+    return [
+        {k: v for k, v in t.items() if k not in ("fn", "task")} | {"activa": t["task"] is not None}
+        for t in _tareas.values()
+    ]
@@ -0,0 +1,89 @@
+"""
+Benchmark de serialización: jsonable_encoder + json.dumps (camino por defecto de
+FastAPI) vs FastJSONResponse (orjson), y tamaño del payload con/sin gzip.
+
+Genera filas sintéticas con la forma de /api/inventario?all=true y de la matriz
+(Decimal, datetime, date, JSONB anidado). Uso:
+
+    cd backend && python scripts/benchmark_json_response.py [n_filas]
+"""
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'postgres://bench')
+
+from fastapi.encoders import jsonable_encoder
+from fast_json import dumps, GZIP_COMPRESS_LEVEL
+
+
+def fila_inventario(i):
+    ahora = datetime(2026, 1, 1, 8, 30) + timedelta(minutes=i)
+    return {
+        "id": str(uuid.uuid4()),
+        "codigo": f"TEL-{i:05d}",
+        "nombre": f"Tela denim 14oz lote {i}",
+        "categoria": "Telas",
+        "unidad_medida": "metro",
+        "stock_actual": Decimal("1520.5000") + i,
+        "stock_minimo": 100,
+        "total_reservado": Decimal("320.2500"),
+        "valorizado": Decimal("18250.7750"),
+        "created_at": ahora,
+        "fecha": ahora.date(),
+    }
+
+
+def fila_matriz(i):
+    return {
+        "id": str(uuid.uuid4()),
+        "n_corte": f"{i:04d}",
+        "estado": "Costura",
+        "prendas": 1200 + i,
+        "fecha_entrega": date(2026, 3, 1),
+        "curva_detalle": [{"talla": t, "cantidad": 100} for t in ("28", "30", "32", "34", "36")],
+        "colores": [
+            {"color": c, "color_general": "Azul", "cantidad": Decimal("240")}
+            for c in ("Celeste", "Indigo", "Stone")
+        ],
+    }
+
+
+def medir(nombre, fn, payload, repeticiones=5):
+    mejor = None
+    data = b""
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        data = fn(payload)
+        dt = time.perf_counter() - t0
+        mejor = dt if mejor is None else min(mejor, dt)
+    comprimido = gzip.compress(data, compresslevel=GZIP_COMPRESS_LEVEL)
+    print(f"  {nombre:<28} {mejor * 1000:9.1f} ms  {len(data) / 1024:9.1f} KB  gzip {len(comprimido) / 1024:8.1f} KB")
+    return mejor
+
+
+def camino_fastapi(payload):
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    casos = {
+        "inventario?all=true": [fila_inventario(i) for i in range(n)],
+        "matriz (detalle)": {"filas": [{"detalle": [fila_matriz(i) for i in range(n // 10)]} for _ in range(10)]},
+    }
+    for nombre, payload in casos.items():
+        print(f"{nombre} ({n} filas)")
+        base = medir("jsonable_encoder+json", camino_fastapi, payload)
+        rapido = medir("FastJSONResponse (orjson)", dumps, payload)
+        print(f"  speedup x{base / rapido:.1f}")
+
+
+if __name__ == "__main__":
+    main()
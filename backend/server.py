@@ -47,6 +47,27 @@ from routes.auditoria import router as auditoria_router, init_audit_tables
 from routes.conversacion import router as conversacion_router
 from routes.distribucion_pt import router as distribucion_pt_router, init_distribucion_pt_tables
 from routes.kardex_pt import router as kardex_pt_router
+from routes.busqueda import router as busqueda_router, init_busqueda_indexes
+from routes.jobs import router as jobs_router
+from routes.registro_bundle import router as registro_bundle_router
+from routes.alertas import router as alertas_router
+from routes.archivo import router as archivo_router
+from fast_json import FastJSONResponse, add_gzip_middleware
+from helpers import recalcular_agregados_inventario, recalcular_wip_resumen
+from routes.inventario_main import tarea_reconciliar_reservas
+from routes.ordenes import tarea_verificar_resumen_wip
+from scheduler import registrar_tarea_periodica, iniciar_tareas, detener_tareas
+from matriz_cubo import init_matriz_cubo_tables, asegurar_cubo, tarea_reconstruir_cubo
+from pdf_render import cerrar_pdf_executor
+from coalescer import InvalidacionEscrituras
+from idempotencia import IdempotenciaMiddleware, init_idempotencia_tables, tarea_limpiar_idempotencia
+from jobs import init_jobs_tables, iniciar_jobs, detener_jobs, tarea_limpiar_jobs
+from alertas_stream import init_alertas_stream_tables, iniciar_alertas_stream, detener_alertas_stream
+from tarifas_persona import init_tarifas_persona_tables
+from alertas_motor import (
+    ALERTAS_REEVALUAR_MIN, init_alertas_tables, tarea_reevaluar_alertas, iniciar_motor_alertas, detener_motor_alertas,
+)
+from archivo_lotes import init_archivo_tables, tarea_archivar_lotes
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -59,6 +80,15 @@ SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'tu-clave-secreta-muy-segura-cambi
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 8760  # 1 año - uso interno, sin expiración práctica
 
+# Tareas periódicas (0 = deshabilitada)
+RECONCILIAR_RESERVAS_INTERVALO_MIN = float(os.environ.get('RECONCILIAR_RESERVAS_INTERVALO_MIN', '60'))
+MATRIZ_CUBO_RECONSTRUIR_HORAS = float(os.environ.get('MATRIZ_CUBO_RECONSTRUIR_HORAS', '24'))
+WIP_RESUMEN_VERIFICAR_HORAS = float(os.environ.get('WIP_RESUMEN_VERIFICAR_HORAS', '24'))
+JOBS_LIMPIAR_INTERVALO_HORAS = float(os.environ.get('JOBS_LIMPIAR_INTERVALO_HORAS', '6'))
+IDEMPOTENCIA_LIMPIAR_INTERVALO_HORAS = float(os.environ.get('IDEMPOTENCIA_LIMPIAR_INTERVALO_HORAS', '1'))
+# El archivo de lotes cerrados mueve datos: deshabilitado salvo que se configure
+ARCHIVO_INTERVALO_HORAS = float(os.environ.get('ARCHIVO_INTERVALO_HORAS', '0'))
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -344,9 +374,41 @@ async def ensure_fase2_tables():
         await conn.execute("ALTER TABLE prod_modelos ADD COLUMN IF NOT EXISTS muestra_modelo_id VARCHAR NULL")
         await conn.execute("ALTER TABLE prod_modelos ADD COLUMN IF NOT EXISTS muestra_base_id VARCHAR NULL")
 
+        # 9) Agregados mantenidos de inventario (reservado, valorizado, stock en capas FIFO)
+        await conn.execute("ALTER TABLE prod_inventario ADD COLUMN IF NOT EXISTS stock_reservado NUMERIC(14,4) DEFAULT 0")
+        await conn.execute("ALTER TABLE prod_inventario ADD COLUMN IF NOT EXISTS valor_inventario NUMERIC(16,4) DEFAULT 0")
+        await conn.execute("ALTER TABLE prod_inventario ADD COLUMN IF NOT EXISTS stock_capas NUMERIC(14,4) DEFAULT 0")
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ingresos_item_disponible ON prod_inventario_ingresos(item_id) WHERE cantidad_disponible > 0"
+        )
+        await recalcular_agregados_inventario(conn)
+
+        # 10) Resumen WIP mantenido por orden (reemplaza la vista v_wip_resumen)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS prod_wip_resumen (
+                orden_id VARCHAR PRIMARY KEY,
+                costo_mp NUMERIC(18,2) NOT NULL DEFAULT 0,
+                costo_servicio NUMERIC(18,2) NOT NULL DEFAULT 0,
+                costo_ajuste NUMERIC(18,2) NOT NULL DEFAULT 0,
+                costo_total NUMERIC(18,2) NOT NULL DEFAULT 0,
+                total_movimientos INT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await recalcular_wip_resumen(conn)
+
+        # 11) Snapshot de costos por registro (preview-cierre, cierre y balance PDF)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS prod_registro_costo_snapshot (
+                registro_id VARCHAR PRIMARY KEY,
+                datos JSONB NOT NULL,
+                generado_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Handler global para desconexiones de BD remota
 @app.exception_handler(asyncpg.exceptions.ConnectionDoesNotExistError)
@@ -1068,6 +1130,8 @@ async def startup():
     await init_audit_tables()
     # Tablas de distribucion PT y conciliacion Odoo
     await init_distribucion_pt_tables()
+    # Índices trigram para búsqueda (pg_trgm)
+    await init_busqueda_indexes()
     # Indices de performance para queries frecuentes
     pool2 = await get_pool()
     async with pool2.acquire() as conn:
@@ -1091,13 +1155,47 @@ async def startup():
                 await conn.execute(idx_sql)
             except Exception:
                 pass
+        # Cubo de la matriz de producción (se construye si está vacío)
+        await init_matriz_cubo_tables(conn)
+        await asegurar_cubo(conn)
+        # Jobs en segundo plano
+        await init_jobs_tables(conn)
+        # Claves de idempotencia de POSTs de inventario/producción
+        await init_idempotencia_tables(conn)
+        # Tarifas persona-servicio normalizadas (se reconstruyen desde el JSONB de personas)
+        await init_tarifas_persona_tables(conn)
+        # Alertas precalculadas (producción, tiempos muertos, stock, paralizaciones)
+        await init_alertas_tables(conn)
+        # Tickets de un solo uso del stream SSE de alertas
+        await init_alertas_stream_tables(conn)
+        # Tablas de archivo de lotes cerrados y vistas <tabla>_con_archivo
+        await init_archivo_tables(conn)
+    # Tareas periódicas en segundo plano
+    registrar_tarea_periodica("reconciliar_reservas", RECONCILIAR_RESERVAS_INTERVALO_MIN * 60, tarea_reconciliar_reservas)
+    registrar_tarea_periodica("reconstruir_cubo_matriz", MATRIZ_CUBO_RECONSTRUIR_HORAS * 3600, tarea_reconstruir_cubo)
+    registrar_tarea_periodica("verificar_resumen_wip", WIP_RESUMEN_VERIFICAR_HORAS * 3600, tarea_verificar_resumen_wip)
+    registrar_tarea_periodica("limpiar_jobs", JOBS_LIMPIAR_INTERVALO_HORAS * 3600, tarea_limpiar_jobs)
+    registrar_tarea_periodica("limpiar_idempotencia", IDEMPOTENCIA_LIMPIAR_INTERVALO_HORAS * 3600, tarea_limpiar_idempotencia)
+    registrar_tarea_periodica("reevaluar_alertas", ALERTAS_REEVALUAR_MIN * 60, tarea_reevaluar_alertas)
+    registrar_tarea_periodica("archivar_lotes", ARCHIVO_INTERVALO_HORAS * 3600, tarea_archivar_lotes)
+    await iniciar_tareas()
+    await iniciar_jobs()
+    await iniciar_motor_alertas()
+    await iniciar_alertas_stream()
 
 @app.on_event("shutdown")
 async def shutdown():
+    await detener_tareas()
+    await detener_jobs()
+    await detener_alertas_stream()
+    await detener_motor_alertas()
+    cerrar_pdf_executor()
     await close_pool()
 
 # ==================== CORS & ROUTER ====================
 
+# Idempotencia va por dentro de CORS y gzip: repite el cuerpo sin comprimir y con headers CORS
+app.add_middleware(IdempotenciaMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -1105,6 +1203,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_gzip_middleware(app)
+app.add_middleware(InvalidacionEscrituras)
 
 app.include_router(inventario_main_router)
 app.include_router(catalogos_router)
@@ -1131,4 +1231,9 @@ app.include_router(transferencias_linea_router)
 app.include_router(auditoria_router)
 app.include_router(conversacion_router)
 app.include_router(distribucion_pt_router)
-app.include_router(kardex_pt_router)
\ No newline at end of file
+app.include_router(kardex_pt_router)
+app.include_router(busqueda_router)
+app.include_router(jobs_router)
+app.include_router(registro_bundle_router)
+app.include_router(alertas_router)
+app.include_router(archivo_router)
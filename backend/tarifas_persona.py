@@ -0,0 +1,121 @@
+"""Tarifas persona-servicio normalizadas.
+
+Las tarifas se editan dentro del JSONB `servicios` de prod_personas_produccion
+(lista de {"servicio_id", "tarifa"} o, en datos antiguos, solo el id). Aquí se
+mantiene una copia indexada, prod_persona_servicio_tarifa, para que los
+reportes la usen en un JOIN y los movimientos no recorran el JSON en cada
+escritura; más un mapa en memoria (persona_id, servicio_id) -> tarifa para
+lecturas.
+
+El CRUD de personas en catalogos.py llama a `sincronizar_tarifas` en la misma
+transacción que guarda el JSONB. Al iniciar se reconstruye la tabla completa
+(cubre restauraciones de backup y datos escritos por fuera de la API). Con
+varios workers, el mapa de los demás queda acotado por TARIFAS_CACHE_TTL_SEG,
+por eso las escrituras (costo_calculado se persiste) consultan la tabla por PK
+con `tarifa_persona_servicio` / `tarifas_de` y no usan el mapa.
+"""
+import os
+import time
+
+TARIFAS_CACHE_TTL_SEG = float(os.environ.get('TARIFAS_CACHE_TTL_SEG', '60'))
+
+_mapa = {"expira": 0.0, "tarifas": {}}
+_metricas = {"hits": 0, "cargas": 0, "sincronizaciones": 0, "invalidaciones": 0}
+
+# Primer elemento por (persona, servicio), igual que el recorrido del JSON que reemplaza
+_SINCRONIZAR_SQL = """
+    INSERT INTO prod_persona_servicio_tarifa (persona_id, servicio_id, tarifa, orden)
+    SELECT DISTINCT ON (p.id, x.servicio_id) p.id, x.servicio_id, x.tarifa, e.orden
+    FROM prod_personas_produccion p
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(p.servicios::jsonb) = 'array' THEN p.servicios::jsonb ELSE '[]'::jsonb END
+    ) WITH ORDINALITY AS e(valor, orden)
+    CROSS JOIN LATERAL (
+        SELECT
+            CASE WHEN jsonb_typeof(e.valor) = 'string' THEN e.valor #>> '{}' ELSE e.valor->>'servicio_id' END as servicio_id,
+            CASE WHEN jsonb_typeof(e.valor->'tarifa') = 'number' THEN (e.valor->>'tarifa')::numeric ELSE 0 END as tarifa
+    ) x
+    WHERE x.servicio_id IS NOT NULL AND ($1::varchar[] IS NULL OR p.id = ANY($1::varchar[]))
+    ORDER BY p.id, x.servicio_id, e.orden
+"""
+
+
+async def init_tarifas_persona_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS prod_persona_servicio_tarifa (
+            persona_id VARCHAR NOT NULL,
+            servicio_id VARCHAR NOT NULL,
+            tarifa NUMERIC NOT NULL DEFAULT 0,
+            orden INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (persona_id, servicio_id)
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_persona_servicio_tarifa_servicio ON prod_persona_servicio_tarifa(servicio_id, persona_id)"
+    )
+    async with conn.transaction():
+        await sincronizar_tarifas(conn)
+
+
+async def sincronizar_tarifas(conn, persona_ids=None):
+    """Reescribe las filas de las personas indicadas (todas si es None) desde su JSONB.
+
+    Llamar dentro de la transacción que modifica prod_personas_produccion.
+    """
+    ids = list(persona_ids) if persona_ids is not None else None
+    # Serializa sincronizaciones concurrentes (p.ej. varios workers iniciando a la vez)
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext('prod_persona_servicio_tarifa'))")
+    if ids is None:
+        await conn.execute("DELETE FROM prod_persona_servicio_tarifa")
+    else:
+        await conn.execute("DELETE FROM prod_persona_servicio_tarifa WHERE persona_id = ANY($1::varchar[])", ids)
+    await conn.execute(_SINCRONIZAR_SQL, ids)
+    _metricas["sincronizaciones"] += 1
+    invalidar_tarifas()
+
+
+async def mapa_tarifas(conn) -> dict:
+    """(persona_id, servicio_id) -> tarifa; solo contiene los servicios asignados a cada persona.
+
+    Cacheado por worker: solo para lecturas. Las escrituras usan `tarifas_de`.
+    """
+    ahora = time.monotonic()
+    if _mapa["expira"] > ahora:
+        _metricas["hits"] += 1
+        return _mapa["tarifas"]
+    rows = await conn.fetch("SELECT persona_id, servicio_id, tarifa FROM prod_persona_servicio_tarifa")
+    _mapa["tarifas"] = {(r['persona_id'], r['servicio_id']): float(r['tarifa']) for r in rows}
+    _mapa["expira"] = ahora + TARIFAS_CACHE_TTL_SEG
+    _metricas["cargas"] += 1
+    return _mapa["tarifas"]
+
+
+async def tarifa_persona_servicio(conn, persona_id: str, servicio_id: str) -> float:
+    """Tarifa vigente de la persona para el servicio (0 si no lo tiene asignado), leída por PK."""
+    tarifa = await conn.fetchval(
+        "SELECT tarifa FROM prod_persona_servicio_tarifa WHERE persona_id = $1 AND servicio_id = $2",
+        persona_id, servicio_id,
+    )
+    return 0 if tarifa is None else float(tarifa)
+
+
+async def tarifas_de(conn, pares) -> dict:
+    """(persona_id, servicio_id) -> tarifa vigente para los pares indicados, leída por PK."""
+    pares = list(set(pares))
+    if not pares:
+        return {}
+    rows = await conn.fetch("""
+        SELECT t.persona_id, t.servicio_id, t.tarifa
+        FROM unnest($1::varchar[], $2::varchar[]) AS x(persona_id, servicio_id)
+        JOIN prod_persona_servicio_tarifa t ON t.persona_id = x.persona_id AND t.servicio_id = x.servicio_id
+    """, [p for p, _ in pares], [s for _, s in pares])
+    return {(r['persona_id'], r['servicio_id']): float(r['tarifa']) for r in rows}
+
+
+def invalidar_tarifas():
+    _metricas["invalidaciones"] += 1
+    _mapa["expira"] = 0.0
+
+
+def estado_tarifas_cache() -> dict:
+    return {"tarifas": len(_mapa["tarifas"]), "ttl_seg": TARIFAS_CACHE_TTL_SEG, **_metricas}
@@ -0,0 +1,32 @@
+"""
+Shared fixtures for the integration tests
+auth_token logs in once per module against REACT_APP_BACKEND_URL; api_client
+is a requests session carrying that token. Modules that define their own
+fixtures with the same names keep using those.
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
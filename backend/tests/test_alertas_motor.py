@@ -0,0 +1,140 @@
+"""
+Test suite for the precomputed alert table
+Tests: the alert endpoints are served from prod_alertas, writes are visible on
+the next read, alerts carry primera_vez, and a lifted paralización leaves a
+resolved row in GET /api/alertas.
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+REGLAS = {"produccion", "tiempos_muertos", "stock_fisico", "stock_disponible", "paralizacion"}
+
+
+class TestAlertasMotor:
+
+    def test_estado_lista_reglas(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/alertas/estado", timeout=30)
+        assert response.status_code == 200, response.text
+        assert REGLAS <= set(response.json()["reglas"])
+
+    def test_alertas_produccion_desde_tabla(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes-produccion/alertas-produccion", timeout=60)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["resumen"]["total"] == len(data["alertas"])
+        for a in data["alertas"]:
+            assert a["primera_vez"]
+            assert a["nivel"] in ("vencido", "critico") or a["paralizado"]
+
+        tabla = api_client.get(f"{BASE_URL}/api/alertas", params={"tipo": "produccion", "limit": 1}, timeout=30)
+        assert tabla.status_code == 200, tabla.text
+        assert tabla.json()["total"] == data["resumen"]["total"]
+
+    def test_tiempos_muertos_resumen(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes-produccion/tiempos-muertos", timeout=60)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert all(i["en_espera"] for i in data["items"])
+        assert data["resumen"]["en_espera"] == data["resumen"]["total"] == len(data["items"])
+
+    def test_estado_invalido(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/alertas", params={"estado": "otra"}, timeout=30)
+        assert response.status_code == 400
+
+    def test_filtro_fechas(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/alertas", params={
+            "estado": "todas", "desde": "2000-01-01", "hasta": "2999-12-31"}, timeout=30)
+        assert response.status_code == 200, response.text
+        todas = api_client.get(f"{BASE_URL}/api/alertas", params={"estado": "todas"}, timeout=30).json()
+        assert response.json()["total"] == todas["total"]
+
+    def test_filtro_fecha_invalida(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/alertas", params={"desde": "ayer"}, timeout=30)
+        assert response.status_code == 422
+
+    def test_ignorar_alerta_stock_visible_al_leer(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/inventario/alertas-stock?incluir_ignorados=true", timeout=30)
+        assert response.status_code == 200, response.text
+        items = [i for i in response.json()["items"] if not i["ignorar_alerta_stock"]]
+        if not items:
+            pytest.skip("No non-ignored stock alerts to toggle")
+        item_id = items[0]["id"]
+
+        toggle = api_client.put(f"{BASE_URL}/api/inventario/{item_id}/ignorar-alerta", timeout=30)
+        assert toggle.status_code == 200, toggle.text
+        try:
+            visibles = api_client.get(f"{BASE_URL}/api/inventario/alertas-stock", timeout=30).json()["items"]
+            assert item_id not in [i["id"] for i in visibles]
+        finally:
+            api_client.put(f"{BASE_URL}/api/inventario/{item_id}/ignorar-alerta", timeout=30)
+
+
+class TestHistorialParalizacion:
+
+    @pytest.fixture
+    def incidencia(self, api_client):
+        motivos = api_client.get(f"{BASE_URL}/api/motivos-incidencia", timeout=30).json()
+        if not motivos:
+            pytest.skip("No motivos de incidencia")
+        activas = api_client.get(f"{BASE_URL}/api/reportes/paralizados?solo_activas=true", timeout=60).json()
+        paralizados = {p["registro_id"] for p in activas["paralizaciones"]}
+        movs = api_client.get(f"{BASE_URL}/api/movimientos-produccion", params={"all": "true"}, timeout=60).json()
+        registro_id = next((m["registro_id"] for m in movs if m["registro_id"] not in paralizados), None)
+        if not registro_id:
+            pytest.skip("No registro without an active paralización")
+        response = api_client.post(f"{BASE_URL}/api/incidencias", json={
+            "registro_id": registro_id, "motivo_id": motivos[0]["id"],
+            "comentario": "TEST_ALERTAS_MOTOR", "paraliza": True,
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        yield data
+        api_client.delete(f"{BASE_URL}/api/incidencias/{data['id']}", timeout=30)
+
+    def test_paralizacion_abre_y_resuelve_alerta(self, api_client, incidencia):
+        registro_id = incidencia["registro_id"]
+        paralizacion_id = incidencia["paralizacion_id"]
+
+        reporte = api_client.get(f"{BASE_URL}/api/reportes/paralizados?solo_activas=true", timeout=60).json()
+        assert paralizacion_id in [p["id"] for p in reporte["paralizaciones"]]
+        abiertas = api_client.get(f"{BASE_URL}/api/alertas", params={
+            "tipo": "paralizacion", "registro_id": registro_id,
+        }, timeout=30).json()["items"]
+        assert [a["clave"] for a in abiertas] == [paralizacion_id]
+        assert abiertas[0]["resuelta_en"] is None
+
+        response = api_client.put(f"{BASE_URL}/api/paralizaciones/{paralizacion_id}/levantar", timeout=30)
+        assert response.status_code == 200, response.text
+
+        reporte = api_client.get(f"{BASE_URL}/api/reportes/paralizados?solo_activas=true", timeout=60).json()
+        assert paralizacion_id not in [p["id"] for p in reporte["paralizaciones"]]
+        resueltas = api_client.get(f"{BASE_URL}/api/alertas", params={
+            "tipo": "paralizacion", "registro_id": registro_id, "estado": "resueltas",
+        }, timeout=30).json()["items"]
+        resuelta = next(a for a in resueltas if a["clave"] == paralizacion_id)
+        assert resuelta["resuelta_en"] and resuelta["primera_vez"] <= resuelta["resuelta_en"]
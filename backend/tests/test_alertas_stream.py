@@ -0,0 +1,110 @@
+"""
+Test suite for the Server-Sent Events alert stream
+Tests: auth via single-use ?ticket= (a JWT in the URL is rejected), initial
+snapshot matches /alertas-produccion, the stream is not gzip-compressed, and
+the stream status endpoint counts subscribers.
+"""
+import json
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+STREAM_URL = f"{BASE_URL}/api/reportes-produccion/alertas-produccion/stream"
+
+
+def _ticket(api_client):
+    response = api_client.post(f"{STREAM_URL}/ticket", timeout=30)
+    assert response.status_code == 200, response.text
+    return response.json()["ticket"]
+
+
+def _primer_evento(response):
+    """(evento, data) del primer evento SSE de la respuesta."""
+    evento, data = None, None
+    for linea in response.iter_lines(decode_unicode=True):
+        if linea.startswith("event: "):
+            evento = linea[len("event: "):]
+        elif linea.startswith("data: "):
+            data = json.loads(linea[len("data: "):])
+        elif linea == "" and evento:
+            return evento, data
+    return evento, data
+
+
+class TestAlertasStream:
+
+    def test_requires_token(self):
+        response = requests.get(STREAM_URL, timeout=30)
+        assert response.status_code == 401
+
+    def test_jwt_in_query_rejected(self, auth_token):
+        response = requests.get(STREAM_URL, params={"token": auth_token}, timeout=30)
+        assert response.status_code == 401
+
+    def test_ticket_single_use(self, api_client):
+        ticket = _ticket(api_client)
+        with requests.get(STREAM_URL, params={"ticket": ticket}, stream=True, timeout=60,
+                          headers={"Accept": "text/event-stream"}) as response:
+            assert response.status_code == 200
+            _primer_evento(response)
+        again = requests.get(STREAM_URL, params={"ticket": ticket}, timeout=30)
+        assert again.status_code == 401
+
+    def test_authorization_header(self, auth_token):
+        with requests.get(STREAM_URL, stream=True, timeout=60,
+                          headers={"Accept": "text/event-stream", "Authorization": f"Bearer {auth_token}"}) as response:
+            assert response.status_code == 200
+            evento, _ = _primer_evento(response)
+        assert evento == "snapshot"
+
+    def test_invalid_ticket(self):
+        response = requests.get(STREAM_URL, params={"ticket": "no-existe"}, timeout=30)
+        assert response.status_code == 401
+
+    def test_snapshot(self, api_client):
+        with requests.get(STREAM_URL, params={"ticket": _ticket(api_client)}, stream=True, timeout=60,
+                          headers={"Accept": "text/event-stream", "Accept-Encoding": "gzip"}) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            assert "content-encoding" not in response.headers
+            evento, data = _primer_evento(response)
+        assert evento == "snapshot"
+        assert set(data) == {"version", "alertas", "resumen"}
+        actual = api_client.get(f"{BASE_URL}/api/reportes-produccion/alertas-produccion", timeout=60).json()
+        assert data["resumen"]["total"] == len(data["alertas"])
+        assert {a["movimiento_id"] for a in data["alertas"]} == {a["movimiento_id"] for a in actual["alertas"]}
+
+    def test_estado_counts_subscribers(self, api_client):
+        with requests.get(STREAM_URL, params={"ticket": _ticket(api_client)}, stream=True, timeout=60,
+                          headers={"Accept": "text/event-stream"}) as response:
+            _primer_evento(response)
+            estado = api_client.get(f"{BASE_URL}/api/reportes-produccion/alertas-produccion/stream/estado", timeout=30)
+            assert estado.status_code == 200
+            data = estado.json()
+            # Con varios workers la conexión puede estar en otro proceso
+            for key in ("suscriptores", "version", "calculos", "diffs_enviados", "tick_seg"):
+                assert key in data
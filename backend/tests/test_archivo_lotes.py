@@ -0,0 +1,119 @@
+"""
+Test suite for archiving closed lots
+Tests: archive status per table, dry runs that move nothing, an archive/restore
+round trip of one closed lot, unknown ids on restore, and reports that opt in
+to archived lots with incluir_archivo (and the dashboard, which ignores it).
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+def _solo_admin(response):
+    if response.status_code == 403:
+        pytest.skip("Test user is not admin")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+class TestArchivoLotes:
+
+    def test_estado_archivo(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/archivo/estado", timeout=60)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["meses"] >= 0
+        assert data["archivables"] >= 0
+        tablas = {t["tabla"]: t for t in data["tablas"]}
+        assert "prod_registros" in tablas
+        assert "prod_movimientos_produccion" in tablas
+        assert "prod_registro_pt_relacion" in tablas
+        assert "prod_registro_pt_odoo_vinculo" in tablas
+
+    def test_dry_run_no_mueve(self, api_client):
+        antes = api_client.get(f"{BASE_URL}/api/archivo/estado", timeout=60).json()
+        data = _solo_admin(api_client.post(f"{BASE_URL}/api/archivo/archivar", json={"dry_run": True, "limite": 5}, timeout=120))
+        assert data["dry_run"] is True
+        assert data["lotes"] == len(data["registro_ids"]) <= 5
+        despues = api_client.get(f"{BASE_URL}/api/archivo/estado", timeout=60).json()
+        assert despues["lotes_archivados"] == antes["lotes_archivados"]
+
+    def test_archivar_y_restaurar(self, api_client):
+        candidatos = _solo_admin(api_client.post(f"{BASE_URL}/api/archivo/archivar",
+                                                 json={"dry_run": True, "limite": 1, "meses": 0}, timeout=120))
+        if not candidatos["registro_ids"]:
+            pytest.skip("No closed lots to archive")
+        rid = candidatos["registro_ids"][0]
+
+        archivado = api_client.post(f"{BASE_URL}/api/archivo/archivar", json={"registro_ids": [rid], "meses": 0}, timeout=120)
+        assert archivado.status_code == 200, archivado.text
+        assert archivado.json()["registro_ids"] == [rid]
+        try:
+            lotes = api_client.get(f"{BASE_URL}/api/archivo/lotes", params={"limit": 500}, timeout=30)
+            assert lotes.status_code == 200, lotes.text
+            assert rid in {l["registro_id"] for l in lotes.json()["items"]}
+
+            sin = api_client.get(f"{BASE_URL}/api/reportes-produccion/balance-terceros", timeout=60).json()
+            con = api_client.get(f"{BASE_URL}/api/reportes-produccion/balance-terceros",
+                                 params={"incluir_archivo": "true"}, timeout=60).json()
+            assert sum(b["movimientos"] for b in con["balance"]) >= sum(b["movimientos"] for b in sin["balance"])
+        finally:
+            restaurado = api_client.post(f"{BASE_URL}/api/archivo/restaurar", json={"registro_ids": [rid]}, timeout=120)
+        assert restaurado.status_code == 200, restaurado.text
+        assert restaurado.json()["registro_ids"] == [rid]
+        assert restaurado.json()["no_encontrados"] == []
+
+    def test_restaurar_id_desconocido(self, api_client):
+        data = _solo_admin(api_client.post(f"{BASE_URL}/api/archivo/restaurar",
+                                           json={"registro_ids": ["no-existe-123"]}, timeout=60))
+        assert data["lotes"] == 0
+        assert data["no_encontrados"] == ["no-existe-123"]
+
+    def test_restaurar_requiere_ids(self, api_client):
+        response = api_client.post(f"{BASE_URL}/api/archivo/restaurar", json={"registro_ids": []}, timeout=30)
+        assert response.status_code == 422
+
+    def test_productividad_incluir_archivo(self, api_client):
+        sin = api_client.get(f"{BASE_URL}/api/reportes/productividad", timeout=60)
+        con = api_client.get(f"{BASE_URL}/api/reportes/productividad", params={"incluir_archivo": "true"}, timeout=60)
+        assert sin.status_code == 200, sin.text
+        assert con.status_code == 200, con.text
+        assert con.json()["total_movimientos"] >= sin.json()["total_movimientos"]
+
+    @pytest.mark.parametrize("params", [{}, {"incluir_archivo": "true"}])
+    def test_dashboard_kpis(self, api_client, params):
+        # Dashboard KPIs only cover open lots, which are never archived
+        response = api_client.get(f"{BASE_URL}/api/reportes-produccion/dashboard", params=params, timeout=60)
+        assert response.status_code == 200, response.text
+        assert isinstance(response.json()["por_servicio"], list)
+
+    def test_balance_terceros_incluir_archivo(self, api_client):
+        sin = api_client.get(f"{BASE_URL}/api/reportes-produccion/balance-terceros", timeout=60)
+        con = api_client.get(f"{BASE_URL}/api/reportes-produccion/balance-terceros",
+                             params={"incluir_archivo": "true"}, timeout=60)
+        assert sin.status_code == 200, sin.text
+        assert con.status_code == 200, con.text
+        assert con.json()["total"] >= sin.json()["total"]
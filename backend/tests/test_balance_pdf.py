@@ -0,0 +1,82 @@
+"""
+Test suite for off-loop balance PDF rendering
+Tests: re-downloads are served from the content-addressed cache, the batch
+mode returns one PDF per registro inside a ZIP, and pool metrics are exposed
+"""
+import io
+import zipfile
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+@pytest.fixture
+def registros(api_client):
+    response = api_client.get(f"{BASE_URL}/api/registros", params={"limit": 3, "excluir_estados": ""}, timeout=60)
+    items = response.json().get("items", [])
+    if not items:
+        pytest.skip("No registros available")
+    return items
+
+
+class TestBalancePdf:
+
+    def test_redownload_hits_cache(self, api_client, registros):
+        url = f"{BASE_URL}/api/registros/{registros[0]['id']}/balance-pdf"
+        first = api_client.get(url, timeout=120)
+        assert first.status_code == 200
+        assert first.headers["content-type"] == "application/pdf"
+        before = api_client.get(f"{BASE_URL}/api/pdf/estado", timeout=30).json()
+        second = api_client.get(url, timeout=120)
+        after = api_client.get(f"{BASE_URL}/api/pdf/estado", timeout=30).json()
+        assert second.content == first.content
+        assert after["hits"] == before["hits"] + 1
+        assert after["renders"] == before["renders"]
+
+    def test_not_found(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/registros/{uuid.uuid4()}/balance-pdf", timeout=30)
+        assert response.status_code == 404
+
+
+class TestBalancePdfLote:
+
+    def test_zip_contains_one_pdf_per_registro(self, api_client, registros):
+        ids = [r["id"] for r in registros] + [str(uuid.uuid4())]
+        response = api_client.post(f"{BASE_URL}/api/registros/balance-pdf/lote",
+                                   json={"registro_ids": ids}, timeout=300)
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+            nombres = zf.namelist()
+            assert len(nombres) == len(registros)
+            for nombre in nombres:
+                assert zf.read(nombre)[:4] == b"%PDF"
+
+    def test_all_unknown_is_404(self, api_client):
+        response = api_client.post(f"{BASE_URL}/api/registros/balance-pdf/lote",
+                                   json={"registro_ids": [str(uuid.uuid4())]}, timeout=30)
+        assert response.status_code == 404
@@ -0,0 +1,115 @@
+"""
+Test suite for the unified trigram search
+Tests: /api/search returns ranked hits across registros, modelos, inventario
+and rollos; list endpoints keep matching with the shared predicates
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+@pytest.fixture
+def test_item(api_client):
+    codigo = f"TEST-BUSQ-{uuid.uuid4().hex[:6].upper()}"
+    response = api_client.post(f"{BASE_URL}/api/inventario", json={
+        "codigo": codigo,
+        "nombre": f"Hilo busqueda {codigo}",
+        "categoria": "Otros",
+        "unidad_medida": "unidad",
+        "stock_minimo": 0,
+        "control_por_rollos": False,
+    }, timeout=30)
+    assert response.status_code == 200, response.text
+    item = response.json()
+    yield item
+    api_client.delete(f"{BASE_URL}/api/inventario/{item['id']}", timeout=30)
+
+
+class TestUnifiedSearch:
+
+    def test_exact_code_ranks_first(self, api_client, test_item):
+        response = api_client.get(f"{BASE_URL}/api/search", params={"q": test_item["codigo"]}, timeout=30)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["resultados"], "Expected at least one hit"
+        top = data["resultados"][0]
+        assert top["tipo"] == "inventario"
+        assert top["id"] == test_item["id"]
+        scores = [r["score"] for r in data["resultados"]]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_tipos_filter(self, api_client, test_item):
+        response = api_client.get(f"{BASE_URL}/api/search",
+                                  params={"q": test_item["codigo"], "tipos": "modelos,rollos"}, timeout=30)
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data["por_tipo"]) == {"modelos", "rollos"}
+        assert all(r["tipo"] in ("modelos", "rollos") for r in data["resultados"])
+
+    def test_short_term_returns_empty(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/search", params={"q": "a"}, timeout=30)
+        assert response.status_code == 200
+        assert response.json()["resultados"] == []
+
+    def test_wildcards_are_literal(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/search", params={"q": "%%"}, timeout=30)
+        assert response.status_code == 200
+        for r in response.json()["resultados"]:
+            assert "%" in (r["titulo"] or "") + (r["subtitulo"] or "")
+
+    def test_requires_auth(self):
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "test"}, timeout=30)
+        assert response.status_code in (401, 403)
+
+
+class TestListEndpointsSharedPredicates:
+
+    def test_inventario_search(self, api_client, test_item):
+        response = api_client.get(f"{BASE_URL}/api/inventario", params={"search": test_item["codigo"]}, timeout=30)
+        assert response.status_code == 200
+        assert any(i["id"] == test_item["id"] for i in response.json()["items"])
+
+    def test_registros_search(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/registros", params={"limit": 1}, timeout=30)
+        items = response.json()["items"]
+        if not items:
+            pytest.skip("No registros available")
+        n_corte = items[0]["n_corte"]
+        response = api_client.get(f"{BASE_URL}/api/registros",
+                                  params={"search": n_corte, "excluir_estados": ""}, timeout=30)
+        assert response.status_code == 200
+        assert any(r["n_corte"] == n_corte for r in response.json()["items"])
+
+    def test_modelos_search(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/modelos", params={"limit": 1}, timeout=30)
+        items = response.json().get("items", [])
+        if not items:
+            pytest.skip("No modelos available")
+        nombre = items[0]["nombre"]
+        response = api_client.get(f"{BASE_URL}/api/modelos", params={"search": nombre}, timeout=30)
+        assert response.status_code == 200
+        assert any(m["nombre"] == nombre for m in response.json()["items"])
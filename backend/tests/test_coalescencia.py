@@ -0,0 +1,98 @@
+"""
+Test suite for single-flight coalescing of expensive production reports
+Tests: concurrent identical requests share one computation, responses match
+the uncoalesced payload, and a local write invalidates the cached result
+"""
+import pytest
+import requests
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+def _estado(api_client, ruta):
+    response = api_client.get(f"{BASE_URL}/api/reportes-produccion/coalescencia/estado", timeout=30)
+    assert response.status_code == 200, response.text
+    return next(r for r in response.json()["rutas"] if r["nombre"] == ruta)
+
+
+class TestCoalescencia:
+
+    def test_concurrent_requests_share_work(self, auth_token):
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        url = f"{BASE_URL}/api/reportes-produccion/dashboard"
+
+        def pedir(_):
+            return requests.get(url, headers=headers, timeout=60)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            respuestas = list(pool.map(pedir, range(8)))
+        assert all(r.status_code == 200 for r in respuestas)
+        cuerpos = {r.content for r in respuestas}
+        assert len(cuerpos) <= 2, "Concurrent identical requests should get the same payload"
+
+    def test_metrics_count_hits(self, api_client):
+        antes = _estado(api_client, "alertas_produccion")
+        for _ in range(3):
+            response = api_client.get(f"{BASE_URL}/api/reportes-produccion/alertas-produccion", timeout=60)
+            assert response.status_code == 200
+        despues = _estado(api_client, "alertas_produccion")
+        assert despues["solicitudes"] >= antes["solicitudes"] + 3
+        assert despues["hits"] + despues["compartidos"] > antes["hits"] + antes["compartidos"]
+        assert 0 <= despues["tasa_ahorro"] <= 1
+
+    def test_params_are_part_of_key(self, api_client):
+        url = f"{BASE_URL}/api/reportes-produccion/matriz"
+        activos = api_client.get(url, params={"solo_activos": "true"}, timeout=60)
+        todos = api_client.get(url, params={"solo_activos": "false"}, timeout=60)
+        assert activos.status_code == 200 and todos.status_code == 200
+        assert todos.json()["total_general"]["registros"] >= activos.json()["total_general"]["registros"]
+
+    def test_write_invalidates(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/modelos?limit=1", timeout=30)
+        if response.status_code != 200 or not response.json().get("items"):
+            pytest.skip("No modelos available for test")
+        modelo = response.json()["items"][0]
+        url = f"{BASE_URL}/api/reportes-produccion/matriz"
+        before = api_client.get(url, params={"modelo_id": modelo["id"], "solo_activos": "false"}, timeout=60).json()
+        response = api_client.post(f"{BASE_URL}/api/registros", json={
+            "n_corte": f"TEST-COAL-{uuid.uuid4().hex[:6].upper()}",
+            "modelo_id": modelo["id"],
+            "curva": "",
+            "estado": "Para Corte",
+            "urgente": False,
+            "tallas": [],
+            "distribucion_colores": [],
+            "linea_negocio_id": modelo.get("linea_negocio_id"),
+            "empresa_id": 7,
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        registro_id = response.json()["id"]
+        try:
+            after = api_client.get(url, params={"modelo_id": modelo["id"], "solo_activos": "false"}, timeout=60).json()
+            assert after["total_general"]["registros"] == before["total_general"]["registros"] + 1
+        finally:
+            api_client.delete(f"{BASE_URL}/api/registros/{registro_id}", timeout=30)
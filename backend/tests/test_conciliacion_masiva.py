@@ -0,0 +1,87 @@
+"""
+Test suite for the cross-registro Odoo conciliación
+Tests: /api/conciliacion-odoo matches the per-registro conciliación, filters and
+pages by estado, and is served from cache until distribución/vínculos change
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Registro con tallas (total=400) y producto Odoo usados en test_distribucion_pt
+TEST_REGISTRO_ID = "4b5ef69c-192a-4ffb-87df-35e4ef5e4fcc"
+TEST_PRODUCT_1 = 1469
+
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+
+@pytest.fixture(scope="module")
+def auth_header(auth_token):
+    """Auth header for requests"""
+    return {"Authorization": f"Bearer {auth_token}"}
+
+
+@pytest.fixture
+def distribucion(auth_header):
+    response = requests.post(
+        f"{BASE_URL}/api/registros/{TEST_REGISTRO_ID}/distribucion-pt",
+        json={"lineas": [{"tipo_salida": "normal", "product_template_id_odoo": TEST_PRODUCT_1, "cantidad": 400}]},
+        headers=auth_header, timeout=30
+    )
+    if response.status_code != 200:
+        pytest.skip(f"No se pudo guardar distribución: {response.text}")
+    yield
+    requests.delete(f"{BASE_URL}/api/registros/{TEST_REGISTRO_ID}/distribucion-pt", headers=auth_header, timeout=30)
+
+
+def _buscar(auth_header, **params):
+    response = requests.get(f"{BASE_URL}/api/conciliacion-odoo", params={"limit": 500, **params},
+                            headers=auth_header, timeout=60)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+class TestConciliacionMasiva:
+
+    def test_matches_single_registro(self, auth_header, distribucion):
+        data = _buscar(auth_header)
+        fila = next((f for f in data["items"] if f["registro_id"] == TEST_REGISTRO_ID), None)
+        assert fila is not None
+        individual = requests.get(f"{BASE_URL}/api/registros/{TEST_REGISTRO_ID}/conciliacion-odoo",
+                                  headers=auth_header, timeout=30).json()
+        assert fila["estado"] == individual["estado"]
+        assert fila["total_esperado"] == pytest.approx(individual["total_esperado"])
+        assert fila["total_ingresado"] == pytest.approx(individual["total_ingresado"])
+
+    def test_cache_until_change(self, auth_header, distribucion):
+        _buscar(auth_header)
+        again = _buscar(auth_header)
+        assert again["desde_cache"] is True
+        requests.delete(f"{BASE_URL}/api/registros/{TEST_REGISTRO_ID}/distribucion-pt", headers=auth_header, timeout=30)
+        after = _buscar(auth_header)
+        assert after["desde_cache"] is False
+        assert all(f["registro_id"] != TEST_REGISTRO_ID for f in after["items"])
+
+    def test_filter_and_paging(self, auth_header):
+        data = _buscar(auth_header, estado="PENDIENTE,PARCIAL")
+        assert all(f["estado"] in ("PENDIENTE", "PARCIAL") for f in data["items"])
+        assert data["total"] == data["resumen"]["PENDIENTE"] + data["resumen"]["PARCIAL"]
+        page = _buscar(auth_header, estado="PENDIENTE,PARCIAL", limit=1, offset=0)
+        assert len(page["items"]) <= 1
+        assert page["total"] == data["total"]
+
+    def test_invalid_estado(self, auth_header):
+        response = requests.get(f"{BASE_URL}/api/conciliacion-odoo", params={"estado": "OTRO"},
+                                headers=auth_header, timeout=30)
+        assert response.status_code == 400
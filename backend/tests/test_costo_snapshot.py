@@ -0,0 +1,101 @@
+"""
+Test suite for the per-registro cost snapshot
+Tests: preview-cierre is stable across reads, writes to costos-servicio and
+mermas invalidate it, and balance-pdf / cierre endpoints keep working on it
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+@pytest.fixture
+def registro_abierto(api_client):
+    response = api_client.get(f"{BASE_URL}/api/registros", params={"limit": 20}, timeout=60)
+    for r in response.json().get("items", []):
+        if r.get("estado") in ("CERRADA", "ANULADA"):
+            continue
+        preview = api_client.get(f"{BASE_URL}/api/registros/{r['id']}/preview-cierre", timeout=60)
+        if preview.status_code == 200:
+            return r
+    pytest.skip("No open registro with preview available")
+
+
+def _preview(api_client, registro_id):
+    response = api_client.get(f"{BASE_URL}/api/registros/{registro_id}/preview-cierre", timeout=60)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+class TestCostoSnapshot:
+
+    def test_preview_stable(self, api_client, registro_abierto):
+        first = _preview(api_client, registro_abierto["id"])
+        second = _preview(api_client, registro_abierto["id"])
+        for key in ("costo_mp", "costo_servicios", "otros_costos", "costo_total_final", "merma_qty"):
+            assert first[key] == second[key]
+        assert first["salidas_mp_detalle"] == second["salidas_mp_detalle"]
+
+    def test_costo_servicio_invalidates(self, api_client, registro_abierto):
+        registro_id = registro_abierto["id"]
+        before = _preview(api_client, registro_id)
+        response = api_client.post(f"{BASE_URL}/api/registros/{registro_id}/costos-servicio",
+                                   json={"empresa_id": 7, "registro_id": registro_id,
+                                         "descripcion": "TEST snapshot", "monto": 12.5}, timeout=30)
+        assert response.status_code == 200, response.text
+        costo_id = response.json()["id"]
+        try:
+            after = _preview(api_client, registro_id)
+            assert after["otros_costos"] == pytest.approx(before["otros_costos"] + 12.5)
+            assert after["costo_total_final"] == pytest.approx(before["costo_total_final"] + 12.5)
+        finally:
+            api_client.delete(f"{BASE_URL}/api/registros/{registro_id}/costos-servicio/{costo_id}", timeout=30)
+        final = _preview(api_client, registro_id)
+        assert final["otros_costos"] == pytest.approx(before["otros_costos"])
+
+    def test_merma_invalidates(self, api_client, registro_abierto):
+        registro_id = registro_abierto["id"]
+        movs = api_client.get(f"{BASE_URL}/api/movimientos-produccion",
+                              params={"registro_id": registro_id}, timeout=30).json()["items"]
+        if not movs:
+            pytest.skip("Registro sin movimientos para asociar la merma")
+        mov = movs[0]
+        before = _preview(api_client, registro_id)
+        response = api_client.post(f"{BASE_URL}/api/mermas", json={
+            "registro_id": registro_id, "movimiento_id": mov["id"], "servicio_id": mov["servicio_id"],
+            "persona_id": mov["persona_id"], "cantidad": 3, "motivo": "TEST snapshot",
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        merma_id = response.json()["id"]
+        try:
+            assert _preview(api_client, registro_id)["merma_qty"] == pytest.approx(before["merma_qty"] + 3)
+        finally:
+            api_client.delete(f"{BASE_URL}/api/mermas/{merma_id}", timeout=30)
+        assert _preview(api_client, registro_id)["merma_qty"] == pytest.approx(before["merma_qty"])
+
+    def test_balance_pdf_from_snapshot(self, api_client, registro_abierto):
+        response = api_client.get(f"{BASE_URL}/api/registros/{registro_abierto['id']}/balance-pdf", timeout=60)
+        assert response.status_code == 200
+        assert response.content[:4] == b"%PDF"
@@ -0,0 +1,82 @@
+"""
+Test suite for the set-based cumplimiento-ruta report
+Tests: per-registro etapa counts are consistent, paging returns disjoint
+pages with a stable total, and solo_resumen matches the detailed report.
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+URL = f"{BASE_URL}/api/reportes-produccion/cumplimiento-ruta"
+
+
+class TestCumplimientoRuta:
+
+    def test_counts_consistent(self, api_client):
+        response = api_client.get(URL, timeout=120)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["total"] == len(data["registros"])
+        for r in data["registros"]:
+            etapas = r["detalle_etapas"]
+            assert r["total_etapas"] == len(etapas)
+            assert r["completadas"] == sum(1 for e in etapas if e["estado"] == "COMPLETADA")
+            assert r["en_curso"] == sum(1 for e in etapas if e["estado"] == "EN_CURSO")
+            assert r["pendientes"] == sum(1 for e in etapas if e["estado"] == "PENDIENTE")
+            esperado = round(r["completadas"] / r["total_etapas"] * 100, 1) if r["total_etapas"] else 0
+            assert r["pct_cumplimiento"] == esperado
+
+    def test_paging(self, api_client):
+        completo = api_client.get(URL, timeout=120).json()
+        if completo["total"] < 2:
+            pytest.skip("Not enough registros with ruta")
+        p1 = api_client.get(URL, params={"limit": 1, "offset": 0}, timeout=60).json()
+        p2 = api_client.get(URL, params={"limit": 1, "offset": 1}, timeout=60).json()
+        assert p1["total"] == p2["total"] == completo["total"]
+        assert p1["registros"][0]["id"] == completo["registros"][0]["id"]
+        assert p2["registros"][0]["id"] == completo["registros"][1]["id"]
+
+    def test_solo_resumen(self, api_client):
+        completo = api_client.get(URL, timeout=120).json()
+        response = api_client.get(URL, params={"solo_resumen": "true"}, timeout=60)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert "registros" not in data
+        resumen = data["resumen"]
+        assert resumen["total_registros"] == completo["total"]
+        assert resumen["completadas"] == sum(r["completadas"] for r in completo["registros"])
+        assert sum(r["registros"] for r in data["por_ruta"]) == completo["total"]
+        assert sum(e["completadas"] + e["en_curso"] + e["pendientes"] for e in data["por_etapa"]) == \
+            sum(r["total_etapas"] for r in completo["registros"])
+
+    def test_ruta_filter(self, api_client):
+        filtros = api_client.get(f"{BASE_URL}/api/reportes-produccion/filtros", timeout=60).json()
+        rutas = filtros.get("rutas") or []
+        if not rutas:
+            pytest.skip("No rutas")
+        data = api_client.get(URL, params={"ruta_id": rutas[0]["id"]}, timeout=60).json()
+        assert all(r["ruta_id"] == rutas[0]["id"] for r in data["registros"])
@@ -0,0 +1,84 @@
+"""
+Test suite for the fast JSON response pipeline (orjson + gzip)
+Tests: large endpoints serialize Decimal/date natively and are gzip-compressed
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}",
+        "Accept-Encoding": "gzip",
+    })
+    return session
+
+
+class TestGzipLargePayloads:
+    """Responses above GZIP_MIN_SIZE are compressed"""
+
+    def test_inventario_all_gzip(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/inventario?all=true", timeout=60)
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data, list)
+        if len(response.content) > 2048:
+            assert response.headers.get("content-encoding") == "gzip"
+        print(f"✓ inventario all: {len(data)} items, encoding={response.headers.get('content-encoding')}")
+
+    def test_small_payload_not_compressed(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/inventario-categorias", timeout=30)
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") != "gzip"
+
+    def test_matriz_gzip(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes-produccion/matriz", timeout=60)
+        assert response.status_code == 200
+        data = response.json()
+        assert "filas" in data and "columnas" in data
+        print(f"✓ matriz: {len(data['filas'])} filas, encoding={response.headers.get('content-encoding')}")
+
+
+class TestNativeSerialization:
+    """Decimal and date values keep the same JSON contract as jsonable_encoder"""
+
+    def test_inventario_numeric_fields(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/inventario?limit=20", timeout=30)
+        assert response.status_code == 200
+        data = response.json()
+        for item in data["items"]:
+            assert isinstance(item["stock_actual"], (int, float))
+            assert isinstance(item["total_reservado"], (int, float))
+            assert isinstance(item["valorizado"], (int, float))
+
+    def test_registros_dates_iso(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/registros?limit=20", timeout=30)
+        assert response.status_code == 200
+        data = response.json()
+        for reg in data["items"]:
+            if reg.get("fecha_creacion"):
+                assert isinstance(reg["fecha_creacion"], str)
+                assert "T" in reg["fecha_creacion"] or "-" in reg["fecha_creacion"]
+
+    def test_costura_items(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes-produccion/costura", timeout=60)
+        assert response.status_code == 200
+        data = response.json()
+        assert "kpis" in data and "items" in data
@@ -0,0 +1,125 @@
+"""
+Test suite for Idempotency-Key on mutating inventory/production POSTs
+Tests: a replay returns the stored response without re-executing, a reused
+key with a different body is rejected, and requests without key are unchanged
+"""
+import pytest
+import requests
+import os
+import uuid
+import time
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+@pytest.fixture
+def test_item(api_client):
+    codigo = f"TEST-IDEM-{uuid.uuid4().hex[:6].upper()}"
+    response = api_client.post(f"{BASE_URL}/api/inventario", json={
+        "codigo": codigo,
+        "nombre": f"Item idempotencia {codigo}",
+        "categoria": "Otros",
+        "unidad_medida": "unidad",
+        "stock_minimo": 0,
+        "control_por_rollos": False,
+    }, timeout=30)
+    assert response.status_code == 200, response.text
+    item = response.json()
+    yield item
+    api_client.delete(f"{BASE_URL}/api/inventario/{item['id']}", timeout=30)
+
+
+def _stock(api_client, item_id):
+    response = api_client.get(f"{BASE_URL}/api/inventario/{item_id}", timeout=30)
+    assert response.status_code == 200
+    return float(response.json()["stock_actual"])
+
+
+class TestIdempotencia:
+
+    def test_replay_does_not_duplicate(self, api_client, test_item):
+        clave = str(uuid.uuid4())
+        payload = {"item_id": test_item["id"], "cantidad": 5, "costo_unitario": 2.5}
+        headers = {"Idempotency-Key": clave}
+        first = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json=payload, headers=headers, timeout=30)
+        assert first.status_code == 200, first.text
+        assert "idempotent-replayed" not in first.headers
+        second = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json=payload, headers=headers, timeout=30)
+        assert second.status_code == 200
+        assert second.headers.get("idempotent-replayed") == "true"
+        assert second.json()["id"] == first.json()["id"]
+        assert _stock(api_client, test_item["id"]) == 5
+
+    def test_key_reuse_with_other_body(self, api_client, test_item):
+        clave = str(uuid.uuid4())
+        headers = {"Idempotency-Key": clave}
+        first = api_client.post(f"{BASE_URL}/api/inventario-ingresos",
+                                json={"item_id": test_item["id"], "cantidad": 1}, headers=headers, timeout=30)
+        assert first.status_code == 200, first.text
+        other = api_client.post(f"{BASE_URL}/api/inventario-ingresos",
+                                json={"item_id": test_item["id"], "cantidad": 2}, headers=headers, timeout=30)
+        assert other.status_code == 422
+        assert _stock(api_client, test_item["id"]) == 1
+
+    def test_failed_request_releases_key(self, api_client):
+        clave = str(uuid.uuid4())
+        headers = {"Idempotency-Key": clave}
+        payload = {"item_id": "no-existe", "cantidad": 1}
+        first = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json=payload, headers=headers, timeout=30)
+        assert first.status_code >= 400
+        second = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json=payload, headers=headers, timeout=30)
+        assert second.status_code == first.status_code
+        assert "idempotent-replayed" not in second.headers
+
+    def test_without_key_executes_twice(self, api_client, test_item):
+        payload = {"item_id": test_item["id"], "cantidad": 3}
+        for _ in range(2):
+            response = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json=payload, timeout=30)
+            assert response.status_code == 200
+        assert _stock(api_client, test_item["id"]) == 6
+
+    def test_key_too_long(self, api_client, test_item):
+        response = api_client.post(f"{BASE_URL}/api/inventario-ingresos",
+                                   json={"item_id": test_item["id"], "cantidad": 1},
+                                   headers={"Idempotency-Key": "x" * 300}, timeout=30)
+        assert response.status_code == 400
+
+    def test_replay_after_token_refresh(self, api_client, test_item):
+        clave = str(uuid.uuid4())
+        payload = {"item_id": test_item["id"], "cantidad": 4}
+        first = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json=payload,
+                                headers={"Idempotency-Key": clave}, timeout=30)
+        assert first.status_code == 200, first.text
+        # A new login issues a different token (exp has second resolution) for the same user
+        time.sleep(1.1)
+        login = requests.post(f"{BASE_URL}/api/auth/login",
+                              json={"username": "eduard", "password": "eduard123"}, timeout=120)
+        assert login.status_code == 200
+        nuevo_token = login.json()["access_token"]
+        assert nuevo_token != api_client.headers["Authorization"].split(" ", 1)[1]
+        second = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json=payload,
+                                 headers={"Idempotency-Key": clave, "Authorization": f"Bearer {nuevo_token}"}, timeout=30)
+        assert second.status_code == 200
+        assert second.headers.get("idempotent-replayed") == "true"
+        assert _stock(api_client, test_item["id"]) == 4
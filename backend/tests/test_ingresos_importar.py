@@ -0,0 +1,83 @@
+"""
+Test suite for bulk ingreso import
+Tests: POST /api/inventario-ingresos/importar loads CSV and JSON ingresos with
+their rollos in one transaction, updates stock once per item, reports row
+counts and timings, and rejects the whole file on errors by default.
+"""
+import uuid
+
+import pytest
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+URL = f"{BASE_URL}/api/inventario-ingresos/importar"
+
+
+@pytest.fixture
+def item_rollos(api_client):
+    """Item temporal con control por rollos; se elimina junto con sus ingresos"""
+    codigo = f"TEST-IMP-{uuid.uuid4().hex[:8]}"
+    response = api_client.post(f"{BASE_URL}/api/inventario", json={
+        "codigo": codigo, "nombre": "TEST tela importada", "categoria": "Telas",
+        "unidad_medida": "metro", "control_por_rollos": True,
+    }, timeout=30)
+    assert response.status_code == 200, response.text
+    item = response.json()
+    yield item
+    for ingreso in api_client.get(f"{BASE_URL}/api/inventario-ingresos", timeout=60).json():
+        if ingreso["item_id"] == item["id"]:
+            api_client.delete(f"{BASE_URL}/api/inventario-ingresos/{ingreso['id']}", timeout=30)
+    api_client.delete(f"{BASE_URL}/api/inventario/{item['id']}", timeout=30)
+
+
+def _stock(api_client, item_id):
+    return float(api_client.get(f"{BASE_URL}/api/inventario/{item_id}", timeout=30).json()["stock_actual"])
+
+
+class TestImportarIngresos:
+
+    def test_csv_con_rollos(self, api_client, item_rollos):
+        csv_text = (
+            "item_codigo;proveedor;numero_documento;costo_unitario;numero_rollo;metraje;tono\n"
+            f"{item_rollos['codigo']};TEST Prov;F-1;10;R1;50;A\n"
+            f"{item_rollos['codigo']};TEST Prov;F-1;10;R2;45.5;B\n"
+            f"{item_rollos['codigo']};TEST Prov;F-2;12;R3;30;A\n"
+        )
+        response = api_client.post(URL, data=csv_text.encode(), headers={"Content-Type": "text/csv"}, timeout=60)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["importado"] is True
+        assert data["filas"] == {"leidas": 3, "ingresos": 2, "rollos": 3, "items": 1, "rechazados": 0}
+        for key in ("lectura", "validacion", "copia", "stock", "total"):
+            assert key in data["tiempos_ms"]
+        assert _stock(api_client, item_rollos["id"]) == pytest.approx(125.5)
+        ingreso_id = data["ingresos"][0]["id"]
+        rollos = api_client.get(f"{BASE_URL}/api/inventario-ingresos/{ingreso_id}/rollos", timeout=30).json()
+        assert sorted(r["numero_rollo"] for r in rollos) == ["R1", "R2"]
+
+    def test_json_dry_run(self, api_client, item_rollos):
+        response = api_client.post(URL, params={"dry_run": "true"}, json=[
+            {"item_id": item_rollos["id"], "rollos": [{"numero_rollo": "R1", "metraje": 20}]},
+        ], timeout=30)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["importado"] is False and data["filas"]["ingresos"] == 1
+        assert _stock(api_client, item_rollos["id"]) == 0
+
+    def test_errores_rechazan_todo(self, api_client, item_rollos):
+        response = api_client.post(URL, json={"ingresos": [
+            {"item_id": item_rollos["id"], "rollos": [{"numero_rollo": "R1", "metraje": 20}]},
+            {"item_codigo": "NO-EXISTE", "cantidad": 5},
+            {"item_id": item_rollos["id"], "rollos": [{"numero_rollo": "R2", "metraje": "abc"}]},
+        ]}, timeout=30)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["importado"] is False
+        assert [e["indice"] for e in data["errores"]] == [1, 2]
+        assert _stock(api_client, item_rollos["id"]) == 0
+
+    def test_columna_desconocida(self, api_client):
+        response = api_client.post(URL, data=b"item_codigo,color\nX,rojo\n", headers={"Content-Type": "text/csv"}, timeout=30)
+        assert response.status_code == 400
@@ -0,0 +1,109 @@
+"""
+Test suite for maintained inventory aggregates (stock_reservado, valor_inventario)
+Tests: inventory list, alertas-stock and stock-por-linea read maintained columns,
+and ingreso/salida/ajuste paths keep them consistent with reservas and FIFO layers
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+@pytest.fixture
+def test_item(api_client):
+    """Creates a throwaway item without rollos control"""
+    codigo = f"TEST-AGG-{uuid.uuid4().hex[:6].upper()}"
+    response = api_client.post(f"{BASE_URL}/api/inventario", json={
+        "codigo": codigo,
+        "nombre": f"Item agregados {codigo}",
+        "categoria": "Otros",
+        "unidad_medida": "unidad",
+        "stock_minimo": 0,
+        "control_por_rollos": False,
+    }, timeout=30)
+    assert response.status_code == 200, response.text
+    item = response.json()
+    yield item
+    api_client.delete(f"{BASE_URL}/api/inventario/{item['id']}", timeout=30)
+
+
+def _get_item_from_list(api_client, codigo):
+    response = api_client.get(f"{BASE_URL}/api/inventario?search={codigo}", timeout=30)
+    assert response.status_code == 200
+    items = [i for i in response.json()["items"] if i["codigo"] == codigo]
+    assert items, f"Item {codigo} not in list"
+    return items[0]
+
+
+class TestMaintainedAggregates:
+
+    def test_ingreso_updates_valorizado(self, api_client, test_item):
+        response = api_client.post(f"{BASE_URL}/api/inventario-ingresos", json={
+            "item_id": test_item["id"], "cantidad": 10, "costo_unitario": 2.5,
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        item = _get_item_from_list(api_client, test_item["codigo"])
+        assert abs(item["valorizado"] - 25.0) < 0.01
+        assert abs(item["valor_inventario"] - 25.0) < 0.01
+        assert item["total_reservado"] == 0
+
+    def test_salida_consumes_valorizado(self, api_client, test_item):
+        api_client.post(f"{BASE_URL}/api/inventario-ingresos", json={
+            "item_id": test_item["id"], "cantidad": 10, "costo_unitario": 3,
+        }, timeout=30)
+        response = api_client.post(f"{BASE_URL}/api/inventario-salidas", json={
+            "item_id": test_item["id"], "cantidad": 4,
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        item = _get_item_from_list(api_client, test_item["codigo"])
+        assert abs(item["valorizado"] - 18.0) < 0.01
+        assert abs(item["stock_actual"] - 6) < 0.01
+
+    def test_ajuste_entrada_keeps_stock(self, api_client, test_item):
+        response = api_client.post(f"{BASE_URL}/api/inventario-ajustes", json={
+            "item_id": test_item["id"], "tipo": "entrada", "cantidad": 5, "motivo": "Test",
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        item = _get_item_from_list(api_client, test_item["codigo"])
+        assert abs(item["stock_actual"] - 5) < 0.01
+
+
+class TestRecalcularAgregados:
+
+    def test_recalcular_is_idempotent(self, api_client):
+        """After a full rebuild, a second rebuild must find nothing to correct"""
+        response = api_client.post(f"{BASE_URL}/api/inventario/recalcular-agregados", timeout=120)
+        assert response.status_code == 200
+        response = api_client.post(f"{BASE_URL}/api/inventario/recalcular-agregados", timeout=120)
+        assert response.status_code == 200
+        assert response.json()["items_corregidos"] == 0
+
+    def test_stock_por_linea_reads_aggregates(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/inventario/stock-por-linea", timeout=30)
+        assert response.status_code == 200
+        for row in response.json():
+            assert "valorizado" in row
+            assert "stock_disponible_ingresos" in row
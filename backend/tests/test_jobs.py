@@ -0,0 +1,133 @@
+"""
+Test suite for the background job runner
+Tests: submit/status/result/cancel through /api/jobs, ?async=1 dispatch of
+heavy endpoints returning the same payload as the synchronous call
+"""
+import pytest
+import requests
+import os
+import time
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+def _esperar(api_client, job_id, timeout=120):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        response = api_client.get(f"{BASE_URL}/api/jobs/{job_id}", timeout=30)
+        assert response.status_code == 200, response.text
+        job = response.json()
+        assert 0 <= job["progreso"] <= 100
+        if job["estado"] in ("COMPLETADO", "ERROR", "CANCELADO"):
+            return job
+        time.sleep(1)
+    pytest.fail(f"Job {job_id} no terminó en {timeout}s")
+
+
+class TestJobsApi:
+
+    def test_tipos_registrados(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/jobs/tipos", timeout=30)
+        assert response.status_code == 200
+        tipos = {t["tipo"] for t in response.json()}
+        for tipo in ("backup_create", "backup_restore", "reporte_trazabilidad", "trazabilidad_kpis",
+                     "reconciliar_reservas", "export_estados_item"):
+            assert tipo in tipos
+
+    def test_submit_status_result(self, api_client):
+        response = api_client.post(f"{BASE_URL}/api/jobs",
+                                   json={"tipo": "reconciliar_reservas", "params": {"dry_run": True}}, timeout=30)
+        assert response.status_code == 200, response.text
+        job_id = response.json()["job_id"]
+        job = _esperar(api_client, job_id)
+        assert job["estado"] == "COMPLETADO", job
+        assert job["progreso"] == 100
+        assert job["resultado"]["media_type"] == "application/json"
+        response = api_client.get(f"{BASE_URL}{job['resultado']['url']}", timeout=30)
+        assert response.status_code == 200
+        assert response.json()["dry_run"] is True
+
+    def test_unknown_tipo(self, api_client):
+        response = api_client.post(f"{BASE_URL}/api/jobs", json={"tipo": "no_existe"}, timeout=30)
+        assert response.status_code == 400
+
+    def test_cancel_finished_job(self, api_client):
+        job_id = api_client.post(f"{BASE_URL}/api/jobs", json={"tipo": "trazabilidad_kpis"}, timeout=30).json()["job_id"]
+        job = _esperar(api_client, job_id)
+        response = api_client.post(f"{BASE_URL}/api/jobs/{job_id}/cancelar", timeout=30)
+        if job["estado"] == "COMPLETADO":
+            assert response.status_code == 409
+
+    def test_cancel_or_complete(self, api_client):
+        job_id = api_client.post(f"{BASE_URL}/api/jobs", json={"tipo": "reporte_trazabilidad"}, timeout=30).json()["job_id"]
+        api_client.post(f"{BASE_URL}/api/jobs/{job_id}/cancelar", timeout=30)
+        job = _esperar(api_client, job_id)
+        assert job["estado"] in ("CANCELADO", "COMPLETADO")
+        if job["estado"] == "CANCELADO":
+            response = api_client.get(f"{BASE_URL}/api/jobs/{job_id}/resultado", timeout=30)
+            assert response.status_code == 409
+
+    def test_listado(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/jobs", params={"limit": 5}, timeout=30)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) <= 5
+        assert data["total"] >= len(data["items"])
+
+    def test_requires_auth(self):
+        response = requests.get(f"{BASE_URL}/api/jobs", timeout=30)
+        assert response.status_code in (401, 403)
+
+
+class TestAsyncDispatch:
+
+    def test_trazabilidad_kpis_async_matches_sync(self, api_client):
+        sync = api_client.get(f"{BASE_URL}/api/reportes/trazabilidad-kpis", timeout=60)
+        assert sync.status_code == 200
+        response = api_client.get(f"{BASE_URL}/api/reportes/trazabilidad-kpis", params={"async": 1}, timeout=30)
+        assert response.status_code == 200
+        job = _esperar(api_client, response.json()["job_id"])
+        assert job["estado"] == "COMPLETADO", job
+        resultado = api_client.get(f"{BASE_URL}{job['resultado']['url']}", timeout=30).json()
+        assert resultado["kpis"] == sync.json()["kpis"]
+
+    def test_export_estados_item_async(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes/estados-item/export", params={"async": 1}, timeout=30)
+        assert response.status_code == 200
+        job = _esperar(api_client, response.json()["job_id"])
+        assert job["estado"] == "COMPLETADO", job
+        assert job["resultado"]["media_type"] == "text/csv"
+        archivo = api_client.get(f"{BASE_URL}{job['resultado']['url']}", timeout=30)
+        assert archivo.status_code == 200
+        assert archivo.content.decode("utf-8-sig").startswith("Item,Hilo")
+
+    def test_backup_async(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/backup/create", params={"async": 1}, timeout=30)
+        if response.status_code == 403:
+            pytest.skip("User is not admin")
+        assert response.status_code == 200
+        job = _esperar(api_client, response.json()["job_id"], timeout=300)
+        assert job["estado"] == "COMPLETADO", job
+        backup = api_client.get(f"{BASE_URL}{job['resultado']['url']}", timeout=120).json()
+        assert "prod_registros" in backup["tables"]
@@ -2,7 +2,7 @@
 Test Suite: Matriz Producción - Colores Feature
 Tests for the color_general field in /api/reportes-produccion/matriz endpoint:
 - Fila-level colores array has color_general field
-- Detalle-level colores array has color_general field
+- Detalle-level colores array (drill-down /matriz/detalle) has color_general field
 - Color grouping by color_general works correctly
 """
 import pytest
@@ -34,6 +34,20 @@ class TestMatrizColores:
         )
         assert response.status_code == 200
         return response.json()
+
+    @pytest.fixture(scope="class")
+    def detalles(self, auth_headers, matriz_data):
+        """Drill-down de las primeras filas de la matriz"""
+        result = []
+        for fila in matriz_data["filas"][:5]:
+            response = requests.get(
+                f"{BASE_URL}/api/reportes-produccion/matriz/detalle",
+                params={"clave": fila["clave"], "solo_activos": "true"},
+                headers=auth_headers
+            )
+            assert response.status_code == 200
+            result.append(response.json()["registros"])
+        return result
     
     def test_matriz_fila_has_colores_field(self, matriz_data):
         """Matriz fila has colores field (array)"""
@@ -59,25 +73,25 @@ class TestMatrizColores:
         
         pytest.skip("No fila with colors found")
     
-    def test_matriz_detalle_has_colores_field(self, matriz_data):
+    def test_matriz_detalle_has_colores_field(self, detalles):
         """Matriz detalle has colores field (array)"""
-        if not matriz_data["filas"]:
+        if not detalles:
             pytest.skip("No filas available for testing")
         
-        for fila in matriz_data["filas"]:
-            if fila.get("detalle"):
-                detalle = fila["detalle"][0]
+        for registros in detalles:
+            if registros:
+                detalle = registros[0]
                 assert "colores" in detalle, "Missing 'colores' field in detalle"
                 assert isinstance(detalle["colores"], list), "colores should be a list"
                 return
         
         pytest.skip("No detalle available for testing")
     
-    def test_matriz_detalle_colores_has_color_general(self, matriz_data):
+    def test_matriz_detalle_colores_has_color_general(self, detalles):
         """Matriz detalle colores items have color_general field"""
         # Find a detalle with colors
-        for fila in matriz_data["filas"]:
-            for detalle in fila.get("detalle", []):
+        for registros in detalles:
+            for detalle in registros:
                 if detalle.get("colores"):
                     color = detalle["colores"][0]
                     assert "color" in color, "Missing 'color' field in detalle colores"
@@ -106,10 +120,10 @@ class TestMatrizColores:
         assert found_generals.intersection(expected_generals), \
             f"Expected at least one of {expected_generals}, found {found_generals}"
     
-    def test_matriz_detalle_colores_resumen(self, matriz_data):
+    def test_matriz_detalle_colores_resumen(self, detalles):
         """Matriz detalle has colores_resumen field (comma-separated colors)"""
-        for fila in matriz_data["filas"]:
-            for detalle in fila.get("detalle", []):
+        for registros in detalles:
+            for detalle in registros:
                 assert "colores_resumen" in detalle, "Missing 'colores_resumen' field in detalle"
                 assert isinstance(detalle["colores_resumen"], str), "colores_resumen should be a string"
                 if detalle.get("colores"):
@@ -129,12 +143,13 @@ class TestMatrizColores:
         assert "colores_resumen" in fila, "Missing 'colores_resumen' field in fila"
         assert isinstance(fila["colores_resumen"], str), "colores_resumen should be a string"
     
-    def test_matriz_colores_cantidad_is_int(self, matriz_data):
+    def test_matriz_colores_cantidad_is_int(self, matriz_data, detalles):
         """Matriz colores cantidad is integer"""
         for fila in matriz_data["filas"]:
             for color in fila.get("colores", []):
                 assert isinstance(color.get("cantidad", 0), int), "cantidad should be int"
-            for detalle in fila.get("detalle", []):
+        for registros in detalles:
+            for detalle in registros:
                 for color in detalle.get("colores", []):
                     assert isinstance(color.get("cantidad", 0), int), "cantidad should be int"
     
@@ -167,7 +182,12 @@ class TestMatrizColoresFiltering:
         
         # Find registro 03 which has colors
         for fila in data["filas"]:
-            for detalle in fila.get("detalle", []):
+            registros = requests.get(
+                f"{BASE_URL}/api/reportes-produccion/matriz/detalle",
+                params={"clave": fila["clave"], "solo_activos": "true"},
+                headers=auth_headers
+            ).json()["registros"]
+            for detalle in registros:
                 if detalle["n_corte"] == "03" and detalle.get("colores"):
                     # Verify colors exist
                     assert len(detalle["colores"]) > 0, "Registro 03 should have colors"
@@ -0,0 +1,126 @@
+"""
+Test suite for the production OLAP cube behind the matriz and estados-item
+Tests: incremental maintenance on registro create/update/delete, drill-down
+consistency with cell counts, and idempotent full rebuild
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+def _matriz(api_client, **params):
+    response = api_client.get(f"{BASE_URL}/api/reportes-produccion/matriz",
+                              params={"solo_activos": "false", **params}, timeout=60)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _total_estado(data, estado):
+    return data["totales_columna"].get(estado, {"registros": 0, "prendas": 0})
+
+
+@pytest.fixture
+def modelo(api_client):
+    response = api_client.get(f"{BASE_URL}/api/modelos?limit=1", timeout=30)
+    if response.status_code != 200 or not response.json().get("items"):
+        pytest.skip("No modelos available for test")
+    return response.json()["items"][0]
+
+
+class TestCuboIncremental:
+
+    def test_create_update_delete_registro(self, api_client, modelo):
+        before = _matriz(api_client, modelo_id=modelo["id"])
+        payload = {
+            "n_corte": f"TEST-CUBO-{uuid.uuid4().hex[:6].upper()}",
+            "modelo_id": modelo["id"],
+            "curva": "",
+            "estado": "Para Corte",
+            "urgente": False,
+            "tallas": [],
+            "distribucion_colores": [],
+            "linea_negocio_id": modelo.get("linea_negocio_id"),
+            "empresa_id": 7,
+        }
+        response = api_client.post(f"{BASE_URL}/api/registros", json=payload, timeout=30)
+        assert response.status_code == 200, response.text
+        registro_id = response.json()["id"]
+        try:
+            after = _matriz(api_client, modelo_id=modelo["id"])
+            assert after["total_general"]["registros"] == before["total_general"]["registros"] + 1
+            assert _total_estado(after, "Para Corte")["registros"] == _total_estado(before, "Para Corte")["registros"] + 1
+
+            payload["estado"] = "Para Costura"
+            response = api_client.put(f"{BASE_URL}/api/registros/{registro_id}", json=payload, timeout=30)
+            assert response.status_code == 200, response.text
+            moved = _matriz(api_client, modelo_id=modelo["id"])
+            assert _total_estado(moved, "Para Corte")["registros"] == _total_estado(before, "Para Corte")["registros"]
+            assert _total_estado(moved, "Para Costura")["registros"] == _total_estado(before, "Para Costura")["registros"] + 1
+        finally:
+            api_client.delete(f"{BASE_URL}/api/registros/{registro_id}", timeout=30)
+        final = _matriz(api_client, modelo_id=modelo["id"])
+        assert final["total_general"] == before["total_general"]
+
+
+class TestCuboDrillDown:
+
+    def test_detalle_matches_cells(self, api_client):
+        data = _matriz(api_client)
+        for fila in data["filas"][:5]:
+            response = api_client.get(f"{BASE_URL}/api/reportes-produccion/matriz/detalle",
+                                      params={"clave": fila["clave"], "solo_activos": "false"}, timeout=60)
+            assert response.status_code == 200, response.text
+            registros = response.json()["registros"]
+            assert len(registros) == fila["total"]["registros"]
+            assert sum(r["prendas"] for r in registros) == fila["total"]["prendas"]
+            for estado, celda in fila["celdas"].items():
+                en_estado = [r for r in registros if r["estado"] == estado]
+                assert len(en_estado) == celda["registros"]
+
+    def test_detalle_invalid_clave(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes-produccion/matriz/detalle",
+                                  params={"clave": "solo-una-parte"}, timeout=30)
+        assert response.status_code == 400
+
+
+class TestCuboRebuild:
+
+    def test_rebuild_is_idempotent(self, api_client):
+        response = api_client.post(f"{BASE_URL}/api/reportes-produccion/matriz/reconstruir-cubo", timeout=300)
+        assert response.status_code == 200, response.text
+        response = api_client.post(f"{BASE_URL}/api/reportes-produccion/matriz/reconstruir-cubo", timeout=300)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["celdas_corregidas"] == 0
+        assert data["hechos"] >= data["celdas"] >= 0
+
+    def test_estados_item_reads_cube(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes/estados-item", timeout=60)
+        assert response.status_code == 200
+        for row in response.json()["rows"]:
+            columnas = [k for k in row if k not in ("item", "hilo", "total")]
+            assert row["total"] == sum(row[c] for c in columnas)
@@ -4,8 +4,8 @@ Tests for the /api/reportes-produccion/matriz endpoint:
 - Basic endpoint functionality
 - Filter parameters (ruta_id, marca_id, solo_activos, solo_atrasados, solo_fraccionados)
 - Response structure (columnas, filas, totales_columna, total_general, filtros_disponibles)
-- Fila structure (item, hilo, celdas, total, detalle)
-- Detalle structure (id, n_corte, estado, prendas, modelo, ruta, urgente, es_hijo, fecha_entrega)
+- Fila structure (item, hilo, celdas, total, clave)
+- Detalle structure via /matriz/detalle drill-down (id, n_corte, estado, prendas, modelo, ruta, urgente, es_hijo, fecha_entrega)
 """
 import pytest
 import requests
@@ -14,6 +14,17 @@ import os
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
 
+def _detalle(fila, auth_headers, **params):
+    """Drill-down de una fila de la matriz"""
+    response = requests.get(
+        f"{BASE_URL}/api/reportes-produccion/matriz/detalle",
+        params={"clave": fila["clave"], **params},
+        headers=auth_headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["registros"]
+
+
 class TestMatrizAuth:
     """Test authentication for matriz endpoint"""
     
@@ -125,7 +136,7 @@ class TestMatrizFilaStructure:
         return {"Authorization": f"Bearer {token}"}
     
     def test_matriz_fila_has_required_fields(self, auth_headers):
-        """Matriz fila has item, hilo, celdas, total, detalle"""
+        """Matriz fila has item, hilo, celdas, total, clave"""
         response = requests.get(
             f"{BASE_URL}/api/reportes-produccion/matriz",
             headers=auth_headers
@@ -134,7 +145,7 @@ class TestMatrizFilaStructure:
         
         if data["filas"]:
             fila = data["filas"][0]
-            required_fields = ["item", "hilo", "celdas", "total", "detalle"]
+            required_fields = ["item", "hilo", "celdas", "total", "clave"]
             for field in required_fields:
                 assert field in fila, f"Missing field in fila: {field}"
     
@@ -207,8 +218,9 @@ class TestMatrizDetalleStructure:
         
         if data["filas"]:
             fila = data["filas"][0]
-            if fila["detalle"]:
-                detalle = fila["detalle"][0]
+            registros = _detalle(fila, auth_headers)
+            if registros:
+                detalle = registros[0]
                 # Original required fields
                 required_fields = [
                     "id", "n_corte", "estado", "prendas",
@@ -234,8 +246,9 @@ class TestMatrizDetalleStructure:
         
         if data["filas"]:
             fila = data["filas"][0]
-            if fila["detalle"]:
-                detalle = fila["detalle"][0]
+            registros = _detalle(fila, auth_headers)
+            if registros:
+                detalle = registros[0]
                 assert isinstance(detalle["id"], str)
                 assert isinstance(detalle["n_corte"], str)
                 assert isinstance(detalle["estado"], str)
@@ -253,8 +266,9 @@ class TestMatrizDetalleStructure:
         
         if data["filas"]:
             fila = data["filas"][0]
-            if fila["detalle"]:
-                detalle = fila["detalle"][0]
+            registros = _detalle(fila, auth_headers)
+            if registros:
+                detalle = registros[0]
                 # curva is string (can be empty)
                 assert isinstance(detalle["curva"], str)
                 # curva_detalle is list of {talla, cantidad}
@@ -284,7 +298,7 @@ class TestMatrizDetalleStructure:
         
         # Find a registro with movements (fecha_inicio_prod not null)
         for fila in data["filas"]:
-            for detalle in fila["detalle"]:
+            for detalle in _detalle(fila, auth_headers):
                 if detalle["fecha_inicio_prod"] is not None:
                     # dias_proceso should be >= 0 when fecha_inicio_prod exists
                     assert detalle["dias_proceso"] >= 0, f"dias_proceso should be >= 0 for registro with movements"
@@ -304,7 +318,7 @@ class TestMatrizDetalleStructure:
         
         # Find a registro without movements (fecha_inicio_prod is null)
         for fila in data["filas"]:
-            for detalle in fila["detalle"]:
+            for detalle in _detalle(fila, auth_headers):
                 if detalle["fecha_inicio_prod"] is None:
                     # dias_proceso should be 0 when no movements
                     assert detalle["dias_proceso"] == 0, f"dias_proceso should be 0 for registro without movements, got {detalle['dias_proceso']}"
@@ -324,8 +338,9 @@ class TestMatrizDetalleStructure:
         
         if data["filas"]:
             fila = data["filas"][0]
-            if fila["detalle"]:
-                detalle = fila["detalle"][0]
+            registros = _detalle(fila, auth_headers)
+            if registros:
+                detalle = registros[0]
                 if detalle["curva_detalle"]:
                     item = detalle["curva_detalle"][0]
                     assert "talla" in item, "curva_detalle item missing 'talla'"
@@ -410,7 +425,7 @@ class TestMatrizFilters:
         
         # Check that no detalle has estado_op CERRADA
         for fila in data["filas"]:
-            for detalle in fila["detalle"]:
+            for detalle in _detalle(fila, auth_headers):
                 # estado field is the etapa, not estado_op, but CERRADA shouldn't appear
                 pass  # Can't directly check estado_op in detalle
     
@@ -590,7 +605,7 @@ class TestMatrizDataConsistency:
         data = response.json()
         
         for fila in data["filas"]:
-            assert len(fila["detalle"]) == fila["total"]["registros"]
+            assert len(_detalle(fila, auth_headers)) == fila["total"]["registros"]
 
 
 if __name__ == "__main__":
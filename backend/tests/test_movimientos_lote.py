@@ -0,0 +1,76 @@
+"""
+Test suite for bulk movement registration
+Tests: POST /api/movimientos-produccion/lote validates the whole batch, reports
+per-row errors with their index, honours dry_run and todo_o_nada, resolves the
+tarifa from the persona-servicio map and inserts valid rows (with mermas).
+"""
+import pytest
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+URL = f"{BASE_URL}/api/movimientos-produccion/lote"
+
+
+@pytest.fixture
+def movimiento_base(api_client):
+    """Registro/servicio/persona válidos tomados de un movimiento existente sin paralización"""
+    response = api_client.get(f"{BASE_URL}/api/movimientos-produccion", params={"all": "true"}, timeout=60)
+    assert response.status_code == 200, response.text
+    for mov in response.json():
+        probe = api_client.post(URL, json={"dry_run": True, "movimientos": [{
+            "registro_id": mov["registro_id"], "servicio_id": mov["servicio_id"], "persona_id": mov["persona_id"],
+        }]}, timeout=30)
+        if probe.status_code == 200 and not probe.json()["errores"]:
+            return {"registro_id": mov["registro_id"], "servicio_id": mov["servicio_id"], "persona_id": mov["persona_id"]}
+    pytest.skip("No movimiento on a non-paralyzed registro to build a batch from")
+
+
+class TestMovimientosLote:
+
+    def test_errores_por_fila(self, api_client, movimiento_base):
+        response = api_client.post(URL, json={"dry_run": True, "movimientos": [
+            movimiento_base,
+            {**movimiento_base, "registro_id": "no-existe"},
+            {**movimiento_base, "persona_id": "no-existe", "fecha_inicio": "31/12/2024"},
+        ]}, timeout=30)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["total"] == 3 and data["rechazados"] == 2 and data["insertados"] == 0
+        errores = {e["indice"]: e["errores"] for e in data["errores"]}
+        assert "Registro no encontrado" in errores[1]
+        assert "Persona no encontrada" in errores[2]
+        assert any("fecha_inicio" in e for e in errores[2])
+        assert [m["indice"] for m in data["movimientos"]] == [0]
+
+    def test_todo_o_nada(self, api_client, movimiento_base):
+        response = api_client.post(URL, json={"todo_o_nada": True, "movimientos": [
+            movimiento_base, {**movimiento_base, "servicio_id": "no-existe"},
+        ]}, timeout=30)
+        assert response.status_code == 200, response.text
+        assert response.json()["insertados"] == 0
+
+    def test_inserta_lote(self, api_client, movimiento_base):
+        response = api_client.post(URL, json={"movimientos": [
+            {**movimiento_base, "cantidad_enviada": 10, "cantidad_recibida": 8, "observaciones": "TEST_lote"},
+            {**movimiento_base, "cantidad_enviada": 5, "cantidad_recibida": 5, "tarifa_aplicada": 1.5, "observaciones": "TEST_lote"},
+        ]}, timeout=60)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        ids = [m["id"] for m in data["movimientos"]]
+        try:
+            assert data["insertados"] == 2 and data["rechazados"] == 0
+            assert data["movimientos"][1]["costo_calculado"] == pytest.approx(7.5)
+            listado = api_client.get(f"{BASE_URL}/api/movimientos-produccion",
+                                     params={"registro_id": movimiento_base["registro_id"], "all": "true"}, timeout=60).json()
+            assert set(ids) <= {m["id"] for m in listado}
+            mermas = api_client.get(f"{BASE_URL}/api/mermas", params={"registro_id": movimiento_base["registro_id"]}, timeout=30).json()
+            assert any(m["movimiento_id"] == ids[0] and m["cantidad"] == 2 for m in mermas)
+        finally:
+            for movimiento_id in ids:
+                api_client.delete(f"{BASE_URL}/api/movimientos-produccion/{movimiento_id}", timeout=30)
+
+    def test_lote_vacio_rechazado(self, api_client):
+        response = api_client.post(URL, json={"movimientos": []}, timeout=30)
+        assert response.status_code == 422
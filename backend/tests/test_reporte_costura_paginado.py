@@ -0,0 +1,83 @@
+"""
+Test suite for the server-side costura board
+Tests: /api/reportes-produccion/costura pages in Postgres (limit/offset/total),
+KPIs and per-persona totals cover the whole filtered set, risk filters and
+sort keys are applied by SQL, and unknown sort keys are rejected.
+"""
+import pytest
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+URL = f"{BASE_URL}/api/reportes-produccion/costura"
+
+
+def _get(api_client, **params):
+    response = api_client.get(URL, params={"servicio_nombre": "__todos__", "incluir_terminados": "true", **params}, timeout=60)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+class TestReporteCostura:
+
+    def test_sin_limit_devuelve_todo(self, api_client):
+        data = _get(api_client)
+        assert data["total"] == len(data["items"])
+        assert data["kpis"]["registros_activos"] == data["total"]
+        assert data["kpis"]["costureros_activos"] == len(data["filtros"]["personas"])
+
+    def test_paginas_y_kpis_del_conjunto(self, api_client):
+        todo = _get(api_client, orden="dias_desc")
+        if todo["total"] < 3:
+            pytest.skip("Not enough movimientos to page")
+        pagina = _get(api_client, orden="dias_desc", limit=2, offset=1)
+        assert pagina["total"] == todo["total"]
+        assert pagina["kpis"] == todo["kpis"]
+        assert [i["movimiento_id"] for i in pagina["items"]] == [i["movimiento_id"] for i in todo["items"][1:3]]
+
+    def test_totales_por_persona(self, api_client):
+        data = _get(api_client)
+        por_persona = {}
+        for item in data["items"]:
+            por_persona[item["persona_id"]] = por_persona.get(item["persona_id"], 0) + 1
+        for persona in data["filtros"]["personas"]:
+            assert persona["registros"] == por_persona[persona["id"]]
+        assert sum(p["vencidos"] for p in data["filtros"]["personas"]) == data["kpis"]["registros_vencidos"]
+
+    @pytest.mark.parametrize("riesgo", ["normal", "atencion", "critico", "vencido"])
+    def test_filtro_riesgo(self, api_client, riesgo):
+        data = _get(api_client, riesgo=riesgo)
+        assert all(i["nivel_riesgo"] == riesgo for i in data["items"])
+
+    def test_filtros_booleanos(self, api_client):
+        assert all(i["nivel_riesgo"] == "vencido" for i in _get(api_client, vencidos="true")["items"])
+        assert all(i["dias_sin_actualizar"] >= 3 for i in _get(api_client, sin_actualizar="true")["items"])
+        assert all(i["incidencias_abiertas"] > 0 for i in _get(api_client, con_incidencias="true")["items"])
+        assert all(i["incidencias_abiertas"] == 0 for i in _get(api_client, con_incidencias="false")["items"])
+
+    def test_orden_dias(self, api_client):
+        dias = [i["dias_transcurridos"] for i in _get(api_client, orden="dias_desc")["items"]]
+        con_valor = [d for d in dias if d is not None]
+        assert con_valor == sorted(con_valor, reverse=True)
+        assert dias[:len(con_valor)] == con_valor
+
+    def test_grupo_mantiene_personas_contiguas(self, api_client):
+        items = _get(api_client, orden="grupo_dias_desc")["items"]
+        vistas = []
+        for item in items:
+            if not vistas or vistas[-1] != item["persona_id"]:
+                assert item["persona_id"] not in vistas
+                vistas.append(item["persona_id"])
+
+    def test_busqueda(self, api_client):
+        items = _get(api_client)["items"]
+        if not items:
+            pytest.skip("No movimientos")
+        corte = items[0]["n_corte"]
+        encontrados = _get(api_client, busqueda=corte)["items"]
+        assert any(i["movimiento_id"] == items[0]["movimiento_id"] for i in encontrados)
+
+    def test_orden_invalido(self, api_client):
+        response = api_client.get(URL, params={"orden": "DROP TABLE"}, timeout=30)
+        assert response.status_code == 400
@@ -0,0 +1,116 @@
+"""
+Test suite for the normalized persona-servicio tarifa table
+Tests: persona create/update/delete keep prod_persona_servicio_tarifa in sync,
+movements resolve their tarifa from it, and balance-terceros / productividad
+expose the current tarifa.
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+LOTE_URL = f"{BASE_URL}/api/movimientos-produccion/lote"
+
+
+@pytest.fixture
+def movimiento_base(api_client):
+    """Registro/servicio válidos tomados de un movimiento existente sin paralización"""
+    response = api_client.get(f"{BASE_URL}/api/movimientos-produccion", params={"all": "true"}, timeout=60)
+    assert response.status_code == 200, response.text
+    for mov in response.json():
+        probe = api_client.post(LOTE_URL, json={"dry_run": True, "movimientos": [{
+            "registro_id": mov["registro_id"], "servicio_id": mov["servicio_id"], "persona_id": mov["persona_id"],
+        }]}, timeout=30)
+        if probe.status_code == 200 and not probe.json()["errores"]:
+            return {"registro_id": mov["registro_id"], "servicio_id": mov["servicio_id"]}
+    pytest.skip("No movimiento on a non-paralyzed registro to build from")
+
+
+@pytest.fixture
+def persona(api_client, movimiento_base):
+    response = api_client.post(f"{BASE_URL}/api/personas-produccion", json={
+        "nombre": "TEST_TARIFA_PERSONA",
+        "servicios": [{"servicio_id": movimiento_base["servicio_id"], "tarifa": 2.5}],
+    }, timeout=30)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    yield data
+    api_client.delete(f"{BASE_URL}/api/personas-produccion/{data['id']}", timeout=30)
+
+
+def _tarifa_en_lote(api_client, movimiento_base, persona_id):
+    response = api_client.post(LOTE_URL, json={"dry_run": True, "movimientos": [{
+        **movimiento_base, "persona_id": persona_id, "cantidad_recibida": 10,
+    }]}, timeout=30)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert not data["errores"], data["errores"]
+    return data["movimientos"][0]
+
+
+class TestTarifasPersona:
+
+    def test_movimiento_usa_tarifa_de_la_tabla(self, api_client, movimiento_base, persona):
+        mov = _tarifa_en_lote(api_client, movimiento_base, persona["id"])
+        assert mov["tarifa_aplicada"] == 2.5
+        assert mov["costo_calculado"] == 25
+
+    def test_actualizar_persona_sincroniza_tarifa(self, api_client, movimiento_base, persona):
+        response = api_client.put(f"{BASE_URL}/api/personas-produccion/{persona['id']}", json={
+            "nombre": persona["nombre"],
+            "servicios": [{"servicio_id": movimiento_base["servicio_id"], "tarifa": 4}],
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        assert _tarifa_en_lote(api_client, movimiento_base, persona["id"])["tarifa_aplicada"] == 4
+
+        # Sin el servicio asignado la tarifa vuelve a 0
+        response = api_client.put(f"{BASE_URL}/api/personas-produccion/{persona['id']}", json={
+            "nombre": persona["nombre"], "servicios": [],
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        assert _tarifa_en_lote(api_client, movimiento_base, persona["id"])["tarifa_aplicada"] == 0
+
+    def test_balance_terceros_incluye_tarifa_vigente(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes-produccion/balance-terceros", timeout=60)
+        assert response.status_code == 200, response.text
+        for fila in response.json().get("balance", []):
+            assert "tarifa_vigente" in fila
+
+    def test_productividad_agregada_en_sql(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/reportes/productividad", timeout=60)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert set(data) == {"por_servicio", "por_persona", "total_movimientos"}
+        assert sum(s["movimientos"] for s in data["por_servicio"]) == data["total_movimientos"]
+        assert sum(p["movimientos"] for p in data["por_persona"]) == data["total_movimientos"]
+        for p in data["por_persona"]:
+            assert p["persona_nombre"]
+            assert "costo_tarifa_vigente" in p
+
+    def test_estado_cache(self, api_client):
+        response = api_client.get(f"{BASE_URL}/api/db/estado", timeout=30)
+        assert response.status_code == 200, response.text
+        assert "sincronizaciones" in response.json()["tarifas_persona"]
@@ -0,0 +1,100 @@
+"""
+Test suite for the maintained WIP summary (prod_wip_resumen)
+Tests: servicio create/update/delete keeps the orden summary in sync with the
+ledger, orden lists read the pre-aggregated row, and the consistency checker
+converges
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+@pytest.fixture(scope="module")
+def auth_token():
+    """Get authentication token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "username": "eduard",
+        "password": "eduard123"
+    }, timeout=120)
+    if response.status_code == 200:
+        return response.json().get("access_token")
+    pytest.skip("Authentication failed - skipping tests")
+
+@pytest.fixture
+def api_client(auth_token):
+    """Shared requests session with auth"""
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {auth_token}"
+    })
+    return session
+
+
+@pytest.fixture
+def orden_abierta(api_client):
+    response = api_client.get(f"{BASE_URL}/api/ordenes", params={"estado_op": "ABIERTA"}, timeout=60)
+    if response.status_code != 200 or not response.json():
+        response = api_client.get(f"{BASE_URL}/api/ordenes", params={"estado_op": "EN_PROCESO"}, timeout=60)
+    if response.status_code != 200 or not response.json():
+        pytest.skip("No open ordenes available")
+    return response.json()[0]
+
+
+def _resumen(api_client, orden_id):
+    response = api_client.get(f"{BASE_URL}/api/ordenes/{orden_id}/resumen-wip", timeout=30)
+    assert response.status_code == 200, response.text
+    return response.json()["resumen"]
+
+
+class TestWipResumenMantenido:
+
+    def test_servicio_lifecycle_updates_resumen(self, api_client, orden_abierta):
+        orden_id = orden_abierta["id"]
+        before = _resumen(api_client, orden_id)
+        response = api_client.post(f"{BASE_URL}/api/servicios-orden", json={
+            "orden_id": orden_id,
+            "descripcion": "TEST WIP resumen",
+            "cantidad_enviada": 10,
+            "cantidad_recibida": 10,
+            "tarifa_unitaria": 1.5,
+        }, timeout=30)
+        assert response.status_code == 200, response.text
+        servicio_id = response.json()["id"]
+        try:
+            after = _resumen(api_client, orden_id)
+            assert float(after["costo_servicio"]) == pytest.approx(float(before["costo_servicio"]) + 15)
+            assert float(after["costo_total"]) == pytest.approx(float(before["costo_total"]) + 15)
+
+            response = api_client.put(f"{BASE_URL}/api/servicios-orden/{servicio_id}",
+                                      json={"tarifa_unitaria": 2}, timeout=30)
+            assert response.status_code == 200, response.text
+            updated = _resumen(api_client, orden_id)
+            assert float(updated["costo_servicio"]) == pytest.approx(float(before["costo_servicio"]) + 20)
+        finally:
+            api_client.delete(f"{BASE_URL}/api/servicios-orden/{servicio_id}", timeout=30)
+        final = _resumen(api_client, orden_id)
+        assert float(final["costo_total"]) == pytest.approx(float(before["costo_total"]))
+
+    def test_orden_list_reads_resumen(self, api_client, orden_abierta):
+        resumen = _resumen(api_client, orden_abierta["id"])
+        assert float(orden_abierta["costo_wip"]) == pytest.approx(float(resumen["costo_total"]))
+        assert isinstance(orden_abierta["total_prendas"], int)
+
+
+class TestWipResumenChecker:
+
+    def test_dry_run_then_converges(self, api_client):
+        response = api_client.post(f"{BASE_URL}/api/wip/verificar-resumen?dry_run=true", timeout=120)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["dry_run"] is True
+        assert data["ordenes_corregidas"] == len(data["detalle"])
+
+        response = api_client.post(f"{BASE_URL}/api/wip/verificar-resumen", timeout=120)
+        assert response.status_code == 200
+        assert "message" in response.json()
+
+        again = api_client.post(f"{BASE_URL}/api/wip/verificar-resumen?dry_run=true", timeout=120).json()
+        assert again["ordenes_corregidas"] == 0
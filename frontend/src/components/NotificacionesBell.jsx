@@ -13,6 +13,14 @@ const NIVEL_STYLES = {
   critico: { bg: 'bg-red-100', text: 'text-red-800', label: 'Crítico' },
 };
 
+// Mismo orden que el backend: paralizados, vencidos, críticos, más días primero
+const PRIORIDAD_NIVEL = { vencido: 0, critico: 1, atencion: 2, normal: 3 };
+const ordenarAlertas = (alertas) => [...alertas].sort((a, b) =>
+  ((a.paralizado ? 0 : 1) - (b.paralizado ? 0 : 1))
+  || ((PRIORIDAD_NIVEL[a.nivel] ?? 3) - (PRIORIDAD_NIVEL[b.nivel] ?? 3))
+  || ((b.dias || 0) - (a.dias || 0))
+);
+
 export const NotificacionesBell = () => {
   const navigate = useNavigate();
   const [open, setOpen] = useState(false);
@@ -27,10 +35,55 @@ export const NotificacionesBell = () => {
     } catch { /* silent */ }
   };
 
+  // Stream SSE: snapshot al conectar y luego solo diffs; polling si no hay EventSource.
+  // El stream se abre con un ticket de un solo uso (el JWT no va en la URL)
   useEffect(() => {
-    fetchAlertas();
-    const interval = setInterval(fetchAlertas, 60000);
-    return () => clearInterval(interval);
+    const token = localStorage.getItem('token');
+    if (typeof EventSource === 'undefined' || !token) {
+      fetchAlertas();
+      const interval = setInterval(fetchAlertas, 60000);
+      return () => clearInterval(interval);
+    }
+    const alertas = new Map();
+    const publicar = (resumen) => setData({ alertas: ordenarAlertas([...alertas.values()]), resumen });
+    let es = null;
+    let reintento = null;
+    let cerrado = false;
+    const conectar = async () => {
+      let ticket;
+      try {
+        const res = await axios.post(`${API}/reportes-produccion/alertas-produccion/stream/ticket`);
+        ticket = res.data.ticket;
+      } catch {
+        if (!cerrado) reintento = setTimeout(conectar, 30000);
+        return;
+      }
+      if (cerrado) return;
+      es = new EventSource(`${API}/reportes-produccion/alertas-produccion/stream?ticket=${encodeURIComponent(ticket)}`);
+      es.addEventListener('snapshot', (e) => {
+        const d = JSON.parse(e.data);
+        alertas.clear();
+        d.alertas.forEach(a => alertas.set(a.movimiento_id, a));
+        publicar(d.resumen);
+      });
+      es.addEventListener('diff', (e) => {
+        const d = JSON.parse(e.data);
+        d.remove.forEach(id => alertas.delete(id));
+        d.upsert.forEach(a => alertas.set(a.movimiento_id, a));
+        publicar(d.resumen);
+      });
+      // La reconexión automática reusaría el ticket ya canjeado: cerrar y pedir otro
+      es.onerror = () => {
+        es.close();
+        if (!cerrado) reintento = setTimeout(conectar, 5000);
+      };
+    };
+    conectar();
+    return () => {
+      cerrado = true;
+      clearTimeout(reintento);
+      if (es) es.close();
+    };
   }, []);
 
   // Close on click outside
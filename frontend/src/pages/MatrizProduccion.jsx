@@ -410,17 +410,24 @@ export const MatrizProduccion = () => {
 
   // ── Modal: abrir con registros filtrados ────────────────────
   const openModal = (fila, col) => {
-    let regs = fila.detalle || [];
+    // El detalle por registro se pide bajo demanda (drill-down del cubo)
+    const params = new URLSearchParams();
+    Object.entries(filters).forEach(([k, v]) => {
+      if (v !== '' && v !== false) params.append(k, String(v));
+    });
+    params.set('clave', fila.clave);
     let titulo = fila.item;
     if (col) {
       // Celda específica: filtrar por estado, incluyendo columnas absorbidas
-      const cols = [col, ...(mergedCols[col] || [])];
-      regs = regs.filter(r => cols.includes(r.estado));
+      [col, ...(mergedCols[col] || [])].forEach(c => params.append('estados', c));
       titulo = `${fila.item} → ${col}${mergedCols[col]?.length ? ` (+${mergedCols[col].join(', ')})` : ''}`;
     }
-    setModalRegistros(regs);
+    setModalRegistros([]);
     setModalTitulo(titulo);
     setModalOpen(true);
+    axios.get(`${API}/reportes-produccion/matriz/detalle?${params}`)
+      .then(res => setModalRegistros(res.data.registros || []))
+      .catch(err => console.error(err));
   };
 
   const hasActiveFilters = Object.entries(filters).some(([k, v]) => k === 'solo_activos' ? !v : v !== '' && v !== false);
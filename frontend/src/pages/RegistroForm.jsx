@@ -161,13 +161,16 @@ export const RegistroForm = () => {
     if (!registroId) { setEstados(estadosGlobales); setUsaRuta(false); setRutaNombre(''); setSiguienteEstado(null); setEtapasCompletas([]); return; }
     try {
       const response = await axios.get(`${API}/registros/${registroId}/estados-disponibles`);
-      const data = response.data;
-      setEstados(data.estados || estadosGlobales); setUsaRuta(data.usa_ruta || false);
-      setRutaNombre(data.ruta_nombre || ''); setSiguienteEstado(data.siguiente_estado || null);
-      setEtapasCompletas(data.etapas_completas || []);
+      aplicarEstadosDisponibles(response.data);
     } catch { setEstados(estadosGlobales); }
   };
 
+  const aplicarEstadosDisponibles = (data) => {
+    setEstados(data.estados || estadosGlobales); setUsaRuta(data.usa_ruta || false);
+    setRutaNombre(data.ruta_nombre || ''); setSiguienteEstado(data.siguiente_estado || null);
+    setEtapasCompletas(data.etapas_completas || []);
+  };
+
   const fetchAnalisisEstado = async () => {
     if (!id || !usaRuta) return;
     try { const r = await axios.get(`${API}/registros/${id}/analisis-estado`); setAnalisisEstado(r.data); } catch {}
@@ -200,8 +203,15 @@ export const RegistroForm = () => {
   const fetchRegistro = async () => {
     if (!id) { setLoadingData(false); return; }
     try {
-      const response = await axios.get(`${API}/registros/${id}`);
-      const registro = response.data;
+      // Una sola llamada con lo que necesita la carga inicial del lote
+      const response = await axios.get(`${API}/registros/${id}/bundle`, {
+        params: { campos: 'registro,estados_disponibles,movimientos,incidencias,salidas' },
+      });
+      const bundle = response.data;
+      const registro = bundle.registro;
+      if (bundle.movimientos) setMovimientosProduccion(bundle.movimientos);
+      if (bundle.incidencias) setIncidencias(bundle.incidencias);
+      if (bundle.salidas) setSalidasRegistro(bundle.salidas);
       setFormData({
         n_corte: registro.n_corte, modelo_id: registro.modelo_id, curva: registro.curva || '',
         estado: registro.estado, urgente: registro.urgente, hilo_especifico_id: registro.hilo_especifico_id || '',
@@ -217,23 +227,22 @@ export const RegistroForm = () => {
         setModeloSeleccionado(modelo || null);
         if (!registro.pt_item_id && modelo?.pt_item_id) setFormData(prev => ({ ...prev, pt_item_id: modelo.pt_item_id }));
       }
-      try { await fetchEstadosDisponibles(id); } catch {}
+      if (bundle.estados_disponibles) aplicarEstadosDisponibles(bundle.estados_disponibles);
+      else setEstados(estadosGlobales);
     } catch { toast.error('Error al cargar registro'); navigate('/registros'); }
     finally { setLoadingData(false); }
   };
 
   // ========== EFFECTS ==========
   const [activeTab, setActiveTab] = useState('produccion');
-  const [tabsLoaded, setTabsLoaded] = useState({ general: false, produccion: false, control: false });
+  const [tabsLoaded, setTabsLoaded] = useState({ general: false, produccion: !!id, control: false });
 
   // Carga inicial: solo datos del formulario + datos ligeros del panel lateral
   useEffect(() => {
     fetchRelatedData();
     if (id) {
+      // Incluye movimientos, incidencias y salidas (panel lateral y pestaña producción)
       fetchRegistro();
-      // Datos ligeros necesarios para el panel lateral
-      fetchMovimientosProduccion();
-      fetchIncidencias();
     } else {
       setLoadingData(false);
     }
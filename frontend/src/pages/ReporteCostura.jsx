@@ -1,4 +1,4 @@
-import { useState, useEffect, useMemo, Fragment } from 'react';
+import { useState, useEffect, useMemo, useRef, Fragment } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { Card, CardContent } from '../components/ui/card';
@@ -18,6 +18,7 @@ import {
 } from 'lucide-react';
 
 const API = process.env.REACT_APP_BACKEND_URL;
+const PAGE_LIMIT = 200;
 
 const RIESGO_CONFIG = {
   normal:   { label: 'Normal',   color: 'bg-transparent text-muted-foreground border-transparent', dot: 'bg-emerald-500', rowClass: '' },
@@ -143,6 +144,8 @@ export const ReporteCostura = () => {
   const [filtroSinActualizar, setFiltroSinActualizar] = useState('__all__');
   const [filtroTerminados, setFiltroTerminados] = useState('en_curso');
   const [filtroBusqueda, setFiltroBusqueda] = useState('');
+  const [busquedaAplicada, setBusquedaAplicada] = useState('');
+  const [offset, setOffset] = useState(0);
   const [filtroServicio, setFiltroServicio] = useState('Costura');
   const [servicios, setServicios] = useState([]);
 
@@ -195,18 +198,29 @@ export const ReporteCostura = () => {
     setResolverSaving(false);
   };
 
+  // Filtros, orden y página se resuelven en el backend
+  const buildParams = () => {
+    const params = new URLSearchParams();
+    params.append('servicio_nombre', filtroServicio);
+    if (filtroPersona !== '__all__') params.append('persona_id', filtroPersona);
+    if (filtroRiesgo !== '__all__') params.append('riesgo', filtroRiesgo);
+    if (filtroConIncidencias === 'si') params.append('con_incidencias', 'true');
+    if (filtroConIncidencias === 'no') params.append('con_incidencias', 'false');
+    if (filtroVencidos === 'si') params.append('vencidos', 'true');
+    if (filtroSinActualizar === 'si') params.append('sin_actualizar', 'true');
+    if (filtroTerminados === 'todos') params.append('incluir_terminados', 'true');
+    if (busquedaAplicada.trim()) params.append('busqueda', busquedaAplicada.trim());
+    const dir = sortDiasDesc ? 'desc' : 'asc';
+    params.append('orden', vistaPlana ? `dias_${dir}` : `grupo_dias_${dir}`);
+    return params;
+  };
+
   const fetchData = async () => {
     setLoading(true);
     try {
-      const params = new URLSearchParams();
-      params.append('servicio_nombre', filtroServicio);
-      if (filtroPersona !== '__all__') params.append('persona_id', filtroPersona);
-      if (filtroRiesgo !== '__all__') params.append('riesgo', filtroRiesgo);
-      if (filtroConIncidencias === 'si') params.append('con_incidencias', 'true');
-      if (filtroConIncidencias === 'no') params.append('con_incidencias', 'false');
-      if (filtroVencidos === 'si') params.append('vencidos', 'true');
-      if (filtroSinActualizar === 'si') params.append('sin_actualizar', 'true');
-      if (filtroTerminados === 'todos') params.append('incluir_terminados', 'true');
+      const params = buildParams();
+      params.append('limit', String(PAGE_LIMIT));
+      params.append('offset', String(offset));
       const resp = await axios.get(`${API}/api/reportes-produccion/costura?${params.toString()}`);
       setData(resp.data);
     } catch (err) {
@@ -215,7 +229,21 @@ export const ReporteCostura = () => {
     setLoading(false);
   };
 
-  useEffect(() => { fetchData(); }, [filtroServicio, filtroPersona, filtroRiesgo, filtroConIncidencias, filtroVencidos, filtroSinActualizar, filtroTerminados]);
+  // Cualquier cambio de filtro u orden vuelve a la primera página (sin pedir dos veces)
+  const filtrosKey = [filtroServicio, filtroPersona, filtroRiesgo, filtroConIncidencias, filtroVencidos, filtroSinActualizar, filtroTerminados, busquedaAplicada, sortDiasDesc, vistaPlana].join('|');
+  const filtrosKeyRef = useRef(filtrosKey);
+  useEffect(() => {
+    if (filtrosKeyRef.current !== filtrosKey) {
+      filtrosKeyRef.current = filtrosKey;
+      if (offset !== 0) { setOffset(0); return; }
+    }
+    fetchData();
+  }, [filtrosKey, offset]);
+
+  useEffect(() => {
+    const t = setTimeout(() => setBusquedaAplicada(filtroBusqueda), 300);
+    return () => clearTimeout(t);
+  }, [filtroBusqueda]);
 
   useEffect(() => {
     axios.get(`${API}/api/motivos-incidencia`).then(r => setMotivos(r.data)).catch(() => {});
@@ -238,74 +266,37 @@ export const ReporteCostura = () => {
     return m.join('; ') || '';
   };
 
-  // Agrupar items por persona
+  // Agrupar items de la página por persona; el backend ya los trae ordenados
+  // y los totales de cada persona cubren todas sus filas, no solo esta página
   const grouped = useMemo(() => {
     if (!data) return [];
-    let items = data.items;
-    if (filtroBusqueda.trim()) {
-      const q = filtroBusqueda.toLowerCase();
-      items = items.filter(i =>
-        (i.n_corte || '').toLowerCase().includes(q) ||
-        (i.modelo_nombre || '').toLowerCase().includes(q) ||
-        (i.tipo_nombre || '').toLowerCase().includes(q) ||
-        (i.entalle_nombre || '').toLowerCase().includes(q) ||
-        (i.tela_nombre || '').toLowerCase().includes(q) ||
-        (i.hilo_especifico || '').toLowerCase().includes(q) ||
-        (i.persona_nombre || '').toLowerCase().includes(q)
-      );
-    }
-    const map = {};
-    for (const item of items) {
-      if (!map[item.persona_id]) {
-        map[item.persona_id] = {
+    const totales = {};
+    for (const p of data.filtros?.personas || []) totales[p.id] = p;
+    const map = new Map();
+    for (const item of data.items) {
+      if (!map.has(item.persona_id)) {
+        const t = totales[item.persona_id] || {};
+        map.set(item.persona_id, {
           persona_id: item.persona_id,
           persona_nombre: item.persona_nombre,
           persona_tipo: item.persona_tipo,
           items: [],
-          total_prendas: 0,
-          total_criticos: 0,
-          total_vencidos: 0,
-          total_incidencias: 0,
-          avance_sum: 0,
-          avance_count: 0,
-        };
+          total_registros: t.registros ?? 0,
+          total_prendas: t.total_prendas ?? 0,
+          total_criticos: t.criticos ?? 0,
+          total_vencidos: t.vencidos ?? 0,
+          total_incidencias: t.incidencias ?? 0,
+          avance_promedio: t.avance_promedio ?? null,
+        });
       }
-      const g = map[item.persona_id];
-      g.items.push(item);
-      g.total_prendas += item.cantidad_enviada || 0;
-      if (item.nivel_riesgo === 'critico') g.total_criticos++;
-      if (item.nivel_riesgo === 'vencido') g.total_vencidos++;
-      g.total_incidencias += item.incidencias_abiertas;
-      if (item.avance_porcentaje != null) { g.avance_sum += item.avance_porcentaje; g.avance_count++; }
-    }
-    const groups = Object.values(map).sort((a, b) => (b.total_criticos + b.total_vencidos) - (a.total_criticos + a.total_vencidos) || a.persona_nombre.localeCompare(b.persona_nombre));
-    // Ordenar items dentro de cada grupo por días
-    for (const g of groups) {
-      g.items.sort((a, b) => {
-        const da = a.dias_transcurridos ?? -1;
-        const db = b.dias_transcurridos ?? -1;
-        return sortDiasDesc ? db - da : da - db;
-      });
+      map.get(item.persona_id).items.push(item);
     }
-    return groups;
-  }, [data, filtroBusqueda, sortDiasDesc]);
+    return [...map.values()];
+  }, [data]);
 
-  // Vista plana: todos los items en una sola lista, ordenados por días globalmente
-  const flatItems = useMemo(() => {
-    if (!grouped.length) return [];
-    const all = [];
-    for (const g of grouped) {
-      for (const item of g.items) {
-        all.push({ ...item, _persona_nombre: g.persona_nombre, _persona_tipo: g.persona_tipo });
-      }
-    }
-    all.sort((a, b) => {
-      const da = a.dias_transcurridos ?? -1;
-      const db = b.dias_transcurridos ?? -1;
-      return sortDiasDesc ? db - da : da - db;
-    });
-    return all;
-  }, [grouped, sortDiasDesc]);
+  const flatItems = useMemo(() => (
+    (data?.items || []).map(item => ({ ...item, _persona_nombre: item.persona_nombre, _persona_tipo: item.persona_tipo }))
+  ), [data]);
 
   const togglePersona = (pid) => {
     setExpandedPersonas(prev => ({ ...prev, [pid]: !prev[pid] }));
@@ -345,32 +336,32 @@ export const ReporteCostura = () => {
 
   const fmtDate = (d) => { if (!d) return '-'; const dt = new Date(d + 'T00:00:00'); return `${String(dt.getDate()).padStart(2,'0')}-${String(dt.getMonth()+1).padStart(2,'0')}-${dt.getFullYear()}`; };
 
-  const getExportRows = () => {
+  // Exporta todas las filas filtradas, no solo la página visible
+  const getExportRows = async () => {
+    const resp = await axios.get(`${API}/api/reportes-produccion/costura?${buildParams().toString()}`);
     const rows = [];
-    for (const grupo of grouped) {
-      for (const item of grupo.items) {
-        rows.push({
-          persona: grupo.persona_nombre,
-          tipo_persona: grupo.persona_tipo,
-          corte: item.n_corte,
-          urgente: item.urgente,
-          modelo: item.modelo_nombre || '',
-          tipo_prenda: item.tipo_nombre || '',
-          entalle: item.entalle_nombre || '',
-          tela: item.tela_nombre || '',
-          hilo_especifico: item.hilo_especifico || '',
-          cantidad: item.cantidad_enviada || 0,
-          inicio: item.fecha_inicio,
-          esperada: item.fecha_esperada,
-          dias: item.dias_transcurridos,
-          avance: item.avance_porcentaje ?? 0,
-          ult_act: item.avance_updated_at ? new Date(item.avance_updated_at).toLocaleDateString('es-PE', {day:'2-digit',month:'2-digit',year:'numeric'}) : '-',
-          dias_sin_act: item.dias_sin_actualizar,
-          incidencias: item.incidencias_abiertas || 0,
-          riesgo: item.nivel_riesgo || 'normal',
-          riesgo_label: (RIESGO_CONFIG[item.nivel_riesgo] || RIESGO_CONFIG.normal).label,
-        });
-      }
+    for (const item of resp.data.items) {
+      rows.push({
+        persona: item.persona_nombre,
+        tipo_persona: item.persona_tipo,
+        corte: item.n_corte,
+        urgente: item.urgente,
+        modelo: item.modelo_nombre || '',
+        tipo_prenda: item.tipo_nombre || '',
+        entalle: item.entalle_nombre || '',
+        tela: item.tela_nombre || '',
+        hilo_especifico: item.hilo_especifico || '',
+        cantidad: item.cantidad_enviada || 0,
+        inicio: item.fecha_inicio,
+        esperada: item.fecha_esperada,
+        dias: item.dias_transcurridos,
+        avance: item.avance_porcentaje ?? 0,
+        ult_act: item.avance_updated_at ? new Date(item.avance_updated_at).toLocaleDateString('es-PE', {day:'2-digit',month:'2-digit',year:'numeric'}) : '-',
+        dias_sin_act: item.dias_sin_actualizar,
+        incidencias: item.incidencias_abiertas || 0,
+        riesgo: item.nivel_riesgo || 'normal',
+        riesgo_label: (RIESGO_CONFIG[item.nivel_riesgo] || RIESGO_CONFIG.normal).label,
+      });
     }
     return rows;
   };
@@ -378,7 +369,8 @@ export const ReporteCostura = () => {
   const handleExportExcel = async () => {
     if (!grouped.length) return;
     const XLSX = (await import('xlsx')).default || await import('xlsx');
-    const rows = getExportRows();
+    let rows;
+    try { rows = await getExportRows(); } catch { toast.error('Error al exportar'); return; }
     const wsData = [
       ['Persona', 'Tipo', 'Corte', 'Modelo', 'Tipo Prenda', 'Entalle', 'Tela', 'Hilo Esp.', 'Cant.', 'Inicio', 'F. Esperada', 'Días', 'Avance %', 'Últ. Act.', 'D/s Act.', 'Inc.', 'Riesgo'],
       ...rows.map(r => [
@@ -402,7 +394,8 @@ export const ReporteCostura = () => {
     const jsPDF = jsPDFMod.default || jsPDFMod.jsPDF;
     const autoTableMod = await import('jspdf-autotable');
     const autoTable = autoTableMod.default || autoTableMod.applyPlugin;
-    const rows = getExportRows();
+    let rows;
+    try { rows = await getExportRows(); } catch { toast.error('Error al exportar'); return; }
     const doc = new jsPDF({ orientation: 'landscape', unit: 'mm', format: 'a4' });
     const pageW = doc.internal.pageSize.getWidth();
 
@@ -898,7 +891,7 @@ export const ReporteCostura = () => {
         <div className="space-y-2" data-testid="tabla-costura">
           {grouped.map((grupo) => {
             const isExpanded = expandedPersonas[grupo.persona_id] !== false; // default expanded
-            const avgAvance = grupo.avance_count > 0 ? Math.round(grupo.avance_sum / grupo.avance_count) : null;
+            const avgAvance = grupo.avance_promedio;
             return (
               <div key={grupo.persona_id} className="rounded-lg border bg-card overflow-hidden">
                 {/* Fila persona */}
@@ -912,7 +905,7 @@ export const ReporteCostura = () => {
                   <div className="flex-1 min-w-0 flex items-center gap-3 flex-wrap">
                     <span className="font-semibold text-sm">{grupo.persona_nombre}</span>
                     <Badge variant="outline" className="text-[10px]">{grupo.persona_tipo}</Badge>
-                    <span className="text-xs text-muted-foreground">{grupo.items.length} registro{grupo.items.length !== 1 ? 's' : ''}</span>
+                    <span className="text-xs text-muted-foreground">{grupo.total_registros} registro{grupo.total_registros !== 1 ? 's' : ''}</span>
                     <Separator orientation="vertical" className="h-4" />
                     <span className="text-xs font-mono">{grupo.total_prendas.toLocaleString()} prendas</span>
                     {avgAvance !== null && <span className="text-xs font-mono text-muted-foreground">~{avgAvance}%</span>}
@@ -1084,6 +1077,25 @@ export const ReporteCostura = () => {
         </div>
       )}
 
+      {/* Paginación */}
+      {!loading && (data?.total || 0) > PAGE_LIMIT && (
+        <div className="flex items-center justify-between" data-testid="paginacion-costura">
+          <div className="text-xs text-muted-foreground">
+            {offset + 1}–{Math.min(offset + PAGE_LIMIT, data.total)} de {data.total}
+          </div>
+          <div className="flex gap-2">
+            <Button variant="outline" size="sm" disabled={loading || offset <= 0}
+              onClick={() => setOffset(Math.max(0, offset - PAGE_LIMIT))}>
+              Anterior
+            </Button>
+            <Button variant="outline" size="sm" disabled={loading || offset + PAGE_LIMIT >= data.total}
+              onClick={() => setOffset(offset + PAGE_LIMIT)}>
+              Siguiente
+            </Button>
+          </div>
+        </div>
+      )}
+
       {/* Dialog incidencia rápida */}
       <Dialog open={!!incDialog} onOpenChange={(open) => { if (!open) { setIncDialog(null); setIncParaliza(false); setIncMotivo(''); setIncComentario(''); } }}>
         <DialogContent className="max-w-md">
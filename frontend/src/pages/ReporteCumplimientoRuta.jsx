@@ -8,6 +8,7 @@ import { useNavigate } from 'react-router-dom';
 import { ArrowLeft, CheckCircle2, Clock, AlertCircle } from 'lucide-react';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const PAGE_LIMIT = 100;
 
 const EstadoBadge = ({ estado }) => {
   if (estado === 'COMPLETADA') return <Badge className="bg-emerald-500/10 text-emerald-600 border-emerald-200 text-[10px]">Completada</Badge>;
@@ -20,6 +21,7 @@ export const ReporteCumplimientoRuta = () => {
   const [filtros, setFiltros] = useState(null);
   const [loading, setLoading] = useState(true);
   const [filterRuta, setFilterRuta] = useState('');
+  const [offset, setOffset] = useState(0);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -30,11 +32,13 @@ export const ReporteCumplimientoRuta = () => {
     setLoading(true);
     const params = new URLSearchParams();
     if (filterRuta && filterRuta !== '_all') params.append('ruta_id', filterRuta);
+    params.append('limit', String(PAGE_LIMIT));
+    params.append('offset', String(offset));
     axios.get(`${API}/reportes-produccion/cumplimiento-ruta?${params}`)
       .then(res => setData(res.data))
       .catch(err => console.error(err))
       .finally(() => setLoading(false));
-  }, [filterRuta]);
+  }, [filterRuta, offset]);
 
   return (
     <div className="space-y-4" data-testid="reporte-cumplimiento-ruta">
@@ -52,7 +56,7 @@ export const ReporteCumplimientoRuta = () => {
       <Card>
         <CardContent className="pt-4">
           <div className="flex gap-3">
-            <Select value={filterRuta} onValueChange={setFilterRuta}>
+            <Select value={filterRuta} onValueChange={(v) => { setFilterRuta(v); setOffset(0); }}>
               <SelectTrigger className="w-[220px]" data-testid="filter-ruta">
                 <SelectValue placeholder="Filtrar por Ruta" />
               </SelectTrigger>
@@ -64,7 +68,7 @@ export const ReporteCumplimientoRuta = () => {
               </SelectContent>
             </Select>
             {filterRuta && (
-              <Button variant="outline" size="sm" onClick={() => setFilterRuta('')}>Limpiar</Button>
+              <Button variant="outline" size="sm" onClick={() => { setFilterRuta(''); setOffset(0); }}>Limpiar</Button>
             )}
           </div>
         </CardContent>
@@ -147,6 +151,23 @@ export const ReporteCumplimientoRuta = () => {
               </table>
             </div>
           )}
+          {(data?.total || 0) > PAGE_LIMIT && (
+            <div className="flex items-center justify-between p-3 border-t">
+              <div className="text-xs text-muted-foreground">
+                {offset + 1}–{Math.min(offset + PAGE_LIMIT, data.total)} de {data.total}
+              </div>
+              <div className="flex gap-2">
+                <Button variant="outline" size="sm" disabled={loading || offset <= 0}
+                  onClick={() => setOffset(Math.max(0, offset - PAGE_LIMIT))}>
+                  Anterior
+                </Button>
+                <Button variant="outline" size="sm" disabled={loading || offset + PAGE_LIMIT >= data.total}
+                  onClick={() => setOffset(offset + PAGE_LIMIT)}>
+                  Siguiente
+                </Button>
+              </div>
+            </div>
+          )}
         </CardContent>
       </Card>
     </div>